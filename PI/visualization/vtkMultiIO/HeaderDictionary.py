@@ -1,3 +1,6 @@
+import contextlib
+import threading
+
 from zope import event
 
 from PI.visualization.vtkMultiIO.events import HeaderValueModifiedEvent, HeaderModifiedEvent
@@ -10,8 +13,16 @@ class HeaderDictionary(dict):
 
     HeaderDictionary acts just like a basic dictionary, but will generate a zope
     event whenever values are modified within the dictionary.
+
+    Assignments made inside a BatchUpdate() block, or through update(), don't fire a
+    HeaderValueModifiedEvent each - a single HeaderModifiedEvent listing the changed
+    keys is fired when the outermost block ends.
     """
 
+    # defaults for instances unpickled from before batching existed
+    _batch_depth = 0
+    _batch_keys = None
+
     def __init__(self, _dict={}):
 
         for key in _dict:
@@ -19,7 +30,104 @@ class HeaderDictionary(dict):
 
     def __setitem__(self, key, value):
         dict.__setitem__(self, key, value)
-        event.notify(HeaderValueModifiedEvent(key, value))
+        if self._batch_depth:
+            self._batch_keys.add(key)
+        else:
+            event.notify(HeaderValueModifiedEvent(key, value))
+
+    @contextlib.contextmanager
+    def BatchUpdate(self):
+        """
+        Context manager that defers notification of every assignment made within it to
+        one HeaderModifiedEvent, fired on exit if anything was assigned.  Blocks nest.
+        """
+        if not self._batch_depth:
+            self._batch_keys = set()
+        self._batch_depth += 1
+        try:
+            yield self
+        finally:
+            self._batch_depth -= 1
+            if not self._batch_depth:
+                keys, self._batch_keys = self._batch_keys, None
+                if keys:
+                    event.notify(HeaderModifiedEvent(self, keys))
+
+    def update(self, *args, **kwargs):
+        """dict.update(), firing a single HeaderModifiedEvent for all the keys assigned"""
+        with self.BatchUpdate():
+            for key, value in dict(*args, **kwargs).items():
+                self[key] = value
 
     def invokeModifiedEvent(self):
         event.notify(HeaderModifiedEvent(self))
+
+
+class DebouncedHeaderSubscriber(object):
+
+    """
+    A zope.event subscriber that coalesces header events arriving in quick succession.
+
+    `callback(keys)` is called once no header event has arrived for `delay` seconds,
+    with the set of keys modified since the last call - or None if any of the events
+    was a HeaderModifiedEvent without keys (i.e. the whole header may have changed).
+    The callback runs on a timer thread; GUI code should marshal it onto its own event
+    loop.  Call Flush() to deliver pending changes immediately and Unsubscribe() when
+    done.
+
+        subscriber = DebouncedHeaderSubscriber(self.RedrawHeader, delay=0.05)
+    """
+
+    def __init__(self, callback, delay=0.1, subscribe=True):
+        self._callback = callback
+        self._delay = delay
+        self._lock = threading.Lock()
+        self._timer = None
+        self._pending = False
+        self._keys = set()
+        if subscribe:
+            event.subscribers.append(self)
+
+    def __call__(self, e):
+        if isinstance(e, HeaderValueModifiedEvent):
+            keys = set([e.GetKey()])
+        elif isinstance(e, HeaderModifiedEvent):
+            keys = e.GetKeys()
+        else:
+            return
+
+        with self._lock:
+            self._pending = True
+            if keys is None or self._keys is None:
+                self._keys = None
+            else:
+                self._keys.update(keys)
+
+            # restart the quiet period
+            if self._timer is not None:
+                self._timer.cancel()
+            self._timer = threading.Timer(self._delay, self.Flush)
+            self._timer.daemon = True
+            self._timer.start()
+
+    def Flush(self):
+        """Deliver any pending changes now"""
+        with self._lock:
+            if self._timer is not None:
+                self._timer.cancel()
+                self._timer = None
+            if not self._pending:
+                return
+            keys, self._keys, self._pending = self._keys, set(), False
+        self._callback(keys)
+
+    def Unsubscribe(self):
+        """Stop listening - pending changes are discarded"""
+        with self._lock:
+            if self._timer is not None:
+                self._timer.cancel()
+                self._timer = None
+            self._pending = False
+            self._keys = set()
+        if self in event.subscribers:
+            event.subscribers.remove(self)
@@ -0,0 +1,398 @@
+"""
+ImageCatalog - a local SQLite index of the images found in a directory tree.
+
+Images are recognised with vtkMultiImageReader's detection engine, and only their
+headers are read: dimensions, spacing and scalar type come from the reader's
+information pass, while modality, dates, patient and study details come from the
+DICOM keywords stored in the header (or from the DICOM header of DICOM files).
+Refreshing a catalog only re-examines files whose modification time or size changed.
+
+Usage:
+
+    catalog = ImageCatalog('archive.db')
+    catalog.Index('/data/archive')
+    for image in catalog.Query(modality='CT', study_uid=uid):
+        print(image['filename'], image['dimensions'])
+"""
+
+import concurrent.futures
+import json
+import logging
+import os
+import sqlite3
+import threading
+import pydicom
+import vtk
+from . import metaimage
+from . import vffheader
+from .utils import GetVTKCompatibleFilename
+
+logger = logging.getLogger(__name__)
+
+# header fields stored in their own (queryable) columns, and the DICOM names they are
+# taken from - dates and times use the same precedence as MVImage.GetDate().  Names
+# follow vtkImageWriterBase.ConvertTags(): the tag name without spaces or apostrophes
+_DICOM_FIELDS = (('modality', ('Modality',)),
+                 ('date', ('ContentDate', 'AcquisitionDate', 'SeriesDate', 'StudyDate')),
+                 ('time', ('ContentTime', 'AcquisitionTime', 'SeriesTime', 'StudyTime')),
+                 ('patient_id', ('PatientID',)),
+                 ('patient_name', ('PatientsName',)),
+                 ('study_id', ('StudyID',)),
+                 ('study_uid', ('StudyInstanceUID',)),
+                 ('series', ('SeriesNumber',)),
+                 ('series_uid', ('SeriesInstanceUID',)),
+                 ('description', ('SeriesDescription', 'StudyDescription')))
+
+_COLUMNS = (('filename', 'TEXT PRIMARY KEY'),
+            ('mtime', 'REAL'),
+            ('size', 'INTEGER'),
+            ('format', 'TEXT'),
+            ('dim_x', 'INTEGER'),
+            ('dim_y', 'INTEGER'),
+            ('dim_z', 'INTEGER'),
+            ('spacing_x', 'REAL'),
+            ('spacing_y', 'REAL'),
+            ('spacing_z', 'REAL'),
+            ('scalar_type', 'INTEGER'),
+            ('components', 'INTEGER')) + \
+    tuple((name, 'TEXT') for name, _keys in _DICOM_FIELDS) + \
+    (('dicom', 'TEXT'),)
+
+COLUMNS = tuple(name for name, _type in _COLUMNS)
+
+_INDEXED_COLUMNS = ('modality', 'patient_id', 'study_uid', 'study_id', 'date')
+
+# number of bytes searched for dicom_* keywords in text headers
+_TEXT_HEADER_SIZE = 65536
+
+
+def _GetDICOMName(element):
+    """The name a DICOM element is stored under in dicom_* keywords"""
+    return element.name.replace(' ', '').replace("'", '')
+
+
+def _StripDICOMKeywords(keywords):
+    """Returns dicom_* keywords keyed by DICOM name; the quotes vtkMultiImageWriter puts
+    around dates and times are removed"""
+
+    dicom = {}
+    for key, value in keywords.items():
+        if len(value) >= 2 and value[0] == value[-1] == "'":
+            value = value[1:-1]
+        dicom[key[len('dicom_'):] if key.startswith('dicom_') else key] = value
+    return dicom
+
+
+def _ReadDICOMKeywords(filename):
+    """Returns the dicom_* keywords of a text header (VFF, MetaImage) keyed by DICOM name"""
+
+    with open(filename, 'rb') as f:
+        text = f.read(_TEXT_HEADER_SIZE)
+
+    # the header ends at the VFF form feed or at MetaImage's ElementDataFile line
+    for terminator in (b'\f', b'ElementDataFile'):
+        end = text.find(terminator)
+        if end >= 0:
+            text = text[:end]
+
+    keywords = {}
+    for line in text.decode('latin-1').splitlines():
+        if not line.startswith('dicom_') or '=' not in line:
+            continue
+        key, value = [s.strip() for s in line.split('=', 1)]
+        keywords[key] = value.rstrip(';').strip()
+    return _StripDICOMKeywords(keywords)
+
+
+def _ReadDICOMFile(filename):
+    """Returns the DICOM values of a DICOM file keyed by name, or None if it isn't one"""
+
+    with open(filename, 'rb') as f:
+        f.seek(128)
+        if f.read(4) != b'DICM':
+            return None
+
+    ds = pydicom.dcmread(filename, stop_before_pixels=True)
+    keywords = {}
+    for element in ds:
+        if element.VR == 'SQ' or not element.keyword:
+            continue
+        keywords[_GetDICOMName(element)] = str(element.value)
+    return keywords
+
+
+def _GetRecordFromInformation(image_reader):
+    """Image geometry from a reader's information pass - no voxels are read"""
+
+    image_reader.UpdateInformation()
+    info = image_reader.GetOutputInformation(0)
+
+    extent = info.Get(vtk.vtkStreamingDemandDrivenPipeline.WHOLE_EXTENT())
+    spacing = info.Get(vtk.vtkDataObject.SPACING()) or (1.0, 1.0, 1.0)
+    scalar_info = vtk.vtkDataObject.GetActiveFieldInformation(
+        info, vtk.vtkDataObject.FIELD_ASSOCIATION_POINTS, vtk.vtkDataSetAttributes.SCALARS)
+
+    record = {'dimensions': [extent[2 * i + 1] - extent[2 * i] + 1 for i in range(3)],
+              'spacing': list(spacing)}
+    if scalar_info is not None:
+        record['scalar_type'] = scalar_info.Get(vtk.vtkDataObject.FIELD_ARRAY_TYPE())
+        record['components'] = scalar_info.Get(vtk.vtkDataObject.FIELD_NUMBER_OF_COMPONENTS())
+    return record
+
+
+def ReadImageMetadata(filename, reader):
+    """
+    Detect the format of `filename` with `reader` (a vtkMultiImageReader) and read its
+    header.  Returns a dictionary of catalog fields, or None if the file isn't an image.
+    """
+
+    filename = GetVTKCompatibleFilename(filename)
+    extension = os.path.splitext(filename)[1].lower()
+
+    if extension in ('.mha', '.mhd') and metaimage.IsMetaImageFile(filename):
+        header = metaimage.ReadMetaImageHeader(filename)
+        return {'format': 'MetaImage',
+                'dimensions': list(header['dimensions']),
+                'spacing': list(header['spacing']),
+                'scalar_type': header['scalar_type'],
+                'components': header['components'],
+                'dicom': _StripDICOMKeywords(header['dicom'])}
+
+    if extension == '.vff':
+        try:
+            header = vffheader.ReadVFFHeader(filename)
+        except (IOError, ValueError):
+            header = None
+        if header is not None:
+            record = {'format': 'VFF',
+                      'dimensions': list(header['dimensions']),
+                      'spacing': list(header['spacing']),
+                      'scalar_type': header['scalar_type'],
+                      'components': header['bands'],
+                      'dicom': _StripDICOMKeywords(header['dicom'])}
+            return record
+
+    classname, image_reader = reader.SetReaderByMagicNumber(filename)
+    if classname is None:
+        return None
+
+    record = {'format': classname.__name__}
+
+    dicom = _ReadDICOMFile(filename)
+    if dicom is None:
+        dicom = _ReadDICOMKeywords(filename)
+    record['dicom'] = dicom
+
+    image_reader.SetFileName(filename)
+    try:
+        record.update(_GetRecordFromInformation(image_reader))
+    except Exception as e:
+        logger.warning("Unable to read image information from {0}: {1}".format(filename, e))
+
+    return record
+
+
+class ImageCatalog(object):
+
+    """
+    A SQLite catalog of image metadata.  Index() walks a directory tree and
+    (re)indexes new or modified files; Query() looks images up by any column.
+    """
+
+    def __init__(self, database, reader_factory=None):
+        """
+        `database` is the SQLite file to use (':memory:' for a temporary catalog).
+        `reader_factory` returns the vtkMultiImageReader used for format detection;
+        by default one with every installed reader plugin is created per thread.
+        """
+
+        self._connection = sqlite3.connect(database)
+        self._connection.row_factory = sqlite3.Row
+        self._reader_factory = reader_factory or _CreateReader
+        self._local = threading.local()
+        self._CreateTables()
+
+    def _CreateTables(self):
+
+        with self._connection:
+            self._connection.execute('CREATE TABLE IF NOT EXISTS images ({0})'.format(
+                ', '.join('{0} {1}'.format(name, _type) for name, _type in _COLUMNS)))
+            for name in _INDEXED_COLUMNS:
+                self._connection.execute(
+                    'CREATE INDEX IF NOT EXISTS images_{0} ON images ({0})'.format(name))
+            # files that aren't images are remembered too, so they aren't re-examined
+            self._connection.execute('CREATE TABLE IF NOT EXISTS skipped '
+                                     '(filename TEXT PRIMARY KEY, mtime REAL, size INTEGER)')
+
+    def Close(self):
+        self._connection.close()
+
+    def _GetReader(self):
+        reader = getattr(self._local, 'reader', None)
+        if reader is None:
+            reader = self._local.reader = self._reader_factory()
+        return reader
+
+    def _ReadRow(self, entry):
+
+        filename, mtime, size = entry
+
+        try:
+            record = ReadImageMetadata(filename, self._GetReader())
+        except Exception as e:
+            logger.warning("Unable to index {0}: {1}".format(filename, e))
+            record = None
+
+        if record is None:
+            return filename, mtime, size, None
+
+        dicom = record.get('dicom') or {}
+        dimensions = record.get('dimensions') or [None] * 3
+        spacing = record.get('spacing') or [None] * 3
+
+        row = {'filename': filename,
+               'mtime': mtime,
+               'size': size,
+               'format': record['format'],
+               'dim_x': dimensions[0], 'dim_y': dimensions[1], 'dim_z': dimensions[2],
+               'spacing_x': spacing[0], 'spacing_y': spacing[1], 'spacing_z': spacing[2],
+               'scalar_type': record.get('scalar_type'),
+               'components': record.get('components'),
+               'dicom': json.dumps(dicom)}
+
+        for column, keys in _DICOM_FIELDS:
+            row[column] = next((dicom[k] for k in keys if dicom.get(k)), None)
+
+        return filename, mtime, size, row
+
+    def _GetKnownFiles(self, directory):
+
+        known = {}
+        prefix = os.path.join(directory, '')
+        for table in ('images', 'skipped'):
+            for filename, mtime, size in self._connection.execute(
+                    'SELECT filename, mtime, size FROM {0}'.format(table)):
+                if filename.startswith(prefix):
+                    known[filename] = (mtime, size)
+        return known
+
+    def Index(self, directory, recursive=True, max_workers=None, prune=True):
+        """
+        Index the images in `directory`.  Files whose modification time and size are
+        unchanged since the last call are not opened again; with `prune`, entries for
+        files that no longer exist are removed.  Returns a dictionary of counts.
+        """
+
+        directory = os.path.abspath(directory)
+        known = self._GetKnownFiles(directory)
+
+        found = set()
+        pending = []
+
+        for root, dirs, files in os.walk(directory):
+            if not recursive:
+                dirs[:] = []
+            for name in files:
+                filename = os.path.join(root, name)
+                try:
+                    st = os.stat(filename)
+                except OSError:
+                    continue
+                found.add(filename)
+                if known.get(filename) != (st.st_mtime, st.st_size):
+                    pending.append((filename, st.st_mtime, st.st_size))
+
+        if max_workers is None:
+            max_workers = min(32, (os.cpu_count() or 1) * 4)
+
+        with concurrent.futures.ThreadPoolExecutor(max_workers=max_workers) as executor:
+            results = list(executor.map(self._ReadRow, pending))
+
+        rows = [row for _f, _m, _s, row in results if row is not None]
+        skipped = [(f, m, s) for f, m, s, row in results if row is None]
+        removed = [(f,) for f in known if f not in found] if prune else []
+
+        with self._connection:
+            changed = [(f,) for f, _m, _s in pending]
+            self._connection.executemany('DELETE FROM images WHERE filename = ?', changed)
+            self._connection.executemany('DELETE FROM skipped WHERE filename = ?', changed)
+            self._connection.executemany('INSERT INTO images ({0}) VALUES ({1})'.format(
+                ', '.join(COLUMNS), ', '.join(':' + c for c in COLUMNS)), rows)
+            self._connection.executemany('INSERT INTO skipped VALUES (?, ?, ?)', skipped)
+            self._connection.executemany('DELETE FROM images WHERE filename = ?', removed)
+            self._connection.executemany('DELETE FROM skipped WHERE filename = ?', removed)
+
+        return {'indexed': len(rows),
+                'skipped': len(skipped),
+                'unchanged': len(found) - len(pending),
+                'removed': len(removed)}
+
+    def Query(self, directory=None, order_by='filename', **criteria):
+        """
+        Returns the catalog entries matching every criterion, e.g.
+        Query(modality='CT', study_uid=uid).  A list or tuple value matches any of its
+        members; `directory` restricts the results to a directory tree.
+        """
+
+        clauses = []
+        values = []
+
+        for column, value in criteria.items():
+            if column not in COLUMNS:
+                raise KeyError("Unknown catalog column '{0}'".format(column))
+            if isinstance(value, (list, tuple, set)):
+                value = list(value)
+                clauses.append('{0} IN ({1})'.format(column, ', '.join('?' * len(value))))
+                values.extend(value)
+            elif value is None:
+                clauses.append('{0} IS NULL'.format(column))
+            else:
+                clauses.append('{0} = ?'.format(column))
+                values.append(value)
+
+        if directory is not None:
+            prefix = os.path.join(os.path.abspath(directory), '')
+            # compared literally - LIKE would be case-insensitive and treat % and _
+            # as wildcards
+            clauses.append('substr(filename, 1, ?) = ?')
+            values.extend([len(prefix), prefix])
+
+        if order_by not in COLUMNS:
+            raise KeyError("Unknown catalog column '{0}'".format(order_by))
+
+        sql = 'SELECT * FROM images'
+        if clauses:
+            sql += ' WHERE ' + ' AND '.join(clauses)
+        sql += ' ORDER BY ' + order_by
+
+        return [self._RowToEntry(row) for row in self._connection.execute(sql, values)]
+
+    def GetEntry(self, filename):
+        """Returns the catalog entry for `filename`, or None"""
+        row = self._connection.execute('SELECT * FROM images WHERE filename = ?',
+                                       (os.path.abspath(filename),)).fetchone()
+        if row is None:
+            return None
+        return self._RowToEntry(row)
+
+    def Remove(self, filename):
+        with self._connection:
+            self._connection.execute('DELETE FROM images WHERE filename = ?',
+                                     (os.path.abspath(filename),))
+
+    def __len__(self):
+        return self._connection.execute('SELECT COUNT(*) FROM images').fetchone()[0]
+
+    @staticmethod
+    def _RowToEntry(row):
+        entry = dict(row)
+        entry['dimensions'] = (entry['dim_x'], entry['dim_y'], entry['dim_z'])
+        entry['spacing'] = (entry['spacing_x'], entry['spacing_y'], entry['spacing_z'])
+        entry['dicom'] = json.loads(entry['dicom'] or '{}')
+        return entry
+
+
+def _CreateReader():
+    """A vtkMultiImageReader with every installed reader plugin registered"""
+    from .vtkLoadReaders import LoadImageReaders
+    return LoadImageReaders(directories=['.'])[0]
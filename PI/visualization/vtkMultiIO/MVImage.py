@@ -11,6 +11,7 @@ from past.utils import old_div
 from builtins import object
 import copy
 import io
+import pickle
 import pydicom
 import pydicom.dataset
 from enum import Enum
@@ -19,7 +20,7 @@ import time
 from . import interfaces
 import vtk
 import logging
-from vtk.util.numpy_support import vtk_to_numpy
+from vtk.util.numpy_support import vtk_to_numpy, numpy_to_vtk
 import numpy as np
 from zope.interface import implementer
 from PI.visualization.common.CoordinateSystem import CoordinateSystem
@@ -181,6 +182,41 @@ class DICOMHeaderDict(dict):
         return str(self._metadata)
 
 
+def _ImageDataFromArray(arr, state):
+    """Build a vtkImageData whose scalars share memory with a flat numpy array"""
+
+    image_data = vtk.vtkImageData()
+    image_data.SetExtent(state['extent'])
+    image_data.SetSpacing(state['spacing'])
+    image_data.SetOrigin(state['origin'])
+
+    components = state['components']
+    if components > 1:
+        arr = arr.reshape(-1, components)
+
+    # shallow copy - numpy_to_vtk keeps a reference to arr for us
+    scalars = numpy_to_vtk(arr, deep=0, array_type=state['scalar_type'])
+    scalars.SetName(state['array_name'])
+    image_data.GetPointData().SetScalars(scalars)
+
+    return image_data
+
+
+def _RebuildMVImage(state, buf):
+    """Unpickle helper - recreate an MVImage from its state and voxel buffer"""
+
+    arr = np.frombuffer(buf, dtype=state['dtype'])
+
+    # VTK assumes it may write into its scalar arrays
+    if not arr.flags.writeable:
+        arr = arr.copy()
+
+    image = MVImage(_ImageDataFromArray(arr, state), filename=state['filename'])
+    image._SetPicklableState(state)
+
+    return image
+
+
 @implementer(interfaces.IDimensionInformation)
 class MVImage(object):
 
@@ -365,6 +401,113 @@ class MVImage(object):
         itk_image = itk.PyBuffer[ImageType].GetImageViewFromArray(arr)
         return itk_image
 
+    def _GetVoxelArray(self):
+        """Return the image scalars as a flat (or N x components) numpy view"""
+
+        image = self._image_data_object
+        scalars = image.GetPointData().GetScalars()
+
+        # image may not have been loaded yet
+        if scalars is None and self._algorithm_output is not None:
+            self._algorithm_output.GetProducer().Update()
+            scalars = image.GetPointData().GetScalars()
+
+        if scalars is None:
+            raise pickle.PicklingError("MVImage contains no voxel data")
+
+        return vtk_to_numpy(scalars), scalars
+
+    def _GetPicklableState(self):
+        """
+        Collect everything needed to rebuild this image in another process, apart from
+        the voxel buffer itself.  VTK objects, converters and stencils are not included -
+        they are recreated (or dropped) on the receiving side.
+        """
+
+        arr, scalars = self._GetVoxelArray()
+        image = self._image_data_object
+
+        slice_headers = self._dicom_slice_headers
+        if isinstance(slice_headers, DICOMHeaderDict):
+            slice_headers = (slice_headers.get_meta_data(), slice_headers.get_slice_dict())
+
+        state = {
+            'extent': image.GetExtent(),
+            'spacing': image.GetSpacing(),
+            'origin': image.GetOrigin(),
+            'scalar_type': scalars.GetDataType(),
+            'components': scalars.GetNumberOfComponents(),
+            'array_name': scalars.GetName() or 'scalars',
+            'dtype': arr.dtype.str,
+            'filename': self._filename,
+            'header': (type(self._header), dict(self._header)),
+            'dimensions': self._dimensions,
+            'value_name': self.__value_name,
+            'unit': self.__unit,
+            'coordinate_system': self._coordinate_system,
+            'x_values': self.__x_values,
+            'y_values': self.__y_values,
+            'z_values': self.__z_values,
+            'dicom_header': self._dicom_header,
+            'slice_headers': slice_headers,
+        }
+
+        return state, arr
+
+    def _SetPicklableState(self, state):
+
+        header_class, header = state['header']
+        self._header = header_class(header)
+        self._dimensions = state['dimensions']
+        self.__value_name = state['value_name']
+        self.__unit = state['unit']
+        self._coordinate_system = state['coordinate_system']
+        self.__x_values = state['x_values']
+        self.__y_values = state['y_values']
+        self.__z_values = state['z_values']
+        self._dicom_header = state['dicom_header']
+
+        slice_headers = state['slice_headers']
+        if isinstance(slice_headers, tuple):
+            metadata, slice_dict = slice_headers
+            slice_headers = DICOMHeaderDict()
+            slice_headers.set_meta_data(metadata)
+            slice_headers.set_slice_dict(slice_dict)
+        self._dicom_slice_headers = slice_headers
+
+    def __reduce_ex__(self, protocol):
+        """
+        Pickle support.  With protocol 5 the voxel buffer is handed to pickle as a
+        PickleBuffer, so callers may pass it out-of-band (e.g. through shared memory)
+        instead of copying it into the pickle stream.  copy.copy() and copy.deepcopy()
+        don't come through here - see __copy__() and __deepcopy__().
+        """
+
+        state, arr = self._GetPicklableState()
+
+        if protocol >= 5:
+            buf = pickle.PickleBuffer(arr)
+        else:
+            buf = bytearray(arr)
+
+        return (_RebuildMVImage, (state, buf))
+
+    def __copy__(self):
+        # the default copy - a new MVImage sharing this one's attributes, without the
+        # pipeline update and voxel copy of pickling
+        cls = self.__class__
+        result = cls.__new__(cls)
+        result.__dict__.update(self.__dict__)
+        return result
+
+    def __deepcopy__(self, memo):
+        cls = self.__class__
+        result = cls.__new__(cls)
+        memo[id(self)] = result
+        for key, value in self.__dict__.items():
+            result.__dict__[key] = copy.deepcopy(value, memo)
+        return result
+
     def ScalarsModified(self):
         self.GetPointData().GetScalars().Modified()
         self.__histogram_stats.Modified()
@@ -503,10 +646,8 @@ class MVImage(object):
             for tag in input_image._dicom_header:
                 self._dicom_header[tag.tag] = tag
 
-        # Copy non-DICOM keyword/value pairs
-        header = input_image.GetHeader()
-        for key in header:
-            self._header[key] = header[key]
+        # Copy non-DICOM keyword/value pairs - a HeaderDictionary fires one event
+        self._header.update(input_image.GetHeader())
 
     def __str__(self):
         s = io.StringIO()
@@ -0,0 +1,185 @@
+"""
+SharedMVImage - an MVImage whose voxel buffer lives in POSIX shared memory.
+
+One process (typically the one that read the image) creates the shared image, and any
+number of other processes attach to it, read-only, by name.  Attached images map the
+same physical pages, so memory use no longer grows with the number of workers.  Header, dimension
+and DICOM information travel with the (small) descriptor returned by GetDescriptor().
+
+Usage:
+
+    # parent
+    image = SharedMVImage.FromImage(reader.GetOutput())
+    pool.map(work, [image.GetDescriptor()] * n)    # or pass `image` itself
+    ...
+    image.Close()
+    image.Unlink()
+
+    # worker
+    image = SharedMVImage.Attach(descriptor)
+"""
+
+import logging
+import mmap
+import os
+import sys
+from multiprocessing import shared_memory
+import numpy as np
+from PI.visualization.vtkMultiIO import MVImage
+
+logger = logging.getLogger(__name__)
+
+
+class _UntrackedSharedMemory(object):
+
+    """
+    An existing POSIX shared memory block, mapped read-only and without registering it
+    with the resource tracker - python < 3.13 registers every block a SharedMemory
+    opens, and the tracker unlinks them (out from under their owner) when the process
+    exits.  Provides the parts of the SharedMemory interface SharedMVImage uses.
+
+    SharedMemory can't map a block read-only, so this relies on _posixshmem, the
+    private CPython module SharedMemory is built on.
+    """
+
+    def __init__(self, name):
+        import _posixshmem
+        self.name = name
+        fd = _posixshmem.shm_open('/' + name, os.O_RDONLY, mode=0o600)
+        try:
+            self._mmap = mmap.mmap(fd, os.fstat(fd).st_size, access=mmap.ACCESS_READ)
+        finally:
+            os.close(fd)
+        self.buf = memoryview(self._mmap)
+
+    def close(self):
+        self.buf.release()
+        self._mmap.close()
+
+    def unlink(self):
+        import _posixshmem
+        _posixshmem.shm_unlink('/' + self.name)
+
+
+def _OpenSharedMemory(name):
+    """
+    Attach to an existing shared memory block without taking ownership of it - mapped
+    read-only where _posixshmem is available, writable (but untracked) otherwise
+    """
+
+    if os.name == 'posix':
+        try:
+            return _UntrackedSharedMemory(name)
+        except ImportError:
+            logger.warning("_posixshmem is unavailable - mapping {0} writable".format(name))
+    if sys.version_info >= (3, 13):
+        return shared_memory.SharedMemory(name=name, track=False)
+    # Windows frees a block with its last handle - there is no tracker to avoid
+    return shared_memory.SharedMemory(name=name)
+
+
+def _AttachSharedMVImage(descriptor):
+    """Unpickle helper"""
+    return SharedMVImage.Attach(descriptor)
+
+
+class SharedMVImage(MVImage.MVImage):
+
+    """
+    An MVImage backed by a multiprocessing.shared_memory block.  Create one with
+    FromImage() and attach to it from other processes with Attach().  Every attached
+    image maps the same pages read-only, so changes the owner makes to the voxels are
+    seen by all of them; pickling a SharedMVImage sends only its descriptor.
+    """
+
+    def __init__(self, image_data, shm, owner=False, **kw):
+        MVImage.MVImage.__init__(self, image_data, **kw)
+        self._shm = shm
+        self._owner = owner
+
+    @classmethod
+    def FromImage(cls, image, name=None):
+        """Copy an MVImage (or vtkImageData) into a new shared memory block"""
+
+        if not isinstance(image, MVImage.MVImage):
+            image = MVImage.MVImage(image)
+
+        state, arr = image._GetPicklableState()
+
+        # a zero-sized block can't be created
+        shm = shared_memory.SharedMemory(name=name, create=True, size=max(arr.nbytes, 1))
+
+        shared_arr = np.ndarray(arr.shape, dtype=arr.dtype, buffer=shm.buf)
+        shared_arr[...] = arr
+
+        shared_image = cls(MVImage._ImageDataFromArray(shared_arr, state), shm, owner=True,
+                           filename=state['filename'])
+        shared_image._SetPicklableState(state)
+
+        return shared_image
+
+    @classmethod
+    def Attach(cls, descriptor):
+        """
+        Attach to a shared image described by `descriptor`.  The voxels are read-only -
+        the block is mapped read-only on POSIX systems, and the numpy view of it is
+        marked read-only everywhere.
+        """
+
+        state = descriptor['state']
+        shm = _OpenSharedMemory(descriptor['name'])
+
+        shape = (descriptor['size'],)
+        if state['components'] > 1:
+            shape = (descriptor['size'] // state['components'], state['components'])
+
+        arr = np.ndarray(shape, dtype=state['dtype'], buffer=shm.buf)
+        arr.flags.writeable = False
+
+        shared_image = cls(MVImage._ImageDataFromArray(arr, state), shm, owner=False,
+                           filename=state['filename'])
+        shared_image._SetPicklableState(state)
+
+        return shared_image
+
+    def GetSharedMemoryName(self):
+        return self._shm.name
+
+    def IsOwner(self):
+        return self._owner
+
+    def GetDescriptor(self):
+        """
+        Returns a small, picklable dictionary that other processes can pass to Attach().
+        Header values are captured at the time of the call.
+        """
+
+        state, arr = self._GetPicklableState()
+
+        return {'name': self._shm.name,
+                'size': arr.size,
+                'state': state}
+
+    def __reduce_ex__(self, protocol):
+        return (_AttachSharedMVImage, (self.GetDescriptor(),))
+
+    def Close(self):
+        """Detach from the shared memory block.  The image must not be used afterwards."""
+
+        # drop VTK's view of the buffer first - the block can't be closed while it's exported
+        self._image_data_object.GetPointData().Initialize()
+
+        try:
+            self._shm.close()
+        except BufferError:
+            logger.warning("Shared image {0} is still referenced - not closing".format(
+                self._shm.name))
+
+    def Unlink(self):
+        """Destroy the shared memory block (owner only) once all processes have closed it"""
+
+        if not self._owner:
+            logger.error("Only the process that created a shared image may unlink it")
+            return
+
+        self._shm.unlink()
@@ -0,0 +1,147 @@
+"""
+Chunked checksums for VFF files.
+
+vtkVFFWriter (with a ChecksumMode of Trailer or Sidecar) hashes the pixel data in
+chunks of `checksum_chunk_slices` z-slices and stores the chunk digests, plus a root
+digest over them, after the pixel data or in a "<file>.md5" sidecar:
+
+    checksum_chunk_slices=16;
+    md5_chunk_digests=<hex> <hex> ...;
+    md5_root_digest=<hex>;
+    \\f
+
+Because every chunk has its own digest, a sub-extent can be verified by reading and
+hashing only the chunks that overlap it.
+"""
+
+import hashlib
+import logging
+import os
+from PI.visualization.vtkMultiIO import vffheader
+
+logger = logging.getLogger(__name__)
+
+CHECKSUM_TRAILER = 'trailer'
+CHECKSUM_SIDECAR = 'sidecar'
+
+
+def ReadChecksums(filename):
+    """
+    Returns the chunked checksum record of a VFF file as a dictionary with the keys
+    'location', 'chunk_slices', 'digests' (hex strings, one per chunk), 'root',
+    'header_size', 'slice_size' and 'depth', or None if the file has no chunked checksums
+    """
+
+    header = vffheader.ReadVFFHeader(filename)
+    keywords = header['keywords']
+    header_size = header['header_size']
+
+    location = keywords.get('checksum_location')
+    if keywords.get('checksum') != 'md5' or location not in (CHECKSUM_TRAILER, CHECKSUM_SIDECAR):
+        return None
+
+    size = header['dimensions']
+    slice_size = size[0] * size[1] * header['bands'] * header['bits'] // 8
+
+    if location == CHECKSUM_TRAILER:
+        with open(filename, 'rb') as f:
+            f.seek(header_size + slice_size * size[2])
+            record = f.read()
+    else:
+        sidecar = filename + '.md5'
+        if not os.path.exists(sidecar):
+            logger.error("Checksum file {0} is missing".format(sidecar))
+            return None
+        with open(sidecar, 'rb') as f:
+            record = f.read()
+
+    record = vffheader.ParseKeywords(record.decode('latin-1'))
+    if 'md5_chunk_digests' not in record:
+        logger.error("{0} has no checksum record".format(filename))
+        return None
+
+    return {'location': location,
+            'chunk_slices': int(record.get('checksum_chunk_slices',
+                                           keywords['checksum_chunk_slices'])),
+            'digests': record['md5_chunk_digests'].split(),
+            'root': record.get('md5_root_digest'),
+            'header_size': header_size,
+            'slice_size': slice_size,
+            'depth': size[2]}
+
+
+def GetRootDigest(digests):
+    """The root digest is the MD5 of the concatenated (binary) chunk digests"""
+    return hashlib.md5(b''.join(bytes.fromhex(d) for d in digests)).hexdigest()
+
+
+def GetChunkRange(checksums, zmin=None, zmax=None):
+    """Returns the range of chunk indices overlapping slices zmin..zmax (inclusive)"""
+    n = checksums['chunk_slices']
+    zmin = 0 if zmin is None else max(zmin, 0)
+    zmax = checksums['depth'] - 1 if zmax is None else min(zmax, checksums['depth'] - 1)
+    if zmax < zmin:
+        return range(0)
+    return range(zmin // n, zmax // n + 1)
+
+
+def FindCorruptChunks(filename, zmin=None, zmax=None, checksums=None):
+    """
+    Hash the chunks overlapping slices zmin..zmax and return the indices of those
+    whose digest does not match.  If the digest list itself does not match the root
+    digest every requested chunk is reported.
+    """
+
+    if checksums is None:
+        checksums = ReadChecksums(filename)
+    if checksums is None:
+        raise IOError("{0} has no chunked checksums".format(filename))
+
+    chunks = GetChunkRange(checksums, zmin, zmax)
+    digests = checksums['digests']
+
+    expected = (checksums['depth'] + checksums['chunk_slices'] - 1) // checksums['chunk_slices']
+    if len(digests) != expected or GetRootDigest(digests) != checksums['root']:
+        logger.error("Checksum record of {0} is damaged".format(filename))
+        return list(chunks)
+
+    chunk_bytes = checksums['chunk_slices'] * checksums['slice_size']
+    data_end = checksums['header_size'] + checksums['depth'] * checksums['slice_size']
+
+    bad = []
+    with open(filename, 'rb') as f:
+        for chunk in chunks:
+            start = checksums['header_size'] + chunk * chunk_bytes
+            f.seek(start)
+            md5 = hashlib.md5()
+            remaining = min(chunk_bytes, data_end - start)
+            while remaining > 0:
+                block = f.read(min(remaining, 1 << 24))
+                if not block:
+                    break
+                md5.update(block)
+                remaining -= len(block)
+            if remaining or md5.hexdigest() != digests[chunk]:
+                logger.error("{0}: checksum mismatch in slices {1}-{2}".format(
+                    filename, chunk * checksums['chunk_slices'],
+                    min((chunk + 1) * checksums['chunk_slices'], checksums['depth']) - 1))
+                bad.append(chunk)
+
+    return bad
+
+
+def VerifyChecksums(filename, extent=None):
+    """
+    Returns True if the pixel data of `filename` matches its chunked checksums.  If a
+    6-element extent is given only the chunks overlapping its z-range are checked.
+    """
+
+    zmin = zmax = None
+    if extent is not None:
+        zmin, zmax = extent[4], extent[5]
+
+    try:
+        return not FindCorruptChunks(filename, zmin, zmax)
+    except (IOError, KeyError, ValueError) as e:
+        logger.error("Unable to verify {0}: {1}".format(filename, e))
+        return False
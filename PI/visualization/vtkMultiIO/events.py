@@ -20,16 +20,30 @@ class HeaderValueModifiedEvent(BaseEvent):
 
         return 'HeaderValue: %s = %s' % (str(self._key), str(self._value))
 
+    def GetKey(self):
+        return self._key
+
+    def GetValue(self):
+        return self._value
+
 
 class HeaderModifiedEvent(BaseEvent):
 
     """
-    Event fired whenever an image header is modified - e.g. for bulk modification
+    Event fired whenever an image header is modified - e.g. for bulk modification.
+    Carries the set of modified keys when they are known, otherwise None.
     """
 
-    def __init__(self, hdr):
+    def __init__(self, hdr, keys=None):
 
         self._hdr = hdr
+        self._keys = frozenset(keys) if keys is not None else None
+
+    def GetHeader(self):
+        return self._hdr
+
+    def GetKeys(self):
+        return self._keys
 
     def __str__(self):
 
@@ -54,3 +68,48 @@ class ImageWriteBeginEvent(BaseEvent):
 
     def GetImageIndex(self):
         return self._image_index
+
+
+class ImageIOMetricsEvent(BaseEvent):
+
+    """
+    Event fired once an image read or write has completed - carries an IOMetrics record
+    """
+
+    def __init__(self, metrics):
+        self._metrics = metrics
+
+    def GetMetrics(self):
+        return self._metrics
+
+    def __str__(self):
+        return str(self._metrics)
+
+
+class MeshLoadProgressEvent(BaseEvent):
+
+    """
+    Event fired each time a mesh of a batch load (see meshbatch.py) has been read
+    """
+
+    def __init__(self, filename, completed, total, error=None):
+        self._filename = filename
+        self._completed = completed
+        self._total = total
+        self._error = error
+
+    def GetFileName(self):
+        return self._filename
+
+    def GetProgress(self):
+        """Returns the fraction of the batch that has been read"""
+        if self._total == 0:
+            return 1.0
+        return float(self._completed) / self._total
+
+    def GetError(self):
+        """Returns the exception raised reading this mesh, or None"""
+        return self._error
+
+    def __str__(self):
+        return 'MeshLoad: %s (%d/%d)' % (str(self._filename), self._completed, self._total)
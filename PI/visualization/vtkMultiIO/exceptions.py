@@ -1,3 +1,8 @@
 class VTKNoImageError(Exception):
     """Exception raised when VTK file does not contain an image"""
     pass
+
+
+class UnsupportedCompressionError(Exception):
+    """Exception raised when a compression can't be written without an optional package"""
+    pass
@@ -0,0 +1,352 @@
+"""
+Vectorized readers for binary STL and binary PLY meshes.
+
+vtkNumpySTLReader and vtkNumpyPLYReader map the whole file, view it with
+np.frombuffer() and build the output vtkPolyData from numpy arrays with numpy_to_vtk -
+there is no per-triangle work in Python or C++.  STL vertices are merged by sorting a
+64 bit hash of their raw coordinates (falling back to np.unique() over the coordinates
+if two different vertices share a hash), giving the same points, in the same order, as
+vtkSTLReader's default point merging.
+
+Anything the fast path doesn't handle - ASCII files, PLY faces of mixed sizes or PLY
+elements other than vertices and faces - is handed to vtkSTLReader or vtkPLYReader,
+so the readers can be registered for every .stl and .ply file.
+"""
+
+import re
+import numpy as np
+import vtk
+from vtk.util import vtkAlgorithm
+from vtk.util.numpy_support import get_vtk_to_numpy_typemap
+from vtk.util.numpy_support import numpy_to_vtk, numpy_to_vtkIdTypeArray
+
+ID_TYPE_CODE = np.dtype(get_vtk_to_numpy_typemap()[vtk.VTK_ID_TYPE])
+
+_STL_HEADER_SIZE = 84
+_STL_RECORD = np.dtype([('normal', '<f4', (3,)),
+                        ('vertices', '<f4', (3, 3)),
+                        ('attribute', '<u2')])
+
+_PLY_TYPES = {'char': 'i1', 'int8': 'i1',
+              'uchar': 'u1', 'uint8': 'u1',
+              'short': 'i2', 'int16': 'i2',
+              'ushort': 'u2', 'uint16': 'u2',
+              'int': 'i4', 'int32': 'i4',
+              'uint': 'u4', 'uint32': 'u4',
+              'float': 'f4', 'float32': 'f4',
+              'double': 'f8', 'float64': 'f8'}
+
+_PLY_FORMATS = {'binary_little_endian': '<', 'binary_big_endian': '>'}
+
+# vertex properties copied to point data, under the names vtkPLYReader uses
+_PLY_POINT_ARRAYS = ((('nx', 'ny', 'nz'), 'Normals'),
+                     (('red', 'green', 'blue', 'alpha'), 'RGBA'),
+                     (('red', 'green', 'blue'), 'RGB'),
+                     (('u', 'v'), 'TCoords'),
+                     (('texture_u', 'texture_v'), 'TCoords'))
+
+_MAX_PLY_HEADER_SIZE = 65536
+
+
+class _FallbackError(Exception):
+    """Raised when a file has to be read by the stock VTK reader"""
+
+
+def IsBinarySTLFile(header, size):
+    """True if `header` (the start of a file of `size` bytes) is a binary STL file"""
+    if size < _STL_HEADER_SIZE or len(header) < _STL_HEADER_SIZE:
+        return False
+    count = np.frombuffer(header, '<u4', 1, 80)[0]
+    return _STL_HEADER_SIZE + _STL_RECORD.itemsize * int(count) == size
+
+
+def IsBinaryPLYFile(header, size):
+    """True if `header` is the start of a binary PLY file"""
+    return re.match(br'ply\r?\nformat binary_', header) is not None
+
+
+def _MakeCells(connectivity, cell_size):
+    """Returns a vtkCellArray of cells with `cell_size` points each"""
+
+    cells = vtk.vtkCellArray()
+    count = len(connectivity) // cell_size
+
+    if hasattr(cells, 'SetData') and hasattr(cells, 'GetOffsetsArray'):
+        offsets = np.arange(0, (count + 1) * cell_size, cell_size, dtype=ID_TYPE_CODE)
+        connectivity = np.ascontiguousarray(connectivity, ID_TYPE_CODE)
+        cells.SetData(numpy_to_vtkIdTypeArray(offsets), numpy_to_vtkIdTypeArray(connectivity))
+    else:
+        # legacy (n, id0, id1, ...) layout
+        legacy = np.empty((count, cell_size + 1), dtype=ID_TYPE_CODE)
+        legacy[:, 0] = cell_size
+        legacy[:, 1:] = connectivity.reshape(count, cell_size)
+        cells.SetCells(count, numpy_to_vtkIdTypeArray(legacy.ravel(), deep=1))
+    return cells
+
+
+def _MakePolyData(points, connectivity, cell_size):
+    polydata = vtk.vtkPolyData()
+    vtkpoints = vtk.vtkPoints()
+    vtkpoints.SetData(numpy_to_vtk(np.ascontiguousarray(points)))
+    polydata.SetPoints(vtkpoints)
+    polydata.SetPolys(_MakeCells(connectivity, cell_size))
+    return polydata
+
+
+def _MergeRows(vertices):
+    """
+    Returns (first, inverse) for the distinct rows of an (n, 3) float32 array, numbered
+    in order of first appearance - the index of each distinct row's first occurrence,
+    and the distinct row number of every row.
+
+    Like np.unique(..., return_index=True, return_inverse=True) on the rows, but sorts
+    a 64 bit hash of their bits rather than 12 byte records, which is several times
+    faster.  Rows whose hashes collide are detected and handed to np.unique.
+    """
+
+    bits = vertices.view(np.uint32).reshape(-1, 3)
+    high = bits[:, 0].astype(np.uint64) << np.uint64(32) | bits[:, 1]
+    low = bits[:, 2]
+    key = high * np.uint64(0x9E3779B97F4A7C15) ^ low
+
+    perm = np.argsort(key)
+    key = key[perm]
+    new = np.empty(len(key), bool)
+    new[:1] = True
+    np.not_equal(key[1:], key[:-1], out=new[1:])
+
+    # rows with equal hashes must really be equal
+    same = ~new[1:]
+    if (same & (high[perm][1:] != high[perm][:-1])).any() or \
+            (same & (low[perm][1:] != low[perm][:-1])).any():
+        keys = vertices.view(np.dtype((np.void, vertices.dtype.itemsize * 3))).ravel()
+        _, first, group = np.unique(keys, return_index=True, return_inverse=True)
+        perm, group = np.arange(len(vertices)), group.ravel()
+    else:
+        first = np.minimum.reduceat(perm, np.flatnonzero(new)) if len(perm) else perm
+        group = np.cumsum(new) - 1
+
+    # renumber the distinct rows by first occurrence
+    order = np.argsort(first)
+    rank = np.empty_like(order)
+    rank[order] = np.arange(len(order))
+    inverse = np.empty(len(vertices), ID_TYPE_CODE)
+    inverse[perm] = rank[group]
+    return first[order], inverse
+
+
+def ReadBinarySTL(filename):
+    """Returns a vtkPolyData with the merged points and triangles of a binary STL file"""
+
+    data = np.memmap(filename, dtype=np.uint8, mode='r')
+    if not IsBinarySTLFile(data[:_STL_HEADER_SIZE].tobytes(), len(data)):
+        raise _FallbackError()
+    count = (len(data) - _STL_HEADER_SIZE) // _STL_RECORD.itemsize
+    records = np.frombuffer(data, _STL_RECORD, count, _STL_HEADER_SIZE)
+
+    # adding 0.0 turns -0.0 into 0.0 so that the two merge
+    vertices = np.add(records['vertices'], np.float32(0.0)).reshape(-1, 3)
+    del records, data
+
+    first, inverse = _MergeRows(vertices)
+    triangles = inverse.reshape(-1, 3)
+
+    # like vtkSTLReader, drop triangles that collapse once their points are merged
+    keep = ((triangles[:, 0] != triangles[:, 1]) & (triangles[:, 1] != triangles[:, 2]) &
+            (triangles[:, 0] != triangles[:, 2]))
+    if not keep.all():
+        triangles = triangles[keep]
+
+    return _MakePolyData(vertices[first], triangles.ravel(), 3)
+
+
+def _ParsePLYHeader(data):
+    """Returns (byte order, header size, [(element, count, [(property, type)])]) where a
+    list property's type is a (count type, index type) pair"""
+
+    end = bytes(data[:_MAX_PLY_HEADER_SIZE]).find(b'end_header')
+    if end < 0:
+        raise _FallbackError()
+    size = bytes(data[end:end + 12]).find(b'\n') + end + 1
+    lines = bytes(data[:end]).decode('latin-1').splitlines()
+
+    order = None
+    elements = []
+    for line in lines[1:]:
+        words = line.split()
+        if not words or words[0] in ('comment', 'obj_info'):
+            continue
+        if words[0] == 'format':
+            order = _PLY_FORMATS.get(words[1])
+        elif words[0] == 'element':
+            elements.append((words[1], int(words[2]), []))
+        elif words[0] == 'property' and elements:
+            if words[1] == 'list':
+                prop = (words[4], (_PLY_TYPES[words[2]], _PLY_TYPES[words[3]]))
+            else:
+                prop = (words[2], _PLY_TYPES[words[1]])
+            elements[-1][2].append(prop)
+
+    if order is None:
+        raise _FallbackError()
+    return order, size, elements
+
+
+def ReadBinaryPLY(filename):
+    """Returns a vtkPolyData with the points, point attributes and faces of a binary PLY
+    file whose faces all have the same number of vertices"""
+
+    data = np.memmap(filename, dtype=np.uint8, mode='r')
+    order, offset, elements = _ParsePLYHeader(data)
+
+    names = [e[0] for e in elements]
+    if names not in (['vertex'], ['vertex', 'face']):
+        raise _FallbackError()
+
+    _, nverts, vprops = elements[0]
+    if any(isinstance(t, tuple) for _, t in vprops):
+        raise _FallbackError()
+    vertex = np.frombuffer(data, np.dtype([(n, order + t) for n, t in vprops]),
+                           nverts, offset)
+    offset += vertex.nbytes
+
+    fields = set(vertex.dtype.names)
+    if not fields.issuperset(('x', 'y', 'z')):
+        raise _FallbackError()
+    points = np.column_stack([vertex[c] for c in 'xyz']).astype(np.float32)
+
+    connectivity = np.empty(0, ID_TYPE_CODE)
+    cell_size = 3
+    if len(elements) == 2 and elements[1][1] > 0:
+        _, nfaces, fprops = elements[1]
+        lists = [p for p in fprops if isinstance(p[1], tuple)]
+        if len(lists) != 1:
+            raise _FallbackError()
+
+        # assume every face has as many vertices as the first, then check
+        face = []
+        for name, t in fprops:
+            if isinstance(t, tuple):
+                count_type = np.dtype(order + t[0])
+                cell_size = int(np.frombuffer(
+                    data, count_type, 1, offset + np.dtype(face).itemsize)[0])
+                face += [('count', count_type), ('indices', order + t[1], (cell_size,))]
+            else:
+                face.append((name, order + t))
+        if cell_size < 3 or \
+                offset + np.dtype(face).itemsize * nfaces > len(data):
+            raise _FallbackError()
+        faces = np.frombuffer(data, np.dtype(face), nfaces, offset)
+        if (faces['count'] != cell_size).any():
+            raise _FallbackError()
+        connectivity = faces['indices'].ravel()
+
+    polydata = _MakePolyData(points, connectivity, cell_size)
+
+    pointdata = polydata.GetPointData()
+    for components, arrayname in _PLY_POINT_ARRAYS:
+        if not fields.issuperset(components) or pointdata.GetArray(arrayname) or \
+                (arrayname == 'RGB' and pointdata.GetArray('RGBA')):
+            continue
+        values = np.column_stack([vertex[c] for c in components])
+        if arrayname in ('RGB', 'RGBA'):
+            values = values.astype(np.uint8)
+        else:
+            values = values.astype(np.float32)
+        array = numpy_to_vtk(values, deep=1)
+        array.SetName(arrayname)
+        if arrayname == 'Normals':
+            pointdata.SetNormals(array)
+        elif arrayname == 'TCoords':
+            pointdata.SetTCoords(array)
+        else:
+            pointdata.SetScalars(array)
+
+    return polydata
+
+
+class _vtkNumpyMeshReader(vtkAlgorithm.VTKPythonAlgorithmBase):
+
+    """Common pipeline plumbing for the numpy mesh readers"""
+
+    _read = None
+    _signature = None
+    _fallback_class = None
+
+    def __init__(self):
+        self.FileName = None
+        self._fallback = None
+        vtkAlgorithm.VTKPythonAlgorithmBase.__init__(self, nInputPorts=0, nOutputPorts=1,
+                                                     outputType='vtkPolyData')
+
+    def SetFileName(self, filename):
+        if filename == self.FileName:
+            return
+        self.FileName = filename
+        self.Modified()
+
+    def GetFileName(self):
+        return self.FileName
+
+    def CanReadFile(self, filename):
+        try:
+            with open(filename, 'rb') as f:
+                header = f.read(1024)
+                f.seek(0, 2)
+                return self._signature(header, f.tell())
+        except (IOError, OSError):
+            return False
+
+    def GetOutput(self):
+        return self.GetOutputDataObject(0)
+
+    def FillOutputPortInformation(self, port, info):
+        info.Set(vtk.vtkDataObject.DATA_TYPE_NAME(), "vtkPolyData")
+        return 1
+
+    def IsFastPath(self):
+        """False if the last file was read by the stock VTK reader"""
+        return self._fallback is None
+
+    def RequestData(self, request, inInfo, outInfoVec):
+        output = vtk.vtkPolyData.GetData(outInfoVec, 0)
+        self._fallback = None
+
+        try:
+            polydata = self._read(self.FileName)
+        except _FallbackError:
+            self._fallback = self._fallback_class()
+            self._fallback.SetFileName(self.FileName)
+            self._fallback.Update()
+            polydata = self._fallback.GetOutput()
+        except (IOError, OSError, ValueError, KeyError) as e:
+            vtk.vtkOutputWindow.GetInstance().DisplayErrorText(
+                "{0}: {1}: {2}".format(self.GetClassName(), self.FileName, e))
+            return 0
+
+        output.ShallowCopy(polydata)
+        return 1
+
+
+class vtkNumpySTLReader(_vtkNumpyMeshReader):
+
+    """Binary STL reader - ASCII files are read with vtkSTLReader"""
+
+    _read = staticmethod(ReadBinarySTL)
+    _fallback_class = vtk.vtkSTLReader
+    _signature = staticmethod(IsBinarySTLFile)
+
+    def GetClassName(self):
+        return "vtkNumpySTLReader"
+
+
+class vtkNumpyPLYReader(_vtkNumpyMeshReader):
+
+    """Binary PLY reader - other PLY files are read with vtkPLYReader"""
+
+    _read = staticmethod(ReadBinaryPLY)
+    _fallback_class = vtk.vtkPLYReader
+    _signature = staticmethod(IsBinaryPLYFile)
+
+    def GetClassName(self):
+        return "vtkNumpyPLYReader"
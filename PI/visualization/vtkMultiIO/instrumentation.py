@@ -0,0 +1,108 @@
+"""
+I/O instrumentation for vtkMultiImageReader and vtkMultiImageWriter.
+
+Every read or write produces an IOMetrics record describing which reader/writer class
+was chosen and how long format detection, header handling and the voxel I/O itself
+took.  Records are handed to any registered metrics observers and are also published
+as an ImageIOMetricsEvent through zope.event.
+"""
+
+import io
+import time
+from zope import event
+from PI.visualization.vtkMultiIO.events import ImageIOMetricsEvent
+
+
+def GetImageDataSize(image):
+    """Returns the size, in bytes, of the scalars held by a vtkImageData"""
+    if image is None:
+        return 0
+    return image.GetNumberOfPoints() * image.GetScalarSize() * image.GetNumberOfScalarComponents()
+
+
+class IOMetrics(object):
+
+    """Timings (in seconds) and sizes recorded for a single image read or write"""
+
+    def __init__(self, operation, filename=None):
+        self.operation = operation          # 'read' or 'write'
+        self.filename = filename
+        self.classname = None               # reader or writer class that was chosen
+        self.detection_time = 0.0           # choosing a reader/writer for the file
+        self.header_time = 0.0              # parsing or preparing header information
+        self.io_time = 0.0                  # reading or writing the voxel data
+        self.bytes = 0                      # voxel bytes read or written
+
+    def GetWallTime(self):
+        return self.detection_time + self.header_time + self.io_time
+
+    def GetThroughput(self):
+        """Returns voxel I/O throughput in MB/s"""
+        if self.io_time <= 0:
+            return 0.0
+        return self.bytes / (1024.0 * 1024.0) / self.io_time
+
+    def AsDict(self):
+        return {'operation': self.operation,
+                'filename': self.filename,
+                'classname': self.classname,
+                'detection_time': self.detection_time,
+                'header_time': self.header_time,
+                'io_time': self.io_time,
+                'wall_time': self.GetWallTime(),
+                'bytes': self.bytes,
+                'throughput': self.GetThroughput()}
+
+    def __str__(self):
+        s = io.StringIO()
+        s.write(u'{0} {1} ({2}):\n'.format(self.operation, self.filename, self.classname))
+        s.write(u'\tdetection: {0:.4f}s header: {1:.4f}s i/o: {2:.4f}s\n'.format(
+            self.detection_time, self.header_time, self.io_time))
+        s.write(u'\t{0} bytes, {1:.1f} MB/s\n'.format(self.bytes, self.GetThroughput()))
+        return s.getvalue()
+
+
+class Stopwatch(object):
+
+    """Context manager that adds the elapsed time of its block to an IOMetrics attribute"""
+
+    def __init__(self, metrics, attribute):
+        self._metrics = metrics
+        self._attribute = attribute
+
+    def __enter__(self):
+        self._start = time.perf_counter()
+        return self
+
+    def __exit__(self, *args):
+        if self._metrics is not None:
+            elapsed = time.perf_counter() - self._start
+            setattr(self._metrics, self._attribute,
+                    getattr(self._metrics, self._attribute) + elapsed)
+
+
+class IOMetricsObservers(object):
+
+    """Keeps track of metrics callbacks and publishes completed IOMetrics records"""
+
+    def __init__(self):
+        self._callbacks = {}
+        self._next_id = 0
+        self._last_metrics = None
+
+    def AddObserver(self, callback):
+        self._next_id += 1
+        self._callbacks[self._next_id] = callback
+        return self._next_id
+
+    def RemoveObserver(self, handle):
+        self._callbacks.pop(handle, None)
+
+    def GetLastMetrics(self):
+        return self._last_metrics
+
+    def Notify(self, metrics):
+        self._last_metrics = metrics
+        for callback in list(self._callbacks.values()):
+            callback(metrics)
+        event.notify(ImageIOMetricsEvent(metrics))
@@ -108,3 +108,36 @@ class IvtkImageWriter(IProgress, IDimensionInformation, IImageInformation):
 
     def GetFileExtensions():
         """Returns file extensions for writer"""
+
+##########################################################################
+
+
+class IIOBackend(interface.Interface):
+
+    """
+    Interface for the storage that readers and writers read from and write to - local
+    files, memory maps, in-memory buffers etc.  Paths are whatever the backend uses to
+    name its files.
+    """
+
+    def Exists(path):
+        """
+        Returns True if `path` exists
+        """
+
+    def GetSize(path):
+        """
+        Returns the size of `path` in bytes
+        """
+
+    def Open(path, mode='rb'):
+        """
+        Open `path` for binary reading ('rb') or writing ('wb') and return a file-like
+        object that can be used as a context manager
+        """
+
+    def ReadRanges(path, ranges):
+        """
+        Read a list of (offset, length) byte ranges from `path` and return a list of
+        bytes objects, one per range.  Raises IOError if a range runs past the end.
+        """
@@ -0,0 +1,231 @@
+"""
+Pluggable I/O backends for the Python readers and writers.
+
+A backend provides the few file operations the readers and writers need - opening a
+file, checking that it exists, its size and reading byte ranges - so the storage behind
+them can be chosen per reader/writer:
+
+    FileBackend     plain buffered files, ranges read with pread() where available
+    MMapBackend     ranges sliced out of a memory map of the file
+    MemoryBackend   named in-memory byte buffers, e.g. for tests or for data
+                    arriving from a socket - nothing touches the disk
+    BatchedBackend  submits the ranges of a request concurrently to a thread pool
+                    (and can hand back futures) on top of another backend
+
+Readers and writers that have no backend of their own use GetDefaultBackend().
+"""
+
+import concurrent.futures
+import io
+import mmap
+import os
+import threading
+from zope.interface import implementer
+from PI.visualization.vtkMultiIO import interfaces
+
+
+def _PRead(f, length, offset):
+    """Read `length` bytes at `offset` from an open file - without moving a shared file
+    position when the platform has pread()"""
+    if hasattr(os, 'pread'):
+        chunks = []
+        while length > 0:
+            block = os.pread(f.fileno(), length, offset)
+            if not block:
+                break
+            chunks.append(block)
+            length -= len(block)
+            offset += len(block)
+        data = b''.join(chunks)
+    else:
+        f.seek(offset)
+        data = f.read(length)
+        length -= len(data)
+    if length:
+        raise IOError("{0}: premature end of file at offset {1}".format(f.name, offset))
+    return data
+
+
+def _CheckMode(mode):
+    if mode not in ('rb', 'wb'):
+        raise ValueError("Unsupported mode '{0}' - use 'rb' or 'wb'".format(mode))
+
+
+@implementer(interfaces.IIOBackend)
+class FileBackend(object):
+
+    """Plain buffered files on a local (or mounted) file system"""
+
+    def __init__(self, buffering=-1):
+        self.buffering = buffering
+
+    def Exists(self, path):
+        return os.path.exists(path)
+
+    def GetSize(self, path):
+        return os.path.getsize(path)
+
+    def Open(self, path, mode='rb'):
+        _CheckMode(mode)
+        return open(path, mode, buffering=self.buffering)
+
+    def ReadRanges(self, path, ranges):
+        with open(path, 'rb', buffering=0) as f:
+            return [_PRead(f, length, offset) for offset, length in ranges]
+
+
+@implementer(interfaces.IIOBackend)
+class MMapBackend(FileBackend):
+
+    """Byte ranges are sliced out of a read-only memory map of the file; Open() returns
+    plain files"""
+
+    def ReadRanges(self, path, ranges):
+        ranges = list(ranges)
+        if self.GetSize(path) == 0:
+            # empty files can't be mapped
+            return FileBackend.ReadRanges(self, path, ranges)
+        with open(path, 'rb') as f, mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as m:
+            data = []
+            for offset, length in ranges:
+                if offset + length > len(m):
+                    raise IOError("{0}: premature end of file at offset {1}".format(
+                        path, len(m)))
+                data.append(m[offset:offset + length])
+            return data
+
+
+class _MemoryFile(io.BytesIO):
+
+    """A writable in-memory file that stores its contents in a MemoryBackend on close"""
+
+    def __init__(self, backend, path):
+        io.BytesIO.__init__(self)
+        self.name = path
+        self._backend = backend
+
+    def close(self):
+        if not self.closed:
+            self._backend.SetData(self.name, self.getvalue())
+        io.BytesIO.close(self)
+
+
+@implementer(interfaces.IIOBackend)
+class MemoryBackend(object):
+
+    """Named in-memory byte buffers standing in for files"""
+
+    def __init__(self, files=None):
+        self._files = {}
+        self._lock = threading.Lock()
+        for path, data in (files or {}).items():
+            self.SetData(path, data)
+
+    def SetData(self, path, data):
+        """Store `data` (any bytes-like object) as the contents of `path`"""
+        with self._lock:
+            self._files[path] = bytes(data)
+
+    def GetData(self, path):
+        with self._lock:
+            try:
+                return self._files[path]
+            except KeyError:
+                raise IOError("No such file: '{0}'".format(path))
+
+    def Remove(self, path):
+        with self._lock:
+            self._files.pop(path, None)
+
+    def GetFileNames(self):
+        with self._lock:
+            return sorted(self._files)
+
+    def Exists(self, path):
+        with self._lock:
+            return path in self._files
+
+    def GetSize(self, path):
+        return len(self.GetData(path))
+
+    def Open(self, path, mode='rb'):
+        _CheckMode(mode)
+        if mode == 'wb':
+            return _MemoryFile(self, path)
+        f = io.BytesIO(self.GetData(path))
+        f.name = path
+        return f
+
+    def ReadRanges(self, path, ranges):
+        data = self.GetData(path)
+        result = []
+        for offset, length in ranges:
+            if offset + length > len(data):
+                raise IOError("{0}: premature end of file at offset {1}".format(
+                    path, len(data)))
+            result.append(data[offset:offset + length])
+        return result
+
+
+@implementer(interfaces.IIOBackend)
+class BatchedBackend(object):
+
+    """
+    Issues the ranges of each request concurrently from a pool of threads, on top of
+    another backend (a FileBackend by default).  SubmitRanges() returns futures so
+    callers can overlap their own work with the reads.
+    """
+
+    def __init__(self, backend=None, max_workers=None):
+        self._backend = backend or FileBackend()
+        self._max_workers = max_workers or min(32, (os.cpu_count() or 1) * 4)
+        self._executor = None
+        self._lock = threading.Lock()
+
+    def _GetExecutor(self):
+        with self._lock:
+            if self._executor is None:
+                self._executor = concurrent.futures.ThreadPoolExecutor(
+                    max_workers=self._max_workers)
+            return self._executor
+
+    def Exists(self, path):
+        return self._backend.Exists(path)
+
+    def GetSize(self, path):
+        return self._backend.GetSize(path)
+
+    def Open(self, path, mode='rb'):
+        return self._backend.Open(path, mode)
+
+    def SubmitRanges(self, path, ranges):
+        """Returns one future per range, each resolving to the bytes read"""
+        executor = self._GetExecutor()
+        return [executor.submit(lambda r: self._backend.ReadRanges(path, [r])[0], r)
+                for r in ranges]
+
+    def ReadRanges(self, path, ranges):
+        ranges = list(ranges)
+        if len(ranges) < 2:
+            return self._backend.ReadRanges(path, ranges)
+        return [future.result() for future in self.SubmitRanges(path, ranges)]
+
+    def Close(self):
+        """Shut down the thread pool"""
+        with self._lock:
+            if self._executor is not None:
+                self._executor.shutdown()
+                self._executor = None
+
+
+_default_backend = FileBackend()
+
+
+def GetDefaultBackend():
+    return _default_backend
+
+
+def SetDefaultBackend(backend):
+    """Set the backend used by readers and writers that haven't been given one"""
+    global _default_backend
+    _default_backend = backend if backend is not None else FileBackend()
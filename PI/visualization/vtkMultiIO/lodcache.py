@@ -0,0 +1,133 @@
+"""
+On-disk cache of decimated meshes.
+
+MeshLODCache keeps coarse versions of large meshes as .vtp files, named after a hash of
+the source file's path, size and modification time and the target triangle count, so
+that a mesh that has been decimated once - by any process - can later be shown without
+reading the full resolution file.  See vtkMultiPolyDataReader.SetLODTargetSize().
+"""
+
+import hashlib
+import logging
+import os
+import tempfile
+import vtk
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_CACHE_DIRECTORY = os.path.join(tempfile.gettempdir(), 'PI-mesh-lod')
+
+
+def HashFile(filename):
+    """
+    Returns a digest identifying the current version of a file - the MD5 of its absolute
+    path, size and modification time.  Only a stat() is needed, however large the file.
+    """
+    st = os.stat(filename)
+    key = '{0}\0{1}\0{2}'.format(os.path.abspath(filename), st.st_size, st.st_mtime_ns)
+    return hashlib.md5(key.encode('utf-8', 'surrogateescape')).hexdigest()
+
+
+def Decimate(polydata, target):
+    """Returns `polydata` reduced to about `target` triangles with vtkQuadricDecimation"""
+
+    triangles = vtk.vtkTriangleFilter()
+    triangles.SetInputData(polydata)
+    triangles.Update()
+    mesh = triangles.GetOutput()
+
+    count = mesh.GetNumberOfPolys()
+    if count <= target:
+        return mesh
+
+    decimate = vtk.vtkQuadricDecimation()
+    decimate.SetInputData(mesh)
+    decimate.SetTargetReduction(1.0 - float(target) / count)
+    decimate.Update()
+
+    output = vtk.vtkPolyData()
+    output.ShallowCopy(decimate.GetOutput())
+    return output
+
+
+class MeshLODCache(object):
+
+    """Decimated meshes stored as .vtp files in `directory`"""
+
+    def __init__(self, directory=None):
+        self._directory = directory or DEFAULT_CACHE_DIRECTORY
+
+    def GetDirectory(self):
+        return self._directory
+
+    def GetCacheFileName(self, filename, target):
+        return os.path.join(self._directory, '{0}-{1}.vtp'.format(HashFile(filename), target))
+
+    def Get(self, filename, target):
+        """Returns the cached level of `filename` for `target` triangles, or None"""
+
+        path = self.GetCacheFileName(filename, target)
+        if not os.path.exists(path):
+            return None
+
+        reader = vtk.vtkXMLPolyDataReader()
+        reader.SetFileName(path)
+        reader.Update()
+        if reader.GetErrorCode():
+            logger.warning("Discarding unreadable LOD cache file {0}".format(path))
+            return None
+        return reader.GetOutput()
+
+    def Put(self, filename, target, polydata):
+        """Store a decimated level of `filename` in the cache"""
+
+        path = self.GetCacheFileName(filename, target)
+        if not os.path.isdir(self._directory):
+            os.makedirs(self._directory, exist_ok=True)
+
+        # write under a temporary name so other processes never see a partial file
+        fd, temp = tempfile.mkstemp(suffix='.vtp', dir=self._directory)
+        os.close(fd)
+        try:
+            writer = vtk.vtkXMLPolyDataWriter()
+            writer.SetFileName(temp)
+            writer.SetInputData(polydata)
+            writer.SetDataModeToAppended()
+            writer.EncodeAppendedDataOff()
+            writer.Write()
+            if writer.GetErrorCode():
+                raise OSError(vtk.vtkErrorCode.GetStringFromErrorCode(writer.GetErrorCode()))
+            os.replace(temp, path)
+        except OSError as e:
+            logger.error("Unable to cache {0}: {1}".format(path, e))
+            if os.path.exists(temp):
+                os.remove(temp)
+
+    def GetLevel(self, filename, target, reader):
+        """
+        Returns the level of `filename` for `target` triangles - from the cache if
+        possible, otherwise by updating `reader` (which reads `filename` at full
+        resolution), decimating and caching the result.  Meshes that are already
+        small enough are returned as they are, and not cached.
+        """
+
+        polydata = self.Get(filename, target)
+        if polydata is not None:
+            return polydata
+
+        reader.Update()
+        full = reader.GetOutput()
+        if full.GetNumberOfCells() <= target:
+            return full
+
+        polydata = Decimate(full, target)
+        self.Put(filename, target, polydata)
+        return polydata
+
+    def Clear(self):
+        """Remove every cached level"""
+        if not os.path.isdir(self._directory):
+            return
+        for name in os.listdir(self._directory):
+            if name.endswith('.vtp'):
+                os.remove(os.path.join(self._directory, name))
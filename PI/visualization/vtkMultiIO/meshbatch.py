@@ -0,0 +1,143 @@
+"""
+Batch loading of surface meshes.
+
+LoadMeshes() reads a list of geometry files (anything vtkMultiPolyDataReader can read)
+from a pool of threads - VTK readers release the GIL while they read - or, optionally,
+a pool of processes.  It returns one vtkPolyData per file or, with merge=True, a single
+appended vtkPolyData in which every point and cell carries the index of the mesh it
+came from in a MESH_ID_ARRAY array.
+
+A MeshLoadProgressEvent is published through zope.event as each mesh completes.
+"""
+
+import concurrent.futures
+import logging
+import os
+import vtk
+from zope import event
+from PI.visualization.vtkMultiIO.events import MeshLoadProgressEvent
+from PI.visualization.vtkMultiIO.vtkMultiPolyDataReader import vtkMultiPolyDataReader
+
+logger = logging.getLogger(__name__)
+
+MESH_ID_ARRAY = 'MeshId'
+
+
+def ReadMesh(filename):
+    """Read a single mesh and return it as a vtkPolyData detached from its reader"""
+
+    # VTK readers only log a missing file
+    if not os.path.exists(filename):
+        raise IOError("No such file: '{0}'".format(filename))
+
+    reader = vtkMultiPolyDataReader()
+    reader.SetFileName(filename)
+    reader.Update()
+
+    output = reader.GetOutput()
+    if output is None or not output.IsA('vtkPolyData'):
+        raise IOError("{0} does not contain polygonal data".format(filename))
+
+    polydata = vtk.vtkPolyData()
+    polydata.ShallowCopy(output)
+    return polydata
+
+
+def _ReadMeshAsString(filename):
+    # process pool worker - VTK objects can't be pickled, XML strings can
+    writer = vtk.vtkXMLPolyDataWriter()
+    writer.WriteToOutputStringOn()
+    writer.SetInputData(ReadMesh(filename))
+    writer.Write()
+    return writer.GetOutputString()
+
+
+def _MeshFromString(s):
+    reader = vtk.vtkXMLPolyDataReader()
+    reader.ReadFromInputStringOn()
+    reader.SetInputString(s)
+    reader.Update()
+    return reader.GetOutput()
+
+
+def AppendMeshes(meshes):
+    """
+    Append a list of vtkPolyData into one, adding point and cell MESH_ID_ARRAY arrays
+    holding each mesh's index in the list.  None entries are skipped.
+    """
+
+    append = vtk.vtkAppendPolyData()
+
+    for index, mesh in enumerate(meshes):
+        if mesh is None:
+            continue
+
+        tagged = vtk.vtkPolyData()
+        tagged.ShallowCopy(mesh)
+
+        for data, count in ((tagged.GetPointData(), tagged.GetNumberOfPoints()),
+                            (tagged.GetCellData(), tagged.GetNumberOfCells())):
+            ids = vtk.vtkIntArray()
+            ids.SetName(MESH_ID_ARRAY)
+            ids.SetNumberOfTuples(count)
+            ids.Fill(index)
+            data.AddArray(ids)
+
+        append.AddInputData(tagged)
+
+    if append.GetNumberOfInputConnections(0) == 0:
+        return vtk.vtkPolyData()
+
+    append.Update()
+    return append.GetOutput()
+
+
+def LoadMeshes(filenames, merge=False, max_workers=None, use_processes=False, progress=None):
+    """
+    Read every file in `filenames` concurrently.
+
+    Returns a list of vtkPolyData in the order of `filenames` (None for files that
+    could not be read, which are logged) or, if `merge` is True, the meshes appended
+    into a single vtkPolyData - see AppendMeshes().
+
+    `progress`, if given, is called as progress(fraction, filename) from the calling
+    thread as each mesh completes, in addition to the MeshLoadProgressEvent.
+    """
+
+    filenames = list(filenames)
+    meshes = [None] * len(filenames)
+
+    if max_workers is None:
+        max_workers = min(32, os.cpu_count() or 1)
+
+    if use_processes:
+        executor = concurrent.futures.ProcessPoolExecutor(max_workers=max_workers)
+        task = _ReadMeshAsString
+    else:
+        executor = concurrent.futures.ThreadPoolExecutor(max_workers=max_workers)
+        task = ReadMesh
+
+    with executor:
+        futures = dict((executor.submit(task, filename), index)
+                       for index, filename in enumerate(filenames))
+
+        for completed, future in enumerate(concurrent.futures.as_completed(futures), 1):
+            index = futures[future]
+            filename = filenames[index]
+            error = future.exception()
+
+            if error is None:
+                mesh = future.result()
+                meshes[index] = _MeshFromString(mesh) if use_processes else mesh
+            else:
+                logger.error("Unable to read {0}: {1}".format(filename, error))
+
+            e = MeshLoadProgressEvent(filename, completed, len(filenames), error)
+            event.notify(e)
+            if progress is not None:
+                progress(e.GetProgress(), filename)
+
+    if merge:
+        return AppendMeshes(meshes)
+
+    return meshes
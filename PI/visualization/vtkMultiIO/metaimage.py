@@ -0,0 +1,142 @@
+"""
+Header-only access to MetaImage (.mha/.mhd) files.
+
+ReadMetaImageHeader() reads a MetaImage file only as far as the ElementDataFile entry
+that ends its header - never into the pixel data of a .mha file - and caches the result
+per file (keyed on modification time and size).  Format detection, image geometry and
+DICOM keyword extraction all share the one parse.
+"""
+
+import collections
+import functools
+import os
+import re
+import vtk
+
+# largest header we are prepared to search for ElementDataFile
+_MAX_HEADER_SIZE = 1 << 20
+_BLOCK_SIZE = 65536
+
+# keys the first block of a MetaImage header holds
+_HEADER_KEYS = (b'ObjectType', b'NDims', b'ElementType')
+
+# MetaIO element types and the scalar types vtkMetaImageReader produces for them
+_SCALAR_TYPES = {'MET_CHAR': vtk.VTK_SIGNED_CHAR,
+                 'MET_UCHAR': vtk.VTK_UNSIGNED_CHAR,
+                 'MET_SHORT': vtk.VTK_SHORT,
+                 'MET_USHORT': vtk.VTK_UNSIGNED_SHORT,
+                 'MET_INT': vtk.VTK_INT,
+                 'MET_UINT': vtk.VTK_UNSIGNED_INT,
+                 'MET_LONG': vtk.VTK_LONG,
+                 'MET_ULONG': vtk.VTK_UNSIGNED_LONG,
+                 'MET_FLOAT': vtk.VTK_FLOAT,
+                 'MET_DOUBLE': vtk.VTK_DOUBLE}
+
+
+def EscapeValue(value):
+    """A header entry ends at the end of its line, so line breaks (and the backslash
+    used to escape them) are written as backslash escapes"""
+    return str(value).replace('\\', '\\\\').replace('\n', '\\n').replace('\r', '\\r')
+
+
+def UnescapeValue(value):
+    """Reverses EscapeValue()"""
+    return re.sub(r'\\(.)', lambda m: {'n': '\n', 'r': '\r'}.get(m.group(1), m.group(1)), value)
+
+
+def _FindHeaderEnd(data, start):
+    """
+    Searches `data` from `start` for the ElementDataFile line that ends the header.
+    Returns (offset just past that line or -1, offset to resume the search from once
+    more data has been read)
+    """
+
+    pos = data.find(b'ElementDataFile', start)
+    while pos > 0 and data[pos - 1:pos] not in (b'\n', b'\r'):
+        pos = data.find(b'ElementDataFile', pos + 1)
+    if pos < 0:
+        # the data may end part way through the keyword
+        return -1, max(len(data) - len('ElementDataFile') + 1, start)
+    end = data.find(b'\n', pos)
+    if end < 0:
+        # the entry was found, but its line continues in the next block
+        return -1, pos
+    return end + 1, pos
+
+
+def _Floats(value, n, default):
+    values = [float(v) for v in (value or '').split()][:n]
+    return values + [default] * (n - len(values))
+
+
+@functools.lru_cache(maxsize=256)
+def _ReadMetaImageHeader(filename, mtime, size):
+
+    with open(filename, 'rb') as f:
+        data = bytearray(f.read(_BLOCK_SIZE))
+        # anything else isn't searched all the way to _MAX_HEADER_SIZE
+        if not any(key in data for key in _HEADER_KEYS):
+            raise IOError("{0} is not a MetaImage file".format(filename))
+        end, start = _FindHeaderEnd(data, 0)
+        while end < 0:
+            block = f.read(_BLOCK_SIZE)
+            if not block or len(data) > _MAX_HEADER_SIZE:
+                raise IOError("{0}: no ElementDataFile entry found".format(filename))
+            data += block
+            end, start = _FindHeaderEnd(data, start)
+
+    keywords = collections.OrderedDict()
+    for line in data[:end].decode('latin-1').splitlines():
+        if '=' in line:
+            key, value = [s.strip() for s in line.split('=', 1)]
+            keywords[key] = value
+
+    ndims = int(keywords.get('NDims', 3))
+    dimensions = [int(v) for v in keywords.get('DimSize', '').split()][:3]
+    dimensions += [1] * (3 - len(dimensions))
+
+    origin = keywords.get('Offset', keywords.get('Position', keywords.get('Origin')))
+
+    return {'filename': filename,
+            'header_size': end,
+            'ndims': ndims,
+            'dimensions': tuple(dimensions),
+            'extent': (0, dimensions[0] - 1, 0, dimensions[1] - 1, 0, dimensions[2] - 1),
+            'spacing': tuple(_Floats(keywords.get('ElementSpacing'), 3, 1.0)),
+            'origin': tuple(_Floats(origin, 3, 0.0)),
+            'scalar_type': _SCALAR_TYPES.get(keywords.get('ElementType')),
+            'components': int(keywords.get('ElementNumberOfChannels', 1)),
+            'compressed': keywords.get('CompressedData', 'False').lower() == 'true',
+            'element_data_file': keywords.get('ElementDataFile'),
+            'keywords': keywords,
+            'dicom': collections.OrderedDict(
+                (k, UnescapeValue(v)) for k, v in keywords.items() if k.startswith('dicom_'))}
+
+
+def ReadMetaImageHeader(filename):
+    """
+    Returns a dictionary describing a MetaImage file:
+
+        filename, header_size, ndims, dimensions, extent, spacing, origin,
+        scalar_type, components, compressed, element_data_file,
+        keywords (every header entry, in order, as strings),
+        dicom (the dicom_* keywords)
+
+    The result is cached and shared between callers - don't modify it.  Raises IOError
+    if no header could be found.
+    """
+
+    st = os.stat(filename)
+    return _ReadMetaImageHeader(filename, st.st_mtime_ns, st.st_size)
+
+
+def ClearHeaderCache():
+    _ReadMetaImageHeader.cache_clear()
+
+
+def IsMetaImageFile(filename):
+    """True if `filename` has a MetaImage header with an ElementType"""
+    try:
+        return 'ElementType' in ReadMetaImageHeader(filename)['keywords']
+    except (IOError, OSError, ValueError):
+        return False
@@ -0,0 +1,269 @@
+"""
+Scalar type conversion for image writers.
+
+Writers declare the sample depths they can store with the DEPTH_* capability bits, and
+UNSIGNED_ONLY if they only store unsigned integers (see vtkImageWriterBase).
+GetTargetScalarType() picks the scalar type an image has to be converted to for a
+writer, and ConvertImage() converts it with one of these policies:
+
+    CAST     plain C-style conversion - values outside the target range wrap
+    CLAMP    values are clipped to the target range
+    RESCALE  the display window (DICOM WindowCenter/WindowWidth, or the image's
+             scalar range) is mapped linearly onto the whole target range
+
+Floating point values converted to integers are rounded to the nearest integer, and NaN
+becomes 0, with either CLAMP or RESCALE.
+
+Conversion is vectorized with numpy and proceeds one z-slice at a time, so temporaries
+never exceed a slice; slices are spread over a thread pool (numpy releases the GIL).
+vtkImageScalarConvert does the same in a pipeline, converting only the extent requested
+downstream - a streamed writer never holds more than a slab of converted scalars.
+"""
+
+import concurrent.futures
+import os
+import numpy as np
+import vtk
+from vtk.util import vtkAlgorithm
+from vtk.util.numpy_support import get_vtk_to_numpy_typemap
+from vtk.util.numpy_support import numpy_to_vtk, vtk_to_numpy
+from PI.visualization.vtkMultiIO import vtkImageWriterBase
+
+NONE = 'none'
+CAST = 'cast'
+CLAMP = 'clamp'
+RESCALE = 'rescale'
+
+POLICIES = (NONE, CAST, CLAMP, RESCALE)
+
+_DEPTHS = ((1, vtkImageWriterBase.DEPTH_8),
+           (2, vtkImageWriterBase.DEPTH_16),
+           (4, vtkImageWriterBase.DEPTH_32),
+           (8, vtkImageWriterBase.DEPTH_64))
+
+_INTEGER_TYPES = {(1, False): vtk.VTK_UNSIGNED_CHAR, (1, True): vtk.VTK_SIGNED_CHAR,
+                  (2, False): vtk.VTK_UNSIGNED_SHORT, (2, True): vtk.VTK_SHORT,
+                  (4, False): vtk.VTK_UNSIGNED_INT, (4, True): vtk.VTK_INT,
+                  (8, False): vtk.VTK_UNSIGNED_LONG_LONG, (8, True): vtk.VTK_LONG_LONG}
+
+_FLOAT_TYPES = {4: vtk.VTK_FLOAT, 8: vtk.VTK_DOUBLE}
+
+
+def GetNumpyType(scalar_type):
+    """Returns the numpy dtype of a VTK scalar type"""
+    return np.dtype(get_vtk_to_numpy_typemap()[scalar_type])
+
+
+def GetTargetScalarType(scalar_type, capabilities):
+    """
+    Returns the VTK scalar type images of `scalar_type` must be converted to for a
+    writer with `capabilities`, or None if the writer can store them as they are (or
+    declares no depths at all).  The nearest supported depth below the input's is
+    preferred over a wider one.
+    """
+
+    depths = [(size, bit) for size, bit in _DEPTHS if capabilities & bit]
+    if not depths:
+        return None
+
+    dtype = GetNumpyType(scalar_type)
+    unsigned_only = capabilities & vtkImageWriterBase.UNSIGNED_ONLY
+    integer = np.issubdtype(dtype, np.integer)
+    signed = not integer or np.issubdtype(dtype, np.signedinteger)
+
+    if dtype.itemsize in [size for size, _ in depths] and \
+            not (unsigned_only and signed):
+        return None
+
+    narrower = [size for size, _ in depths if size <= dtype.itemsize]
+    size = max(narrower) if narrower else min(size for size, _ in depths)
+
+    if unsigned_only:
+        return _INTEGER_TYPES[(size, False)]
+    if not integer and size in _FLOAT_TYPES:
+        return _FLOAT_TYPES[size]
+    return _INTEGER_TYPES[(size, signed)]
+
+
+def GetDICOMWindow(ds):
+    """Returns (center, width) from a DICOM dataset's first window, or None"""
+
+    if ds is None or 'WindowCenter' not in ds or 'WindowWidth' not in ds:
+        return None
+    try:
+        center, width = ds.WindowCenter, ds.WindowWidth
+        # multi-valued for more than one window
+        if not isinstance(center, (str, bytes)) and hasattr(center, '__len__'):
+            center = center[0]
+        if not isinstance(width, (str, bytes)) and hasattr(width, '__len__'):
+            width = width[0]
+        center, width = float(center), float(width)
+    except (TypeError, ValueError, IndexError):
+        return None
+    if width <= 0:
+        return None
+    return center, width
+
+
+def GetRangeWindow(values):
+    """Returns the (center, width) window spanning the range of a numpy array"""
+
+    low, high = float(np.nanmin(values)), float(np.nanmax(values))
+    return (low + high) / 2.0, max(high - low, 1e-12)
+
+
+def _Min(dtype):
+    return np.iinfo(dtype).min if np.issubdtype(dtype, np.integer) else -np.inf
+
+
+def _Max(dtype):
+    return np.iinfo(dtype).max if np.issubdtype(dtype, np.integer) else np.inf
+
+
+def ConvertArray(values, dtype, policy, window=None, out=None):
+    """
+    Convert a numpy array to `dtype` with `policy`.  For RESCALE, `window` is the
+    (center, width) mapped onto the whole range of `dtype`; it is required.  Floating
+    point targets are never rescaled, only clamped.
+    """
+
+    dtype = np.dtype(dtype)
+    if out is None:
+        out = np.empty(values.shape, dtype)
+
+    if policy == CAST:
+        np.copyto(out, values, casting='unsafe')
+        return out
+
+    if np.issubdtype(dtype, np.integer):
+        info = np.iinfo(dtype)
+    else:
+        info = np.finfo(dtype)
+        if policy == RESCALE:
+            policy = CLAMP
+
+    if policy == CLAMP:
+        if np.issubdtype(dtype, np.integer) and not np.issubdtype(values.dtype, np.integer):
+            _CastRounded(np.rint(values), info, out)
+        else:
+            np.clip(values, max(info.min, _Min(values.dtype)),
+                    min(info.max, _Max(values.dtype)), out=out, casting='unsafe')
+    elif policy == RESCALE:
+        center, width = window
+        low = center - width / 2.0
+        scale = (float(info.max) - float(info.min)) / width
+        temp = (values - low) * scale + float(info.min)
+        np.rint(temp, out=temp)
+        _CastRounded(temp, info, out)
+    else:
+        raise ValueError("Unknown scalar conversion policy '{0}'".format(policy))
+    return out
+
+
+def _CastRounded(temp, info, out):
+    # `temp` holds rounded floats - NaN would cast to an arbitrary integer
+    np.clip(temp, info.min, info.max, out=temp)
+    np.copyto(temp, 0, where=np.isnan(temp))
+    np.copyto(out, temp, casting='unsafe')
+
+
+def ConvertImage(image, scalar_type, policy, window=None, max_workers=None):
+    """
+    Returns a copy of `image` whose scalars are converted to `scalar_type` with `policy`.
+    For RESCALE, `window` defaults to the image's scalar range.
+    """
+
+    scalars = image.GetPointData().GetScalars()
+    nx, ny, nz = image.GetDimensions()
+    values = vtk_to_numpy(scalars).reshape(nz, -1)
+
+    if policy == RESCALE and window is None:
+        window = GetRangeWindow(values)
+    converted = _ConvertSlices(values, GetNumpyType(scalar_type), policy, window, max_workers)
+
+    array = numpy_to_vtk(converted.reshape(-1, scalars.GetNumberOfComponents()),
+                         deep=0, array_type=scalar_type)
+    array.SetName(scalars.GetName())
+
+    output = vtk.vtkImageData()
+    output.CopyStructure(image)
+    output.GetPointData().SetScalars(array)
+    return output
+
+
+def _ConvertSlices(values, dtype, policy, window, max_workers=None):
+    """Convert `values`, indexed by z first, one slice per thread pool task"""
+
+    nz = len(values)
+    converted = np.empty(values.shape, dtype)
+
+    def convert(z):
+        ConvertArray(values[z], dtype, policy, window, out=converted[z])
+
+    if max_workers is None:
+        max_workers = min(nz, os.cpu_count() or 1)
+    if max_workers > 1:
+        with concurrent.futures.ThreadPoolExecutor(max_workers=max_workers) as executor:
+            list(executor.map(convert, range(nz)))
+    else:
+        for z in range(nz):
+            convert(z)
+    return converted
+
+
+class vtkImageScalarConvert(vtkAlgorithm.VTKPythonAlgorithmBase):
+
+    """
+    Converts the scalars of its input to another scalar type with one of the policies,
+    for just the extent requested downstream.  For RESCALE, a window must be given - a
+    slab's own range would map each slab differently.
+    """
+
+    def __init__(self, scalar_type, policy, window=None, max_workers=None):
+        if policy == RESCALE and window is None:
+            raise ValueError("RESCALE needs a window")
+        self.ScalarType = scalar_type
+        self.Policy = policy
+        self.Window = window
+        self.MaxWorkers = max_workers
+        vtkAlgorithm.VTKPythonAlgorithmBase.__init__(self, nInputPorts=1, inputType='vtkImageData',
+                                                     nOutputPorts=1, outputType='vtkImageData')
+
+    def GetOutput(self):
+        return self.GetOutputDataObject(0)
+
+    def RequestInformation(self, request, inInfo, outInfo):
+        # everything else is copied from the input
+        vtk.vtkDataObject.SetPointDataActiveScalarInfo(
+            outInfo.GetInformationObject(0), self.ScalarType, -1)
+        return 1
+
+    def RequestData(self, request, inInfo, outInfoVec):
+
+        outInfo = outInfoVec.GetInformationObject(0)
+        input = vtk.vtkImageData.GetData(inInfo[0])
+        output = vtk.vtkImageData.GetData(outInfo)
+
+        extent = outInfo.Get(vtk.vtkStreamingDemandDrivenPipeline.UPDATE_EXTENT())
+        if extent is None:
+            extent = input.GetExtent()
+        scalars = input.GetPointData().GetScalars()
+
+        # the input may cover more than was requested - convert only the request
+        e = input.GetExtent()
+        values = vtk_to_numpy(scalars).reshape(
+            e[5] - e[4] + 1, e[3] - e[2] + 1, e[1] - e[0] + 1, -1)
+        values = values[extent[4] - e[4]:extent[5] - e[4] + 1,
+                        extent[2] - e[2]:extent[3] - e[2] + 1,
+                        extent[0] - e[0]:extent[1] - e[0] + 1]
+        converted = _ConvertSlices(values, GetNumpyType(self.ScalarType), self.Policy,
+                                   self.Window, self.MaxWorkers)
+
+        array = numpy_to_vtk(converted.reshape(-1, scalars.GetNumberOfComponents()),
+                             deep=0, array_type=self.ScalarType)
+        array.SetName(scalars.GetName())
+
+        output.CopyStructure(input)
+        output.SetExtent(extent)
+        output.GetPointData().SetScalars(array)
+        return 1
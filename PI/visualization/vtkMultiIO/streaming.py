@@ -0,0 +1,355 @@
+"""
+Streaming (slab by slab) image output.
+
+ImageSlabStream requests an upstream pipeline in z-slabs, so that images larger than
+memory can be written with only one slab resident at a time.  The header builders in
+this module reproduce what the corresponding VTK/vtkMultiIO writers emit, so files
+written by streaming can't be told apart from those written in one piece.
+"""
+
+import os
+import sys
+import zlib
+import logging
+import numpy as np
+import vtk
+from vtk.util.numpy_support import get_numpy_array_type, vtk_to_numpy
+from PI.visualization.vtkMultiIO import exceptions
+from PI.visualization.vtkMultiIO import metaimage
+
+logger = logging.getLogger(__name__)
+
+# keywords vtkVFFWriter computes itself
+VFF_RESERVED_KEYWORDS = ('size', 'origin', 'aspect', 'format', 'type',
+                         'bands', 'bits', 'spacing', 'rank', 'rawsize')
+
+_META_ELEMENT_TYPES = {vtk.VTK_CHAR: 'MET_CHAR',
+                       vtk.VTK_SIGNED_CHAR: 'MET_CHAR',
+                       vtk.VTK_UNSIGNED_CHAR: 'MET_UCHAR',
+                       vtk.VTK_SHORT: 'MET_SHORT',
+                       vtk.VTK_UNSIGNED_SHORT: 'MET_USHORT',
+                       vtk.VTK_INT: 'MET_INT',
+                       vtk.VTK_UNSIGNED_INT: 'MET_UINT',
+                       vtk.VTK_LONG: 'MET_LONG',
+                       vtk.VTK_UNSIGNED_LONG: 'MET_ULONG',
+                       vtk.VTK_LONG_LONG: 'MET_LONG_LONG',
+                       vtk.VTK_UNSIGNED_LONG_LONG: 'MET_ULONG_LONG',
+                       vtk.VTK_FLOAT: 'MET_FLOAT',
+                       vtk.VTK_DOUBLE: 'MET_DOUBLE'}
+
+_LEGACY_VTK_TYPES = {vtk.VTK_CHAR: 'char',
+                     vtk.VTK_SIGNED_CHAR: 'char',
+                     vtk.VTK_UNSIGNED_CHAR: 'unsigned_char',
+                     vtk.VTK_SHORT: 'short',
+                     vtk.VTK_UNSIGNED_SHORT: 'unsigned_short',
+                     vtk.VTK_INT: 'int',
+                     vtk.VTK_UNSIGNED_INT: 'unsigned_int',
+                     vtk.VTK_LONG: 'long',
+                     vtk.VTK_UNSIGNED_LONG: 'unsigned_long',
+                     vtk.VTK_LONG_LONG: 'vtktypeint64',
+                     vtk.VTK_UNSIGNED_LONG_LONG: 'vtktypeuint64',
+                     vtk.VTK_FLOAT: 'float',
+                     vtk.VTK_DOUBLE: 'double'}
+
+
+def _FormatNumber(value):
+    # matches the default formatting of a double written to a C++ ostream
+    return '{0:g}'.format(value)
+
+
+class ImageSlabStream(object):
+
+    """
+    Pulls an image from an upstream vtkAlgorithmOutput one z-slab at a time.
+
+    Iterating yields (zmin, zmax, array) tuples, where array has shape
+    (nz, ny, nx, components) and covers exactly the requested slab.  An array is only
+    valid until the next slab is requested.
+    """
+
+    def __init__(self, algorithm_output, slab_size):
+
+        self._producer = algorithm_output.GetProducer()
+        self._port = algorithm_output.GetIndex()
+        self._slab_size = max(int(slab_size), 1)
+
+        self._producer.UpdateInformation()
+        info = self._producer.GetOutputInformation(self._port)
+        self._whole_extent = tuple(info.Get(vtk.vtkStreamingDemandDrivenPipeline.WHOLE_EXTENT()))
+
+        # the first slab tells us everything we need to know about the scalars
+        z0 = self._whole_extent[4]
+        self._first = (z0, min(z0 + self._slab_size - 1, self._whole_extent[5]))
+        image, arr = self._Fetch(*self._first)
+        self._first_array = arr
+
+        scalars = image.GetPointData().GetScalars()
+        self._spacing = image.GetSpacing()
+        self._origin = image.GetOrigin()
+        self._direction = (1.0, 0.0, 0.0, 0.0, 1.0, 0.0, 0.0, 0.0, 1.0)
+        if hasattr(image, 'GetDirectionMatrix'):
+            matrix = image.GetDirectionMatrix()
+            self._direction = tuple(matrix.GetElement(i, j) for i in range(3) for j in range(3))
+        self._scalar_type = scalars.GetDataType()
+        self._components = scalars.GetNumberOfComponents()
+        self._scalar_size = scalars.GetDataTypeSize()
+        self._array_name = scalars.GetName()
+
+    def _Fetch(self, zmin, zmax):
+
+        extent = list(self._whole_extent)
+        extent[4], extent[5] = zmin, zmax
+
+        request = vtk.vtkInformation()
+        request.Set(vtk.vtkStreamingDemandDrivenPipeline.UPDATE_EXTENT(), extent, 6)
+        requests = vtk.vtkInformationVector()
+        requests.SetInformationObject(self._port, request)
+        self._producer.Update(self._port, requests)
+
+        image = self._producer.GetOutputDataObject(self._port)
+        scalars = image.GetPointData().GetScalars() if image else None
+        if scalars is None:
+            raise exceptions.VTKNoImageError(
+                "Upstream pipeline produced no scalars for extent {0}".format(extent))
+
+        # producers are free to hand back more than was asked for - crop to the slab
+        e = image.GetExtent()
+        arr = vtk_to_numpy(scalars).reshape(
+            e[5] - e[4] + 1, e[3] - e[2] + 1, e[1] - e[0] + 1, -1)
+        arr = arr[zmin - e[4]:zmax - e[4] + 1,
+                  extent[2] - e[2]:extent[3] - e[2] + 1,
+                  extent[0] - e[0]:extent[1] - e[0] + 1]
+
+        return image, arr
+
+    def __iter__(self):
+
+        zmin, zmax = self._first
+        if self._first_array is not None:
+            arr, self._first_array = self._first_array, None
+        else:
+            arr = self._Fetch(zmin, zmax)[1]
+        yield zmin, zmax, arr
+
+        for z in range(zmax + 1, self._whole_extent[5] + 1, self._slab_size):
+            zmax = min(z + self._slab_size - 1, self._whole_extent[5])
+            yield z, zmax, self._Fetch(z, zmax)[1]
+
+    def GetNumberOfSlabs(self):
+        depth = self._whole_extent[5] - self._whole_extent[4] + 1
+        return (depth + self._slab_size - 1) // self._slab_size
+
+    def GetWholeExtent(self):
+        return self._whole_extent
+
+    def GetDimensions(self):
+        e = self._whole_extent
+        return (e[1] - e[0] + 1, e[3] - e[2] + 1, e[5] - e[4] + 1)
+
+    def GetSpacing(self):
+        return self._spacing
+
+    def GetOrigin(self):
+        return self._origin
+
+    def GetDirection(self):
+        """Returns the direction matrix, row by row"""
+        return self._direction
+
+    def GetScalarType(self):
+        return self._scalar_type
+
+    def GetScalarSize(self):
+        return self._scalar_size
+
+    def GetNumberOfScalarComponents(self):
+        return self._components
+
+    def GetArrayName(self):
+        return self._array_name
+
+    def GetDataType(self):
+        """Returns the numpy dtype of the scalars, in native byte order"""
+        return np.dtype(get_numpy_array_type(self._scalar_type))
+
+    def GetRawSize(self):
+        nx, ny, nz = self.GetDimensions()
+        return nx * ny * nz * self._scalar_size * self._components
+
+
+def WriteSlabs(f, stream, dtype=None, progress=None):
+    """
+    Write every slab of `stream` to the open binary file `f`, converting to `dtype`
+    (e.g. a byte-swapped dtype) on the way.  `progress`, if given, is called with the
+    completed fraction after each slab.
+    """
+
+    nslabs = stream.GetNumberOfSlabs()
+
+    for n, (zmin, zmax, arr) in enumerate(stream):
+        if dtype is not None and arr.dtype != dtype:
+            arr = arr.astype(dtype)
+        f.write(memoryview(np.ascontiguousarray(arr)).cast('B'))
+        if progress is not None:
+            progress(float(n + 1) / nslabs)
+
+
+def CompressSlabs(stream, level=2, progress=None):
+    """
+    Yields the zlib-compressed data of every slab of `stream`, as one continuous zlib
+    stream.  Level 2 is the level MetaIO compresses with.
+    """
+
+    compressor = zlib.compressobj(level)
+    nslabs = stream.GetNumberOfSlabs()
+
+    for n, (zmin, zmax, arr) in enumerate(stream):
+        data = compressor.compress(memoryview(np.ascontiguousarray(arr)).cast('B'))
+        if data:
+            yield data
+        if progress is not None:
+            progress(float(n + 1) / nslabs)
+
+    yield compressor.flush()
+
+
+def GetVFFDataType(stream):
+    """On-disk dtype used by vtkVFFWriter - only shorts and floats are stored big-endian"""
+
+    dtype = stream.GetDataType()
+    if sys.byteorder == 'little' and stream.GetScalarType() in (vtk.VTK_SHORT, vtk.VTK_FLOAT):
+        dtype = dtype.newbyteorder('>')
+    return dtype
+
+
+def GetVFFHeader(stream, keywords):
+    """Returns the header vtkVFFWriter would write for this image, as bytes"""
+
+    wExt = stream.GetWholeExtent()
+    width, height, depth = stream.GetDimensions()
+    spacing = stream.GetSpacing()
+    origin = stream.GetOrigin()
+
+    dimensionality = len([v for v in (width, height, depth) if v > 1])
+
+    # same origin adjustment as vtkVFFWriter::WriteFileHeader for a whole-extent write
+    o2 = origin[2] + spacing[2] * (wExt[2] - (wExt[4] - wExt[3]))
+
+    size = [width, height]
+    origins = [origin[0] / spacing[0], origin[1] / spacing[1]]
+    spacings = [spacing[0], spacing[1]]
+    if depth > 1:
+        size.append(depth)
+        origins.append(o2 / spacing[2])
+        spacings.append(spacing[2])
+
+    lines = ['ncaa',
+             'type=raster;',
+             'format=slice;',
+             'bands={0};'.format(stream.GetNumberOfScalarComponents()),
+             'rank={0};'.format(dimensionality),
+             'bits={0};'.format(stream.GetScalarSize() * 8),
+             'size={0};'.format(' '.join(str(v) for v in size)),
+             'rawsize={0};'.format(stream.GetRawSize()),
+             'origin={0};'.format(' '.join(_FormatNumber(v) for v in origins)),
+             'spacing={0};'.format(' '.join(_FormatNumber(v) for v in spacings))]
+
+    # additional keywords, in the (sorted) order the C++ writer's std::map keeps them
+    for key in sorted(keywords):
+        if key.startswith('hidden') or key in VFF_RESERVED_KEYWORDS:
+            continue
+        lines.append('{0}={1};'.format(key, keywords[key]))
+
+    lines.append('\f')
+
+    return ('\n'.join(lines) + '\n').encode('latin-1')
+
+
+def GetMetaImageHeader(stream, element_data_file, keywords=None, compressed_size=None):
+    """
+    Returns a MetaImage header, as vtkMetaImageWriter writes it, as bytes.  The data is
+    described as compressed when `compressed_size` is given.
+    """
+
+    e = stream.GetWholeExtent()
+    dims = stream.GetDimensions()
+    spacing = stream.GetSpacing()
+    origin = stream.GetOrigin()
+    direction = stream.GetDirection()
+
+    ndims = 3 if dims[2] > 1 else 2
+    # the offset is the world position of the first voxel of the whole extent
+    offset = [origin[i] + sum(direction[3 * i + j] * e[2 * j] * spacing[j] for j in range(3))
+              for i in range(ndims)]
+    matrix = [direction[3 * i + j] for i in range(ndims) for j in range(ndims)]
+
+    lines = ['ObjectType = Image',
+             'NDims = {0}'.format(ndims),
+             'BinaryData = True',
+             'BinaryDataByteOrderMSB = {0}'.format(sys.byteorder == 'big'),
+             'CompressedData = {0}'.format(compressed_size is not None)]
+
+    if compressed_size is not None:
+        lines.append('CompressedDataSize = {0}'.format(compressed_size))
+
+    lines += ['TransformMatrix = {0}'.format(' '.join(_FormatNumber(v) for v in matrix)),
+             'Offset = {0}'.format(' '.join(_FormatNumber(v) for v in offset)),
+             'CenterOfRotation = {0}'.format(' '.join(['0'] * ndims)),
+             'ElementSpacing = {0}'.format(' '.join(_FormatNumber(v) for v in spacing[:ndims])),
+             'DimSize = {0}'.format(' '.join(str(v) for v in dims[:ndims])),
+             'AnatomicalOrientation = {0}'.format('?' * ndims)]
+
+    if stream.GetNumberOfScalarComponents() > 1:
+        lines.append('ElementNumberOfChannels = {0}'.format(stream.GetNumberOfScalarComponents()))
+
+    lines.append('ElementType = {0}'.format(_META_ELEMENT_TYPES[stream.GetScalarType()]))
+
+    # ElementDataFile has to be the last header entry
+    for key in (keywords or {}):
+        lines.append('{0} = {1}'.format(key, metaimage.EscapeValue(keywords[key])))
+
+    lines.append('ElementDataFile = {0}'.format(element_data_file))
+
+    return ('\n'.join(lines) + '\n').encode('utf-8')
+
+
+def GetLegacyVTKHeader(stream, name=None):
+    """Returns a binary legacy VTK STRUCTURED_POINTS header, as bytes"""
+
+    e = stream.GetWholeExtent()
+    dims = stream.GetDimensions()
+    spacing = stream.GetSpacing()
+    origin = stream.GetOrigin()
+    components = stream.GetNumberOfScalarComponents()
+
+    # vtkDataSetWriter folds the extent into the origin
+    origin = [origin[i] + e[2 * i] * spacing[i] for i in range(3)]
+    name = name or stream.GetArrayName() or 'ImageScalars'
+
+    lines = ['# vtk DataFile Version 3.0',
+             'vtk output',
+             'BINARY',
+             'DATASET STRUCTURED_POINTS',
+             'DIMENSIONS {0} {1} {2}'.format(*dims),
+             'SPACING {0}'.format(' '.join(_FormatNumber(v) for v in spacing)),
+             'ORIGIN {0}'.format(' '.join(_FormatNumber(v) for v in origin)),
+             'POINT_DATA {0}'.format(dims[0] * dims[1] * dims[2])]
+
+    if stream.GetScalarType() == vtk.VTK_UNSIGNED_CHAR:
+        lines.append('COLOR_SCALARS {0} {1}'.format(name, components))
+    else:
+        lines.append('SCALARS {0} {1} {2}'.format(
+            name, _LEGACY_VTK_TYPES[stream.GetScalarType()], components))
+        lines.append('LOOKUP_TABLE default')
+
+    return ('\n'.join(lines) + '\n').encode('latin-1')
+
+
+def GetLegacyVTKDataType(stream):
+    """Legacy VTK binary data is always big-endian"""
+    return stream.GetDataType().newbyteorder('>')
+
+
+def GetMetaImageRawFileName(filename, compressed=False):
+    """Name of the detached data file vtkMetaImageWriter uses for a .mhd header"""
+    return os.path.splitext(filename)[0] + ('.zraw' if compressed else '.raw')
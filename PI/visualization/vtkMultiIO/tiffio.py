@@ -0,0 +1,655 @@
+"""
+Multi-page TIFF reading and writing.
+
+WriteTIFF() writes a 2D or 3D vtkImageData as a TIFF file with one page per z-slice, in
+8, 16 or 32 bit integer or 32 bit float samples, with deflate, LZW, PackBits or no
+compression.  Strips are compressed concurrently by a pool of threads.  When tifffile
+is installed it does the writing (and provides every codec); otherwise a built-in
+writer handles deflate and uncompressed files, and WriteTIFF() raises
+UnsupportedCompressionError for the other codecs (see CanWrite()) so callers can fall
+back to vtkTIFFWriter.
+
+TIFFFile indexes the pages of a file from their IFDs alone and decodes single pages on
+request - uncompressed, deflate and PackBits pages directly, anything else through
+a tifffile.TiffFile it keeps open, when tifffile is installed.  vtkTIFFStackReader is a VTK reader built on it that
+decodes only the pages an update extent covers, falling back to vtkTIFFReader for
+files it can't decode.
+
+Rows are stored top-down, as the TIFF specification and vtkTIFFWriter (for 2D images)
+store them - volumes written by vtkTIFFWriter, which stores their rows bottom-up, read
+upside down.  The spacing and origin of the
+image are kept in a JSON ImageDescription on the first page, in the form tifffile
+uses for its own metadata.
+"""
+
+import collections
+import concurrent.futures
+import json
+import os
+import struct
+import threading
+import zlib
+import numpy as np
+import vtk
+from vtk.util import vtkAlgorithm
+from vtk.util.numpy_support import vtk_to_numpy
+from PI.visualization.vtkMultiIO import iobackends
+from PI.visualization.vtkMultiIO.exceptions import UnsupportedCompressionError
+
+try:
+    import tifffile
+except ImportError:
+    tifffile = None
+
+NONE = 'none'
+DEFLATE = 'deflate'
+LZW = 'lzw'
+PACKBITS = 'packbits'
+
+COMPRESSIONS = (NONE, DEFLATE, LZW, PACKBITS)
+
+SIGNATURES = (b'II*\x00', b'MM\x00*', b'II+\x00', b'MM\x00+')
+
+# TIFF Compression tag values
+_COMPRESSION_TAGS = {NONE: 1, LZW: 5, DEFLATE: 8, PACKBITS: 32773}
+_TIFFFILE_COMPRESSION = {NONE: None, LZW: 'lzw', DEFLATE: 'zlib', PACKBITS: 'packbits'}
+
+# codecs the built-in decoder handles: none, deflate (both tag values), PackBits
+_DECODABLE = (1, 8, 32946, 32773)
+
+# uncompressed bytes per strip written
+_STRIP_SIZE = 1 << 17
+
+# zlib level for deflate - compresses predicted image data about as well as the default
+# level 6, several times faster
+_DEFLATE_LEVEL = 3
+
+# TIFF field types - struct format and size
+_TYPES = {1: ('B', 1), 2: ('s', 1), 3: ('H', 2), 4: ('I', 4), 5: ('II', 8), 6: ('b', 1),
+          7: ('B', 1), 8: ('h', 2), 9: ('i', 4), 10: ('ii', 8), 11: ('f', 4), 12: ('d', 8),
+          16: ('Q', 8), 17: ('q', 8), 18: ('Q', 8)}
+
+_SAMPLE_FORMATS = {'u': 1, 'i': 2, 'f': 3}
+
+# tags TIFFFile reads
+_NEW_SUBFILE_TYPE = 254
+_IMAGE_WIDTH = 256
+_IMAGE_LENGTH = 257
+_BITS_PER_SAMPLE = 258
+_COMPRESSION = 259
+_PHOTOMETRIC = 262
+_IMAGE_DESCRIPTION = 270
+_STRIP_OFFSETS = 273
+_SAMPLES_PER_PIXEL = 277
+_ROWS_PER_STRIP = 278
+_STRIP_BYTE_COUNTS = 279
+_PLANAR_CONFIGURATION = 284
+_PREDICTOR = 317
+_TILE_WIDTH = 322
+_EXTRA_SAMPLES = 338
+_SAMPLE_FORMAT = 339
+
+_TAGS = (_NEW_SUBFILE_TYPE, _IMAGE_WIDTH, _IMAGE_LENGTH, _BITS_PER_SAMPLE, _COMPRESSION,
+         _PHOTOMETRIC, _IMAGE_DESCRIPTION, _STRIP_OFFSETS, _SAMPLES_PER_PIXEL,
+         _ROWS_PER_STRIP, _STRIP_BYTE_COUNTS, _PLANAR_CONFIGURATION, _PREDICTOR,
+         _TILE_WIDTH, _SAMPLE_FORMAT)
+
+TIFFPage = collections.namedtuple('TIFFPage', [
+    'index', 'width', 'height', 'samples', 'dtype', 'compression', 'predictor',
+    'offsets', 'byte_counts', 'rows_per_strip', 'decodable', 'description'])
+
+
+def IsTIFFHeader(header):
+    return header[:4] in SIGNATURES
+
+
+def ImageToArray(image):
+    """Returns the scalars of a vtkImageData as a (z, y, x, components) numpy view"""
+    nx, ny, nz = image.GetDimensions()
+    scalars = vtk_to_numpy(image.GetPointData().GetScalars())
+    return scalars.reshape(nz, ny, nx, -1)
+
+
+def _GetDescription(image, shape):
+    return json.dumps({'shape': list(shape),
+                       'spacing': list(image.GetSpacing()),
+                       'origin': list(image.GetOrigin())})
+
+
+def CanWrite(compression):
+    """True if WriteTIFF() can write `compression` - every codec needs tifffile but
+    deflate and no compression"""
+    return tifffile is not None or compression in (NONE, DEFLATE)
+
+
+def WriteTIFF(filename, image, compression=DEFLATE, max_workers=None, backend=None,
+              progress=None):
+    """
+    Write `image` to `filename`, one page per z-slice, compressing strips on
+    `max_workers` threads (default: one per CPU).  `progress`, if given, is called
+    with the fraction of pages written.  Raises UnsupportedCompressionError if
+    `compression` needs tifffile and it isn't installed.
+    """
+
+    if compression not in COMPRESSIONS:
+        raise ValueError("Unknown TIFF compression '{0}'".format(compression))
+
+    array = ImageToArray(image)
+    if array.dtype.kind not in 'uif' or array.dtype.itemsize > 4 or \
+            (array.dtype.kind == 'f' and array.dtype.itemsize != 4):
+        raise ValueError("TIFF files can't hold {0} samples".format(array.dtype))
+
+    if max_workers is None:
+        max_workers = os.cpu_count() or 1
+    backend = backend or iobackends.GetDefaultBackend()
+    description = _GetDescription(image, array.shape[:3] if array.shape[3] == 1 else
+                                  array.shape)
+
+    if tifffile is not None:
+        _WriteWithTiffFile(filename, array, compression, max_workers, backend, description)
+    elif compression in (NONE, DEFLATE):
+        with backend.Open(filename, 'wb') as f:
+            _WritePages(f, array, compression, max_workers, description, progress)
+    else:
+        raise UnsupportedCompressionError("{0} compression needs tifffile".format(compression))
+
+    if progress is not None:
+        progress(1.0)
+
+
+def _WriteWithTiffFile(filename, array, compression, max_workers, backend, description):
+
+    nc = array.shape[3]
+    photometric = 'rgb' if nc in (3, 4) and array.dtype.kind == 'u' else 'minisblack'
+    data = array[:, ::-1]
+    if nc == 1:
+        data = data[..., 0]
+
+    with backend.Open(filename, 'wb') as f:
+        tifffile.imwrite(f, data, photometric=photometric, planarconfig='contig',
+                         compression=_TIFFFILE_COMPRESSION[compression],
+                         compressionargs={'level': _DEFLATE_LEVEL} if compression == DEFLATE
+                         else None,
+                         predictor=compression != NONE and array.dtype.kind in 'ui',
+                         maxworkers=max_workers, description=description, metadata=None)
+
+
+def _EncodeStrip(block, compression, predictor):
+    """Returns the encoded bytes of a (rows, width, samples) block"""
+
+    block = np.ascontiguousarray(block, block.dtype.newbyteorder('<'))
+    if predictor:
+        # horizontal differencing, wrapping like the unsigned arithmetic of libtiff
+        diff = block.copy()
+        diff[:, 1:] -= block[:, :-1]
+        block = diff
+    data = block.tobytes()
+    if compression == DEFLATE:
+        data = zlib.compress(data, _DEFLATE_LEVEL)
+    return data
+
+
+def _PackIFD(entries, offset):
+    """
+    Returns the bytes of a little-endian IFD at `offset` holding `entries` - a list of
+    (tag, type, values) - followed by the values that don't fit in an entry, and the
+    position of its next-IFD pointer relative to `offset`.
+    """
+
+    entries = sorted(entries)
+    next_pointer = 2 + 12 * len(entries)
+    base = offset + next_pointer + 4
+
+    packed = [struct.pack('<H', len(entries))]
+    extra = b''
+    for tag, typ, values in entries:
+        if typ == 2:
+            data = values.encode('latin-1') + b'\x00'
+            count = len(data)
+        else:
+            count = len(values)
+            data = struct.pack('<' + _TYPES[typ][0] * count, *values)
+        if len(data) <= 4:
+            value = data.ljust(4, b'\x00')
+        else:
+            value = struct.pack('<I', base + len(extra))
+            extra += data + b'\x00' * (len(data) % 2)
+        packed.append(struct.pack('<HHI', tag, typ, count) + value)
+    packed.append(struct.pack('<I', 0))
+    packed.append(extra)
+
+    return b''.join(packed), next_pointer
+
+
+def _WritePages(f, array, compression, max_workers, description, progress=None):
+    """Built-in little-endian strip writer"""
+
+    nz, ny, nx, nc = array.shape
+    dtype = array.dtype
+    predictor = compression == DEFLATE and dtype.kind in 'ui'
+    rows_per_strip = max(1, min(ny, _STRIP_SIZE // (nx * nc * dtype.itemsize)))
+    rgb = nc in (3, 4) and dtype.kind == 'u'
+
+    common = [(_IMAGE_WIDTH, 4, [nx]),
+              (_IMAGE_LENGTH, 4, [ny]),
+              (_BITS_PER_SAMPLE, 3, [8 * dtype.itemsize] * nc),
+              (_COMPRESSION, 3, [_COMPRESSION_TAGS[compression]]),
+              (_PHOTOMETRIC, 3, [2 if rgb else 1]),
+              (_SAMPLES_PER_PIXEL, 3, [nc]),
+              (_ROWS_PER_STRIP, 4, [rows_per_strip]),
+              (_PLANAR_CONFIGURATION, 3, [1]),
+              (_SAMPLE_FORMAT, 3, [_SAMPLE_FORMATS[dtype.kind]] * nc)]
+    if predictor:
+        common.append((_PREDICTOR, 3, [2]))
+    if rgb and nc == 4:
+        # unassociated alpha
+        common.append((_EXTRA_SAMPLES, 3, [2]))
+    elif not rgb and nc > 1:
+        common.append((_EXTRA_SAMPLES, 3, [0] * (nc - 1)))
+
+    def encode(z):
+        page = array[z, ::-1]
+        return [executor.submit(_EncodeStrip, page[row:row + rows_per_strip],
+                                compression, predictor)
+                for row in range(0, ny, rows_per_strip)]
+
+    def patch(position, value):
+        end = f.tell()
+        f.seek(position)
+        f.write(struct.pack('<I', value))
+        f.seek(end)
+
+    f.write(b'II*\x00' + struct.pack('<I', 0))
+    next_pointer = 4
+
+    # keep a bounded number of pages in flight, so memory stays proportional to the pool
+    window = 2 * max_workers
+    with concurrent.futures.ThreadPoolExecutor(max_workers=max_workers) as executor:
+        pending = collections.deque()
+        submitted = 0
+        for z in range(nz):
+            while submitted < nz and submitted <= z + window:
+                pending.append(encode(submitted))
+                submitted += 1
+
+            offsets, counts = [], []
+            for future in pending.popleft():
+                strip = future.result()
+                offsets.append(f.tell())
+                counts.append(len(strip))
+                f.write(strip)
+            if f.tell() % 2:
+                f.write(b'\x00')
+
+            entries = common + [(_STRIP_OFFSETS, 4, offsets), (_STRIP_BYTE_COUNTS, 4, counts)]
+            if z == 0:
+                entries.append((_IMAGE_DESCRIPTION, 2, description))
+
+            offset = f.tell()
+            ifd, pointer = _PackIFD(entries, offset)
+            if offset + len(ifd) >= 1 << 32:
+                raise IOError("TIFF file exceeds 4 GB - install tifffile to write BigTIFF")
+            patch(next_pointer, offset)
+            f.write(ifd)
+            next_pointer = offset + pointer
+
+            if progress is not None:
+                progress(float(z + 1) / nz)
+
+
+def _UnpackBits(data):
+    """Decode PackBits"""
+    out = bytearray()
+    i, n = 0, len(data)
+    while i < n:
+        c = data[i]
+        i += 1
+        if c < 128:
+            out += data[i:i + c + 1]
+            i += c + 1
+        elif c > 128:
+            out += data[i:i + 1] * (257 - c)
+            i += 1
+    return bytes(out)
+
+
+class TIFFFile(object):
+
+    """
+    The page index of a TIFF (or BigTIFF) file, built by walking its IFDs without
+    reading any pixel data, and random access to the pages.  Reduced resolution
+    subfiles are left out.
+    """
+
+    def __init__(self, filename, backend=None):
+        self._filename = filename
+        self._backend = backend or iobackends.GetDefaultBackend()
+        self._pages = []
+
+        # tifffile.TiffFile for the pages the built-in decoder can't handle, opened on
+        # first use and shared by the threads reading pages
+        self._file = None
+        self._tifffile = None
+        self._lock = threading.Lock()
+
+        with self._backend.Open(filename, 'rb') as f:
+            header = f.read(16)
+            if not IsTIFFHeader(header):
+                raise IOError("{0} is not a TIFF file".format(filename))
+            self._order = '<' if header[:2] == b'II' else '>'
+            self._bigtiff = header[2:4] in (b'+\x00', b'\x00+')
+            if self._bigtiff:
+                offset = struct.unpack(self._order + 'Q', header[8:16])[0]
+            else:
+                offset = struct.unpack(self._order + 'I', header[4:8])[0]
+
+            index = 0
+            seen = set()
+            while offset and offset not in seen:
+                seen.add(offset)
+                tags, offset = self._ReadIFD(f, offset)
+                page = self._MakePage(index, tags)
+                if page is not None:
+                    self._pages.append(page)
+                index += 1
+
+    def _ReadIFD(self, f, offset):
+        """Returns ({tag: values} for the tags TIFFFile uses, next IFD offset)"""
+
+        order = self._order
+        if self._bigtiff:
+            count_format, entry_size, value_size, pointer_format = 'Q', 20, 8, 'Q'
+        else:
+            count_format, entry_size, value_size, pointer_format = 'H', 12, 4, 'I'
+
+        f.seek(offset)
+        count_size = struct.calcsize(count_format)
+        count = struct.unpack(order + count_format, f.read(count_size))[0]
+        data = f.read(count * entry_size + value_size)
+        if len(data) < count * entry_size + value_size:
+            raise IOError("{0}: truncated IFD at offset {1}".format(self._filename, offset))
+
+        tags = {}
+        for i in range(count):
+            entry = data[i * entry_size:(i + 1) * entry_size]
+            tag, typ = struct.unpack(order + 'HH', entry[:4])
+            if tag not in _TAGS or typ not in _TYPES:
+                continue
+            n = struct.unpack(order + ('Q' if self._bigtiff else 'I'),
+                              entry[4:4 + value_size])[0]
+            fmt, size = _TYPES[typ]
+            value = entry[4 + value_size:]
+            if n * size > value_size:
+                f.seek(struct.unpack(order + pointer_format, value)[0])
+                value = f.read(n * size)
+            value = value[:n * size]
+            if typ == 2:
+                tags[tag] = value.rstrip(b'\x00').decode('latin-1')
+            else:
+                tags[tag] = struct.unpack(order + fmt * n, value)
+
+        next_offset = struct.unpack(order + pointer_format, data[count * entry_size:])[0]
+        return tags, next_offset
+
+    def _MakePage(self, index, tags):
+
+        # skip thumbnails and pyramid levels
+        if tags.get(_NEW_SUBFILE_TYPE, (0,))[0] & 1:
+            return None
+
+        samples = tags.get(_SAMPLES_PER_PIXEL, (1,))[0]
+        bits = set(tags.get(_BITS_PER_SAMPLE, (1,)))
+        kinds = set(tags.get(_SAMPLE_FORMAT, (1,)))
+        dtype = None
+        if len(bits) == 1 and len(kinds) == 1:
+            bits, kind = bits.pop(), {1: 'u', 2: 'i', 3: 'f'}.get(kinds.pop())
+            if kind and bits in (8, 16, 32, 64):
+                dtype = np.dtype('{0}{1}{2}'.format(self._order, kind, bits // 8))
+
+        height = tags.get(_IMAGE_LENGTH, (0,))[0]
+        compression = tags.get(_COMPRESSION, (1,))[0]
+        predictor = tags.get(_PREDICTOR, (1,))[0]
+        decodable = (dtype is not None and _TILE_WIDTH not in tags and
+                     _STRIP_OFFSETS in tags and
+                     tags.get(_PLANAR_CONFIGURATION, (1,))[0] == 1 and
+                     compression in _DECODABLE and predictor in (1, 2))
+
+        return TIFFPage(index=index,
+                        width=tags.get(_IMAGE_WIDTH, (0,))[0],
+                        height=height,
+                        samples=samples,
+                        dtype=dtype,
+                        compression=compression,
+                        predictor=predictor,
+                        offsets=tags.get(_STRIP_OFFSETS, ()),
+                        byte_counts=tags.get(_STRIP_BYTE_COUNTS, ()),
+                        rows_per_strip=tags.get(_ROWS_PER_STRIP, (height,))[0],
+                        decodable=decodable,
+                        description=tags.get(_IMAGE_DESCRIPTION))
+
+    def GetFileName(self):
+        return self._filename
+
+    def Close(self):
+        """Close the file tifffile decodes pages from, if it was opened"""
+        with self._lock:
+            if self._tifffile is not None:
+                self._tifffile.close()
+                self._file.close()
+                self._file = self._tifffile = None
+
+    def _ReadWithTiffFile(self, index):
+        with self._lock:
+            if self._tifffile is None:
+                f = self._backend.Open(self._filename, 'rb')
+                try:
+                    self._tifffile = tifffile.TiffFile(f)
+                except Exception:
+                    f.close()
+                    raise
+                self._file = f
+            return self._tifffile.pages[index].asarray()
+
+    def GetNumberOfPages(self):
+        return len(self._pages)
+
+    def GetPage(self, index):
+        return self._pages[index]
+
+    def GetPages(self):
+        return list(self._pages)
+
+    def CanDecode(self):
+        """True if every page can be decoded, by the built-in decoder or tifffile"""
+        return tifffile is not None or all(p.decodable for p in self._pages)
+
+    def GetMetadata(self):
+        """Returns the JSON ImageDescription of the first page as a dict, or {}"""
+        description = self._pages[0].description if self._pages else None
+        if description and description.startswith('{'):
+            try:
+                return json.loads(description)
+            except ValueError:
+                pass
+        return {}
+
+    def ReadPage(self, index):
+        """Returns page `index` as a (height, width, samples) array, rows top-down"""
+
+        page = self._pages[index]
+        shape = (page.height, page.width, page.samples)
+
+        if not page.decodable:
+            if tifffile is None:
+                raise IOError("{0}: can't decode page {1} (compression {2})".format(
+                    self._filename, index, page.compression))
+            return self._ReadWithTiffFile(page.index).reshape(shape)
+
+        strips = self._backend.ReadRanges(self._filename,
+                                          list(zip(page.offsets, page.byte_counts)))
+        if page.compression in (8, 32946):
+            strips = [zlib.decompress(s) for s in strips]
+        elif page.compression == 32773:
+            strips = [_UnpackBits(s) for s in strips]
+
+        count = page.height * page.width * page.samples
+        data = np.frombuffer(b''.join(strips), page.dtype, count).reshape(shape)
+        data = data.astype(page.dtype.newbyteorder('='), copy=False)
+        if page.predictor == 2:
+            data = np.cumsum(data, axis=1, dtype=data.dtype)
+        return data
+
+
+class vtkTIFFStackReader(vtkAlgorithm.VTKPythonAlgorithmBase):
+
+    """
+    Reads a multi-page TIFF file as a volume, one page per z-slice.  Only the pages an
+    update extent covers are read, decoded concurrently by a pool of threads.  Files
+    whose pages can't be decoded here are read with vtkTIFFReader.
+    """
+
+    def __init__(self):
+        self.FileName = None
+        self.NumberOfThreads = 0
+        self.IOBackend = None
+        self._tiff = None
+        self._fallback = None
+        vtkAlgorithm.VTKPythonAlgorithmBase.__init__(self, nInputPorts=0, nOutputPorts=1,
+                                                     outputType='vtkImageData')
+
+    def SetFileName(self, filename):
+        if filename == self.FileName:
+            return
+        self.FileName = filename
+        self._ClearTIFFFile()
+        self._fallback = None
+        self.Modified()
+
+    def GetFileName(self):
+        return self.FileName
+
+    def SetNumberOfThreads(self, threads):
+        """Threads decoding pages - 0 (the default) for one per CPU"""
+        self.NumberOfThreads = threads
+        self.Modified()
+
+    def GetNumberOfThreads(self):
+        return self.NumberOfThreads
+
+    def SetIOBackend(self, backend):
+        self.IOBackend = backend
+        self._ClearTIFFFile()
+        self.Modified()
+
+    def GetIOBackend(self):
+        return self.IOBackend or iobackends.GetDefaultBackend()
+
+    def _ClearTIFFFile(self):
+        if self._tiff is not None:
+            self._tiff.Close()
+            self._tiff = None
+
+    def GetTIFFFile(self):
+        """Returns the TIFFFile page index of the current file"""
+        if self._tiff is None:
+            self._tiff = TIFFFile(self.FileName, self.GetIOBackend())
+        return self._tiff
+
+    def GetOutput(self):
+        return self.GetOutputDataObject(0)
+
+    def FillOutputPortInformation(self, port, info):
+        info.Set(vtk.vtkDataObject.DATA_TYPE_NAME(), "vtkImageData")
+        return 1
+
+    def RequestInformation(self, request, inInfo, outInfo):
+
+        oinfo = outInfo.GetInformationObject(0)
+
+        try:
+            tiff = self.GetTIFFFile()
+        except (IOError, OSError, struct.error) as e:
+            vtk.vtkOutputWindow.GetInstance().DisplayErrorText(
+                "vtkTIFFStackReader: {0}".format(e))
+            return 0
+
+        first = tiff.GetPage(0) if tiff.GetNumberOfPages() else None
+        uniform = first is not None and all(
+            (p.width, p.height, p.samples, p.dtype) ==
+            (first.width, first.height, first.samples, first.dtype)
+            for p in tiff.GetPages())
+
+        if not (uniform and first.dtype is not None and tiff.CanDecode()):
+            self._fallback = vtk.vtkTIFFReader()
+            # rows bottom-up, as the pages decoded here are
+            self._fallback.SetOrientationType(4)
+            self._fallback.SetFileName(self.FileName)
+            self._fallback.UpdateInformation()
+            finfo = self._fallback.GetOutputInformation(0)
+            for key in (vtk.vtkStreamingDemandDrivenPipeline.WHOLE_EXTENT(),
+                        vtk.vtkDataObject.SPACING(), vtk.vtkDataObject.ORIGIN()):
+                oinfo.CopyEntry(finfo, key)
+            oinfo.CopyEntry(finfo, vtk.vtkDataObject.POINT_DATA_VECTOR(), 1)
+            return 1
+
+        self._fallback = None
+        metadata = tiff.GetMetadata()
+        extent = (0, first.width - 1, 0, first.height - 1, 0, tiff.GetNumberOfPages() - 1)
+        scalar_type = _VTK_TYPES[first.dtype.newbyteorder('=').str[1:]]
+
+        oinfo.Set(vtk.vtkAlgorithm.CAN_PRODUCE_SUB_EXTENT(), 1)
+        oinfo.Set(vtk.vtkStreamingDemandDrivenPipeline.WHOLE_EXTENT(), extent, 6)
+        oinfo.Set(vtk.vtkDataObject.SPACING(), tuple(metadata.get('spacing', (1, 1, 1))), 3)
+        oinfo.Set(vtk.vtkDataObject.ORIGIN(), tuple(metadata.get('origin', (0, 0, 0))), 3)
+        vtk.vtkDataObject.SetPointDataActiveScalarInfo(oinfo, scalar_type, first.samples)
+        return 1
+
+    def RequestData(self, request, inInfo, outInfoVec):
+
+        outInfo = outInfoVec.GetInformationObject(0)
+        output = vtk.vtkImageData.GetData(outInfo)
+
+        if self._fallback is not None:
+            self._fallback.Update()
+            output.ShallowCopy(self._fallback.GetOutput())
+            return 1
+
+        extent = outInfo.Get(vtk.vtkStreamingDemandDrivenPipeline.UPDATE_EXTENT())
+        if extent is None:
+            extent = outInfo.Get(vtk.vtkStreamingDemandDrivenPipeline.WHOLE_EXTENT())
+        output.SetExtent(extent)
+        output.AllocateScalars(outInfo)
+
+        nx, ny, nz = output.GetDimensions()
+        array = ImageToArray(output)
+        tiff = self.GetTIFFFile()
+        height = tiff.GetPage(0).height
+
+        def read(k):
+            page = tiff.ReadPage(extent[4] + k)
+            # TIFF rows run top-down
+            rows = page[height - 1 - extent[3]:height - extent[2]][::-1]
+            array[k] = rows[:, extent[0]:extent[1] + 1]
+
+        threads = self.NumberOfThreads or os.cpu_count() or 1
+        try:
+            if threads > 1 and nz > 1:
+                with concurrent.futures.ThreadPoolExecutor(max_workers=threads) as executor:
+                    list(executor.map(read, range(nz)))
+            else:
+                for k in range(nz):
+                    self.UpdateProgress(float(k) / nz)
+                    read(k)
+        except (IOError, OSError, ValueError, zlib.error) as e:
+            vtk.vtkOutputWindow.GetInstance().DisplayErrorText(
+                "vtkTIFFStackReader: {0}".format(e))
+            return 0
+
+        return 1
+
+
+_VTK_TYPES = {'u1': vtk.VTK_UNSIGNED_CHAR, 'i1': vtk.VTK_SIGNED_CHAR,
+              'u2': vtk.VTK_UNSIGNED_SHORT, 'i2': vtk.VTK_SHORT,
+              'u4': vtk.VTK_UNSIGNED_INT, 'i4': vtk.VTK_INT,
+              'u8': vtk.VTK_UNSIGNED_LONG_LONG, 'i8': vtk.VTK_LONG_LONG,
+              'f4': vtk.VTK_FLOAT, 'f8': vtk.VTK_DOUBLE}
@@ -0,0 +1,153 @@
+"""
+Header-only access to VFF files.
+
+ReadVFFHeader() reads a VFF file only as far as the form feed that ends its header and
+returns the parsed metadata, so volume size, spacing, bit depth and DICOM keywords can
+be listed without constructing a reader or touching the pixel data.  ScanVFFDirectory()
+does the same for every VFF file in a directory using a thread pool.
+
+Keywords follow the vtkVFFWriter conventions: 'dicom_*' keywords carry DICOM values,
+'hidden*' keywords are never written (and are ignored if present), and '*_digest'
+keywords hold image checksums.
+"""
+
+import concurrent.futures
+import logging
+import os
+import vtk
+
+logger = logging.getLogger(__name__)
+
+VFF_MAGIC = b'ncaa'
+
+# number of bytes read at a time while looking for the end of the header
+_BLOCK_SIZE = 4096
+
+# VFF bit depths and the scalar types vtkVFFWriter writes them from
+_SCALAR_TYPES = {8: vtk.VTK_UNSIGNED_CHAR,
+                 16: vtk.VTK_SHORT,
+                 32: vtk.VTK_FLOAT,
+                 64: vtk.VTK_DOUBLE}
+
+
+def ParseKeywords(text):
+    """Parse 'key=value;' lines into a dictionary of strings"""
+    keywords = {}
+    for line in text.splitlines():
+        line = line.strip().rstrip(';')
+        if '=' in line:
+            key, value = line.split('=', 1)
+            keywords[key.strip()] = value.strip()
+    return keywords
+
+
+def ReadRawHeader(filename, backend=None):
+    """Returns (header bytes, header size) - the header is everything up to and
+    including the form feed (and the newline following it).  The file is opened
+    through `backend` (an iobackends backend) if one is given"""
+
+    with (backend.Open(filename) if backend else open(filename, 'rb')) as f:
+        data = f.read(_BLOCK_SIZE)
+        if not data.startswith(VFF_MAGIC):
+            raise IOError("{0} is not a VFF file".format(filename))
+        end = data.find(b'\f')
+        while end < 0:
+            block = f.read(_BLOCK_SIZE)
+            if not block:
+                raise IOError("{0}: unterminated VFF header".format(filename))
+            start = len(data)
+            data += block
+            end = data.find(b'\f', start)
+
+    end += 1
+    if data[end:end + 1] == b'\n':
+        end += 1
+
+    return data[:end], end
+
+
+def _Floats(value, n, default):
+    values = [float(v) for v in value.split()][:n]
+    return values + [default] * (n - len(values))
+
+
+def ReadVFFHeader(filename):
+    """
+    Returns a dictionary describing a VFF file:
+
+        filename, header_size, rank, bands, bits, rawsize, scalar_type,
+        dimensions, spacing, origin (world coordinates, as the reader produces),
+        keywords (every non-hidden keyword, as strings),
+        dicom (the dicom_* keywords), digests (the *_digest keywords)
+
+    Raises IOError if the file is not a VFF file.
+    """
+
+    raw, header_size = ReadRawHeader(filename)
+    keywords = ParseKeywords(raw.decode('latin-1'))
+
+    # vtkVFFWriter never writes hidden keywords
+    keywords = dict((k, v) for k, v in keywords.items() if not k.startswith('hidden'))
+
+    size = [int(v) for v in keywords.get('size', '0 0').split()]
+    dimensions = (size + [1, 1, 1])[:3]
+    spacing = _Floats(keywords.get('spacing', ''), 3, 1.0)
+    origin = _Floats(keywords.get('origin', ''), 3, 0.0)
+
+    bits = int(keywords.get('bits', 8))
+    bands = int(keywords.get('bands', 1))
+
+    header = {'filename': filename,
+              'header_size': header_size,
+              'rank': int(keywords.get('rank', len([d for d in dimensions if d > 1]))),
+              'bands': bands,
+              'bits': bits,
+              'rawsize': int(keywords.get('rawsize',
+                                          dimensions[0] * dimensions[1] * dimensions[2] *
+                                          bands * bits // 8)),
+              'scalar_type': _SCALAR_TYPES.get(bits),
+              'dimensions': tuple(dimensions),
+              'spacing': tuple(spacing),
+              # the header stores the origin in voxels
+              'origin': tuple(o * s for o, s in zip(origin, spacing)),
+              'keywords': keywords,
+              'dicom': dict((k, v) for k, v in keywords.items() if k.startswith('dicom_')),
+              'digests': dict((k, v) for k, v in keywords.items() if k.endswith('_digest'))}
+
+    return header
+
+
+def _ReadVFFHeaderOrNone(filename):
+    try:
+        return ReadVFFHeader(filename)
+    except (IOError, OSError, ValueError) as e:
+        logger.debug("Skipping {0}: {1}".format(filename, e))
+        return None
+
+
+def _ListVFFFiles(directory, recursive, extensions):
+    for entry in os.scandir(directory):
+        if entry.is_dir(follow_symlinks=False):
+            if recursive:
+                for filename in _ListVFFFiles(entry.path, recursive, extensions):
+                    yield filename
+        elif os.path.splitext(entry.name)[1].lower() in extensions:
+            yield entry.path
+
+
+def ScanVFFDirectory(directory, recursive=False, max_workers=None, extensions=('.vff',)):
+    """
+    Read the header of every VFF file in `directory` using a pool of threads.  Returns
+    a list of ReadVFFHeader() dictionaries sorted by filename; files that are not valid
+    VFF files are skipped.
+    """
+
+    filenames = sorted(_ListVFFFiles(directory, recursive, extensions))
+
+    if max_workers is None:
+        max_workers = min(32, (os.cpu_count() or 1) * 4)
+
+    with concurrent.futures.ThreadPoolExecutor(max_workers=max_workers) as executor:
+        headers = executor.map(_ReadVFFHeaderOrNone, filenames)
+
+    return [header for header in headers if header is not None]
@@ -1,7 +1,11 @@
+import concurrent.futures
 import vtk
 from vtk.util import vtkAlgorithm
 from vtk.util.numpy_support import vtk_to_numpy
 import numpy as np
+from PI.visualization.vtkMultiIO import checksums
+from PI.visualization.vtkMultiIO import iobackends
+from PI.visualization.vtkMultiIO import vffheader
 
 
 class vtkImageReader3(vtkAlgorithm.VTKPythonAlgorithmBase):
@@ -21,15 +25,16 @@ class vtkImageReader3(vtkAlgorithm.VTKPythonAlgorithmBase):
         self.DataOrigin = [0, 0, 0]
         self.DataScalarType = vtk.VTK_SHORT
         self.DataByteOrder = 1
+        self.FileLowerLeft = 0
+        self.ParallelRead = False
+        self.VerifyChecksums = False
+        self.IOBackend = None
 
         vtkAlgorithm.VTKPythonAlgorithmBase.__init__(self, nInputPorts=0, nOutputPorts=1, outputType='vtkImageData')
 
-    def __getattr__(self, attr):
-        print("getattr: {}".format(attr))
-
     def SetFileName(self, filename):
         if filename:
-            if self.Filename is filename:
+            if self.FileName is filename:
                 return
         self.FileName = filename
         self.FilePrefix = None
@@ -70,41 +75,101 @@ class vtkImageReader3(vtkAlgorithm.VTKPythonAlgorithmBase):
 
         return 1
 
+    def _GetHeaderSize(self, filename, data_size):
+        """The header of a VFF file ends at its form feed, so anything stored after
+        the pixel data (a checksum trailer) is not counted as header; other files
+        are assumed to end with the pixel data"""
+
+        backend = self.GetIOBackend()
+        try:
+            return vffheader.ReadRawHeader(filename, backend)[1]
+        except IOError:
+            return backend.GetSize(filename) - data_size
+
+    def _GetSliceFiles(self, extent, slice_size):
+        """Returns a (filename, offset) pair for each slice of `extent`, for a single
+        volume file or one file per slice"""
+
+        zmin = self.DataExtent[4]
+        if self.FileNames:
+            names = [self.FileNames.GetValue(z - zmin) for z in range(extent[4], extent[5] + 1)]
+            header = [self.HeaderSize if self.ManualHeaderSize else
+                      self._GetHeaderSize(name, slice_size) for name in names]
+            return list(zip(names, header))
+
+        header = self.HeaderSize
+        if not self.ManualHeaderSize:
+            depth = self.DataExtent[5] - zmin + 1
+            header = self._GetHeaderSize(self.FileName, slice_size * depth)
+        return [(self.FileName, header + (z - zmin) * slice_size)
+                for z in range(extent[4], extent[5] + 1)]
+
     def RequestData(self, request, inInfo, outInfoVec):
         outInfo = outInfoVec.GetInformationObject(0)
         oimage = outInfo.Get(vtk.vtkDataObject.DATA_OBJECT())
-        oimage.SetExtent(outInfo.Get(vtk.vtkStreamingDemandDrivenPipeline.WHOLE_EXTENT()))
+
+        # read only the requested sub-extent
+        extent = outInfo.Get(vtk.vtkStreamingDemandDrivenPipeline.UPDATE_EXTENT())
+        if extent is None:
+            extent = outInfo.Get(vtk.vtkStreamingDemandDrivenPipeline.WHOLE_EXTENT())
+        oimage.SetExtent(extent)
         oimage.AllocateScalars(outInfo)
 
         # get access to VTK image as a numpy array
         dims = oimage.GetDimensions()
         array_name = oimage.GetPointData().GetArrayName(0)
         arr = vtk_to_numpy(oimage.GetPointData().GetArray(array_name))
-        arr.shape = dims[::-1]
-
-        # go read data
-        _file = None
-        for z in range(dims[2]):
-
-            self.UpdateProgress(float(z) / float(dims[2]))
-
-            if self.FileNames:
-                _file = open(self.FileNames.GetValue(z), 'rb')
-                _file.seek(self.HeaderSize)
+        arr.shape = (dims[2], dims[1], dims[0] * self.NumberOfScalarComponents)
+
+        dtype = arr.dtype if self.DataByteOrder else arr.dtype.newbyteorder()
+        pixel_size = dtype.itemsize * self.NumberOfScalarComponents
+        data_extent = self.DataExtent
+        row_size = (data_extent[1] - data_extent[0] + 1) * pixel_size
+        slice_size = (data_extent[3] - data_extent[2] + 1) * row_size
+
+        # rows are stored top-down when FileLowerLeft is on
+        flip = (self.FileLowerLeft == 1)
+        if flip:
+            first_row = data_extent[3] - extent[3]
+        else:
+            first_row = extent[2] - data_extent[2]
+        x_offset = (extent[0] - data_extent[0]) * pixel_size
+        length = dims[0] * pixel_size
+        whole_rows = (length == row_size)
+
+        backend = self.GetIOBackend()
+
+        def read(k):
+            filename, offset = slices[k]
+            offset += first_row * row_size + x_offset
+            if whole_rows:
+                ranges = [(offset, dims[1] * length)]
             else:
-                if self.FileName and _file is None:
-                    _file = open(self.FileName, 'rb')
-                    _file.seek(self.HeaderSize)
-
-            temp_arr = np.fromfile(_file, dtype=arr.dtype, count=dims[0]*dims[1])
-            temp_arr.shape = dims[0:2][::-1]
-            arr[z, :, :] = temp_arr
-
-            if self.FileNames:
-                _file.close()
-
-        if not self.DataByteOrder:
-            arr.byteswap(True)
+                ranges = [(offset + y * row_size, length) for y in range(dims[1])]
+            data = b''.join(backend.ReadRanges(filename, ranges))
+            rows = np.frombuffer(data, dtype=dtype).reshape(dims[1], -1)
+            arr[k] = rows[::-1] if flip else rows
+
+        try:
+            slices = self._GetSliceFiles(extent, slice_size)
+            if self.ParallelRead and len(slices) > 1:
+                with concurrent.futures.ThreadPoolExecutor() as executor:
+                    list(executor.map(read, range(len(slices))))
+            else:
+                for k in range(len(slices)):
+                    self.UpdateProgress(float(k) / float(len(slices)))
+                    read(k)
+        except (IOError, OSError, ValueError) as e:
+            vtk.vtkOutputWindow.GetInstance().DisplayErrorText(
+                "vtkImageReader3: {0}".format(e))
+            return 0
+
+        # only the checksum chunks overlapping the extent we read are hashed
+        if self.VerifyChecksums and self.FileName:
+            if not checksums.VerifyChecksums(self.FileName, oimage.GetExtent()):
+                vtk.vtkOutputWindow.GetInstance().DisplayErrorText(
+                    "vtkImageReader3: checksum verification failed for {0}".format(self.FileName))
+                return 0
 
         return 1
 
@@ -128,7 +193,7 @@ class vtkImageReader3(vtkAlgorithm.VTKPythonAlgorithmBase):
         return self.NumberOfScalarComponents
 
     def SetNumberOfScalarComponents(self, components):
-        if components != self.NumberScalarComponents:
+        if components != self.NumberOfScalarComponents:
             self.NumberOfScalarComponents = components
             self.Modified()
 
@@ -165,6 +230,60 @@ class vtkImageReader3(vtkAlgorithm.VTKPythonAlgorithmBase):
     def SetDataByteOrder(self, order):
         self.DataByteOrder = order
 
+    def GetFileLowerLeft(self):
+        return self.FileLowerLeft
+
+    def SetFileLowerLeft(self, lowerleft):
+        """Rows are flipped top-to-bottom while reading when FileLowerLeft is 1"""
+        if lowerleft != self.FileLowerLeft:
+            self.FileLowerLeft = lowerleft
+            self.Modified()
+
+    def FileLowerLeftOn(self):
+        self.SetFileLowerLeft(1)
+
+    def FileLowerLeftOff(self):
+        self.SetFileLowerLeft(0)
+
+    def GetParallelRead(self):
+        return self.ParallelRead
+
+    def SetParallelRead(self, parallel):
+        """Read the slices of the update extent from a pool of threads"""
+        if parallel != self.ParallelRead:
+            self.ParallelRead = parallel
+            self.Modified()
+
+    def ParallelReadOn(self):
+        self.SetParallelRead(True)
+
+    def ParallelReadOff(self):
+        self.SetParallelRead(False)
+
+    def GetIOBackend(self):
+        return self.IOBackend or iobackends.GetDefaultBackend()
+
+    def SetIOBackend(self, backend):
+        """Read through `backend` (see iobackends.py) - None selects the default backend"""
+        if backend is not self.IOBackend:
+            self.IOBackend = backend
+            self.Modified()
+
+    def GetVerifyChecksums(self):
+        return self.VerifyChecksums
+
+    def SetVerifyChecksums(self, verify):
+        """Verify the chunked checksums (see checksums.py) of the slices being read"""
+        if verify != self.VerifyChecksums:
+            self.VerifyChecksums = verify
+            self.Modified()
+
+    def VerifyChecksumsOn(self):
+        self.SetVerifyChecksums(True)
+
+    def VerifyChecksumsOff(self):
+        self.SetVerifyChecksums(False)
+
 if __name__ == '__main__':
     r = vtkImageReader3()
     r.Update()
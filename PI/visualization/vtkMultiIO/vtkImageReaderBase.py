@@ -2,10 +2,12 @@ from __future__ import print_function
 from __future__ import absolute_import
 from builtins import range
 from builtins import object
+import io
 import os
 import vtk
 from zope.interface import implementer
 from . import interfaces
+from . import iobackends
 from . import MVImage
 from datetime import datetime
 from PI.visualization.common.CoordinateSystem import CoordinateSystem
@@ -20,6 +22,9 @@ IMAGE_2D = 1 << 4
 IMAGE_3D = 1 << 5
 WHOLE_FILENAME = 1 << 6
 
+# VTK readers that can decode a file held in memory (SetStream/SetMemoryBuffer)
+_MEMORY_BUFFER_READERS = ('vtkPNGReader', 'vtkJPEGReader')
+
 ##########################################################################
 
 @implementer((interfaces.IImageInformation,
@@ -31,10 +36,14 @@ class vtkImageReaderBase(object):
     __magic__ = [('', 0)]
     __capabilities__ = DEPTH_16
 
+    # I/O backend used for format detection (None - the default backend)
+    _io_backend = None
+
     def __init__(self):
         self._ImageReader = None
         self._output = None
         self._filename = None
+        self._buffer = None
         self._coordinate_system = CoordinateSystem.vtk_coords
         self.dicom_converter = convert.BaseDicomConverter()
 
@@ -47,6 +56,13 @@ class vtkImageReaderBase(object):
     def SetCoordinateSystem(self, val):
         self._coordinate_system = val
 
+    def SetIOBackend(self, backend):
+        """Read through `backend` (see iobackends.py) - None selects the default backend"""
+        self._io_backend = backend
+
+    def GetIOBackend(self):
+        return self._io_backend or iobackends.GetDefaultBackend()
+
     def GetCoordinateSystem(self):
         return self._coordinate_system
 
@@ -90,8 +106,10 @@ class vtkImageReaderBase(object):
 
     def CanReadFile(self, filename, magic=None):
 
+        backend = self.GetIOBackend()
+
         # sanity check
-        if not os.path.exists(filename):
+        if not backend.Exists(filename):
             return 0
 
         valid = True
@@ -109,10 +127,13 @@ class vtkImageReaderBase(object):
             # determine maximum amount to read -- negative offsets indicate
             # line-based magic number check
             if _offset >= 0:
-                with open(filename, 'rb') as f:
+                with backend.Open(filename, 'rb') as f:
                     l = _offset + len(_magic)
                     offset = _offset
                     arr = f.read(l)
+                    # magic strings are given as text - compare bytes with bytes
+                    if isinstance(_magic, str):
+                        _magic = _magic.encode('latin-1')
 
                 # was read of header successful?
                 if len(arr) == 0:
@@ -122,7 +143,7 @@ class vtkImageReaderBase(object):
                             return '[Error 100]: Truncated image'
                     raise MyError()
             else:
-                with open(filename, 'rt') as f:
+                with io.TextIOWrapper(backend.Open(filename, 'rb')) as f:
                     numlines = -_offset
                     for n in range(numlines + 1):
                         arr = f.readline()
@@ -137,6 +158,63 @@ class vtkImageReaderBase(object):
         else:
             return 0
 
+    def CanReadBuffer(self, data, magic=None):
+        """Like CanReadFile(), for the contents of a file held in memory"""
+
+        if magic is None:
+            magic = self.__magic__
+
+        if not data:
+            return 0
+
+        for _magic, _offset in magic:
+
+            # abort early if there's no magic string for this format
+            if _magic == '':
+                return 0
+
+            if isinstance(_magic, str):
+                _magic = _magic.encode('latin-1')
+
+            # negative offsets indicate line-based magic number check
+            if _offset >= 0:
+                arr = data[_offset:_offset + len(_magic)]
+            else:
+                lines = data.split(b'\n', -_offset + 1)
+                arr = lines[-_offset][:len(_magic)] if len(lines) > -_offset else b''
+
+            if arr != _magic:
+                return 0
+
+        return 3
+
+    def SetInputBuffer(self, data):
+        """
+        Read the image from `data`, the bytes of a file, if the underlying VTK reader can
+        decode from memory.  Returns False (and changes nothing) if it can't.
+        """
+
+        reader = self._ImageReader
+
+        if reader.IsA('vtkXMLReader'):
+            reader.ReadFromInputStringOn()
+            reader.SetInputString(data)
+        elif reader.GetClassName() in _MEMORY_BUFFER_READERS:
+            if hasattr(vtk, 'vtkMemoryResourceStream'):
+                stream = vtk.vtkMemoryResourceStream()
+                stream.SetBuffer(data, len(data), True)
+                reader.SetStream(stream)
+            else:
+                reader.SetMemoryBuffer(data)
+                reader.SetMemoryBufferLength(len(data))
+        else:
+            return False
+
+        # the reader may refer to our copy - keep it alive
+        self._buffer = data
+        self._filename = None
+        return True
+
     def SetFileName(self, filename):
 
         # pass on to our reader
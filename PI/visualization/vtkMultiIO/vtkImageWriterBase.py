@@ -1,11 +1,16 @@
 from __future__ import absolute_import
 from builtins import str
 from builtins import object
+import os
+import shutil
+import tempfile
 import vtk
+from vtk.util import numpy_support
 
 import pydicom
 from zope.interface import implementer
 from PI.visualization.vtkMultiIO import interfaces
+from PI.visualization.vtkMultiIO import iobackends
 import logging
 from PI.visualization.vtkMultiIO import MVImage
 
@@ -17,6 +22,7 @@ DEPTH_64 = 1 << 3
 IMAGE_2D = 1 << 4
 IMAGE_3D = 1 << 5
 WHOLE_FILENAME = 1 << 6
+UNSIGNED_ONLY = 1 << 7      # only unsigned integer samples, e.g. PNG and JPEG
 
 logger = logging.getLogger(__name__)
 
@@ -38,8 +44,12 @@ class vtkImageWriterBase(vtkWriterBase):
 
     __capabilities__ = (DEPTH_16)
 
+    # I/O backend used by WriteStreaming() (None - the default backend)
+    _io_backend = None
+
     def __init__(self):
         self._ImageWriter = None
+        self._algorithm_output = None
         self.__image = None
         self.ClearDICOMHeader()
 
@@ -52,6 +62,17 @@ class vtkImageWriterBase(vtkWriterBase):
     def ClearDICOMHeader(self):
         self._ds = pydicom.dataset.Dataset()
 
+    def ClearHeader(self):
+        """Forget the header values of the previous file - called for each new file name"""
+        self.ClearDICOMHeader()
+
+    def SetIOBackend(self, backend):
+        """Write through `backend` (see iobackends.py) - None selects the default backend"""
+        self._io_backend = backend
+
+    def GetIOBackend(self):
+        return self._io_backend or iobackends.GetDefaultBackend()
+
     def ConvertTags(self, ds):
 
         tags = {}
@@ -96,8 +117,10 @@ class vtkImageWriterBase(vtkWriterBase):
         return self._algorithm_output
 
     def SetInputConnection(self, algorithm_output):
+        # keep the pipeline connected so the writer (or WriteStreaming) can request pieces
         self._algorithm_output = algorithm_output
-        self.SetInputData(algorithm_output.GetProducer().GetOutputDataObject(0))
+        self.__image = None
+        self._ImageWriter.SetInputConnection(algorithm_output)
 
     def SetInputData(self, image):
         self.__image = image
@@ -123,3 +146,74 @@ class vtkImageWriterBase(vtkWriterBase):
     def SetupWriter(self):
         """Perform any writer initialization"""
         pass
+
+    def GetStreamingInputConnection(self):
+        """Returns the vtkAlgorithmOutput feeding the underlying writer, or None"""
+        if self._ImageWriter is None or self._ImageWriter.GetNumberOfInputConnections(0) == 0:
+            return None
+        return self._ImageWriter.GetInputConnection(0, 0)
+
+    def SupportsStreaming(self):
+        """Subclasses that implement WriteStreaming() return True when it can be used"""
+        return False
+
+    def WriteStreaming(self, slab_size):
+        """Write the image by requesting and writing `slab_size` z-slices at a time"""
+        raise NotImplementedError
+
+    def WriteToBuffer(self):
+        """
+        Encode the image in memory and return the bytes of the file that Write() would
+        have written.  Formats that write more than one file can't be written to a buffer.
+        """
+
+        writer = self._ImageWriter
+
+        # PNG, JPEG and BMP encode to memory themselves
+        if hasattr(writer, 'WriteToMemoryOn'):
+            writer.WriteToMemoryOn()
+            try:
+                writer.Write()
+            finally:
+                writer.WriteToMemoryOff()
+            return numpy_support.vtk_to_numpy(writer.GetResult()).tobytes()
+
+        if self.SupportsStreaming() and self.GetStreamingInputConnection() is not None:
+            # streamed formats write through an in-memory backend
+            memory = iobackends.MemoryBackend()
+            backend = self._io_backend
+            self.SetIOBackend(memory)
+            try:
+                self.WriteStreaming(vtk.VTK_INT_MAX)
+            finally:
+                self.SetIOBackend(backend)
+            files = dict((name, memory.GetData(name)) for name in memory.GetFileNames())
+        else:
+            files = self._WriteToTempDirectory()
+
+        if len(files) != 1:
+            raise IOError("{0} wrote {1} files - can't return them as a single buffer".format(
+                self.__class__.__name__, len(files)))
+
+        return list(files.values())[0]
+
+    def _WriteToTempDirectory(self):
+        """Let the VTK writer write into a scratch directory and return {name: bytes}"""
+
+        writer = self._ImageWriter
+        filename = writer.GetFileName()
+        directory = tempfile.mkdtemp()
+        try:
+            writer.SetFileName(os.path.join(directory, os.path.basename(filename or 'image')))
+            try:
+                writer.Write()
+            finally:
+                writer.SetFileName(filename)
+
+            files = {}
+            for name in os.listdir(directory):
+                with open(os.path.join(directory, name), 'rb') as _f:
+                    files[name] = _f.read()
+            return files
+        finally:
+            shutil.rmtree(directory, ignore_errors=True)
@@ -62,6 +62,8 @@ import pydicom
 import os
 import gc
 import sys
+import tempfile
+import time
 import vtk
 import logging
 import collections
@@ -70,6 +72,10 @@ from . import vtkImageReaderBase
 from . import _vtkMultiIO
 from . import HeaderDictionary
 from . import exceptions
+from . import instrumentation
+from . import iobackends
+from . import metaimage
+from . import tiffio
 from .utils import GetVTKCompatibleFilename
 from PI.dicom import convert
 
@@ -127,6 +133,12 @@ class MyXMLImageDataReader(vtkImageReaderBase.vtkImageReaderBase):
 
         return 0
 
+    def CanReadBuffer(self, data, magic=None):
+        head = data[:1024]
+        if b'<VTKFile' in head and b'"ImageData"' in head:
+            return 3
+        return 0
+
 ############################################################
 
 
@@ -142,16 +154,9 @@ class MyMetaImageReader(vtkImageReaderBase.vtkImageReaderBase):
 
     def CanReadFile(self, filename, magic=None):
 
-        if not os.access(filename, os.R_OK):
-            return 0
-        try:
-            with open(filename, 'rb') as _f:
-                for i in range(30):
-                    line = _f.readline(50).decode()
-                    if line.startswith('ElementType ='):
-                        return 3
-        except:
-            return 0
+        # the header parsed here is cached and reused for geometry and DICOM keywords
+        if metaimage.IsMetaImageFile(filename):
+            return 3
 
         return 0
 
@@ -166,21 +171,55 @@ class MyMetaImageReader(vtkImageReaderBase.vtkImageReaderBase):
         vtkImageReaderBase.vtkImageReaderBase.UpdateDICOMHeaderInfo(
             self, filename)
 
-        # re-read metafile header - it may contain additional DICOM tags (MicroView specific)
-        header = {}
-
+        # the metafile header may contain additional DICOM tags (MicroView specific)
         try:
-            with open(filename, 'rt') as _f:
-                for line in _f:
-                    key, value = [s.strip() for s in line.split('=', 1)]
-                    if key.startswith('dicom_'):
-                        header[key] = value
-        except:
-            pass
+            header = dict(metaimage.ReadMetaImageHeader(filename)['dicom'])
+        except (IOError, OSError, ValueError):
+            header = {}
 
         ds = self.GetOutput().GetDICOMHeader()
         self._converter.convert_canonical_tags(ds, header)
 
+    def _GetHeader(self):
+        if self._filename is None:
+            return None
+        try:
+            return metaimage.ReadMetaImageHeader(self._filename)
+        except (IOError, OSError, ValueError):
+            return None
+
+    # image geometry comes from the cached header rather than an information pass
+
+    def GetDataExtent(self):
+        header = self._GetHeader()
+        if header is None:
+            return self._ImageReader.GetDataExtent()
+        return header['extent']
+
+    def GetDataSpacing(self):
+        header = self._GetHeader()
+        if header is None:
+            return self._ImageReader.GetDataSpacing()
+        return header['spacing']
+
+    def GetDataOrigin(self):
+        header = self._GetHeader()
+        if header is None:
+            return self._ImageReader.GetDataOrigin()
+        return header['origin']
+
+    def GetDataScalarType(self):
+        header = self._GetHeader()
+        if header is None or header['scalar_type'] is None:
+            return self._ImageReader.GetDataScalarType()
+        return header['scalar_type']
+
+    def GetNumberOfScalarComponents(self):
+        header = self._GetHeader()
+        if header is None:
+            return self._ImageReader.GetNumberOfScalarComponents()
+        return header['components']
+
 ############################################################
 
 
@@ -248,6 +287,49 @@ class MySLCImageReader(vtkImageReaderBase.vtkImageReaderBase):
 ############################################################
 
 
+class MyTIFFReader(vtkImageReaderBase.vtkImageReaderBase):
+
+    """Multi-page TIFF files, read a page per z-slice by tiffio.vtkTIFFStackReader"""
+
+    __extensions__ = {'.tif': 'TIFF', '.tiff': 'TIFF'}
+    __magic__ = [('II*\x00', 0)]
+
+    def __init__(self):
+        vtkImageReaderBase.vtkImageReaderBase.__init__(self)
+        self.SetImageReader(tiffio.vtkTIFFStackReader())
+
+    def SetIOBackend(self, backend):
+        vtkImageReaderBase.vtkImageReaderBase.SetIOBackend(self, backend)
+        self._ImageReader.SetIOBackend(backend)
+
+    def CanReadFile(self, filename, magic=None):
+
+        backend = self.GetIOBackend()
+        if not backend.Exists(filename):
+            return 0
+
+        # either byte order, classic TIFF or BigTIFF
+        with backend.Open(filename, 'rb') as f:
+            return 3 if tiffio.IsTIFFHeader(f.read(4)) else 0
+
+    def CanReadBuffer(self, data, magic=None):
+        return 3 if data and tiffio.IsTIFFHeader(data[:4]) else 0
+
+    def SetInputBuffer(self, data):
+
+        # read the pages out of memory
+        memory = iobackends.MemoryBackend()
+        memory.SetData('buffer.tif', data)
+        self._ImageReader.SetIOBackend(memory)
+        self._ImageReader.SetFileName('buffer.tif')
+
+        self._buffer = data
+        self._filename = None
+        return True
+
+############################################################
+
+
 class vtkMultiImageReader(object):
 
     def __init__(self):
@@ -261,6 +343,22 @@ class vtkMultiImageReader(object):
 
         self._reader_classname = None
 
+        # remember what was asked of us, so that we can be re-created elsewhere
+        self._filename = None
+        self._filenames = None
+        self._filename_kw = {}
+
+        # I/O instrumentation
+        self._metrics_observers = instrumentation.IOMetricsObservers()
+        self._io_metrics = None
+        self._read_start = None
+
+        # I/O backend handed to the readers (None - the default backend)
+        self._io_backend = None
+
+        # file holding an input buffer for readers that can't read from memory
+        self._temp_filename = None
+
         # register file types
         self.registerFileTypes()
 
@@ -270,6 +368,7 @@ class vtkMultiImageReader(object):
 
     def tearDown(self):
 
+        self._RemoveTempFile()
         self._method = {}
         self._reader = None
         self._header = None
@@ -282,6 +381,19 @@ class vtkMultiImageReader(object):
     def GetCoordinateSystem(self):
         return self._reader.GetCoordinateSystem()
 
+    def SetIOBackend(self, backend):
+        """
+        Detect formats and read through `backend` (see iobackends.py).  Readers that
+        read their files themselves (the VTK readers) still need a real file system.
+        None selects the default backend.
+        """
+        self._io_backend = backend
+        if hasattr(self._reader, 'SetIOBackend'):
+            self._reader.SetIOBackend(backend)
+
+    def GetIOBackend(self):
+        return self._io_backend or iobackends.GetDefaultBackend()
+
     def clear_reader(self):
         self._reader = None
         gc.collect()
@@ -306,6 +418,9 @@ class vtkMultiImageReader(object):
         self.registerFileType({'.slc': 'SLC'}, MySLCImageReader, [('', 0)], (
             vtkImageReaderBase.DEPTH_8 | vtkImageReaderBase.DEPTH_16 | vtkImageReaderBase.DEPTH_32 |
             vtkImageReaderBase.DEPTH_64 | vtkImageReaderBase.IMAGE_3D))
+        self.registerFileType({'.tif': 'TIFF', '.tiff': 'TIFF'}, MyTIFFReader, [('II*\x00', 0)], (
+            vtkImageReaderBase.DEPTH_8 | vtkImageReaderBase.DEPTH_16 | vtkImageReaderBase.DEPTH_32 |
+            vtkImageReaderBase.IMAGE_2D | vtkImageReaderBase.IMAGE_3D))
 
         # Register MINC
         if 'vtkMINCImageReader' in dir(vtk):
@@ -385,14 +500,7 @@ class vtkMultiImageReader(object):
 
             description, classname, capabilities = self._wholefilename_map[
                 f][0]
-            self._reader = classname()
-            self._reader_classname = classname
-            self._header = None
-
-            # If any Progress methods have been registered, attach them now
-            for k in list(self._method.keys()):
-                for meth in self._method[k][:]:
-                    self._reader.AddObserver(k, meth)
+            self._InstallReader(classname, classname())
             return True
         else:
             return False
@@ -425,29 +533,40 @@ class vtkMultiImageReader(object):
                 if output is not None:
                     output.ReleaseData()
                 self._reader = None
-            self._reader_classname = classname
-            self._reader = reader
-            self._header = None
+            self._InstallReader(classname, reader)
         else:
             return False
 
+        return True
+
+    def _InstallReader(self, classname, reader):
+        """Make `reader` (an instance of `classname`) the active reader"""
+
+        self._reader_classname = classname
+        self._reader = reader
+        self._header = None
+
+        if self._io_backend is not None and hasattr(reader, 'SetIOBackend'):
+            reader.SetIOBackend(self._io_backend)
+
         # If any Progress methods have been registered, attach them now
         for k in list(self._method.keys()):
             for meth in self._method[k][:]:
                 self._reader.AddObserver(k, meth)
-        return True
 
     def SetReaderByMagicNumber(self, filename):
 
         # convert filename to given locale
         filename = GetVTKCompatibleFilename(filename)
 
-        if not os.path.exists(filename):
+        backend = self.GetIOBackend()
+
+        if not backend.Exists(filename):
             # abort early if file isn't present
             return None, None
 
         try:
-            sz = os.stat(filename).st_size
+            sz = backend.GetSize(filename)
             # abort early if file is zero bytes long
             if sz == 0:
                 return None, None
@@ -481,6 +600,8 @@ class vtkMultiImageReader(object):
                 if hasattr(classname, 'CanReadFile'):
 
                     reader = classname()
+                    if self._io_backend is not None and hasattr(reader, 'SetIOBackend'):
+                        reader.SetIOBackend(self._io_backend)
                     try:
                         try:
                             if reader.CanReadFile(filename) > 0:
@@ -498,12 +619,119 @@ class vtkMultiImageReader(object):
                         logger.exception(e)
                 else:
                     # rely on code in vtkImageReaderBase
-                    if vtkImageReaderBase.vtkImageReaderBase().CanReadFile(filename, magic=magic) > 0:
+                    base = vtkImageReaderBase.vtkImageReaderBase()
+                    base.SetIOBackend(self._io_backend)
+                    if base.CanReadFile(filename, magic=magic) > 0:
                         self._usemm = usemm
                         return (classname, classname())
 
         return None, None
 
+    def _DetectBufferReader(self, data, name=None):
+        """Magic number detection on the contents of a file - returns (classname, reader)"""
+
+        keys = sorted(self._extension_map.keys())
+
+        # examine most likely classes first
+        ext = os.path.splitext(name or '')[1].lower()
+        if ext in keys:
+            keys.remove(ext)
+            keys.insert(0, ext)
+
+        classname_list = []
+
+        for extension in keys:
+
+            for entry in self._extension_map[extension]:
+
+                description, classname, magic, _capabilities, usemm = entry
+
+                if classname in classname_list:
+                    continue
+
+                classname_list.append(classname)
+
+                try:
+                    if hasattr(classname, 'CanReadFile'):
+                        reader = classname()
+                        if hasattr(reader, 'CanReadBuffer') and reader.CanReadBuffer(data, magic) > 0:
+                            self._usemm = usemm
+                            return (classname, reader)
+                    elif vtkImageReaderBase.vtkImageReaderBase().CanReadBuffer(data, magic=magic) > 0:
+                        self._usemm = usemm
+                        return (classname, classname())
+                except Exception as e:
+                    logger.exception(e)
+
+        return None, None
+
+    def _RemoveTempFile(self):
+        if self._temp_filename is not None:
+            try:
+                os.remove(self._temp_filename)
+            except OSError:
+                pass
+            self._temp_filename = None
+
+    def SetInputBuffer(self, buffer, name=None):
+        """
+        Load an image from the contents of a file held in memory (bytes, bytearray,
+        memoryview...) - e.g. received over the network - rather than from disk.  `name`
+        is an optional filename used as a hint for formats without a magic number.
+
+        The format is detected from the buffer's magic number.  Readers that can decode
+        from memory read the buffer directly; for the others the buffer is written to a
+        temporary file, which is removed with the next input or when the reader is torn
+        down.  Either way GetFileName() and GetRecipe() have no filename to report.
+        """
+
+        data = bytes(buffer)
+
+        self._RemoveTempFile()
+        self._header = None
+        self._filename = None
+        self._filenames = None
+        self._filename_kw = {}
+
+        metrics = instrumentation.IOMetrics('read', name)
+
+        with instrumentation.Stopwatch(metrics, 'detection_time'):
+            classname, reader = self._DetectBufferReader(data, name)
+
+        if classname is not None and hasattr(reader, 'SetInputBuffer'):
+            with instrumentation.Stopwatch(metrics, 'header_time'):
+                ret = reader.SetInputBuffer(data)
+            if ret:
+                if self._reader is not None:
+                    output = self._reader.GetOutput()
+                    if output is not None:
+                        output.ReleaseData()
+                    self._reader = None
+                self._InstallReader(classname, reader)
+                self._AttachIOMetrics(metrics)
+                return True
+
+        # no reader can decode this buffer from memory - go through a file
+        suffix = os.path.splitext(name or '')[1]
+        if not suffix and classname is not None and getattr(classname, '__extensions__', None):
+            suffix = sorted(classname.__extensions__)[0]
+
+        fd, filename = tempfile.mkstemp(suffix=suffix)
+        with os.fdopen(fd, 'wb') as _f:
+            _f.write(data)
+
+        try:
+            ret = self.SetFileName(filename)
+        finally:
+            self._temp_filename = filename
+            # the temporary file is private to this reader
+            self._filename = None
+
+        if ret and self._io_metrics is not None:
+            self._io_metrics.filename = name
+
+        return ret
+
     def SetFilePattern(self, pat):
 
         # convert filename to given locale
@@ -531,7 +759,12 @@ class vtkMultiImageReader(object):
     def SetFileNames(self, filename_array, **kw):
         """load image from a collection of slices"""
 
+        self._RemoveTempFile()
         self._header = None
+        self._filename = None
+        self._filenames = [filename_array.GetValue(i)
+                           for i in range(filename_array.GetNumberOfValues())]
+        self._filename_kw = kw
 
         # extract first filename from array
         filename = filename_array.GetValue(0)
@@ -539,36 +772,49 @@ class vtkMultiImageReader(object):
         # convert filename to given locale
         filename = GetVTKCompatibleFilename(filename)
 
+        metrics = instrumentation.IOMetrics('read', filename)
+
         # adjust reader so it understands the first file slice
         extension = os.path.splitext(
             os.path.basename(filename).lower())[-1][1:]
-        ret = self.SetExtension(extension, filename)
+        with instrumentation.Stopwatch(metrics, 'detection_time'):
+            ret = self.SetExtension(extension, filename)
 
         # And call it's SetFileNames() method
         if not ret:
             logger.error("Unable to load images")
             return ret
         else:
-            ret = self._reader.SetFileNames(filename_array, **kw)
+            with instrumentation.Stopwatch(metrics, 'header_time'):
+                ret = self._reader.SetFileNames(filename_array, **kw)
+            self._AttachIOMetrics(metrics)
             if ret is None:
                 ret = True
             return ret
 
     def SetFileName(self, filename, **kw):
 
+        self._RemoveTempFile()
         self._header = None
 
         filename = GetVTKCompatibleFilename(filename)
 
+        self._filename = filename
+        self._filenames = None
+        self._filename_kw = kw
+
         temp = os.path.basename(filename).lower()
 
-        # attempt to map by the whole filename
-        ret = self.SetWholeName(temp)
+        metrics = instrumentation.IOMetrics('read', filename)
 
-        # if this fails, map by the file's extension
-        if not ret:
-            extension = os.path.splitext(temp)[-1][1:]
-            ret = self.SetExtension(extension, filename)
+        with instrumentation.Stopwatch(metrics, 'detection_time'):
+            # attempt to map by the whole filename
+            ret = self.SetWholeName(temp)
+
+            # if this fails, map by the file's extension
+            if not ret:
+                extension = os.path.splitext(temp)[-1][1:]
+                ret = self.SetExtension(extension, filename)
 
         # And call it's SetFileName() method
         if not ret:
@@ -593,12 +839,60 @@ class vtkMultiImageReader(object):
                 filename = filename.encode(
                     sys.getfilesystemencoding() or 'UTF-8')
 
-            ret = self._reader.SetFileName(filename, **kw)
+            with instrumentation.Stopwatch(metrics, 'header_time'):
+                ret = self._reader.SetFileName(filename, **kw)
+            self._AttachIOMetrics(metrics)
             if ret is None:
                 ret = True
             return ret
 
+    def _AttachIOMetrics(self, metrics):
+        """Watch the underlying reader so that the voxel read itself gets timed too"""
+
+        metrics.classname = self.GetReaderClassName()
+        self._io_metrics = metrics
+        self._read_start = None
+
+        if hasattr(self._reader, 'AddObserver'):
+            self._reader.AddObserver('StartEvent', self._OnReadStart)
+            self._reader.AddObserver('EndEvent', self._OnReadEnd)
+
+    def _OnReadStart(self, caller, evt):
+        self._read_start = time.perf_counter()
+
+    def _OnReadEnd(self, caller, evt):
+
+        metrics = self._io_metrics
+        if metrics is None or self._read_start is None:
+            return
+
+        metrics.io_time = time.perf_counter() - self._read_start
+        self._read_start = None
+
+        if hasattr(caller, 'GetOutputDataObject'):
+            output = caller.GetOutputDataObject(0)
+            if output is not None and output.IsA('vtkImageData'):
+                metrics.bytes = instrumentation.GetImageDataSize(output)
+
+        self._metrics_observers.Notify(metrics)
+
+    def AddIOMetricsObserver(self, callback):
+        """
+        Register a callable that receives an IOMetrics record each time an image has been
+        read.  Returns a handle for RemoveIOMetricsObserver().
+        """
+        return self._metrics_observers.AddObserver(callback)
+
+    def RemoveIOMetricsObserver(self, handle):
+        self._metrics_observers.RemoveObserver(handle)
+
+    def GetLastIOMetrics(self):
+        """Returns the IOMetrics record of the most recent read, or None"""
+        return self._metrics_observers.GetLastMetrics()
+
     def GetFileName(self):
+        if self._temp_filename is not None:
+            return self._filename
         if hasattr(self._reader, 'GetFileName'):
             return self._reader.GetFileName()
         else:
@@ -616,6 +910,16 @@ class vtkMultiImageReader(object):
     def GetOutputPort(self):
         return self._reader.GetOutputPort()
 
+    def GetSharedOutput(self, name=None):
+        """
+        Returns the image as a SharedMVImage, so that other processes can attach to the
+        voxel buffer by name instead of loading their own copy.  The caller owns the
+        shared memory block and is responsible for unlinking it.
+        """
+        # multiprocessing.shared_memory is only needed here
+        from .SharedMVImage import SharedMVImage
+        return SharedMVImage.FromImage(self.GetOutput(), name=name)
+
     def __repr__(self):
         """
         Return the readers registered
@@ -692,3 +996,90 @@ class vtkMultiImageReader(object):
 
     def SetProgressText(self, text):
         self._reader.SetProgressText(text)
+
+    def GetRecipe(self):
+        """
+        Returns a picklable vtkMultiImageReaderRecipe describing this reader's current
+        configuration.  Send the recipe (or this reader, which pickles as its recipe) to
+        worker processes instead of the loaded image.
+        """
+
+        header = None
+        if self._header is not None:
+            header = dict(self._header)
+
+        coordinate_system = None
+        if hasattr(self._reader, 'GetCoordinateSystem'):
+            coordinate_system = self._reader.GetCoordinateSystem()
+
+        return vtkMultiImageReaderRecipe(reader_class=self._reader_classname,
+                                         filename=self._filename,
+                                         filenames=self._filenames,
+                                         kw=self._filename_kw,
+                                         header=header,
+                                         coordinate_system=coordinate_system,
+                                         usemm=self._usemm)
+
+    def __reduce__(self):
+        return (_ReaderFromRecipe, (self.GetRecipe(),))
+
+
+def _ReaderFromRecipe(recipe):
+    return recipe.CreateReader()
+
+
+class vtkMultiImageReaderRecipe(object):
+
+    """
+    A picklable description of a configured vtkMultiImageReader.
+
+    Only the filename(s), the reader class chosen by format detection and a few plain
+    settings are stored.  CreateReader() rebuilds an equivalent reader - typically inside
+    a multiprocessing or concurrent.futures worker - without repeating format detection.
+    Reader classes are pickled by reference, so plugin readers must be importable in
+    the worker process.
+    """
+
+    def __init__(self, reader_class=None, filename=None, filenames=None, kw=None,
+                 header=None, coordinate_system=None, usemm=1):
+        self.reader_class = reader_class
+        self.filename = filename
+        self.filenames = filenames
+        self.kw = kw or {}
+        self.header = header
+        self.coordinate_system = coordinate_system
+        self.usemm = usemm
+
+    def CreateReader(self):
+        """Returns a new vtkMultiImageReader configured from this recipe"""
+
+        reader = vtkMultiImageReader()
+
+        if self.reader_class is None:
+            # nothing was detected - nothing to restore
+            return reader
+
+        reader._InstallReader(self.reader_class, self.reader_class())
+        reader._usemm = self.usemm
+
+        if self.filenames:
+            filename_array = vtk.vtkStringArray()
+            for filename in self.filenames:
+                filename_array.InsertNextValue(filename)
+            reader._filenames = list(self.filenames)
+            reader._filename_kw = self.kw
+            reader._reader.SetFileNames(filename_array, **self.kw)
+            reader._AttachIOMetrics(instrumentation.IOMetrics('read', self.filenames[0]))
+        elif self.filename:
+            reader._filename = self.filename
+            reader._filename_kw = self.kw
+            reader._reader.SetFileName(self.filename, **self.kw)
+            reader._AttachIOMetrics(instrumentation.IOMetrics('read', self.filename))
+
+        if self.coordinate_system is not None:
+            reader.SetCoordinateSystem(self.coordinate_system)
+
+        if self.header is not None:
+            reader.SetHeader(self.header)
+
+        return reader
@@ -51,12 +51,22 @@ from __future__ import absolute_import
 from builtins import str
 from builtins import object
 import collections
+import concurrent.futures
 import os
 import logging
+import shutil
 import sys
+import tempfile
+import threading
 import vtk
+from vtk.util.numpy_support import numpy_to_vtk, vtk_to_numpy
 from . import vtkImageWriterBase
 from . import _vtkMultiIO
+from . import instrumentation
+from . import iobackends
+from . import scalarconvert
+from . import streaming
+from . import tiffio
 from .utils import GetVTKCompatibleFilename
 from PI.visualization.vtkMultiIO import MVImage
 from PI.visualization.vtkMultiIO import vtkImageWriterBase
@@ -72,6 +82,21 @@ class MyVTKDataSetWriter(vtkImageWriterBase.vtkImageWriterBase):
         vtkImageWriterBase.vtkImageWriterBase.__init__(self)
         self.SetImageWriter(vtk.vtkDataSetWriter())
 
+    def SupportsStreaming(self):
+        return self._ImageWriter.GetFileType() == vtk.VTK_BINARY
+
+    def WriteStreaming(self, slab_size):
+
+        stream = streaming.ImageSlabStream(self.GetStreamingInputConnection(), slab_size)
+
+        self._ImageWriter.InvokeEvent('StartEvent')
+        with self.GetIOBackend().Open(self._ImageWriter.GetFileName(), 'wb') as _f:
+            _f.write(streaming.GetLegacyVTKHeader(stream))
+            streaming.WriteSlabs(_f, stream, streaming.GetLegacyVTKDataType(stream),
+                                 self._ImageWriter.UpdateProgress)
+            _f.write(b'\n')
+        self._ImageWriter.InvokeEvent('EndEvent')
+
 ############################################################
 
 
@@ -85,32 +110,58 @@ class MyMetaImageWriter(vtkImageWriterBase.vtkImageWriterBase):
 
     def Write(self):
 
-        # write image
-        self._ImageWriter.Write()
-
-        # adjust header values
-        filename = self._ImageWriter.GetFileName()
-        header = collections.OrderedDict()
+        # vtkMetaImageWriter knows nothing of DICOM keywords - images that have some are
+        # written as a single slab by WriteStreaming(), whose header includes them
+        if self.ConvertTags(self.GetDICOMHeader()) and \
+                self.GetStreamingInputConnection() is not None:
+            self.WriteStreaming(vtk.VTK_INT_MAX)
+        else:
+            self._ImageWriter.Write()
 
-        try:
-            with open(filename, 'rt') as _f:
-                for line in _f:
-                    key, value = [s.strip() for s in line.split('=', 1)]
-                    header[key] = value
-        except:
-            pass
+    def SupportsStreaming(self):
+        return True
 
-        # migrate DICOM values as well
-        header2 = self.ConvertTags(self.GetDICOMHeader())
+    def WriteStreaming(self, slab_size):
 
-        try:
-            with open(filename, 'wt') as _f:
-                for key in header:
-                    _f.write("{0} = {1}\n".format(key, header[key]))
-                for key in header2:
-                    _f.write("{0} = {1}\n".format(key, header2[key]))
-        except:
-            pass
+        stream = streaming.ImageSlabStream(self.GetStreamingInputConnection(), slab_size)
+        filename = self._ImageWriter.GetFileName()
+        keywords = self.ConvertTags(self.GetDICOMHeader())
+        compressed = bool(self._ImageWriter.GetCompression())
+        progress = self._ImageWriter.UpdateProgress
+        backend = self.GetIOBackend()
+
+        self._ImageWriter.InvokeEvent('StartEvent')
+        if filename.lower().endswith('.mha'):
+            with backend.Open(filename, 'wb') as _f:
+                if compressed:
+                    # the compressed size precedes the data, so the compressed data is
+                    # spooled (to disk once it outgrows memory) until the header is written
+                    with tempfile.SpooledTemporaryFile(max_size=64 << 20) as spool:
+                        for chunk in streaming.CompressSlabs(stream, progress=progress):
+                            spool.write(chunk)
+                        _f.write(streaming.GetMetaImageHeader(
+                            stream, 'LOCAL', keywords, spool.tell()))
+                        spool.seek(0)
+                        shutil.copyfileobj(spool, _f, 1 << 20)
+                else:
+                    _f.write(streaming.GetMetaImageHeader(stream, 'LOCAL', keywords))
+                    streaming.WriteSlabs(_f, stream, progress=progress)
+        else:
+            rawfilename = self._ImageWriter.GetRAWFileName() or \
+                streaming.GetMetaImageRawFileName(filename, compressed)
+            compressed_size = None
+            with backend.Open(rawfilename, 'wb') as _f:
+                if compressed:
+                    compressed_size = 0
+                    for chunk in streaming.CompressSlabs(stream, progress=progress):
+                        _f.write(chunk)
+                        compressed_size += len(chunk)
+                else:
+                    streaming.WriteSlabs(_f, stream, progress=progress)
+            with backend.Open(filename, 'wb') as _f:
+                _f.write(streaming.GetMetaImageHeader(
+                    stream, os.path.basename(rawfilename), keywords, compressed_size))
+        self._ImageWriter.InvokeEvent('EndEvent')
 
 ############################################################
 
@@ -151,14 +202,111 @@ class MyMINCImageWriter(vtkImageWriterBase.vtkImageWriterBase):
 
 class MyTIFFWriter(vtkImageWriterBase.vtkImageWriterBase):
 
+    """
+    Multi-page TIFF writer - one page per z-slice, compressed on a pool of threads by
+    tiffio.WriteTIFF().  Without tifffile, PackBits files are written by vtkTIFFWriter
+    and LZW can't be written at all (VTK's libtiff leaves the LZW encoder out).
+    """
+
     __extensions__ = {'.tif': 'TIFF', '.tiff': 'TIFF'}
 
     def __init__(self):
         vtkImageWriterBase.vtkImageWriterBase.__init__(self)
         self.SetImageWriter(vtk.vtkTIFFWriter())
+        self._compression = tiffio.DEFLATE
+        self._number_of_threads = 0
+
+    def SetCompression(self, compression):
+        """Select 'deflate' (the default), 'lzw', 'packbits' or 'none'"""
+        if compression not in tiffio.COMPRESSIONS:
+            raise ValueError("Unknown TIFF compression '{0}'".format(compression))
+        self._compression = compression
+        self.SetupWriter()
+
+    def GetCompression(self):
+        return self._compression
+
+    def SetCompressionToDeflate(self):
+        self.SetCompression(tiffio.DEFLATE)
+
+    def SetCompressionToLZW(self):
+        self.SetCompression(tiffio.LZW)
+
+    def SetCompressionToPackBits(self):
+        self.SetCompression(tiffio.PACKBITS)
+
+    def SetCompressionToNoCompression(self):
+        self.SetCompression(tiffio.NONE)
+
+    def SetNumberOfThreads(self, threads):
+        """Threads compressing strips - 0 (the default) for one per CPU"""
+        self._number_of_threads = threads
+
+    def GetNumberOfThreads(self):
+        return self._number_of_threads
 
     def SetupWriter(self):
-        self._ImageWriter.SetCompressionToNoCompression()
+        {tiffio.NONE: self._ImageWriter.SetCompressionToNoCompression,
+         tiffio.DEFLATE: self._ImageWriter.SetCompressionToDeflate,
+         tiffio.LZW: self._ImageWriter.SetCompressionToLZW,
+         tiffio.PACKBITS: self._ImageWriter.SetCompressionToPackBits}[self._compression]()
+
+    def _GetInput(self):
+        writer = self._ImageWriter
+        writer.GetInputAlgorithm().Update(writer.GetInputConnection(0, 0).GetIndex())
+        return writer.GetInput()
+
+    def _WriteTIFF(self, filename, backend):
+        """Returns False if tiffio can't write the current compression"""
+
+        if not tiffio.CanWrite(self._compression):
+            return False
+
+        writer = self._ImageWriter
+        writer.InvokeEvent('StartEvent')
+        try:
+            tiffio.WriteTIFF(filename, self._GetInput(), self._compression,
+                             self._number_of_threads or None, backend, writer.UpdateProgress)
+        finally:
+            writer.InvokeEvent('EndEvent')
+        return True
+
+    def _WriteWithVTK(self):
+
+        if self._compression == tiffio.LZW:
+            raise IOError("LZW compressed TIFF files can only be written with tifffile")
+        logger.info("Writing {0} TIFF with vtkTIFFWriter".format(self._compression))
+
+        writer = self._ImageWriter
+        image = self._GetInput()
+        if image.GetDimensions()[2] == 1:
+            writer.Write()
+            return
+
+        # vtkTIFFWriter stores the rows of volumes bottom-up - flip them to the top-down
+        # order of every other page tiffio writes or reads (holding on to the producer
+        # of the input, which nothing else may reference while the flip is connected)
+        connection = writer.GetInputConnection(0, 0)
+        producer = connection.GetProducer()
+        flip = vtk.vtkImageFlip()
+        flip.SetFilteredAxis(1)
+        flip.SetInputData(image)
+        writer.SetInputConnection(flip.GetOutputPort())
+        try:
+            writer.Write()
+        finally:
+            writer.SetInputConnection(producer.GetOutputPort(connection.GetIndex()))
+
+    def Write(self):
+        if not self._WriteTIFF(self._ImageWriter.GetFileName(), self.GetIOBackend()):
+            self._WriteWithVTK()
+
+    def WriteToBuffer(self):
+        memory = iobackends.MemoryBackend()
+        filename = self._ImageWriter.GetFileName() or 'image.tif'
+        if not self._WriteTIFF(filename, memory):
+            return vtkImageWriterBase.vtkImageWriterBase.WriteToBuffer(self)
+        return memory.GetData(filename)
 
 ############################################################
 
@@ -193,9 +341,22 @@ class MyVFFWriter(vtkImageWriterBase.vtkImageWriterBase):
         vtkImageWriterBase.vtkImageWriterBase.__init__(self)
         self.SetImageWriter(_vtkMultiIO.vtkVFFWriter())
 
-    def SetInput(self, image):
+        # shadow copy of the header keywords, for WriteStreaming()
+        self._keywords = {}
 
-        vtkImageWriterBase.vtkImageWriterBase.SetInput(self, image)
+    def SetKeyword(self, key, value):
+        self._ImageWriter.SetKeyword(key, value)
+        if key not in streaming.VFF_RESERVED_KEYWORDS:
+            self._keywords[key] = value
+
+    def ClearHeader(self):
+        vtkImageWriterBase.vtkImageWriterBase.ClearHeader(self)
+        self._ImageWriter.ClearKeywords()
+        self._keywords = {}
+
+    def SetInputData(self, image):
+
+        vtkImageWriterBase.vtkImageWriterBase.SetInputData(self, image)
 
         # migrate DICOM values to vff header values here
         header = self.ConvertTags(self.GetDICOMHeader())
@@ -203,7 +364,26 @@ class MyVFFWriter(vtkImageWriterBase.vtkImageWriterBase):
             try:
                 self.SetKeyword(key, header[key])
             except Exception as e:
-                logger.error("Unable to convert tag {0}".format(name))
+                logger.error("Unable to convert tag {0}".format(key))
+
+    def SupportsStreaming(self):
+        # file prefix/pattern (one file per slice) output isn't streamed, and neither
+        # are checksummed files - vtkVFFWriter computes the checksums as it writes
+        writer = self._ImageWriter
+        if writer.GetChecksumMode() or writer.GetRequireChecksums():
+            return False
+        return bool(writer.GetFileName())
+
+    def WriteStreaming(self, slab_size):
+
+        stream = streaming.ImageSlabStream(self.GetStreamingInputConnection(), slab_size)
+
+        self._ImageWriter.InvokeEvent('StartEvent')
+        with self.GetIOBackend().Open(self._ImageWriter.GetFileName(), 'wb') as _f:
+            _f.write(streaming.GetVFFHeader(stream, self._keywords))
+            streaming.WriteSlabs(_f, stream, streaming.GetVFFDataType(stream),
+                                 self._ImageWriter.UpdateProgress)
+        self._ImageWriter.InvokeEvent('EndEvent')
 
 ############################################################
 
@@ -213,13 +393,30 @@ class vtkMultiImageWriter(object):
     def __init__(self):
         self._extension_map = {}
         self._wholefilename_map = {}
+
+        # registered extension lengths, longest first - see _FindWriterClass()
+        self._suffix_lengths = []
         self._writer = vtk.vtkDataSetWriter()
         self._writer.SetFileTypeToBinary()
         self._observers = {}
         self._date = ""
         self._time = ""
         self._observer_id = 0
+        self._observer_tags = {}
         self._ds = None
+        self._slab_size = 0
+
+        # scalar conversion for writers that can't store the input's scalar type
+        self._conversion_policy = scalarconvert.RESCALE
+        self._window = None
+        self._converter = None
+
+        # I/O backend handed to the writers (None - the default backend)
+        self._io_backend = None
+
+        # I/O instrumentation
+        self._metrics_observers = instrumentation.IOMetricsObservers()
+        self._io_metrics = None
 
         # register file types
         self.registerFileTypes()
@@ -230,26 +427,97 @@ class vtkMultiImageWriter(object):
 
     def SetInputData(self, image):
 
+        self._window = None
+        real_image = image
+
         if image:
             if isinstance(image, MVImage.MVImage):
                 ds = image.GetDICOMHeader()
                 header = image.GetHeader()
-                ##image = image.GetRealImage()
+                real_image = image.GetRealImage()
                 # might as well set header from this
-                self.SetDICOMHeader(ds)
-                self.SetHeader(header)
-
-        # a TIFF hack -- TIFF writer needs unsigned shorts rather than signed
-        # shorts
-        if image and self._writer.GetClassName() in ('vtkTIFFWriter',):
-            if image.GetScalarTypeAsString() == 'short':
-                cast = vtk.vtkImageCast()
-                cast.SetInput(image)
-                cast.SetOutputScalarTypeToUnsignedShort()
-                image = cast.GetOutput()
+                with instrumentation.Stopwatch(self._io_metrics, 'header_time'):
+                    self.SetDICOMHeader(ds)
+                    self.SetHeader(header)
+                self._window = scalarconvert.GetDICOMWindow(ds)
+
+        # convert scalar types the writer can't store
+        converted = self._ConvertScalars(real_image)
+        if isinstance(converted, vtk.vtkAlgorithm):
+            # the writer still takes the input's header, but reads the converter's slabs
+            self._writer.SetInputData(image)
+            self._writer.SetInputConnection(converted.GetOutputPort())
+            return
+        if converted is not real_image:
+            image = converted
 
         self._writer.SetInputData(image)
 
+    def SetScalarConversionPolicy(self, policy):
+        """
+        Choose how images are converted for writers that can't store their scalar type,
+        judged by the writer's DEPTH_* and UNSIGNED_ONLY capabilities - e.g. 16 bit
+        volumes written as PNG or JPEG.  One of the scalarconvert policies:
+
+            'rescale'  map the DICOM window (WindowCenter/WindowWidth) of an MVImage
+                       input, or the input's scalar range, onto the target type (default)
+            'clamp'    clip values to the range of the target type
+            'cast'     plain conversion; out of range values wrap
+            'none'     hand the writer the input unchanged
+        """
+        if policy not in scalarconvert.POLICIES:
+            raise ValueError("Unknown scalar conversion policy '{0}'".format(policy))
+        self._conversion_policy = policy
+
+    def GetScalarConversionPolicy(self):
+        return self._conversion_policy
+
+    def _GetTargetScalarType(self, scalar_type, classname):
+        """Returns the scalar type `classname` needs in place of `scalar_type`, or None"""
+
+        if self._conversion_policy == scalarconvert.NONE:
+            return None
+
+        capabilities = 0
+        for entries in list(self._extension_map.values()) + \
+                list(self._wholefilename_map.values()):
+            for _, _classname, _capabilities in entries:
+                if _classname is classname:
+                    capabilities |= _capabilities
+
+        return scalarconvert.GetTargetScalarType(scalar_type, capabilities)
+
+    def _ConvertScalars(self, image):
+        """
+        Returns `image` converted for the current writer, or `image` itself.  Writers
+        that stream get a vtkImageScalarConvert filter instead, which converts each slab
+        as it is requested.
+        """
+
+        scalars = image.GetPointData().GetScalars() if image else None
+        if scalars is None:
+            return image
+
+        target = self._GetTargetScalarType(scalars.GetDataType(), self._writer.__class__)
+        if target is None:
+            return image
+
+        logger.info("Converting {0} scalars to {1} ({2}) for {3}".format(
+            scalars.GetDataTypeAsString(), scalarconvert.GetNumpyType(target),
+            self._conversion_policy, self._writer.__class__.__name__))
+
+        if not (hasattr(self._writer, 'SupportsStreaming') and self._writer.SupportsStreaming()):
+            return scalarconvert.ConvertImage(image, target, self._conversion_policy,
+                                              self._window)
+
+        window = self._window
+        if window is None and self._conversion_policy == scalarconvert.RESCALE:
+            window = scalarconvert.GetRangeWindow(vtk_to_numpy(scalars))
+        self._converter = scalarconvert.vtkImageScalarConvert(
+            target, self._conversion_policy, window)
+        self._converter.SetInputDataObject(0, image)
+        return self._converter
+
     def registerFileTypes(self):
 
         # These are the only built-in image writers that are guaranteed to
@@ -260,15 +528,20 @@ class vtkMultiImageWriter(object):
         self.registerFileType({'.pnm': 'Portable anymap',
                                '.ppm': 'Portable pixmap',
                                '.pbm': 'Portable bitmap'}, MyPNMImageWriter,
-                              (vtkImageWriterBase.DEPTH_8 | vtkImageWriterBase.IMAGE_2D))
-        # self.registerFileType({'.tiff': 'TIFF', '.tif': 'TIFF'}, MyTIFFWriter, (
-        #    vtkImageWriterBase.DEPTH_8 | vtkImageWriterBase.DEPTH_16 | vtkImageWriterBase.DEPTH_32 | vtkImageWriterBase.IMAGE_2D))
+                              (vtkImageWriterBase.DEPTH_8 | vtkImageWriterBase.UNSIGNED_ONLY |
+                               vtkImageWriterBase.IMAGE_2D))
+        self.registerFileType({'.tiff': 'TIFF', '.tif': 'TIFF'}, MyTIFFWriter, (
+            vtkImageWriterBase.DEPTH_8 | vtkImageWriterBase.DEPTH_16 | vtkImageWriterBase.DEPTH_32 |
+            vtkImageWriterBase.IMAGE_2D | vtkImageWriterBase.IMAGE_3D))
         self.registerFileType({'.png': 'PNG'}, MyPNGWriter, (
-            vtkImageWriterBase.DEPTH_8 | vtkImageWriterBase.IMAGE_2D))
+            vtkImageWriterBase.DEPTH_8 | vtkImageWriterBase.DEPTH_16 |
+            vtkImageWriterBase.UNSIGNED_ONLY | vtkImageWriterBase.IMAGE_2D))
         self.registerFileType({'.jpg': 'JPEG', '.jpeg': 'JPEG'}, MyJPEGWriter, (
-            vtkImageWriterBase.DEPTH_8 | vtkImageWriterBase.IMAGE_2D))
+            vtkImageWriterBase.DEPTH_8 | vtkImageWriterBase.UNSIGNED_ONLY |
+            vtkImageWriterBase.IMAGE_2D))
         self.registerFileType({'.bmp': 'Windows BMP'}, MyBMPImageWriter, (
-            vtkImageWriterBase.DEPTH_8 | vtkImageWriterBase.IMAGE_2D))
+            vtkImageWriterBase.DEPTH_8 | vtkImageWriterBase.UNSIGNED_ONLY |
+            vtkImageWriterBase.IMAGE_2D))
         self.registerFileType({'.mhd': 'UNC Meta', '.mha': 'UNC Meta'}, MyMetaImageWriter, (
             vtkImageWriterBase.DEPTH_8 | vtkImageWriterBase.DEPTH_16 | vtkImageWriterBase.DEPTH_32 |
             vtkImageWriterBase.IMAGE_3D))
@@ -280,9 +553,186 @@ class vtkMultiImageWriter(object):
 
     def Write(self):
         """Write the image to disk - capture and forward VTK errors as python errors"""
-        self._writer.Write()
-        if hasattr(self._writer, 'GetErrorCode'):
-            code = self._writer.GetErrorCode()
+
+        metrics = self._io_metrics
+        if metrics is None:
+            metrics = instrumentation.IOMetrics('write', self._writer.GetFileName())
+            metrics.classname = self._writer.__class__.__name__
+
+        with instrumentation.Stopwatch(metrics, 'io_time'):
+            if self._slab_size > 0 and self._CanStream():
+                self._writer.WriteStreaming(self._slab_size)
+            else:
+                if self._slab_size > 0:
+                    logger.info("{0} can't stream - writing image in one piece".format(
+                        self._writer.__class__.__name__))
+                self._writer.Write()
+
+        metrics.bytes = self._GetBytesWritten(metrics.filename)
+        self._metrics_observers.Notify(metrics)
+
+        # timings start over with the next file
+        self._io_metrics = None
+
+        self._CheckErrorCode()
+
+    def WriteToBuffer(self):
+        """
+        Encode the image in memory instead of writing it to disk and return the bytes of
+        the file.  SetFileName() still chooses the format, but nothing is written to
+        that file.  Formats that write more than one file (e.g. .mhd) can't be written
+        to a buffer.
+        """
+
+        if not hasattr(self._writer, 'WriteToBuffer'):
+            raise IOError("{0} can't write to a buffer".format(self._writer.GetClassName()))
+
+        metrics = self._io_metrics
+        if metrics is None:
+            metrics = instrumentation.IOMetrics('write', self._writer.GetFileName())
+            metrics.classname = self._writer.__class__.__name__
+
+        with instrumentation.Stopwatch(metrics, 'io_time'):
+            data = self._writer.WriteToBuffer()
+
+        metrics.bytes = len(data)
+        self._metrics_observers.Notify(metrics)
+        self._io_metrics = None
+
+        self._CheckErrorCode()
+
+        return data
+
+    def WriteSeries(self, pattern, z_range=None, max_workers=None):
+        """
+        Write each z-slice of the input as a file of its own, named by `pattern` - a
+        printf style pattern such as 'slice_%04d.png' given the slice's z index - and
+        return the list of filenames written.  `z_range` is an inclusive (first, last)
+        pair of z indices, by default the whole input.
+
+        Slices are encoded concurrently by `max_workers` threads (default: one per CPU),
+        each with a writer of its own.  Every slice is handed to its writer as a
+        zero-copy view of the input's scalars.  The pattern's extension picks the format,
+        so 2D formats (PNG, JPEG, BMP, PNM) can export volumes.  ProgressEvents are
+        invoked on the calling thread as slices complete.
+
+        Every slice is written with the DICOM header given to SetDICOMHeader() (or that
+        of an MVImage input), for formats that store one.  Other header values, set
+        with SetHeader(), are not written to the slices.
+        """
+
+        image = self._GetInputImage()
+        extent = image.GetExtent()
+        first, last = z_range if z_range is not None else extent[4:6]
+        if first > last or first < extent[4] or last > extent[5]:
+            raise ValueError("z range {0} is outside the input's z extent {1}".format(
+                (first, last), tuple(extent[4:6])))
+
+        try:
+            filenames = [pattern % z for z in range(first, last + 1)]
+        except (TypeError, ValueError):
+            filenames = []
+        if len(set(filenames)) != last - first + 1:
+            raise ValueError("File pattern '{0}' needs a single integer placeholder for the "
+                             "slice index, e.g. 'slice_%04d.png'".format(pattern))
+
+        metrics = instrumentation.IOMetrics('write', pattern)
+        with instrumentation.Stopwatch(metrics, 'detection_time'):
+            classname = self._FindWriterClass(pattern)
+            if classname is None:
+                raise AttributeError(
+                    'Unknown file extension. Please re-enter filename with an explicit extension.')
+            # the writer for the series receives observers and progress
+            self._SetWriterClass(classname)
+        metrics.classname = classname.__name__
+
+        scalars = image.GetPointData().GetScalars()
+        nx, ny, nz = image.GetDimensions()
+        planes = vtk_to_numpy(scalars).reshape(nz, nx * ny, -1)
+        ds = self._ds
+        local = threading.local()
+
+        # slices the writer can't store are converted one at a time, as they're written
+        scalar_type = scalars.GetDataType()
+        target = self._GetTargetScalarType(scalar_type, classname)
+        window = self._window
+        if target is not None:
+            scalar_type = target
+            if window is None and self._conversion_policy == scalarconvert.RESCALE:
+                window = scalarconvert.GetRangeWindow(planes)
+
+        def write(index):
+            writer = getattr(local, 'writer', None)
+            if writer is None:
+                writer = local.writer = self._CreateWriter(classname)
+                if ds is not None and hasattr(writer, 'SetDICOMHeader'):
+                    writer.SetDICOMHeader(ds)
+
+            z = first + index
+            plane = vtk.vtkImageData()
+            plane.SetExtent(extent[0], extent[1], extent[2], extent[3], z, z)
+            plane.SetOrigin(image.GetOrigin())
+            plane.SetSpacing(image.GetSpacing())
+            values = planes[z - extent[4]]
+            if target is not None:
+                values = scalarconvert.ConvertArray(
+                    values, scalarconvert.GetNumpyType(target), self._conversion_policy, window)
+            array = numpy_to_vtk(values, array_type=scalar_type)
+            array.SetName(scalars.GetName())
+            plane.GetPointData().SetScalars(array)
+
+            writer.SetFileName(filenames[index])
+            writer.SetupWriter()
+            writer.SetInputData(plane)
+            writer.Write()
+            self._CheckErrorCode(writer)
+
+        if max_workers is None:
+            max_workers = min(32, os.cpu_count() or 1)
+
+        self._writer.InvokeEvent('StartEvent')
+        try:
+            with instrumentation.Stopwatch(metrics, 'io_time'):
+                with concurrent.futures.ThreadPoolExecutor(max_workers=max_workers) as executor:
+                    futures = [executor.submit(write, index)
+                               for index in range(len(filenames))]
+                    for completed, future in enumerate(
+                            concurrent.futures.as_completed(futures), 1):
+                        future.result()
+                        self._writer.UpdateProgress(float(completed) / len(futures))
+        finally:
+            self._writer.InvokeEvent('EndEvent')
+
+        metrics.bytes = sum(self._GetBytesWritten(f) for f in filenames)
+        self._metrics_observers.Notify(metrics)
+        self._io_metrics = None
+
+        return filenames
+
+    def _GetInputImage(self):
+        """Returns the vtkImageData connected to the current writer, updated"""
+
+        if self._writer is None or self._writer.GetNumberOfInputConnections(0) == 0:
+            raise ValueError("No input image - call SetInputData() first")
+        self._writer.GetInputAlgorithm().Update()
+        return self._writer.GetInput()
+
+    def _CreateWriter(self, classname):
+        """Returns a new, configured writer instance of `classname`"""
+
+        writer = classname()
+        if writer.IsA('vtkDataSetWriter'):
+            writer.SetFileTypeToBinary()
+        if self._io_backend is not None and hasattr(writer, 'SetIOBackend'):
+            writer.SetIOBackend(self._io_backend)
+        return writer
+
+    def _CheckErrorCode(self, writer=None):
+        """Raise VTK writer errors as python errors"""
+
+        writer = writer or self._writer
+        if hasattr(writer, 'GetErrorCode'):
+            code = writer.GetErrorCode()
             if code > 0:
                 errmessage = {1: 'File Not Found Error',
                               2: 'Cannot Open File Error',
@@ -291,9 +741,67 @@ class vtkMultiImageWriter(object):
                               5: 'File Format Error',
                               6: 'No FileName Error',
                               7: 'Out of Disk Space Error',
-                              8: 'Unknown Error'}[code]
+                              8: 'Unknown Error'}.get(code)
+                # the VTK writers report vtkErrorCode values
+                errmessage = errmessage or vtk.vtkErrorCode.GetStringFromErrorCode(code)
                 raise IOError(code, errmessage)
 
+    def SetStreamingSlabSize(self, slab_size):
+        """
+        Write images in z-slabs of `slab_size` slices, requesting each slab from the
+        upstream pipeline in turn, for formats that support it (VFF, MetaImage
+        and binary legacy VTK).  Connect the input with SetInputConnection()
+        so the whole image never has to be in memory.  0 disables streaming.
+        """
+        self._slab_size = max(int(slab_size), 0)
+
+    def GetStreamingSlabSize(self):
+        return self._slab_size
+
+    def _CanStream(self):
+        return hasattr(self._writer, 'SupportsStreaming') and self._writer.SupportsStreaming() and \
+            self._writer.GetStreamingInputConnection() is not None
+
+    def SetIOBackend(self, backend):
+        """
+        Write through `backend` (see iobackends.py).  Only streamed writes go through
+        the backend - the VTK writers write their files themselves.  None selects the
+        default backend.
+        """
+        self._io_backend = backend
+        if hasattr(self._writer, 'SetIOBackend'):
+            self._writer.SetIOBackend(backend)
+
+    def GetIOBackend(self):
+        return self._io_backend or iobackends.GetDefaultBackend()
+
+    def _GetBytesWritten(self, filename):
+
+        # prefer the size of what actually landed on disk, fall back to the input size
+        try:
+            return self.GetIOBackend().GetSize(filename)
+        except (IOError, OSError, TypeError):
+            pass
+
+        try:
+            return instrumentation.GetImageDataSize(self._writer.GetInput())
+        except Exception:
+            return 0
+
+    def AddIOMetricsObserver(self, callback):
+        """
+        Register a callable that receives an IOMetrics record each time an image has been
+        written.  Returns a handle for RemoveIOMetricsObserver().
+        """
+        return self._metrics_observers.AddObserver(callback)
+
+    def RemoveIOMetricsObserver(self, handle):
+        self._metrics_observers.RemoveObserver(handle)
+
+    def GetLastIOMetrics(self):
+        """Returns the IOMetrics record of the most recent write, or None"""
+        return self._metrics_observers.GetLastMetrics()
+
     def GetClassName(self):
         return "vtkMultiImageWriter"
 
@@ -308,6 +816,10 @@ class vtkMultiImageWriter(object):
             self._extension_map[e_lower].append(
                 (extensions[e] + ' file', classname, capabilities))
 
+            if len(e_lower) not in self._suffix_lengths:
+                self._suffix_lengths.append(len(e_lower))
+                self._suffix_lengths.sort(reverse=True)
+
     def registerWholeFileName(self, extensions, classname, capabilities):
 
         for i in extensions:
@@ -323,59 +835,91 @@ class vtkMultiImageWriter(object):
     def SetWholeName(self, filename):
         f = filename.lower()
         if (f in self._wholefilename_map):
-            if (self._writer != None):
-                self._writer = None
-            self._writer = self._wholefilename_map[f]()
-            self._writer.SetupWriter()
-            # If any Progress methods have been registered, attach them now
-            for val in list(self._observers.values()):
-                self._writer.AddObserver(val[0], val[1])
+            self._SetWriterClass(self._wholefilename_map[f][0][1])
             return True
         else:
             return False
 
-    def SetWriterByFileExtension(self, filename):
+    def _FindWriterClass(self, filename):
+        """Returns the writer class registered for the longest extension `filename` ends
+        with, or None"""
 
         flower = filename.lower()
+        for length in self._suffix_lengths:
+            entries = self._extension_map.get(flower[-length:])
+            if entries:
+                return entries[0][1]
+        return None
 
-        self._writer = None
-
-        for entry in self._extension_map:
-            if flower.endswith(entry):
-                self._writer = self._extension_map[entry][0][1]()
+    def SetWriterByFileExtension(self, filename):
 
-        if self._writer is None:
+        classname = self._FindWriterClass(filename)
+        if classname is None:
             raise AttributeError(
                 'Unknown file extension. Please re-enter filename with an explicit extension.')
 
-        self._writer.SetupWriter()
+        self._SetWriterClass(classname)
+        return True
 
-        # Handle built-in type initializations
-        if self._writer.IsA('vtkDataSetWriter'):
-            self._writer.SetFileTypeToBinary()
+    def _SetWriterClass(self, classname):
+        """
+        Make the current writer an instance of `classname`.  The current writer is kept,
+        with its configuration and observers, if it already is one - so a series of
+        files in the same format is written by a single writer instance.  Returns True
+        if a new writer was created.
+        """
+
+        if self._writer is not None and self._writer.__class__ is classname:
+            return False
+
+        self._DetachObservers()
+        self._writer = self._CreateWriter(classname)
 
         # If any Progress methods have been registered, attach them now
-        for val in list(self._observers.values()):
-            self._writer.AddObserver(val[0], val[1])
+        self._AttachObservers()
         return True
 
+    def _AttachObservers(self):
+        self._observer_tags = {}
+        for handle, val in list(self._observers.items()):
+            self._observer_tags[handle] = self._writer.AddObserver(val[0], val[1])
+
+    def _DetachObservers(self):
+        if self._writer is not None:
+            for tag in self._observer_tags.values():
+                self._writer.RemoveObserver(tag)
+        self._observer_tags = {}
+
     def SetFileName(self, filename):
 
         filename = GetVTKCompatibleFilename(filename)
 
         temp = os.path.basename(filename).lower()
 
-        # attempt to map by the whole filename
-        ret = self.SetWholeName(temp)
+        metrics = instrumentation.IOMetrics('write', filename)
+
+        with instrumentation.Stopwatch(metrics, 'detection_time'):
+            # attempt to map by the whole filename
+            ret = self.SetWholeName(temp)
 
-        # if this fails, map by the file's extension
-        if not ret:
-            ret = self.SetWriterByFileExtension(filename)
+            # if this fails, map by the file's extension
+            if not ret:
+                ret = self.SetWriterByFileExtension(filename)
+
+        metrics.classname = self._writer.__class__.__name__
+        self._io_metrics = metrics
+
+        # a reused writer mustn't carry the previous file's header values over
+        if hasattr(self._writer, 'ClearHeader'):
+            self._writer.ClearHeader()
+        self._ds = None
 
         # And call it's SetFileName() method
         ret = self._writer.SetFileName(filename)
 
-        self._writer.SetupWriter()
+        # the one per-file SetupWriter() call, for new and reused writers alike
+        with instrumentation.Stopwatch(metrics, 'header_time'):
+            self._writer.SetupWriter()
 
         return ret
 
@@ -386,19 +930,22 @@ class vtkMultiImageWriter(object):
         return list(self._extension_map.keys())
 
     def AddObserver(self, event, method):
-        self._observer_id += self._observer_id
+        self._observer_id += 1
         index = self._observer_id
-        self._observers[self._observer_id] = (event, method)
+        self._observers[index] = (event, method)
         if self._writer is not None:
-            index = self._writer.AddObserver(event, method)
+            self._observer_tags[index] = self._writer.AddObserver(event, method)
         return index
 
     def RemoveObserver(self, handle):
         del(self._observers[handle])
-        if self._writer is not None:
-            self._writer.RemoveObserver(handle)
+        tag = self._observer_tags.pop(handle, None)
+        if self._writer is not None and tag is not None:
+            self._writer.RemoveObserver(tag)
 
     def SetDICOMHeader(self, ds):
+        # kept for the writers WriteSeries() creates
+        self._ds = ds
         if hasattr(self._writer, 'SetDICOMHeader'):
             # let image writer handle DICOM tags directly
             self._writer.SetDICOMHeader(ds)
@@ -50,19 +50,74 @@ default class, call registerFileType(extension, classname).
 from builtins import object
 import collections
 import os
+import struct
 import sys
 import vtk
 import logging
+from . import fastmesh
+from . import lodcache
 
 logger = logging.getLogger(__name__)
 
+# number of bytes read from the start of a file for signature matching
+SIGNATURE_HEADER_SIZE = 1024
+
+
+def _IsSTLFile(header, size):
+    # binary STL: 80 byte header, triangle count, 50 bytes per triangle
+    if size >= 84 and len(header) >= 84:
+        count = struct.unpack('<I', header[80:84])[0]
+        if 84 + 50 * count == size:
+            return True
+    return header.lstrip()[:5].lower() == b'solid'
+
+
+def _IsXMLPolyDataFile(header, size):
+    return b'<VTKFile' in header and b'"PolyData"' in header
+
+
+def ReadSignatureHeader(filename):
+    """Returns (the first SIGNATURE_HEADER_SIZE bytes, file size), or (b'', 0)"""
+    try:
+        with open(filename, 'rb') as f:
+            size = os.fstat(f.fileno()).st_size
+            return f.read(SIGNATURE_HEADER_SIZE), size
+    except (IOError, OSError):
+        return b'', 0
+
+
+def MatchSignature(signature, header, size):
+    """
+    True if a file with the given header bytes and size matches `signature` - either
+    a list of (magic, offset) pairs that must all match, or a callable(header, size)
+    """
+    if not header:
+        return False
+    if callable(signature):
+        return bool(signature(header, size))
+    for magic, offset in signature:
+        if magic == '' or magic == b'':
+            return False
+        if isinstance(magic, str):
+            magic = magic.encode('latin-1')
+        if header[offset:offset + len(magic)] != magic:
+            return False
+    return True
+
 
 class vtkMultiPolyDataReader(object):
 
     def __init__(self):
         self._extension_map = {}
         self._all_readers = []
+        self._signatures = {}
         self._reader = vtk.vtkPolyDataReader()
+        self._filename = None
+
+        # level of detail - see SetLODTargetSize()
+        self._lod_target = 0
+        self._lod_cache = lodcache.MeshLODCache()
+        self._lod_output = None
 
         # register file types
         self.registerFileTypes()
@@ -74,16 +129,22 @@ class vtkMultiPolyDataReader(object):
 
         # Add built in readers
         try:
-            self.registerFileType({'.vtk': 'VTK'}, vtk.vtkDataSetReader)
+            self.registerFileType({'.vtk': 'VTK'}, vtk.vtkDataSetReader,
+                                  [('# vtk DataFile', 0)])
         except:
             logger.error("Unable to find vtkDataSetReader")
         try:
             self.registerFileType({'.obj': 'Wavefront OBJ'}, vtk.vtkOBJReader)
         except:
             logger.error("Unable to find vtkOBJReader")
+        # numpy fast paths for binary STL and PLY, ahead of the VTK readers
+        self.registerFileType({'.stl': 'Stereo Lithography'},
+                              fastmesh.vtkNumpySTLReader, fastmesh.IsBinarySTLFile)
+        self.registerFileType({'.ply': 'PLY'},
+                              fastmesh.vtkNumpyPLYReader, fastmesh.IsBinaryPLYFile)
         try:
             self.registerFileType(
-                {'.stl': 'Stereo Lithography'}, vtk.vtkSTLReader)
+                {'.stl': 'Stereo Lithography'}, vtk.vtkSTLReader, _IsSTLFile)
         except:
             logger.error("Unable to find vtkSTLReader")
         if vtk.vtkVersion().GetVTKMajorVersion() == 5:
@@ -92,12 +153,12 @@ class vtkMultiPolyDataReader(object):
             except:
                 logger.error("Unable to find vtkPLOT3DReader")
         try:
-            self.registerFileType({'.ply': 'PLY'}, vtk.vtkPLYReader)
+            self.registerFileType({'.ply': 'PLY'}, vtk.vtkPLYReader, [('ply', 0)])
         except:
             logger.error("Unable to find vtkPLYReader")
         try:
             self.registerFileType(
-                {'.vtp': 'VTK XML'}, vtk.vtkXMLPolyDataReader)
+                {'.vtp': 'VTK XML'}, vtk.vtkXMLPolyDataReader, _IsXMLPolyDataFile)
         except:
             logger.error("Unable to find vtkXMLPolyDataReader")
         try:
@@ -114,14 +175,23 @@ class vtkMultiPolyDataReader(object):
         except:
             logger.error("Unable to find vtkPDBReader")
 
-    def registerFileType(self, extensions, classname):
+    def registerFileType(self, extensions, classname, signature=None):
         """
         extension is a dictionary similar to PIL.Image.EXTENSION dictionary
+
+        signature identifies the format from the start of a file without constructing
+        the reader - a list of (magic, offset) pairs or a callable(header, size), see
+        MatchSignature().  Reader classes may instead declare a __magic__ list.
         """
 
         # keep track of all reader classes
         self._all_readers.append(classname)
 
+        if signature is None:
+            signature = getattr(classname, '__magic__', None)
+        if signature:
+            self._signatures[classname] = signature
+
         # iterate over all extensions
         for e in extensions:
             e_lower = e.lower()
@@ -142,12 +212,48 @@ class vtkMultiPolyDataReader(object):
         self._reader = self._extension_map[ext][0][1]()
         return self._reader
 
+    def _FindReaderClass(self, filename):
+        """
+        Identify the reader from a single read of the file's header, checking the
+        readers registered for the file's extension first.  A reader without a signature
+        is trusted on its extension.  Returns None if nothing matched.
+        """
+
+        header, size = ReadSignatureHeader(filename)
+
+        extension = os.path.splitext(os.path.basename(filename).lower())[-1]
+        candidates = [c for _, c in self._extension_map.get(extension, [])]
+        candidates += [c for c in self._all_readers if c not in candidates]
+
+        for c in candidates:
+            signature = self._signatures.get(c)
+            if signature and MatchSignature(signature, header, size):
+                return c
+
+        for c in candidates[:len(self._extension_map.get(extension, []))]:
+            if c not in self._signatures:
+                return c
+
+        return None
+
     def SetFileName(self, filename):
 
-        # first, iterate through all readers that have a 'CanReadFile' method
         self._reader = None
+        self._filename = filename
+        self._lod_output = None
+
+        # match file signatures first, constructing only the reader that is chosen
+        c = self._FindReaderClass(filename)
+        if c is not None:
+            self._reader = c()
 
+        # otherwise iterate through the readers without a signature that have a
+        # 'CanReadFile' method
         for c in self._all_readers:
+            if self._reader is not None:
+                break
+            if c in self._signatures:
+                continue
             if hasattr(c, 'CanReadFile'):
                 # reader has a CanReadFile() method - let's use it
                 reader = c()
@@ -177,8 +283,44 @@ class vtkMultiPolyDataReader(object):
     def __getattr__(self, attr):
         return getattr(self._reader, attr)
 
+    def SetLODTargetSize(self, triangles):
+        """
+        Make GetOutput() return a decimated level of detail of about `triangles`
+        triangles, cached on disk (see lodcache.py) so that later loads of the same
+        file skip the full resolution read.  0 (the default) disables LOD.  The full
+        resolution mesh is available from GetFullResolutionOutput().
+        """
+        self._lod_target = max(int(triangles), 0)
+        self._lod_output = None
+
+    def GetLODTargetSize(self):
+        return self._lod_target
+
+    def SetLODCacheDirectory(self, directory):
+        self._lod_cache = lodcache.MeshLODCache(directory)
+        self._lod_output = None
+
+    def GetLODCacheDirectory(self):
+        return self._lod_cache.GetDirectory()
+
+    def Update(self):
+        if self._lod_target > 0 and self._filename is not None:
+            if self._lod_output is None:
+                self._lod_output = self._lod_cache.GetLevel(
+                    self._filename, self._lod_target, self._reader)
+        else:
+            self._reader.Update()
+
     def GetOutput(self):
-        """Get the polydata object"""
+        """Get the polydata object - the coarse level when LOD is enabled"""
+        if self._lod_target > 0 and self._filename is not None:
+            self.Update()
+            return self._lod_output
+        return self._reader.GetOutput()
+
+    def GetFullResolutionOutput(self):
+        """Read (if not done yet) and return the mesh at full resolution"""
+        self._reader.Update()
         return self._reader.GetOutput()
 
     def GetExtensions(self):
@@ -199,6 +341,7 @@ class vtkMultiPolyDataReader(object):
 
                 if description not in formats:
                     formats[description] = []
-                formats[description].append(val)
+                if val not in formats[description]:
+                    formats[description].append(val)
 
         return formats
@@ -54,6 +54,17 @@ import sys
 import logging
 import vtk
 
+logger = logging.getLogger(__name__)
+
+# default options for the built in writers - see vtkMultiPolyDataWriter.registerFileType
+BINARY_OPTIONS = {'FileType': vtk.VTK_BINARY}
+
+XML_OPTIONS = {'DataMode': vtk.vtkXMLWriter.Appended,
+               'EncodeAppendedData': 0,
+               'HeaderType': vtk.vtkXMLWriter.UInt64}
+if hasattr(vtk.vtkXMLWriter, 'ZLIB'):
+    XML_OPTIONS['CompressorType'] = vtk.vtkXMLWriter.ZLIB
+
 
 class vtkMultiPolyDataWriter(object):
 
@@ -62,21 +73,33 @@ class vtkMultiPolyDataWriter(object):
         self._scalars_name = 'scalars'
         self._writer = vtk.vtkPolyDataWriter()
 
+        # per-extension option overrides, see SetWriterOptions()
+        self._options = {}
+
         # register file types
         self.registerFileTypes()
 
     def registerFileTypes(self):
         # Add built in writers
-        self.registerFileType({'.vtk': 'VTK PolyData'}, vtk.vtkPolyDataWriter)
+        self.registerFileType({'.vtk': 'VTK PolyData'}, vtk.vtkPolyDataWriter, BINARY_OPTIONS)
         self.registerFileType({'.iv': 'OpenInventor'}, vtk.vtkIVWriter)
         self.registerFileType({
-                              '.stl': 'Stereo Lithography'}, vtk.vtkSTLWriter)
-        self.registerFileType({'.ply': 'Stanford PLY'}, vtk.vtkPLYWriter)
+                              '.stl': 'Stereo Lithography'}, vtk.vtkSTLWriter, BINARY_OPTIONS)
+        self.registerFileType({'.ply': 'Stanford PLY'}, vtk.vtkPLYWriter, BINARY_OPTIONS)
         self.registerFileType({
                               '.obj': 'MNI surface mesh'}, vtk.vtkMNIObjectWriter)
-        self.registerFileType({'.vtp': 'VTK XML'}, vtk.vtkXMLPolyDataWriter)
+        self.registerFileType({'.vtp': 'VTK XML'}, vtk.vtkXMLPolyDataWriter, XML_OPTIONS)
 
-    def registerFileType(self, extensions, classname):
+    def registerFileType(self, extensions, classname, options=None):
+        """
+        options is a dictionary of writer properties applied to each new writer, named
+        as the writer's Set methods without the 'Set' - e.g. {'FileType': vtk.VTK_BINARY}
+        or {'CompressorType': vtk.vtkXMLWriter.LZ4, 'CompressionLevel': 9}.  Writer
+        classes may instead declare an __options__ dictionary.
+        """
+
+        if options is None:
+            options = getattr(classname, '__options__', None)
 
         # iterate over all extensions
         for e in extensions:
@@ -85,7 +108,7 @@ class vtkMultiPolyDataWriter(object):
                 self._extension_map[e_lower] = []
 
             self._extension_map[e_lower].append(
-                (extensions[e] + ' file', classname))
+                (extensions[e] + ' file', classname, dict(options or {})))
 
     def GetClassName(self):
         return "vtkMultiPolyDataWriter"
@@ -102,10 +125,54 @@ class vtkMultiPolyDataWriter(object):
         # only consider the first writer that can handle this extension
         # TODO: we could extend this by passing a description of writer -- can wx filedialogs return the
         # extension we selected?
-        _, classname = self._extension_map[ext][0]
+        _, classname, options = self._extension_map[ext][0]
 
         self._writer = classname()
 
+        options = dict(options)
+        options.update(self._options.get(ext, {}))
+        self._ApplyOptions(self._writer, options)
+
+    @staticmethod
+    def _ApplyOptions(writer, options):
+        for key, value in options.items():
+            setter = getattr(writer, 'Set' + key, None)
+            if setter is None:
+                logger.warning("{0} has no {1} option".format(writer.GetClassName(), key))
+                continue
+            setter(value)
+
+    def SetWriterOptions(self, ext, **options):
+        """
+        Override the registered options of the writer for extension `ext`, e.g.
+
+            writer.SetWriterOptions('.vtp', CompressorType=vtk.vtkXMLWriter.LZ4,
+                                    CompressionLevel=1)
+            writer.SetWriterOptions('.stl', FileType=vtk.VTK_ASCII)
+
+        Takes effect from the next SetFileName() or SetExtension().
+        """
+        ext = ext.lower()
+        if ext not in self._extension_map:
+            raise AttributeError('Unknown file extension {0}'.format(ext))
+        self._options.setdefault(ext, {}).update(options)
+
+    def GetWriterOptions(self, ext):
+        """Returns the options the writer for extension `ext` will be created with"""
+        ext = ext.lower()
+        if ext not in self._extension_map:
+            raise AttributeError('Unknown file extension {0}'.format(ext))
+        options = dict(self._extension_map[ext][0][2])
+        options.update(self._options.get(ext, {}))
+        return options
+
+    def ClearWriterOptions(self, ext=None):
+        """Go back to the registered options for `ext` (or for every extension)"""
+        if ext is None:
+            self._options = {}
+        else:
+            self._options.pop(ext.lower(), None)
+
     def SetFileName(self, filename):
         temp = os.path.basename(filename).lower()
         extension = os.path.splitext(temp)[-1]
@@ -143,7 +210,7 @@ class vtkMultiPolyDataWriter(object):
         keys.sort()
         for extension in keys:
             for entry in self._extension_map[extension]:
-                description, classname = entry
+                description, classname, _options = entry
 
                 if extension.startswith('.'):
                     val = '*' + extension
@@ -0,0 +1,378 @@
+#!/usr/bin/env python
+"""
+Image reader/writer benchmark for vtkMultiIO.
+
+Synthesizes volumes of several sizes, scalar types and component counts, writes each
+one through every writer registered with vtkMultiImageWriter, reads it back through
+vtkMultiImageReader and records write/read throughput, format detection latency and
+peak resident memory.  Every case runs in its own forked process so that peak RSS
+figures don't bleed into each other.
+
+By default only the formats built into vtkMultiIO are exercised; --plugins also loads
+readers and writers registered through entry points.  Results are written as JSON;
+pass a previous result file with --compare to flag regressions.
+
+    python benchmarks/bench_image_io.py -o results.json
+    python benchmarks/bench_image_io.py --sizes 64,128 --formats .vff,.vtk -o new.json \\
+        --compare results.json --threshold 15
+"""
+
+import argparse
+import json
+import multiprocessing
+import os
+import platform
+import resource
+import shutil
+import sys
+import tempfile
+import time
+import traceback
+
+import numpy as np
+import vtk
+from vtk.util.numpy_support import numpy_to_vtk, vtk_to_numpy
+
+from PI.visualization.vtkMultiIO import vtkImageWriterBase
+from PI.visualization.vtkMultiIO import vtkMultiImageReader
+from PI.visualization.vtkMultiIO import vtkMultiImageWriter
+
+_DTYPES = {'uint8': vtkImageWriterBase.DEPTH_8,
+           'int16': vtkImageWriterBase.DEPTH_16,
+           'uint16': vtkImageWriterBase.DEPTH_16,
+           'float32': vtkImageWriterBase.DEPTH_32,
+           'float64': vtkImageWriterBase.DEPTH_64}
+
+# set from the command line - load entry point plugins as well as built-in formats
+_use_plugins = False
+
+# metrics compared by --compare, and whether a larger value is better
+_COMPARED = {'write_throughput': True,
+             'read_throughput': True,
+             'read_detection_time': False,
+             'peak_rss': False}
+
+
+def SynthesizeVolume(size, dtype, components, seed=0):
+    """Returns a reproducible vtkImageData of size**3 (or size**2 if 2D) voxels"""
+
+    nx, ny, nz = size
+    rng = np.random.RandomState(seed)
+
+    # a smooth gradient plus noise, so compressing writers have something realistic to do
+    z, y, x = np.mgrid[0:nz, 0:ny, 0:nx]
+    base = (x + y + z).astype(np.float64) / max(nx + ny + nz - 3, 1)
+    base = base[..., np.newaxis] + 0.1 * rng.standard_normal((nz, ny, nx, components))
+
+    if np.issubdtype(np.dtype(dtype), np.integer):
+        info = np.iinfo(dtype)
+        lo, hi = max(info.min, 0), min(info.max, 4095)
+        arr = np.clip(base * (hi - lo) + lo, info.min, info.max).astype(dtype)
+    else:
+        arr = base.astype(dtype)
+
+    image = vtk.vtkImageData()
+    image.SetDimensions(nx, ny, nz)
+    image.SetSpacing(0.1, 0.1, 0.1)
+    scalars = numpy_to_vtk(arr.reshape(-1, components), deep=1)
+    scalars.SetName('scalars')
+    image.GetPointData().SetScalars(scalars)
+
+    return image
+
+
+def CreateWriter():
+    if _use_plugins:
+        from PI.visualization.vtkMultiIO import vtkLoadWriters
+        return vtkLoadWriters.LoadImageWriters()[0]
+    return vtkMultiImageWriter.vtkMultiImageWriter()
+
+
+def CreateReader():
+    if _use_plugins:
+        from PI.visualization.vtkMultiIO import vtkLoadReaders
+        return vtkLoadReaders.LoadImageReaders()[0]
+    return vtkMultiImageReader.vtkMultiImageReader()
+
+
+def GetPeakRSS():
+    """Returns the peak resident set size of this process in bytes"""
+
+    try:
+        with open('/proc/self/status') as _f:
+            for line in _f:
+                if line.startswith('VmHWM:'):
+                    return int(line.split()[1]) * 1024
+    except IOError:
+        pass
+
+    # ru_maxrss is in kilobytes on linux, bytes on macOS
+    scale = 1 if sys.platform == 'darwin' else 1024
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss * scale
+
+
+def ResetPeakRSS():
+    """Resets the kernel's high-water mark so peak RSS reflects only what follows"""
+
+    try:
+        with open('/proc/self/clear_refs', 'w') as _f:
+            _f.write('5')
+        return True
+    except IOError:
+        return False
+
+
+def RunCase(case, workdir):
+    """Write and read back a single case - runs in a child process"""
+
+    result = dict(case)
+    size = case['size']
+    image = SynthesizeVolume(size, case['dtype'], case['components'])
+    filename = os.path.join(workdir, 'bench_{0}x{1}x{2}_{3}_{4}{5}'.format(
+        size[0], size[1], size[2], case['dtype'], case['components'], case['extension']))
+
+    reset = ResetPeakRSS()
+    baseline = GetPeakRSS()
+
+    # write
+    writer = CreateWriter()
+    t0 = time.perf_counter()
+    writer.SetFileName(filename)
+    writer.SetInputData(image)
+    writer.Write()
+    write_wall = time.perf_counter() - t0
+    write_metrics = writer.GetLastIOMetrics()
+
+    # read back
+    reader = CreateReader()
+    t0 = time.perf_counter()
+    if not reader.SetFileName(filename):
+        raise IOError('no registered reader recognizes {0}'.format(
+            os.path.basename(filename)))
+    reader.Update()
+    read_wall = time.perf_counter() - t0
+    read_metrics = reader.GetLastIOMetrics()
+    output = reader.GetOutput()
+
+    nbytes = image.GetNumberOfPoints() * image.GetScalarSize() * \
+        image.GetNumberOfScalarComponents()
+
+    result['writer'] = write_metrics.classname if write_metrics else None
+    result['reader'] = reader.GetReaderClassName()
+    result['voxel_bytes'] = nbytes
+    result['file_bytes'] = os.path.getsize(filename)
+    result['write_time'] = write_wall
+    result['write_throughput'] = nbytes / (1024.0 * 1024.0) / write_wall
+    result['read_time'] = read_wall
+    result['read_throughput'] = nbytes / (1024.0 * 1024.0) / read_wall
+    result['read_detection_time'] = read_metrics.detection_time if read_metrics else None
+    result['read_header_time'] = read_metrics.header_time if read_metrics else None
+    result['peak_rss'] = GetPeakRSS()
+    result['peak_rss_delta'] = result['peak_rss'] - baseline if reset else None
+    result['roundtrip'] = _CompareImages(image, output)
+
+    os.remove(filename)
+
+    return result
+
+
+def _CompareImages(original, output):
+    """Returns 'exact', 'lossy' or 'mismatch'"""
+
+    scalars = output.GetPointData().GetScalars() if output else None
+    if scalars is None or output.GetDimensions() != original.GetDimensions():
+        return 'mismatch'
+
+    a = vtk_to_numpy(original.GetPointData().GetScalars())
+    b = vtk_to_numpy(scalars)
+    if a.size != b.size:
+        return 'mismatch'
+
+    b = b.reshape(a.shape)
+
+    # some formats store rows bottom-up; accept either orientation
+    nx, ny, nz = original.GetDimensions()
+    flipped = b.reshape(nz, ny, nx, -1)[:, ::-1].reshape(a.shape)
+    if np.array_equal(a, b) or np.array_equal(a, flipped):
+        return 'exact'
+    return 'lossy'
+
+
+def _CaseWorker(case, workdir, conn):
+    try:
+        conn.send(RunCase(case, workdir))
+    except Exception:
+        result = dict(case)
+        result['error'] = traceback.format_exc().strip().splitlines()[-1]
+        conn.send(result)
+    finally:
+        conn.close()
+
+
+def RunIsolated(case, workdir, timeout):
+    """Run a case in a forked child so that its peak RSS is measured in isolation"""
+
+    ctx = multiprocessing.get_context('fork')
+    parent, child = ctx.Pipe(duplex=False)
+    proc = ctx.Process(target=_CaseWorker, args=(case, workdir, child))
+    proc.start()
+    child.close()
+
+    if parent.poll(timeout):
+        result = parent.recv()
+    else:
+        result = dict(case)
+        result['error'] = 'timed out after {0}s'.format(timeout)
+        proc.terminate()
+
+    proc.join()
+    return result
+
+
+def BuildCases(sizes, dtypes, components, formats):
+    """Enumerate every (writer, size, scalar type, component count) the writer supports"""
+
+    writer = CreateWriter()
+    cases = []
+
+    for extension in sorted(writer.GetExtensions()):
+        if formats and extension not in formats:
+            continue
+
+        description, classname, capabilities = writer._extension_map[extension][0]
+        is_3d = capabilities & vtkImageWriterBase.IMAGE_3D
+
+        for n in sizes:
+            size = (n, n, n) if is_3d else (n, n, 1)
+            for dtype in dtypes:
+                if not capabilities & _DTYPES[dtype]:
+                    continue
+                for nc in components:
+                    cases.append({'name': '{0}/{1}/{2}/{3}'.format(extension, n, dtype, nc),
+                                  'extension': extension,
+                                  'format': description,
+                                  'size': size,
+                                  'dtype': dtype,
+                                  'components': nc})
+
+    return cases
+
+
+def GetEnvironment():
+    return {'python': platform.python_version(),
+            'vtk': vtk.vtkVersion.GetVTKVersion(),
+            'numpy': np.__version__,
+            'platform': platform.platform(),
+            'machine': platform.machine(),
+            'cpu_count': os.cpu_count(),
+            'timestamp': time.strftime('%Y-%m-%dT%H:%M:%S')}
+
+
+def Compare(results, baseline, threshold):
+    """Returns a list of (case, metric, old, new, percent) regressions beyond threshold %"""
+
+    old = {r['name']: r for r in baseline['results'] if 'error' not in r}
+    regressions = []
+
+    for r in results['results']:
+        if 'error' in r or r['name'] not in old:
+            continue
+        for metric, higher_is_better in _COMPARED.items():
+            a, b = old[r['name']].get(metric), r.get(metric)
+            if not a or b is None:
+                continue
+            change = 100.0 * (b - a) / a
+            if (higher_is_better and change < -threshold) or \
+                    (not higher_is_better and change > threshold):
+                regressions.append((r['name'], metric, a, b, change))
+
+    return regressions
+
+
+def main(argv=None):
+
+    parser = argparse.ArgumentParser(description='vtkMultiIO image I/O benchmark')
+    parser.add_argument('--sizes', default='32,64,128',
+                        help='comma separated edge lengths (default: %(default)s)')
+    parser.add_argument('--dtypes', default='uint8,int16,float32',
+                        help='comma separated scalar types, from: ' + ', '.join(_DTYPES))
+    parser.add_argument('--components', default='1,3',
+                        help='comma separated component counts (default: %(default)s)')
+    parser.add_argument('--formats', default='',
+                        help='comma separated extensions to benchmark (default: all)')
+    parser.add_argument('--plugins', action='store_true',
+                        help='also benchmark readers/writers registered as plugins')
+    parser.add_argument('--repeat', type=int, default=3,
+                        help='runs per case; the fastest is kept (default: %(default)s)')
+    parser.add_argument('--timeout', type=float, default=600,
+                        help='seconds allowed per case (default: %(default)s)')
+    parser.add_argument('--workdir', default=None,
+                        help='directory for temporary files (default: system temp)')
+    parser.add_argument('-o', '--output', default='-', help='JSON result file')
+    parser.add_argument('--compare', default=None, help='baseline JSON result file')
+    parser.add_argument('--threshold', type=float, default=10.0,
+                        help='regression threshold in percent (default: %(default)s)')
+    args = parser.parse_args(argv)
+
+    global _use_plugins
+    _use_plugins = args.plugins
+
+    sizes = [int(s) for s in args.sizes.split(',') if s]
+    dtypes = [s for s in args.dtypes.split(',') if s]
+    components = [int(s) for s in args.components.split(',') if s]
+    formats = [s if s.startswith('.') else '.' + s for s in args.formats.split(',') if s]
+
+    for dtype in dtypes:
+        if dtype not in _DTYPES:
+            parser.error('unknown scalar type {0}'.format(dtype))
+
+    workdir = tempfile.mkdtemp(prefix='vtkmultiio-bench-', dir=args.workdir)
+    results = {'environment': GetEnvironment(), 'results': []}
+
+    try:
+        for case in BuildCases(sizes, dtypes, components, formats):
+            best = None
+            for _ in range(max(args.repeat, 1)):
+                result = RunIsolated(case, workdir, args.timeout)
+                if 'error' in result:
+                    best = result
+                    break
+                if best is None or result['read_time'] + result['write_time'] < \
+                        best['read_time'] + best['write_time']:
+                    best = result
+
+            if 'error' in best:
+                sys.stderr.write('{0:<28} ERROR {1}\n'.format(case['name'], best['error']))
+            else:
+                sys.stderr.write('{0:<28} write {1:8.1f} MB/s  read {2:8.1f} MB/s  '
+                                 'detect {3:7.2f} ms  rss {4:7.1f} MB  {5}\n'.format(
+                                     case['name'], best['write_throughput'],
+                                     best['read_throughput'],
+                                     1000.0 * (best['read_detection_time'] or 0.0),
+                                     best['peak_rss'] / (1024.0 * 1024.0), best['roundtrip']))
+            results['results'].append(best)
+    finally:
+        shutil.rmtree(workdir, ignore_errors=True)
+
+    text = json.dumps(results, indent=2, sort_keys=True)
+    if args.output == '-':
+        sys.stdout.write(text + '\n')
+    else:
+        with open(args.output, 'w') as _f:
+            _f.write(text + '\n')
+
+    if args.compare:
+        with open(args.compare) as _f:
+            baseline = json.load(_f)
+        regressions = Compare(results, baseline, args.threshold)
+        for name, metric, a, b, change in regressions:
+            sys.stderr.write('REGRESSION {0} {1}: {2:.4g} -> {3:.4g} ({4:+.1f}%)\n'.format(
+                name, metric, a, b, change))
+        if regressions:
+            return 1
+
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
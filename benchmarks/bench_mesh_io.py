@@ -0,0 +1,153 @@
+#!/usr/bin/env python
+"""
+Mesh reader benchmark for vtkMultiIO.
+
+Writes binary STL and PLY versions of a triangulated sphere at several resolutions and
+times reading each through the numpy fast path readers in fastmesh.py and through the
+stock vtkSTLReader/vtkPLYReader, checking that both produce the same points and cells.
+Each timing is the fastest of --repeat runs.  Results are written as JSON.
+
+    python benchmarks/bench_mesh_io.py --sizes 100000,1000000 -o results.json
+"""
+
+import argparse
+import json
+import os
+import platform
+import shutil
+import sys
+import tempfile
+import time
+
+import numpy as np
+import vtk
+from vtk.util.numpy_support import vtk_to_numpy
+
+from PI.visualization.vtkMultiIO import fastmesh
+
+_FORMATS = {'.stl': (vtk.vtkSTLWriter, vtk.vtkSTLReader, fastmesh.vtkNumpySTLReader),
+            '.ply': (vtk.vtkPLYWriter, vtk.vtkPLYReader, fastmesh.vtkNumpyPLYReader)}
+
+
+def SynthesizeMesh(triangles):
+    """Returns a sphere of roughly `triangles` triangles"""
+
+    resolution = max(int(np.sqrt(triangles / 2.0)), 3)
+    sphere = vtk.vtkSphereSource()
+    sphere.SetThetaResolution(resolution)
+    sphere.SetPhiResolution(resolution)
+    sphere.Update()
+    return sphere.GetOutput()
+
+
+def TimeReader(readerclass, filename, repeat):
+    """Returns (fastest read time, output) over `repeat` fresh readers"""
+
+    best, output = None, None
+    for _ in range(max(repeat, 1)):
+        reader = readerclass()
+        reader.SetFileName(filename)
+        t0 = time.perf_counter()
+        reader.Update()
+        elapsed = time.perf_counter() - t0
+        if best is None or elapsed < best:
+            best, output = elapsed, reader.GetOutput()
+    return best, output
+
+
+def _SameMesh(a, b):
+    if a.GetNumberOfPoints() != b.GetNumberOfPoints() or \
+            a.GetNumberOfCells() != b.GetNumberOfCells():
+        return False
+    return np.array_equal(vtk_to_numpy(a.GetPoints().GetData()),
+                          vtk_to_numpy(b.GetPoints().GetData())) and \
+        np.array_equal(vtk_to_numpy(a.GetPolys().GetConnectivityArray()),
+                       vtk_to_numpy(b.GetPolys().GetConnectivityArray()))
+
+
+def RunCase(extension, triangles, workdir, repeat):
+    writerclass, vtkreaderclass, fastreaderclass = _FORMATS[extension]
+    mesh = SynthesizeMesh(triangles)
+    filename = os.path.join(workdir, 'bench_{0}{1}'.format(triangles, extension))
+
+    writer = writerclass()
+    writer.SetFileName(filename)
+    writer.SetInputData(mesh)
+    writer.SetFileTypeToBinary()
+    writer.Write()
+
+    fast_time, fast = TimeReader(fastreaderclass, filename, repeat)
+    vtk_time, stock = TimeReader(vtkreaderclass, filename, repeat)
+    nbytes = os.path.getsize(filename)
+    os.remove(filename)
+
+    return {'name': '{0}/{1}'.format(extension, triangles),
+            'extension': extension,
+            'triangles': mesh.GetNumberOfPolys(),
+            'file_bytes': nbytes,
+            'fast_time': fast_time,
+            'vtk_time': vtk_time,
+            'speedup': vtk_time / fast_time,
+            'fast_throughput': nbytes / (1024.0 * 1024.0) / fast_time,
+            'vtk_throughput': nbytes / (1024.0 * 1024.0) / vtk_time,
+            'identical': _SameMesh(fast, stock)}
+
+
+def GetEnvironment():
+    return {'python': platform.python_version(),
+            'vtk': vtk.vtkVersion.GetVTKVersion(),
+            'numpy': np.__version__,
+            'platform': platform.platform(),
+            'machine': platform.machine(),
+            'cpu_count': os.cpu_count(),
+            'timestamp': time.strftime('%Y-%m-%dT%H:%M:%S')}
+
+
+def main(argv=None):
+
+    parser = argparse.ArgumentParser(description='vtkMultiIO mesh reader benchmark')
+    parser.add_argument('--sizes', default='10000,100000,1000000',
+                        help='comma separated triangle counts (default: %(default)s)')
+    parser.add_argument('--formats', default='.stl,.ply',
+                        help='comma separated extensions (default: %(default)s)')
+    parser.add_argument('--repeat', type=int, default=3,
+                        help='runs per reader; the fastest is kept (default: %(default)s)')
+    parser.add_argument('--workdir', default=None,
+                        help='directory for temporary files (default: system temp)')
+    parser.add_argument('-o', '--output', default='-', help='JSON result file')
+    args = parser.parse_args(argv)
+
+    sizes = [int(s) for s in args.sizes.split(',') if s]
+    formats = [s if s.startswith('.') else '.' + s for s in args.formats.split(',') if s]
+    for extension in formats:
+        if extension not in _FORMATS:
+            parser.error('unknown format {0}'.format(extension))
+
+    workdir = tempfile.mkdtemp(prefix='vtkmultiio-bench-', dir=args.workdir)
+    results = {'environment': GetEnvironment(), 'results': []}
+
+    try:
+        for extension in formats:
+            for triangles in sizes:
+                result = RunCase(extension, triangles, workdir, args.repeat)
+                sys.stderr.write('{0:<16} numpy {1:8.1f} MB/s  vtk {2:8.1f} MB/s  '
+                                 'x{3:5.2f}  {4}\n'.format(
+                                     result['name'], result['fast_throughput'],
+                                     result['vtk_throughput'], result['speedup'],
+                                     'identical' if result['identical'] else 'DIFFERENT'))
+                results['results'].append(result)
+    finally:
+        shutil.rmtree(workdir, ignore_errors=True)
+
+    text = json.dumps(results, indent=2, sort_keys=True)
+    if args.output == '-':
+        sys.stdout.write(text + '\n')
+    else:
+        with open(args.output, 'w') as _f:
+            _f.write(text + '\n')
+
+    return 0 if all(r['identical'] for r in results['results']) else 1
+
+
+if __name__ == '__main__':
+    sys.exit(main())
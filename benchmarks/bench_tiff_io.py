@@ -0,0 +1,174 @@
+#!/usr/bin/env python
+"""
+Multi-page TIFF benchmark for vtkMultiIO.
+
+Writes a synthetic volume with tiffio.WriteTIFF() for each compression and thread count,
+and with an uncompressed vtkTIFFWriter for reference, then reads every file back with
+tiffio.vtkTIFFStackReader, checking that the volume survives the round trip.  Each
+timing is the fastest of --repeat runs.  Results are written as JSON.
+
+    python benchmarks/bench_tiff_io.py --shape 64,512,512 --threads 1,4 -o results.json
+"""
+
+import argparse
+import json
+import os
+import platform
+import shutil
+import sys
+import tempfile
+import time
+
+import numpy as np
+import vtk
+from vtk.util.numpy_support import numpy_to_vtk, vtk_to_numpy
+
+from PI.visualization.vtkMultiIO import tiffio
+from PI.visualization.vtkMultiIO.exceptions import UnsupportedCompressionError
+
+
+def SynthesizeVolume(shape, dtype):
+    """Returns a smooth, slightly noisy vtkImageData of `shape` (z, y, x)"""
+
+    z, y, x = np.ogrid[0:shape[0], 0:shape[1], 0:shape[2]]
+    values = 1000.0 * np.sin(x / 17.0) * np.cos(y / 23.0) + 20.0 * z
+    values = values + np.random.default_rng(0).normal(0.0, 5.0, shape)
+    values = values.astype(dtype) if np.dtype(dtype).kind == 'f' else \
+        (values - values.min()).astype(dtype)
+
+    image = vtk.vtkImageData()
+    image.SetDimensions(shape[2], shape[1], shape[0])
+    image.GetPointData().SetScalars(numpy_to_vtk(values.reshape(-1, 1), deep=1))
+    return image
+
+
+def Best(function, repeat):
+    best = None
+    for _ in range(max(repeat, 1)):
+        t0 = time.perf_counter()
+        result = function()
+        elapsed = time.perf_counter() - t0
+        if best is None or elapsed < best:
+            best = elapsed
+    return best, result
+
+
+def ReadVolume(filename):
+    reader = tiffio.vtkTIFFStackReader()
+    reader.SetFileName(filename)
+    reader.Update()
+    return vtk_to_numpy(reader.GetOutput().GetPointData().GetScalars())
+
+
+def RunCase(image, compression, threads, workdir, repeat):
+    filename = os.path.join(workdir, 'bench_{0}_{1}.tif'.format(compression, threads))
+
+    if compression == 'vtk':
+        def write():
+            writer = vtk.vtkTIFFWriter()
+            writer.SetCompressionToNoCompression()
+            writer.SetFileName(filename)
+            writer.SetInputData(image)
+            writer.Write()
+    else:
+        def write():
+            tiffio.WriteTIFF(filename, image, compression, threads)
+
+    write_time, _ = Best(write, repeat)
+    read_time, values = Best(lambda: ReadVolume(filename), repeat)
+    nbytes = os.path.getsize(filename)
+    os.remove(filename)
+
+    raw = image.GetPointData().GetScalars()
+    expected = vtk_to_numpy(raw)
+    if compression == 'vtk':
+        # vtkTIFFWriter stores volume rows bottom-up
+        nx, ny, nz = image.GetDimensions()
+        expected = expected.reshape(nz, ny, nx)[:, ::-1].ravel()
+    megabytes = raw.GetNumberOfValues() * raw.GetDataTypeSize() / (1024.0 * 1024.0)
+
+    return {'name': '{0}/{1}'.format(compression, threads),
+            'compression': compression,
+            'threads': threads,
+            'file_bytes': nbytes,
+            'ratio': raw.GetNumberOfValues() * raw.GetDataTypeSize() / float(nbytes),
+            'write_time': write_time,
+            'read_time': read_time,
+            'write_throughput': megabytes / write_time,
+            'read_throughput': megabytes / read_time,
+            'identical': bool(np.array_equal(values, expected))}
+
+
+def GetEnvironment():
+    return {'python': platform.python_version(),
+            'vtk': vtk.vtkVersion.GetVTKVersion(),
+            'numpy': np.__version__,
+            'tifffile': getattr(tiffio.tifffile, '__version__', None),
+            'platform': platform.platform(),
+            'machine': platform.machine(),
+            'cpu_count': os.cpu_count(),
+            'timestamp': time.strftime('%Y-%m-%dT%H:%M:%S')}
+
+
+def main(argv=None):
+
+    parser = argparse.ArgumentParser(description='vtkMultiIO TIFF benchmark')
+    parser.add_argument('--shape', default='32,512,512',
+                        help='volume shape z,y,x (default: %(default)s)')
+    parser.add_argument('--dtype', default='uint16', help='sample type (default: %(default)s)')
+    parser.add_argument('--compressions', default='none,deflate',
+                        help='comma separated compressions (default: %(default)s)')
+    parser.add_argument('--threads', default='1,{0}'.format(os.cpu_count() or 1),
+                        help='comma separated thread counts (default: %(default)s)')
+    parser.add_argument('--repeat', type=int, default=3,
+                        help='runs per case; the fastest is kept (default: %(default)s)')
+    parser.add_argument('--workdir', default=None,
+                        help='directory for temporary files (default: system temp)')
+    parser.add_argument('-o', '--output', default='-', help='JSON result file')
+    args = parser.parse_args(argv)
+
+    shape = tuple(int(s) for s in args.shape.split(','))
+    compressions = [s for s in args.compressions.split(',') if s]
+    threads = sorted(set(int(s) for s in args.threads.split(',') if s))
+    for compression in compressions:
+        if compression not in tiffio.COMPRESSIONS:
+            parser.error('unknown compression {0}'.format(compression))
+
+    image = SynthesizeVolume(shape, args.dtype)
+    workdir = tempfile.mkdtemp(prefix='vtkmultiio-bench-', dir=args.workdir)
+    results = {'environment': GetEnvironment(), 'shape': shape, 'dtype': args.dtype,
+               'results': []}
+
+    cases = [('vtk', 1)] + [(c, t) for c in compressions for t in threads]
+    skipped = set()
+    try:
+        for compression, count in cases:
+            if compression in skipped:
+                continue
+            try:
+                result = RunCase(image, compression, count, workdir, args.repeat)
+            except UnsupportedCompressionError as e:
+                sys.stderr.write('{0:<16} skipped: {1}\n'.format(compression, e))
+                skipped.add(compression)
+                continue
+            sys.stderr.write('{0:<16} write {1:8.1f} MB/s  read {2:8.1f} MB/s  '
+                             'x{3:5.2f} smaller  {4}\n'.format(
+                                 result['name'], result['write_throughput'],
+                                 result['read_throughput'], result['ratio'],
+                                 'identical' if result['identical'] else 'DIFFERENT'))
+            results['results'].append(result)
+    finally:
+        shutil.rmtree(workdir, ignore_errors=True)
+
+    text = json.dumps(results, indent=2, sort_keys=True)
+    if args.output == '-':
+        sys.stdout.write(text + '\n')
+    else:
+        with open(args.output, 'w') as _f:
+            _f.write(text + '\n')
+
+    return 0 if all(r['identical'] for r in results['results']) else 1
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -8,12 +8,22 @@
 #include "vtkObjectFactory.h"
 #include "vtkPointData.h"
 #include "vtkErrorCode.h"
+#include "vtkSMPTools.h"
 #include "vtkStreamingDemandDrivenPipeline.h"
 #include "vtkStringArray.h"
 #include "vtkType.h"
 
 #include <sys/stat.h>
 
+#include <algorithm>
+#include <atomic>
+#include <cerrno>
+#include <climits>
+#include <cstdio>
+#include <cstring>
+#include <string>
+#include <vector>
+
 #include <fcntl.h>
 #ifndef _WIN32
 #include <unistd.h>
@@ -63,6 +73,8 @@ vtkImageReader3::vtkImageReader3()
   this->FileNameSliceOffset = 0;
   this->FileNameSliceSpacing = 1;
 
+  this->ParallelRead = 0;
+
   // Left over from short reader
   this->SwapBytes = 0;
   this->FileLowerLeft = 0;
@@ -480,6 +492,8 @@ void vtkImageReader3::PrintSelf(ostream& os, vtkIndent indent)
 
   os << indent << "Swap Bytes: " << (this->SwapBytes ? "On\n" : "Off\n");
 
+  os << indent << "ParallelRead: " << (this->ParallelRead ? "On\n" : "Off\n");
+
   os << indent << "DataIncrements: (" << this->DataIncrements[0];
   for (idx = 1; idx < 2; ++idx)
     {
@@ -680,6 +694,37 @@ unsigned long vtkImageReader3::GetHeaderSize()
   return this->GetHeaderSize(firstIdx);
 }
 
+//----------------------------------------------------------------------------
+// Returns the length of a VFF header - everything up to and including the
+// form feed and the newline following it - or -1 if the file is not VFF.
+static long vtkImageReader3VFFHeaderLength(const char *filename)
+{
+  FILE *fp = fopen(filename, "rb");
+  if (!fp)
+    {
+    return -1;
+    }
+
+  long length = -1;
+  char magic[4];
+  if (fread(magic, 1, 4, fp) == 4 && memcmp(magic, "ncaa", 4) == 0)
+    {
+    int c;
+    long position = 4;
+    while ((c = getc(fp)) != EOF)
+      {
+      ++position;
+      if (c == '\f')
+        {
+        length = (getc(fp) == '\n') ? position + 1 : position;
+        break;
+        }
+      }
+    }
+  fclose(fp);
+  return length;
+}
+
 //----------------------------------------------------------------------------
 unsigned long vtkImageReader3::GetHeaderSize(unsigned long idx)
 {
@@ -695,6 +740,14 @@ unsigned long vtkImageReader3::GetHeaderSize(unsigned long idx)
     // make sure we figure out a filename to open
     this->ComputeInternalFileName(idx);
 
+    // a VFF header ends at its form feed - anything stored after the pixel
+    // data (a checksum trailer) is not part of it
+    long vffHeaderLength = vtkImageReader3VFFHeaderLength(this->InternalFileName);
+    if (vffHeaderLength >= 0)
+      {
+      return static_cast<unsigned long>(vffHeaderLength);
+      }
+
     struct stat statbuf;
     if (!stat(this->InternalFileName, &statbuf))
       {
@@ -751,106 +804,220 @@ void vtkImageReader3::SeekFile(int i, int j, int k)
 }
 
 //----------------------------------------------------------------------------
-// This function reads in one data of data.
-// templated to handle different data types.
+// Read len bytes at offset, retrying short reads and interrupts.
+static bool vtkImageReader3PRead(int fd, char *buf, size_t len, vtkTypeUInt64 offset)
+{
+  while (len > 0)
+    {
+#ifdef _WIN32
+    // no pread() here - Windows reads are always serial
+    if (_lseeki64(fd, offset, SEEK_SET) < 0)
+      {
+      return false;
+      }
+    int n = _read(fd, buf, static_cast<unsigned int>(std::min<size_t>(len, INT_MAX)));
+#else
+    ssize_t n = pread(fd, buf, len, static_cast<off_t>(offset));
+#endif
+    if (n < 0 && errno == EINTR)
+      {
+      continue;
+      }
+    if (n <= 0)
+      {
+      return false;
+      }
+    buf += n;
+    len -= n;
+    offset += n;
+    }
+  return true;
+}
+
+//----------------------------------------------------------------------------
+static int vtkImageReader3Open(const char *filename)
+{
+#ifdef _WIN32
+  return _open(filename, O_RDONLY | O_BINARY);
+#else
+  return open(filename, O_RDONLY);
+#endif
+}
+
+//----------------------------------------------------------------------------
+// Reads the x/y/z sub-extent of the output from a single volume file or from
+// one file per slice.  The file and offset of every slice are worked out
+// first; each slice is then read with pread(), so slices can be read
+// concurrently.  Returns 0 on a read error.
 template <class OT>
 #ifdef _REQUIRE_CHECKSUMS_
-void vtkImageReader3Update(vtkImageReader3 *self, vtkImageData *data, OT *outPtr, EVP_MD_CTX * mdctx)
+int vtkImageReader3Update(vtkImageReader3 *self, vtkImageData *data, OT *outPtr, EVP_MD_CTX * mdctx)
 #else
-void vtkImageReader3Update(vtkImageReader3 *self, vtkImageData *data, OT *outPtr)
+int vtkImageReader3Update(vtkImageReader3 *self, vtkImageData *data, OT *outPtr)
 #endif
 {
   vtkIdType outIncr[3];
-  OT *outPtr1;
-  long streamRead;
-  int idx1 = 0, idx2, nComponents;
   int outExtent[6];
-  unsigned long count = 0, numZ;
+  int dataExtent[6];
 
   // Get the requested extents and increments
   data->GetExtent(outExtent);
   data->GetIncrements(outIncr);
-  nComponents = data->GetNumberOfScalarComponents();
-
-  // length of a slice, num pixels read at a time
-  int pixelRead = (outExtent[1] - outExtent[0] + 1) * (outExtent[3] - outExtent[2] + 1);
-  streamRead = (long)(pixelRead*nComponents*sizeof(OT));
-
-  // number of Z slices
-  numZ = outExtent[5] - outExtent[4] + 1;
-
-  // read the data row by row
-  if (self->GetFileDimensionality() == 3)
-    {
+  self->GetDataExtent(dataExtent);
+  unsigned long *fileIncr = self->GetDataIncrements();
+
+  const int nx = outExtent[1] - outExtent[0] + 1;
+  const int ny = outExtent[3] - outExtent[2] + 1;
+  const int nz = outExtent[5] - outExtent[4] + 1;
+  const size_t rowLength = nx * fileIncr[0];
+  const vtkIdType rowValues = static_cast<vtkIdType>(nx) *
+    data->GetNumberOfScalarComponents();
+
+  // rows are stored top-down when FileLowerLeft is on
+  const bool flip = (self->GetFileLowerLeft() == 1);
+  const bool swap = self->GetSwapBytes() && sizeof(OT) > 1;
+  // a slice can be fetched in one read when its rows are contiguous in the
+  // file and land in the output in file order
+  const bool wholeSlice = (nx == dataExtent[1] - dataExtent[0] + 1) && !flip;
+  const int firstFileRow = flip ? dataExtent[3] - outExtent[3]
+                                : outExtent[2] - dataExtent[2];
+
+  // where each slice starts: one volume file, or one file per slice
+  const bool volumeFile = (self->GetFileDimensionality() >= 3);
+  std::vector<std::string> fileNames(volumeFile ? 1 : nz);
+  std::vector<vtkTypeUInt64> sliceOffsets(nz);
+  if (volumeFile)
+    {
+    vtkTypeUInt64 header = self->GetHeaderSize();
     self->ComputeInternalFileName(0);
-    if ( !self->OpenFile() )
+    fileNames[0] = self->GetInternalFileName() ? self->GetInternalFileName() : "";
+    for (int k = 0; k < nz; ++k)
       {
-      return;
+      sliceOffsets[k] = header +
+        static_cast<vtkTypeUInt64>(outExtent[4] + k - dataExtent[4]) * fileIncr[2];
+      }
+    }
+  else
+    {
+    for (int k = 0; k < nz; ++k)
+      {
+      sliceOffsets[k] = self->GetHeaderSize(outExtent[4] + k);
+      self->ComputeInternalFileName(outExtent[4] + k);
+      fileNames[k] = self->GetInternalFileName() ? self->GetInternalFileName() : "";
       }
     }
-  outPtr1 = outPtr;
 
-  // seek to the correct row
-  lseek(self->GetFd(), self->GetHeaderSize(), SEEK_SET);
+  int volumeFd = -1;
+  if (volumeFile)
+    {
+    volumeFd = vtkImageReader3Open(fileNames[0].c_str());
+    if (volumeFd < 0)
+      {
+      vtkGenericWarningMacro("Could not open file " << fileNames[0]);
+      return 0;
+      }
+    }
 
-  for (idx2 = outExtent[4]; idx2 <= outExtent[5]; ++idx2)
+  auto readSlice = [&](int k) -> bool
     {
-    if (self->GetFileDimensionality() == 2)
+    int fd = volumeFd;
+    if (!volumeFile)
       {
-      vtkGenericWarningMacro("File operations on 2D image not supported!!\n");
-      self->ComputeInternalFileName(idx2);
-      if ( !self->OpenFile() )
+      fd = vtkImageReader3Open(fileNames[k].c_str());
+      if (fd < 0)
         {
-        return;
+        vtkGenericWarningMacro("Could not open file " << fileNames[k]);
+        return false;
         }
       }
-    self->UpdateProgress((float)count/(float)numZ);
-    count++;
 
-    // read the slice
-    if ( !read(self->GetFd(), (char *)outPtr1, streamRead))
-        {
-        vtkGenericWarningMacro("File operation failed. slice = " << idx1
-                               << ", Read = " << streamRead
-                               << ", FilePos = " << lseek(self->GetFd(), 0, SEEK_CUR));
-        return;
-        }
+    OT *slicePtr = outPtr + k * outIncr[2];
+    vtkTypeUInt64 offset = sliceOffsets[k] +
+      static_cast<vtkTypeUInt64>(outExtent[0] - dataExtent[0]) * fileIncr[0];
+    bool ok = true;
 
-      // update digest
+    if (wholeSlice)
+      {
+      ok = vtkImageReader3PRead(fd, reinterpret_cast<char *>(slicePtr), ny * rowLength,
+                                offset + firstFileRow * fileIncr[1]);
 #ifdef _REQUIRE_CHECKSUMS_
-      EVP_DigestUpdate(mdctx, outPtr1, streamRead);
+      EVP_DigestUpdate(mdctx, slicePtr, ny * rowLength);
 #endif
-
-      // handle swapping
-      if (self->GetSwapBytes() && sizeof(OT) > 1)
+      if (ok && swap)
         {
-        vtkByteSwap::SwapVoidRange(outPtr1, pixelRead*nComponents, sizeof(OT));
+        vtkByteSwap::SwapVoidRange(slicePtr, rowValues * ny, sizeof(OT));
         }
+      }
+    else
+      {
+      // rows are read in file order straight into their (possibly flipped)
+      // output row and byte swapped while still in cache
+      for (int r = 0; ok && r < ny; ++r)
+        {
+        OT *rowPtr = slicePtr + (flip ? ny - 1 - r : r) * outIncr[1];
+        ok = vtkImageReader3PRead(fd, reinterpret_cast<char *>(rowPtr), rowLength,
+                                  offset + (firstFileRow + r) * fileIncr[1]);
+#ifdef _REQUIRE_CHECKSUMS_
+        EVP_DigestUpdate(mdctx, rowPtr, rowLength);
+#endif
+        if (ok && swap)
+          {
+          vtkByteSwap::SwapVoidRange(rowPtr, rowValues, sizeof(OT));
+          }
+        }
+      }
 
-      // handle image flip
-	  if (self->GetFileLowerLeft() == 1) {
-
-        long num_x = (outExtent[1] - outExtent[0] + 1) * nComponents;
-        long num_y = (outExtent[3] - outExtent[2] + 1);
+    if (!volumeFile)
+      {
+      close(fd);
+      }
+    if (!ok)
+      {
+      vtkGenericWarningMacro("File operation failed. slice = " << outExtent[4] + k
+                             << ", Read = " << ny * rowLength
+                             << ", FilePos = " << offset);
+      return false;
+      }
+    return true;
+    };
 
-        OT temp;
-        OT *flip1, *flip2;
+  bool ok = true;
+#if defined(_REQUIRE_CHECKSUMS_) || defined(_WIN32)
+  const bool parallel = false;
+#else
+  const bool parallel = self->GetParallelRead() != 0;
+#endif
 
-#pragma omp parallel
-        for (long y = 0; y < (num_y / 2); y++) {
-            flip1 = &outPtr1[y * num_x * nComponents];
-            flip2 = &outPtr1[(num_y - y - 1) * num_x * nComponents];
-            for (long x = 0; x < num_x; x++) {
-                temp = flip1[x];
-                flip1[x] = flip2[x];
-                flip2[x] = temp;
-            }
+  if (parallel)
+    {
+    std::atomic<bool> failed(false);
+    vtkSMPTools::For(0, nz, [&](vtkIdType begin, vtkIdType end) {
+      for (vtkIdType k = begin; k < end && !failed; ++k)
+        {
+        if (!readSlice(static_cast<int>(k)))
+          {
+          failed = true;
+          }
         }
+    });
+    ok = !failed;
+    }
+  else
+    {
+    // the digest needs the slices in order
+    for (int k = 0; ok && k < nz; ++k)
+      {
+      self->UpdateProgress(static_cast<double>(k) / nz);
+      ok = readSlice(k);
       }
+    }
 
-    // increment
-    outPtr1 += outIncr[2];
+  if (volumeFd >= 0)
+    {
+    close(volumeFd);
     }
+
+  return ok ? 1 : 0;
 }
 
 void vtkImageReader3::FinalizeDigest()
@@ -951,17 +1118,22 @@ void vtkImageReader3::ExecuteDataWithInformation(vtkDataObject *output,
   this->ComputeDataIncrements();
 
   // Call the correct templated function for the output
+  int ok = 1;
   ptr = data->GetScalarPointer();
   switch (this->GetDataScalarType())
     {
 #ifdef _REQUIRE_CHECKSUMS_
-    vtkTemplateMacro(vtkImageReader3Update(this, data, (VTK_TT *)(ptr), &mdctx));
+    vtkTemplateMacro(ok = vtkImageReader3Update(this, data, (VTK_TT *)(ptr), &mdctx));
 #else
-    vtkTemplateMacro(vtkImageReader3Update(this, data, (VTK_TT *)(ptr)));
+    vtkTemplateMacro(ok = vtkImageReader3Update(this, data, (VTK_TT *)(ptr)));
 #endif
     default:
       vtkErrorMacro(<< "UpdateFromFile: Unknown data type");
     }
+  if (!ok)
+    {
+    this->SetErrorCode(vtkErrorCode::PrematureEndOfFileError);
+    }
 // Close file from any previous image
   if (this->fd != -1)
     {
@@ -155,6 +155,14 @@ public:
   virtual int GetSwapBytes() {return this->SwapBytes;}
   vtkBooleanMacro(SwapBytes,int);
 
+  // Description:
+  // When on, the slices of the update extent are read by a pool of threads,
+  // each pread()ing its slice at an offset computed up front.  Reads stay
+  // serial when checksums are being computed, and on Windows.  Off by default.
+  vtkSetMacro(ParallelRead, vtkTypeBool);
+  vtkGetMacro(ParallelRead, vtkTypeBool);
+  vtkBooleanMacro(ParallelRead, vtkTypeBool);
+
 //BTX
   int GetFd() { return this->fd; }
   vtkGetVectorMacro(DataIncrements,unsigned long,4);
@@ -233,6 +241,8 @@ protected:
   int FileNameSliceOffset;
   int FileNameSliceSpacing;
 
+  vtkTypeBool ParallelRead;
+
   virtual int RequestInformation(vtkInformation* request,
                                  vtkInformationVector** inputVector,
                                  vtkInformationVector* outputVector);
@@ -26,6 +26,9 @@
 
 #include <sys/stat.h>
 
+#include <cstdio>
+#include <cstring>
+
 //vtkCxxRevisionMacro(vtkImageReader4, "$Revision: 1.43 $");
 vtkStandardNewMacro(vtkImageReader4);
 
@@ -661,6 +664,37 @@ unsigned long vtkImageReader4::GetHeaderSize()
   return this->GetHeaderSize(firstIdx);
 }
 
+//----------------------------------------------------------------------------
+// Returns the length of a VFF header - everything up to and including the
+// form feed and the newline following it - or -1 if the file is not VFF.
+static long vtkImageReader4VFFHeaderLength(const char *filename)
+{
+  FILE *fp = fopen(filename, "rb");
+  if (!fp)
+    {
+    return -1;
+    }
+
+  long length = -1;
+  char magic[4];
+  if (fread(magic, 1, 4, fp) == 4 && memcmp(magic, "ncaa", 4) == 0)
+    {
+    int c;
+    long position = 4;
+    while ((c = getc(fp)) != EOF)
+      {
+      ++position;
+      if (c == '\f')
+        {
+        length = (getc(fp) == '\n') ? position + 1 : position;
+        break;
+        }
+      }
+    }
+  fclose(fp);
+  return length;
+}
+
 //----------------------------------------------------------------------------
 unsigned long vtkImageReader4::GetHeaderSize(unsigned long idx)
 {
@@ -676,6 +710,14 @@ unsigned long vtkImageReader4::GetHeaderSize(unsigned long idx)
     // make sure we figure out a filename to open
     this->ComputeInternalFileName(idx);
 
+    // a VFF header ends at its form feed - anything stored after the pixel
+    // data (a checksum trailer) is not part of it
+    long vffHeaderLength = vtkImageReader4VFFHeaderLength(this->InternalFileName);
+    if (vffHeaderLength >= 0)
+      {
+      return static_cast<unsigned long>(vffHeaderLength);
+      }
+
     struct stat statbuf;
     if (!stat(this->InternalFileName, &statbuf))
       {
@@ -7,6 +7,7 @@
 #include "vtkInformationVector.h"
 #include "vtkObjectFactory.h"
 #include "vtkPointData.h"
+#include "vtkSMPTools.h"
 #include "vtkStreamingDemandDrivenPipeline.h"
 #include "vtkImageData.h"
 
@@ -18,11 +19,25 @@ vtkStandardNewMacro(vtkVFFWriter);
 
 #include "vtkByteSwap.h"
 #include <iomanip>
+#include <sstream>
 
 #ifndef WIN32
 #include <unistd.h>
 #endif
 
+#include <algorithm>
+
+#ifndef _WIN32
+#include <atomic>
+#include <cerrno>
+#include <condition_variable>
+#include <cstring>
+#include <fcntl.h>
+#include <mutex>
+#include <thread>
+#include <vector>
+#endif
+
 //--------------------------------------------------------------------------
 vtkVFFWriter::vtkVFFWriter()
 {
@@ -38,6 +53,15 @@ vtkVFFWriter::vtkVFFWriter()
 
   this->FileLowerLeft = 1;
 
+  this->ParallelWrite = 0;
+  this->SlabSize = 16;
+  this->WritingInParallel = 0;
+
+  this->ChecksumMode = VTK_VFF_CHECKSUM_NONE;
+  this->ChecksumChunkSize = 16;
+  this->ChunkMD5 = NULL;
+  this->ChunkSlices = 0;
+
   this->MinimumFileNumber = this->MaximumFileNumber = 0;
   this->FilesDeleted = 0;
   this->SetNumberOfOutputPorts(0);
@@ -70,6 +94,11 @@ vtkVFFWriter::~vtkVFFWriter()
     delete [] this->FileName;
     this->FileName = NULL;
     }
+  if (this->ChunkMD5)
+    {
+    vtksysMD5_Delete(this->ChunkMD5);
+    this->ChunkMD5 = NULL;
+    }
 }
 
 
@@ -86,6 +115,10 @@ void vtkVFFWriter::PrintSelf(ostream& os, vtkIndent indent)
     (this->FilePattern ? this->FilePattern : "(none)") << "\n";
 
   os << indent << "FileDimensionality: " << this->FileDimensionality << "\n";
+  os << indent << "ParallelWrite: " << (this->ParallelWrite ? "On" : "Off") << "\n";
+  os << indent << "SlabSize: " << this->SlabSize << "\n";
+  os << indent << "ChecksumMode: " << this->ChecksumMode << "\n";
+  os << indent << "ChecksumChunkSize: " << this->ChecksumChunkSize << "\n";
 
   // print header values
   std::map<vtkStdString, vtkStdString>::iterator curr;
@@ -98,6 +131,117 @@ void vtkVFFWriter::PrintSelf(ostream& os, vtkIndent indent)
 }
 
 
+//----------------------------------------------------------------------------
+// vtksysMD5_Append() takes an int length
+static void vtkVFFWriterMD5Append(vtksysMD5 *md5, const char *data, size_t len)
+{
+  const size_t block = 1 << 30;
+  while (len > 0)
+    {
+    size_t n = std::min(len, block);
+    vtksysMD5_Append(md5, reinterpret_cast<const unsigned char *>(data),
+                     static_cast<int>(n));
+    data += n;
+    len -= n;
+    }
+}
+
+//----------------------------------------------------------------------------
+// Finish the running chunk digest (if any) and add it to ChunkDigests.
+void vtkVFFWriter::EndChecksumChunk()
+{
+  if (!this->ChunkMD5)
+    {
+    return;
+    }
+  unsigned char digest[16];
+  vtksysMD5_Finalize(this->ChunkMD5, digest);
+  vtksysMD5_Delete(this->ChunkMD5);
+  this->ChunkMD5 = NULL;
+  this->ChunkSlices = 0;
+  this->ChunkDigests.insert(this->ChunkDigests.end(), digest, digest + 16);
+}
+
+//----------------------------------------------------------------------------
+// The checksum record uses header keyword syntax and is terminated by a form
+// feed, like the header itself:
+//
+//   checksum_chunk_slices=16;
+//   md5_chunk_digests=<hex> <hex> ...;
+//   md5_root_digest=<hex>;
+//   \f
+std::string vtkVFFWriter::GetChecksumRecord()
+{
+  char hex[33];
+  hex[32] = 0;
+
+  std::ostringstream record;
+  record << "checksum_chunk_slices=" << this->ChecksumChunkSize << ";\n";
+  record << "md5_chunk_digests=";
+  for (size_t i = 0; i < this->ChunkDigests.size() / 16; i++)
+    {
+    vtksysMD5_DigestToHex(&this->ChunkDigests[i * 16], hex);
+    record << (i ? " " : "") << hex;
+    }
+  record << ";\n";
+
+  // the root digest is the digest of the concatenated chunk digests
+  unsigned char root[16];
+  vtksysMD5 *md5 = vtksysMD5_New();
+  vtksysMD5_Initialize(md5);
+  vtkVFFWriterMD5Append(md5, reinterpret_cast<const char *>(this->ChunkDigests.data()),
+                        this->ChunkDigests.size());
+  vtksysMD5_Finalize(md5, root);
+  vtksysMD5_Delete(md5);
+  vtksysMD5_DigestToHex(root, hex);
+  record << "md5_root_digest=" << hex << ";\n";
+  record << "\f\n";
+
+  return record.str();
+}
+
+//----------------------------------------------------------------------------
+int vtkVFFWriter::WriteChecksumSidecar(const std::string &record)
+{
+  std::string sidecarName = std::string(this->InternalFileName) + ".md5";
+  vtksys::ofstream sidecar(sidecarName.c_str(), ios::out | ios::binary);
+  if (sidecar.fail())
+    {
+    vtkErrorMacro("Could not open checksum file " << sidecarName);
+    this->SetErrorCode(vtkErrorCode::CannotOpenFileError);
+    return 0;
+    }
+  sidecar << record;
+  sidecar.close();
+  if (sidecar.fail())
+    {
+    this->SetErrorCode(vtkErrorCode::OutOfDiskSpaceError);
+    return 0;
+    }
+  return 1;
+}
+
+//----------------------------------------------------------------------------
+void vtkVFFWriter::WriteFileTrailer(ostream *file, vtkImageData *)
+{
+  if (this->ChecksumMode == VTK_VFF_CHECKSUM_NONE)
+    {
+    return;
+    }
+
+  this->EndChecksumChunk();
+  std::string record = this->GetChecksumRecord();
+
+  if (this->ChecksumMode == VTK_VFF_CHECKSUM_TRAILER)
+    {
+    *file << record;
+    }
+  else
+    {
+    this->WriteChecksumSidecar(record);
+    }
+}
+
 //----------------------------------------------------------------------------
 // Breaks region into pieces with correct dimensionality.
 void vtkVFFWriter::RecursiveWrite(int axis,
@@ -108,6 +252,16 @@ void vtkVFFWriter::RecursiveWrite(int axis,
   vtkImageData    *data;
   int             fileOpenedHere = 0;
 
+#ifndef _WIN32
+  // single file output can be written slab-parallel
+  if (this->ParallelWrite && this->FileName && !file &&
+      (axis + 1) == this->FileDimensionality)
+    {
+    this->ParallelRecursiveWrite(cache, inInfo);
+    return;
+    }
+#endif
+
   // if we need to open another slice, do it
   if (!file && (axis + 1) == this->FileDimensionality)
     {
@@ -422,6 +576,291 @@ void vtkVFFWriter::RecursiveWrite(int axis,
 
 }
 
+#ifndef _WIN32
+//----------------------------------------------------------------------------
+// Write all of buf at the given offset, retrying short writes and interrupts.
+static bool vtkVFFWriterPWrite(int fd, const char *buf, size_t len, off_t offset)
+{
+  while (len > 0)
+    {
+    ssize_t n = pwrite(fd, buf, len, offset);
+    if (n < 0)
+      {
+      if (errno == EINTR)
+        {
+        continue;
+        }
+      return false;
+      }
+    buf += n;
+    len -= n;
+    offset += n;
+    }
+  return true;
+}
+
+//----------------------------------------------------------------------------
+// Writes the whole update extent into a single preallocated file.  The header
+// is formatted in memory first so the offset of every z-slab is known; slabs
+// are then byteswapped and written concurrently with pwrite().
+void vtkVFFWriter::ParallelRecursiveWrite(vtkImageData *cache,
+                                          vtkInformation* inInfo)
+{
+  // bring the update extent into memory
+  vtkStreamingDemandDrivenPipeline* inputExec =
+    vtkStreamingDemandDrivenPipeline::SafeDownCast(
+      vtkExecutive::PRODUCER()->GetExecutive(inInfo));
+  int inputOutputPort = vtkExecutive::PRODUCER()->GetPort(inInfo);
+  inputExec->PropagateUpdateExtent(inputOutputPort);
+  inputExec->Update(inputOutputPort);
+
+  int* wExt = vtkStreamingDemandDrivenPipeline::GetWholeExtent(inInfo);
+  int ext[6];
+  vtkStreamingDemandDrivenPipeline::GetUpdateExtent(inInfo, ext);
+
+  sprintf(this->InternalFileName, "%s", this->FileName);
+
+  std::ostringstream header;
+  this->WritingInParallel = 1;
+  this->WriteFileHeader(&header, cache, wExt);
+  this->WritingInParallel = 0;
+  const std::string headerString = header.str();
+
+#ifdef _REQUIRE_CHECKSUMS_
+  // WriteFileHeader() started a running digest for the serial path
+  EVP_MD_CTX_cleanup(&mdctx);
+  const EVP_MD *digestType = this->md;
+  const unsigned int digestLength = this->md_len;
+#endif
+
+  int fd = open(this->InternalFileName, O_WRONLY | O_CREAT | O_TRUNC, 0644);
+  if (fd < 0)
+    {
+    vtkErrorMacro("ParallelRecursiveWrite: Could not open file " <<
+                  this->InternalFileName);
+    this->SetErrorCode(vtkErrorCode::CannotOpenFileError);
+    return;
+    }
+
+  const int scalarSize = cache->GetScalarSize();
+  const int rows = ext[3] - ext[2] + 1;
+  const int depth = ext[5] - ext[4] + 1;
+  const size_t rowLength = static_cast<size_t>(scalarSize) *
+    cache->GetNumberOfScalarComponents() * (ext[1] - ext[0] + 1);
+  const size_t sliceLength = rowLength * rows;
+  const off_t dataOffset = static_cast<off_t>(headerString.size());
+
+  // reserve the whole file up front so threads never extend it concurrently
+  const off_t fileLength = dataOffset + static_cast<off_t>(sliceLength) * depth;
+#ifdef __linux__
+  int err = posix_fallocate(fd, 0, fileLength);
+  if (err == EINVAL || err == EOPNOTSUPP)
+    {
+    // the file system can't preallocate - size the file instead
+    vtkDebugMacro("ParallelRecursiveWrite: posix_fallocate failed (" <<
+                  strerror(err) << "), extending the file with ftruncate");
+    err = ftruncate(fd, fileLength) ? errno : 0;
+    }
+#else
+  int err = ftruncate(fd, fileLength) ? errno : 0;
+#endif
+  if (err != 0)
+    {
+    close(fd);
+    if (err == ENOSPC)
+      {
+      this->SetErrorCode(vtkErrorCode::OutOfDiskSpaceError);
+      }
+    else
+      {
+      vtkErrorMacro("ParallelRecursiveWrite: Could not reserve " << fileLength <<
+                    " bytes for " << this->InternalFileName << ": " << strerror(err));
+      this->SetErrorCode(vtkErrorCode::UnknownError);
+      }
+    this->DeleteFiles();
+    return;
+    }
+
+  if (!vtkVFFWriterPWrite(fd, headerString.data(), headerString.size(), 0))
+    {
+    close(fd);
+    this->SetErrorCode(vtkErrorCode::OutOfDiskSpaceError);
+    this->DeleteFiles();
+    return;
+    }
+
+  // same byte order rules as WriteFile()
+  short test_s = 10;
+  vtkByteSwap::Swap2LE(&test_s);
+  const bool swap = (test_s == 10) &&
+    ((cache->GetScalarType() == VTK_SHORT) || (cache->GetScalarType() == VTK_FLOAT));
+
+  vtkIdType increments[3];
+  cache->GetIncrements(increments);
+  const char *origin = static_cast<const char *>(
+    cache->GetScalarPointer(ext[0], ext[2], ext[4]));
+
+  // with chunked checksums every slab is a checksum chunk
+  const bool chunked = (this->ChecksumMode != VTK_VFF_CHECKSUM_NONE);
+  const int slabSize = this->GetParallelSlabSize();
+  const int fileLowerLeft = this->FileLowerLeft;
+  const vtkIdType numberOfSlabs = (depth + slabSize - 1) / slabSize;
+  std::atomic<int> errorCode(vtkErrorCode::NoError);
+
+#ifdef _REQUIRE_CHECKSUMS_
+  std::vector<unsigned char> digests(numberOfSlabs * digestLength);
+#endif
+  this->ChunkDigests.assign(chunked ? numberOfSlabs * 16 : 0, 0);
+
+  // slabs written so far, and whether the pool is done - guarded by progressMutex
+  std::mutex progressMutex;
+  std::condition_variable progressChanged;
+  vtkIdType slabsWritten = 0;
+  bool finished = false;
+
+  // the slabs are written from a separate thread, so that this one can report
+  // progress (observers need not be thread safe) as they complete
+  std::thread pool([&]() {
+    vtkSMPTools::For(0, numberOfSlabs, [&](vtkIdType begin, vtkIdType end) {
+      std::vector<char> buffer;
+      for (vtkIdType slab = begin; slab < end; ++slab)
+        {
+        if (errorCode != vtkErrorCode::NoError)
+          {
+          return;
+          }
+
+        const int z0 = ext[4] + static_cast<int>(slab) * slabSize;
+        const int z1 = std::min(z0 + slabSize - 1, ext[5]);
+        buffer.resize(sliceLength * (z1 - z0 + 1));
+
+        // gather the slab's rows in file order
+        char *dst = buffer.data();
+        for (int z = z0; z <= z1; ++z)
+          {
+          for (int r = 0; r < rows; ++r)
+            {
+            const int y = fileLowerLeft ? r : (rows - 1 - r);
+            memcpy(dst, origin + (y * increments[1] +
+                                  (z - ext[4]) * increments[2]) * scalarSize,
+                   rowLength);
+            dst += rowLength;
+            }
+          }
+
+        if (swap)
+          {
+          vtkByteSwap::SwapVoidRange(buffer.data(), buffer.size() / scalarSize, scalarSize);
+          }
+
+#ifdef _REQUIRE_CHECKSUMS_
+        EVP_Digest(buffer.data(), buffer.size(), &digests[slab * digestLength],
+                   NULL, digestType, NULL);
+#endif
+
+        if (chunked)
+          {
+          vtksysMD5 *md5 = vtksysMD5_New();
+          vtksysMD5_Initialize(md5);
+          vtkVFFWriterMD5Append(md5, buffer.data(), buffer.size());
+          vtksysMD5_Finalize(md5, &this->ChunkDigests[slab * 16]);
+          vtksysMD5_Delete(md5);
+          }
+
+        if (!vtkVFFWriterPWrite(fd, buffer.data(), buffer.size(),
+                                dataOffset + (z0 - ext[4]) * sliceLength))
+          {
+          errorCode = (errno == ENOSPC) ? vtkErrorCode::OutOfDiskSpaceError
+                                        : vtkErrorCode::UnknownError;
+          }
+
+          {
+          std::lock_guard<std::mutex> lock(progressMutex);
+          ++slabsWritten;
+          }
+        progressChanged.notify_one();
+        }
+    });
+      {
+      std::lock_guard<std::mutex> lock(progressMutex);
+      finished = true;
+      }
+    progressChanged.notify_one();
+  });
+
+    {
+    std::unique_lock<std::mutex> lock(progressMutex);
+    vtkIdType reported = 0;
+    while (!finished)
+      {
+      progressChanged.wait(lock, [&]() { return finished || slabsWritten != reported; });
+      reported = slabsWritten;
+      lock.unlock();
+      this->UpdateProgress(static_cast<double>(reported) / numberOfSlabs);
+      lock.lock();
+      }
+    }
+  pool.join();
+
+#ifdef _REQUIRE_CHECKSUMS_
+  if (errorCode == vtkErrorCode::NoError)
+    {
+    // the file digest is the digest of the concatenated slab digests
+    unsigned char root[EVP_MAX_MD_SIZE];
+    unsigned int rootLength;
+    EVP_Digest(digests.data(), digests.size(), root, &rootLength, digestType, NULL);
+
+    std::ostringstream hexdigest;
+    for (unsigned int i = 0; i < rootLength; i++)
+      {
+      hexdigest << std::hex << std::setw(2) << std::setfill('0')
+                << static_cast<int>(root[i]);
+      }
+    if (!vtkVFFWriterPWrite(fd, hexdigest.str().data(), hexdigest.str().size(),
+                            this->fposition))
+      {
+      errorCode = vtkErrorCode::OutOfDiskSpaceError;
+      }
+    }
+#endif
+
+  if (chunked && errorCode == vtkErrorCode::NoError)
+    {
+    std::string record = this->GetChecksumRecord();
+    if (this->ChecksumMode == VTK_VFF_CHECKSUM_TRAILER)
+      {
+      if (!vtkVFFWriterPWrite(fd, record.data(), record.size(),
+                              dataOffset + sliceLength * depth))
+        {
+        errorCode = vtkErrorCode::OutOfDiskSpaceError;
+        }
+      }
+    else if (!this->WriteChecksumSidecar(record))
+      {
+      errorCode = this->GetErrorCode();
+      }
+    }
+
+  if (close(fd) != 0 && errorCode == vtkErrorCode::NoError)
+    {
+    errorCode = vtkErrorCode::OutOfDiskSpaceError;
+    }
+
+  if (errorCode != vtkErrorCode::NoError)
+    {
+    this->SetErrorCode(errorCode);
+    if (errorCode == vtkErrorCode::OutOfDiskSpaceError)
+      {
+      this->DeleteFiles();
+      }
+    return;
+    }
+
+  ++this->FileNumber;
+  this->UpdateProgress(1.0);
+}
+#endif
+
 
 //----------------------------------------------------------------------------
 template <class T>
@@ -505,8 +944,21 @@ void vtkVFFWriter::WriteFileHeader(ostream *file, vtkImageData *cache, int wExt[
   // get image type
   checksum_key += this->GetKeyword("image_type");
 
+  // parallel writes store a digest of per-slab digests under their own key
+  std::string other_key = checksum_key + "_" + DIGEST_TYPE +
+    (this->WritingInParallel ? "_digest" : "tree_digest");
+  this->header.header.erase(other_key);
+  this->header.header.erase(checksum_key + "_" + DIGEST_TYPE + "tree_slices");
+
   checksum_key += "_";
   checksum_key += DIGEST_TYPE;
+  if (this->WritingInParallel)
+    {
+    std::ostringstream slices;
+    slices << this->GetParallelSlabSize();
+    this->SetKeyword((checksum_key + "tree_slices").c_str(), slices.str().c_str());
+    checksum_key += "tree";
+    }
   checksum_key += "_digest";
 
   // create a dummy checksum
@@ -521,6 +973,29 @@ void vtkVFFWriter::WriteFileHeader(ostream *file, vtkImageData *cache, int wExt[
   EVP_DigestInit_ex(&mdctx, md, NULL);
 #endif
 
+  // describe the chunked checksum, which is written after the data
+  this->header.header.erase("checksum");
+  this->header.header.erase("checksum_chunk_slices");
+  this->header.header.erase("checksum_location");
+  if (this->ChecksumMode != VTK_VFF_CHECKSUM_NONE)
+    {
+    std::ostringstream slices;
+    slices << this->ChecksumChunkSize;
+    this->SetKeyword("checksum", "md5");
+    this->SetKeyword("checksum_chunk_slices", slices.str().c_str());
+    this->SetKeyword("checksum_location",
+      this->ChecksumMode == VTK_VFF_CHECKSUM_TRAILER ? "trailer" : "sidecar");
+    }
+
+  // start a fresh set of chunk digests for this file
+  if (this->ChunkMD5)
+    {
+    vtksysMD5_Delete(this->ChunkMD5);
+    this->ChunkMD5 = NULL;
+    }
+  this->ChunkSlices = 0;
+  this->ChunkDigests.clear();
+
   // print additional header keywords
   std::map<vtkStdString, vtkStdString>::iterator curr;
   curr = this->header.header.begin();
@@ -620,6 +1095,20 @@ void vtkVFFWriter::WriteFile(ostream *file, vtkImageData *data,
     //this->GetInput()->SetUpdateExtent(extent[0], extent[1], extent[2], extent[3], idxZ, idxZ);
     //this->GetInput()->Update();
 
+    if (this->ChecksumMode != VTK_VFF_CHECKSUM_NONE)
+      {
+      if (this->ChunkSlices == this->ChecksumChunkSize)
+        {
+        this->EndChecksumChunk();
+        }
+      if (!this->ChunkMD5)
+        {
+        this->ChunkMD5 = vtksysMD5_New();
+        vtksysMD5_Initialize(this->ChunkMD5);
+        }
+      this->ChunkSlices++;
+      }
+
     for (idxY = ystart; idxY != yend; idxY = idxY + yinc)
       {
       if (!(count%target))
@@ -632,7 +1121,7 @@ void vtkVFFWriter::WriteFile(ostream *file, vtkImageData *data,
       if ((little == 1) && ((data->GetScalarType() == VTK_SHORT) ||
           (data->GetScalarType() == VTK_FLOAT))) {
 	memcpy((char *)buffer, (char *) ptr, rowLength);
-	vtkByteSwap::SwapVoidRange(buffer, rowLength, data->GetScalarSize());
+	vtkByteSwap::SwapVoidRange(buffer, rowLength / data->GetScalarSize(), data->GetScalarSize());
 	write_buffer = (char *)buffer;
       } else {
 	write_buffer = (char *)ptr;
@@ -640,6 +1129,10 @@ void vtkVFFWriter::WriteFile(ostream *file, vtkImageData *data,
 #ifdef _REQUIRE_CHECKSUMS_
       EVP_DigestUpdate(&mdctx, write_buffer, rowLength);
 #endif
+      if (this->ChunkMD5)
+        {
+        vtkVFFWriterMD5Append(this->ChunkMD5, write_buffer, rowLength);
+        }
       if ( ! file->write((char *)write_buffer, rowLength))
         {
         delete [] buffer;
@@ -677,3 +1170,17 @@ void vtkVFFWriter::SetKeyword(const char *keyword, const char *value)
 
   this->header.header[s] = t;
 }
+
+//----------------------------------------------------------------------------
+int vtkVFFWriter::GetParallelSlabSize()
+{
+  return this->ChecksumMode != VTK_VFF_CHECKSUM_NONE ?
+    this->ChecksumChunkSize : this->SlabSize;
+}
+
+//----------------------------------------------------------------------------
+void vtkVFFWriter::ClearKeywords()
+{
+  this->header.header.clear();
+  this->Modified();
+}
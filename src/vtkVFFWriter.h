@@ -6,6 +6,9 @@
 #include "vtkIOImageModule.h"
 #include "vtkVersion.h"
 
+#include <vector>
+#include <vtksys/MD5.h>
+
 class vtkVFFHeaderInternal;
 
 //#define _REQUIRE_CHECKSUMS_
@@ -15,6 +18,11 @@ class vtkVFFHeaderInternal;
 #include <openssl/evp.h>
 #endif
 
+// chunked checksum storage
+#define VTK_VFF_CHECKSUM_NONE    0
+#define VTK_VFF_CHECKSUM_TRAILER 1
+#define VTK_VFF_CHECKSUM_SIDECAR 2
+
 class VTK_EXPORT vtkVFFWriter : public vtkImageWriter
 {
 public:
@@ -25,7 +33,55 @@ public:
   void PrintSelf(ostream& os, vtkIndent indent) override;
   const char *GetKeyword(const char *key);
   void SetKeyword(const char *key, const char *value);
+  void ClearKeywords();
   void SetTitle(const char *value) { this->SetKeyword("title", value); }
+
+  // Description:
+  // When on, single-file output is written by a pool of threads: the file is
+  // preallocated and each thread byteswaps and pwrite()s independent z-slabs
+  // of SlabSize slices at their computed offsets.  Checksums (when enabled)
+  // are computed per slab and combined into a single tree digest.  Ignored
+  // on Windows and for multi-file (prefix/pattern) output.  Off by default.
+  vtkSetMacro(ParallelWrite, vtkTypeBool);
+  vtkGetMacro(ParallelWrite, vtkTypeBool);
+  vtkBooleanMacro(ParallelWrite, vtkTypeBool);
+
+  // Description:
+  // Number of z-slices in each slab handed to a thread.  Default 16.
+  vtkSetClampMacro(SlabSize, int, 1, VTK_INT_MAX);
+  vtkGetMacro(SlabSize, int);
+
+  // Description:
+  // Chunked checksums.  The pixel data is hashed (MD5) as it is written in
+  // chunks of ChecksumChunkSize z-slices; the chunk digests and a root digest
+  // (the MD5 of the concatenated chunk digests) are written after the pixel
+  // data (Trailer) or to "<file>.md5" (Sidecar).  The header only records the
+  // scheme, so nothing is patched after the fact and the output may be a pipe.
+  // Readers can verify a sub-extent by hashing only the chunks it overlaps.
+  // When writing in parallel the slabs are the checksum chunks.  Off by default.
+  vtkSetClampMacro(ChecksumMode, int, VTK_VFF_CHECKSUM_NONE, VTK_VFF_CHECKSUM_SIDECAR);
+  vtkGetMacro(ChecksumMode, int);
+  void SetChecksumModeToNone() { this->SetChecksumMode(VTK_VFF_CHECKSUM_NONE); }
+  void SetChecksumModeToTrailer() { this->SetChecksumMode(VTK_VFF_CHECKSUM_TRAILER); }
+  void SetChecksumModeToSidecar() { this->SetChecksumMode(VTK_VFF_CHECKSUM_SIDECAR); }
+
+  // Description:
+  // Number of z-slices hashed into each checksum chunk.  Default 16.
+  vtkSetClampMacro(ChecksumChunkSize, int, 1, VTK_INT_MAX);
+  vtkGetMacro(ChecksumChunkSize, int);
+
+  // Description:
+  // True if the writer was built with _REQUIRE_CHECKSUMS_, in which case every
+  // file carries a whole-file digest in its header.
+  static vtkTypeBool GetRequireChecksums()
+  {
+#ifdef _REQUIRE_CHECKSUMS_
+    return 1;
+#else
+    return 0;
+#endif
+  }
+
 #if VTK_MAJOR_VERSION == 5
   virtual void RecursiveWrite(int dim, vtkImageData *region, ofstream *file);
   virtual void RecursiveWrite(int axis, vtkImageData *cache, vtkImageData *data, ofstream *file);
@@ -39,6 +95,27 @@ protected:
   ~vtkVFFWriter();
   vtkVFFHeaderInternal header;
 
+  vtkTypeBool ParallelWrite;
+  int SlabSize;
+  int WritingInParallel;
+
+  int ChecksumMode;
+  int ChecksumChunkSize;
+  vtksysMD5 *ChunkMD5;
+  int ChunkSlices;
+  std::vector<unsigned char> ChunkDigests;
+
+  // slices per slab of a parallel write - the checksum chunks, if there are any
+  int GetParallelSlabSize();
+
+  void EndChecksumChunk();
+  std::string GetChecksumRecord();
+  int WriteChecksumSidecar(const std::string &record);
+
+#ifndef _WIN32
+  void ParallelRecursiveWrite(vtkImageData *cache, vtkInformation* inInfo);
+#endif
+
 #if VTK_MAJOR_VERSION == 5
   virtual void WriteFile(ofstream *file, vtkImageData *data, int ext[6]);
   virtual void WriteFileHeader(ofstream *, vtkImageData *);
@@ -46,6 +123,7 @@ protected:
   virtual void WriteFile(ostream *file, vtkImageData *data,
                          int extent[6], int wExtent[6]) override;
   virtual void WriteFileHeader(ostream *, vtkImageData *, int [6]) override;
+  virtual void WriteFileTrailer(ostream *, vtkImageData *) override;
 #endif
 
 private:
@@ -0,0 +1,128 @@
+"""
+HeaderDictionary events: one HeaderValueModifiedEvent per assignment, coalesced into a
+single HeaderModifiedEvent by BatchUpdate() and update(), and debounced subscribers.
+
+    python -m unittest discover tests
+"""
+
+import pickle
+import threading
+import unittest
+
+from zope import event
+
+from PI.visualization.vtkMultiIO.HeaderDictionary import DebouncedHeaderSubscriber
+from PI.visualization.vtkMultiIO.HeaderDictionary import HeaderDictionary
+from PI.visualization.vtkMultiIO.events import HeaderModifiedEvent, HeaderValueModifiedEvent
+
+
+class HeaderEventTest(unittest.TestCase):
+
+    def setUp(self):
+        self.events = []
+        event.subscribers.append(self.events.append)
+
+    def tearDown(self):
+        event.subscribers.remove(self.events.append)
+
+    def test_assignment(self):
+        header = HeaderDictionary({'title': 'phantom'})
+        self.assertEqual(self.events, [])
+        header['title'] = 'scan'
+        self.assertEqual(len(self.events), 1)
+        self.assertIsInstance(self.events[0], HeaderValueModifiedEvent)
+        self.assertEqual((self.events[0].GetKey(), self.events[0].GetValue()),
+                         ('title', 'scan'))
+
+    def test_batch(self):
+        header = HeaderDictionary()
+        with header.BatchUpdate():
+            header['a'] = 1
+            with header.BatchUpdate():
+                header['b'] = 2
+            header['a'] = 3
+            # nothing until the outermost block ends
+            self.assertEqual(self.events, [])
+
+        self.assertEqual(len(self.events), 1)
+        self.assertIsInstance(self.events[0], HeaderModifiedEvent)
+        self.assertIs(self.events[0].GetHeader(), header)
+        self.assertEqual(self.events[0].GetKeys(), frozenset(['a', 'b']))
+        self.assertEqual(header, {'a': 3, 'b': 2})
+
+    def test_empty_batch(self):
+        header = HeaderDictionary()
+        with header.BatchUpdate():
+            pass
+        self.assertEqual(self.events, [])
+
+    def test_batch_exception(self):
+        # keys assigned before an error are still reported
+        header = HeaderDictionary()
+        with self.assertRaises(KeyError):
+            with header.BatchUpdate():
+                header['a'] = 1
+                raise KeyError('b')
+        self.assertEqual(self.events[0].GetKeys(), frozenset(['a']))
+        header['c'] = 2
+        self.assertIsInstance(self.events[1], HeaderValueModifiedEvent)
+
+    def test_update(self):
+        header = HeaderDictionary()
+        header.update({'a': 1}, b=2)
+        self.assertEqual(len(self.events), 1)
+        self.assertEqual(self.events[0].GetKeys(), frozenset(['a', 'b']))
+
+    def test_pickle(self):
+        header = pickle.loads(pickle.dumps(HeaderDictionary({'a': 1})))
+        header.update(b=2)
+        self.assertEqual(header, {'a': 1, 'b': 2})
+        self.assertEqual(self.events[-1].GetKeys(), frozenset(['b']))
+
+
+class DebouncedHeaderSubscriberTest(unittest.TestCase):
+
+    def setUp(self):
+        self.calls = []
+        self.called = threading.Event()
+
+    def OnChange(self, keys):
+        self.calls.append(keys)
+        self.called.set()
+
+    def test_coalesced(self):
+        subscriber = DebouncedHeaderSubscriber(self.OnChange, delay=0.05)
+        try:
+            header = HeaderDictionary()
+            header['a'] = 1
+            header.update(b=2, c=3)
+            self.assertTrue(self.called.wait(5))
+            self.assertEqual(self.calls, [set(['a', 'b', 'c'])])
+        finally:
+            subscriber.Unsubscribe()
+
+    def test_flush(self):
+        subscriber = DebouncedHeaderSubscriber(self.OnChange, delay=60)
+        try:
+            subscriber.Flush()
+            self.assertEqual(self.calls, [])
+            HeaderDictionary()['a'] = 1
+            # a keyless event means the whole header may have changed
+            HeaderDictionary().invokeModifiedEvent()
+            subscriber.Flush()
+            self.assertEqual(self.calls, [None])
+        finally:
+            subscriber.Unsubscribe()
+        self.assertNotIn(subscriber, event.subscribers)
+
+    def test_unsubscribe(self):
+        subscriber = DebouncedHeaderSubscriber(self.OnChange, delay=60)
+        HeaderDictionary()['a'] = 1
+        subscriber.Unsubscribe()
+        subscriber.Flush()
+        HeaderDictionary()['b'] = 2
+        self.assertEqual(self.calls, [])
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,156 @@
+"""
+ImageCatalog: incremental indexing, directory queries, and the DICOM columns of
+images whose DICOM values are stored as header keywords.
+
+    python -m unittest discover tests
+"""
+
+import os
+import shutil
+import tempfile
+import unittest
+
+import numpy as np
+import pydicom
+import vtk
+from vtk.util.numpy_support import numpy_to_vtk
+
+from PI.visualization.vtkMultiIO.ImageCatalog import ImageCatalog
+from PI.visualization.vtkMultiIO.vtkMultiImageReader import vtkMultiImageReader
+from PI.visualization.vtkMultiIO.vtkMultiImageWriter import vtkMultiImageWriter
+
+
+def MakeImage():
+    image = vtk.vtkImageData()
+    image.SetDimensions(8, 6, 4)
+    image.SetSpacing(0.5, 0.5, 1.0)
+    image.GetPointData().SetScalars(numpy_to_vtk(np.arange(192, dtype=np.int16), deep=1))
+    return image
+
+
+def MakeDICOMHeader():
+    ds = pydicom.dataset.Dataset()
+    ds.Modality = 'MR'
+    ds.PatientID = 'P-0042'
+    ds.PatientName = 'Doe^Jane'
+    ds.StudyDate = '20240131'
+    ds.AcquisitionTime = '101500'
+    ds.StudyInstanceUID = '1.2.3.4'
+    ds.SeriesDescription = 'T1 axial'
+    return ds
+
+
+def WriteMetaImage(filename):
+    writer = vtk.vtkMetaImageWriter()
+    writer.SetFileName(filename)
+    writer.SetCompression(False)
+    writer.SetInputData(MakeImage())
+    writer.Write()
+
+
+class ImageCatalogIndexTest(unittest.TestCase):
+
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+        self.catalog = ImageCatalog(':memory:', reader_factory=vtkMultiImageReader)
+
+    def tearDown(self):
+        self.catalog.Close()
+        shutil.rmtree(self.directory, ignore_errors=True)
+
+    def Write(self, *names):
+        filename = os.path.join(self.directory, *names)
+        if not os.path.isdir(os.path.dirname(filename)):
+            os.makedirs(os.path.dirname(filename))
+        WriteMetaImage(filename)
+        return filename
+
+    def test_refresh(self):
+        first = self.Write('first.mha')
+        self.Write('second.mha')
+        with open(os.path.join(self.directory, 'notes.txt'), 'w') as f:
+            f.write('not an image')
+
+        counts = self.catalog.Index(self.directory)
+        self.assertEqual((counts['indexed'], counts['skipped'], counts['unchanged']), (2, 1, 0))
+        self.assertEqual(self.catalog.GetEntry(first)['dimensions'], (8, 6, 4))
+
+        # nothing changed - nothing is opened again
+        counts = self.catalog.Index(self.directory)
+        self.assertEqual((counts['indexed'], counts['skipped'], counts['unchanged']), (0, 0, 3))
+
+        os.remove(first)
+        counts = self.catalog.Index(self.directory)
+        self.assertEqual(counts['removed'], 1)
+        self.assertIsNone(self.catalog.GetEntry(first))
+
+    def test_query_directory(self):
+        # '_' and '%' are literal and case matters
+        self.Write('study_1', 'image.mha')
+        self.Write('studyX1', 'image.mha')
+        self.Write('STUDY_1', 'image.mha')
+        self.Write('study%', 'image.mha')
+        self.catalog.Index(self.directory)
+
+        for name in ('study_1', 'studyX1', 'STUDY_1', 'study%'):
+            entries = self.catalog.Query(directory=os.path.join(self.directory, name))
+            self.assertEqual([e['filename'] for e in entries],
+                             [os.path.join(self.directory, name, 'image.mha')])
+
+        self.assertEqual(len(self.catalog.Query(directory=self.directory)), 4)
+        self.assertEqual(self.catalog.Query(directory=os.path.join(self.directory, 'study')), [])
+
+
+class ImageCatalogDICOMTest(unittest.TestCase):
+
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+        self.catalog = ImageCatalog(':memory:', reader_factory=vtkMultiImageReader)
+
+    def tearDown(self):
+        self.catalog.Close()
+        shutil.rmtree(self.directory, ignore_errors=True)
+
+    def CheckEntry(self, filename, format):
+        self.catalog.Index(self.directory)
+        entry = self.catalog.GetEntry(os.path.join(self.directory, filename))
+
+        self.assertEqual(entry['format'], format)
+        self.assertEqual(entry['dimensions'], (8, 6, 4))
+        self.assertEqual(entry['modality'], 'MR')
+        self.assertEqual(entry['patient_id'], 'P-0042')
+        self.assertEqual(entry['patient_name'], 'Doe^Jane')
+        self.assertEqual(entry['date'], '20240131')
+        self.assertEqual(entry['time'], '101500')
+        self.assertEqual(entry['study_uid'], '1.2.3.4')
+        self.assertEqual(entry['description'], 'T1 axial')
+        return entry
+
+    def test_metaimage(self):
+        writer = vtkMultiImageWriter()
+        writer.SetFileName(os.path.join(self.directory, 'image.mha'))
+        writer.SetDICOMHeader(MakeDICOMHeader())
+        writer.SetInputData(MakeImage())
+        writer.Write()
+
+        self.CheckEntry('image.mha', 'MetaImage')
+        self.assertEqual(len(self.catalog.Query(patient_name='Doe^Jane', modality='MR')), 1)
+
+    def test_vff_quoted_dates(self):
+        # vtkMultiImageWriter quotes DA and TM values it passes on as keywords
+        header = ('ncaa\ntype=raster;\nformat=slice;\nbands=1;\nrank=3;\nbits=16;\n'
+                  'size=8 6 4;\nspacing=0.5 0.5 1;\n'
+                  'dicom_AcquisitionTime=\'101500\';\ndicom_Modality=MR;\n'
+                  'dicom_PatientID=P-0042;\ndicom_PatientsName=Doe^Jane;\n'
+                  'dicom_SeriesDescription=T1 axial;\ndicom_StudyDate=\'20240131\';\n'
+                  'dicom_StudyInstanceUID=1.2.3.4;\n\f\n')
+        with open(os.path.join(self.directory, 'image.vff'), 'wb') as f:
+            f.write(header.encode('latin-1'))
+            f.write(np.zeros(192, '>i2').tobytes())
+
+        entry = self.CheckEntry('image.vff', 'VFF')
+        self.assertEqual(entry['dicom']['StudyDate'], '20240131')
+
+
+if __name__ == '__main__':
+    unittest.main()
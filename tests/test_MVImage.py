@@ -0,0 +1,104 @@
+"""
+MVImage and vtkMultiImageReader pickling: voxel buffers passed out-of-band with
+pickle protocol 5, and readers shipped to workers as recipes.
+
+    python -m unittest discover tests
+"""
+
+import copy
+import os
+import pickle
+import shutil
+import tempfile
+import unittest
+
+import numpy as np
+import vtk
+from vtk.util.numpy_support import numpy_to_vtk, vtk_to_numpy
+
+from PI.visualization.vtkMultiIO.MVImage import MVImage
+from PI.visualization.vtkMultiIO.vtkMultiImageReader import vtkMultiImageReader
+from PI.visualization.vtkMultiIO.vtkMultiImageReader import vtkMultiImageReaderRecipe
+
+
+def MakeImage():
+    image = vtk.vtkImageData()
+    image.SetDimensions(8, 6, 4)
+    image.SetSpacing(0.5, 0.25, 2.0)
+    image.SetOrigin(1.0, 2.0, 3.0)
+    image.GetPointData().SetScalars(numpy_to_vtk(np.arange(192, dtype=np.int16), deep=1))
+    return image
+
+
+def GetValues(image):
+    return vtk_to_numpy(image.GetPointData().GetScalars())
+
+
+class MVImagePickleTest(unittest.TestCase):
+
+    def setUp(self):
+        self.image = MVImage(MakeImage())
+        self.image.GetHeader()['title'] = 'phantom'
+
+    def CheckImage(self, image):
+        self.assertEqual(image.GetDimensions(), (8, 6, 4))
+        self.assertEqual(image.GetSpacing(), (0.5, 0.25, 2.0))
+        self.assertEqual(image.GetOrigin(), (1.0, 2.0, 3.0))
+        self.assertEqual(image.GetHeader()['title'], 'phantom')
+        np.testing.assert_array_equal(GetValues(image), np.arange(192))
+
+    def test_out_of_band(self):
+        buffers = []
+        data = pickle.dumps(self.image, protocol=5, buffer_callback=buffers.append)
+        # the voxels travel in the buffer, not in the pickle stream
+        self.assertEqual(len(buffers), 1)
+        self.assertEqual(buffers[0].raw().nbytes, 192 * 2)
+        self.assertGreaterEqual(len(pickle.dumps(self.image, protocol=5)) - len(data), 192 * 2)
+        self.CheckImage(pickle.loads(data, buffers=buffers))
+
+    def test_in_band(self):
+        for protocol in (2, 5):
+            self.CheckImage(pickle.loads(pickle.dumps(self.image, protocol=protocol)))
+
+    def test_copy(self):
+        # copy.copy() shares the attributes; it doesn't go through pickling
+        image = copy.copy(self.image)
+        self.assertIs(image.GetRealImage(), self.image.GetRealImage())
+        self.assertIs(image.GetHeader(), self.image.GetHeader())
+
+
+class ReaderRecipeTest(unittest.TestCase):
+
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+        self.filename = os.path.join(self.directory, 'image.mha')
+        writer = vtk.vtkMetaImageWriter()
+        writer.SetFileName(self.filename)
+        writer.SetInputData(MakeImage())
+        writer.Write()
+
+    def tearDown(self):
+        shutil.rmtree(self.directory, ignore_errors=True)
+
+    def test_recipe(self):
+        reader = vtkMultiImageReader()
+        reader.SetFileName(self.filename)
+
+        recipe = pickle.loads(pickle.dumps(reader.GetRecipe()))
+        self.assertIsInstance(recipe, vtkMultiImageReaderRecipe)
+        self.assertEqual(recipe.filename, self.filename)
+        self.assertIs(recipe.reader_class, reader._reader_classname)
+
+        # a pickled reader comes back as a reader of the same class and file
+        copied = pickle.loads(pickle.dumps(reader))
+        self.assertIsInstance(copied, vtkMultiImageReader)
+        self.assertIs(copied._reader_classname, reader._reader_classname)
+        self.assertEqual(copied.GetRecipe().filename, self.filename)
+
+    def test_empty_reader(self):
+        reader = pickle.loads(pickle.dumps(vtkMultiImageReader()))
+        self.assertIsNone(reader.GetRecipe().reader_class)
+
+
+if __name__ == '__main__':
+    unittest.main()
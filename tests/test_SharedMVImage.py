@@ -0,0 +1,85 @@
+"""
+SharedMVImage: images copied into shared memory once and attached, read-only, by
+name from other processes.
+
+    python -m unittest discover tests
+"""
+
+import concurrent.futures
+import pickle
+import unittest
+
+import numpy as np
+import vtk
+from vtk.util.numpy_support import numpy_to_vtk, vtk_to_numpy
+
+from PI.visualization.vtkMultiIO.SharedMVImage import SharedMVImage
+
+SIZE = 32 * 24 * 4
+
+
+def MakeImage():
+    image = vtk.vtkImageData()
+    image.SetDimensions(32, 24, 4)
+    image.SetSpacing(0.5, 0.25, 2.0)
+    image.GetPointData().SetScalars(numpy_to_vtk(np.arange(SIZE, dtype=np.int16), deep=1))
+    return image
+
+
+def SumVoxels(descriptor):
+    """Worker: attach to a shared image and sum its voxels"""
+    image = SharedMVImage.Attach(descriptor)
+    try:
+        return int(vtk_to_numpy(image.GetPointData().GetScalars()).sum())
+    finally:
+        image.Close()
+
+
+class SharedMVImageTest(unittest.TestCase):
+
+    def setUp(self):
+        self.image = SharedMVImage.FromImage(MakeImage())
+        self.image.GetHeader()['title'] = 'phantom'
+
+    def tearDown(self):
+        self.image.Close()
+        self.image.Unlink()
+
+    def test_attach(self):
+        attached = SharedMVImage.Attach(self.image.GetDescriptor())
+        try:
+            self.assertFalse(attached.IsOwner())
+            self.assertEqual(attached.GetDimensions(), (32, 24, 4))
+            self.assertEqual(attached.GetSpacing(), (0.5, 0.25, 2.0))
+            self.assertEqual(attached.GetHeader()['title'], 'phantom')
+            np.testing.assert_array_equal(
+                vtk_to_numpy(attached.GetPointData().GetScalars()), np.arange(SIZE))
+
+            # the owner's changes show through; the attached mapping is read-only
+            vtk_to_numpy(self.image.GetPointData().GetScalars())[0] = 42
+            self.assertEqual(vtk_to_numpy(attached.GetPointData().GetScalars())[0], 42)
+            self.assertTrue(attached._shm.buf.readonly)
+        finally:
+            attached.Close()
+
+    def test_pickle_sends_descriptor(self):
+        data = pickle.dumps(self.image)
+        self.assertLess(len(data), SIZE * 2)
+        attached = pickle.loads(data)
+        try:
+            self.assertEqual(attached.GetSharedMemoryName(), self.image.GetSharedMemoryName())
+        finally:
+            attached.Close()
+
+    def test_worker(self):
+        with concurrent.futures.ProcessPoolExecutor(max_workers=1) as executor:
+            total = executor.submit(SumVoxels, self.image.GetDescriptor()).result()
+        self.assertEqual(total, sum(range(SIZE)))
+
+        # the worker's exit mustn't have unlinked the owner's block
+        attached = SharedMVImage.Attach(self.image.GetDescriptor())
+        attached.Close()
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,172 @@
+"""
+Chunked VFF checksums: records written by vtkVFFWriter, and reading and verifying
+them (checksums.py and vtkImageReader3).
+
+    python -m unittest discover tests
+"""
+
+import hashlib
+import os
+import shutil
+import tempfile
+import unittest
+
+import numpy as np
+import vtk
+from vtk.util.numpy_support import numpy_to_vtk, vtk_to_numpy
+
+from PI.visualization.vtkMultiIO import checksums
+from PI.visualization.vtkMultiIO.vtkImageReader3 import vtkImageReader3
+from PI.visualization.vtkMultiIO.vtkMultiImageWriter import vtkMultiImageWriter
+
+LOGGER = checksums.logger.name
+
+SHAPE = (5, 6, 8)
+CHUNK_SLICES = 2
+
+
+def MakeValues():
+    return (np.arange(int(np.prod(SHAPE))) * 3 - 100).astype(np.int16).reshape(SHAPE)
+
+
+def MakeVFF(values, location=checksums.CHECKSUM_TRAILER):
+    """The bytes of a 16 bit VFF file of `values` with chunked checksums, as
+    vtkVFFWriter lays it out, and its checksum record"""
+
+    nz, ny, nx = values.shape
+    header = ('ncaa\ntype=raster;\nformat=slice;\nbands=1;\nrank=3;\nbits=16;\n'
+              'size={0} {1} {2};\nchecksum=md5;\nchecksum_chunk_slices={3};\n'
+              'checksum_location={4};\n\f\n').format(nx, ny, nz, CHUNK_SLICES, location)
+
+    data = values.astype('>i2')
+    digests = [hashlib.md5(data[z:z + CHUNK_SLICES].tobytes()).hexdigest()
+               for z in range(0, nz, CHUNK_SLICES)]
+    record = ('checksum_chunk_slices={0};\nmd5_chunk_digests={1};\nmd5_root_digest={2};\n'
+              '\f\n').format(CHUNK_SLICES, ' '.join(digests), checksums.GetRootDigest(digests))
+
+    return header.encode('latin-1') + data.tobytes(), record.encode('latin-1')
+
+
+def ReadVFF(filename, verify=True):
+    reader = vtkImageReader3()
+    reader.SetFileName(filename)
+    reader.SetDataExtent(0, SHAPE[2] - 1, 0, SHAPE[1] - 1, 0, SHAPE[0] - 1)
+    reader.SetDataScalarTypeToShort()
+    reader.SetDataByteOrder(0)
+    reader.SetVerifyChecksums(verify)
+    reader.Update()
+    return vtk_to_numpy(reader.GetOutputDataObject(0).GetPointData().GetScalars())
+
+
+def Corrupt(filename, slice_index):
+    """Flip a byte of slice `slice_index` of a file written by MakeVFF()"""
+    offset = checksums.ReadChecksums(filename)['header_size'] + \
+        slice_index * SHAPE[1] * SHAPE[2] * 2 + 5
+    with open(filename, 'r+b') as f:
+        f.seek(offset)
+        byte = f.read(1)
+        f.seek(offset)
+        f.write(bytes([byte[0] ^ 0xff]))
+
+
+class ChecksumTestCase(unittest.TestCase):
+
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+        self.filename = os.path.join(self.directory, 'image.vff')
+
+    def tearDown(self):
+        shutil.rmtree(self.directory, ignore_errors=True)
+
+
+class ChecksumReaderTest(ChecksumTestCase):
+
+    def Create(self, location):
+        data, record = MakeVFF(MakeValues(), location)
+        if location == checksums.CHECKSUM_TRAILER:
+            data += record
+        else:
+            with open(self.filename + '.md5', 'wb') as f:
+                f.write(record)
+        with open(self.filename, 'wb') as f:
+            f.write(data)
+
+    def test_read_record(self):
+        self.Create(checksums.CHECKSUM_TRAILER)
+        record = checksums.ReadChecksums(self.filename)
+        self.assertEqual(record['location'], checksums.CHECKSUM_TRAILER)
+        self.assertEqual(record['chunk_slices'], CHUNK_SLICES)
+        self.assertEqual(len(record['digests']), 3)
+        self.assertEqual(record['root'], checksums.GetRootDigest(record['digests']))
+
+    def test_trailer_is_not_header(self):
+        # the header size comes from the form feed, not from the size of the file
+        self.Create(checksums.CHECKSUM_TRAILER)
+        np.testing.assert_array_equal(ReadVFF(self.filename), MakeValues().ravel())
+
+    def test_verify(self):
+        for location in (checksums.CHECKSUM_TRAILER, checksums.CHECKSUM_SIDECAR):
+            self.Create(location)
+            self.assertTrue(checksums.VerifyChecksums(self.filename))
+
+    def test_corrupt_chunk(self):
+        self.Create(checksums.CHECKSUM_TRAILER)
+        Corrupt(self.filename, 3)
+        with self.assertLogs(LOGGER, 'ERROR'):
+            self.assertEqual(checksums.FindCorruptChunks(self.filename), [1])
+        # sub-extents that don't overlap the corrupt chunk still verify
+        self.assertTrue(checksums.VerifyChecksums(self.filename, (0, 7, 0, 5, 0, 1)))
+        with self.assertLogs(LOGGER, 'ERROR'):
+            self.assertFalse(checksums.VerifyChecksums(self.filename, (0, 7, 0, 5, 2, 2)))
+
+    def test_damaged_record(self):
+        self.Create(checksums.CHECKSUM_SIDECAR)
+        with open(self.filename + '.md5', 'r+b') as f:
+            record = f.read().replace(b'md5_root_digest=', b'md5_root_digest=0')
+            f.seek(0)
+            f.write(record)
+        with self.assertLogs(LOGGER, 'ERROR'):
+            self.assertEqual(checksums.FindCorruptChunks(self.filename), [0, 1, 2])
+
+
+class ChecksumWriterTest(ChecksumTestCase):
+
+    def Write(self, mode):
+        image = vtk.vtkImageData()
+        image.SetDimensions(SHAPE[2], SHAPE[1], SHAPE[0])
+        image.GetPointData().SetScalars(numpy_to_vtk(MakeValues().ravel(), deep=1))
+
+        writer = vtkMultiImageWriter()
+        writer.SetFileName(self.filename)
+        writer.SetScalarConversionPolicy('none')
+        getattr(writer, 'SetChecksumModeTo' + mode)()
+        writer.SetChecksumChunkSize(CHUNK_SLICES)
+        writer.SetInputData(image)
+        writer.Write()
+
+    def test_trailer(self):
+        self.Write('Trailer')
+
+        _data, record = MakeVFF(MakeValues())
+        self.assertEqual(checksums.ReadChecksums(self.filename)['location'],
+                         checksums.CHECKSUM_TRAILER)
+        self.assertTrue(checksums.VerifyChecksums(self.filename))
+        with open(self.filename, 'rb') as f:
+            self.assertTrue(f.read().endswith(record))
+        np.testing.assert_array_equal(ReadVFF(self.filename), MakeValues().ravel())
+
+    def test_sidecar(self):
+        self.Write('Sidecar')
+
+        _data, record = MakeVFF(MakeValues(), checksums.CHECKSUM_SIDECAR)
+        with open(self.filename + '.md5', 'rb') as f:
+            self.assertEqual(f.read(), record)
+        self.assertTrue(checksums.VerifyChecksums(self.filename))
+
+        Corrupt(self.filename, 4)
+        with self.assertLogs(LOGGER, 'ERROR'):
+            self.assertEqual(checksums.FindCorruptChunks(self.filename), [2])
+
+
+if __name__ == '__main__':
+    unittest.main()
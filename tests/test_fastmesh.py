@@ -0,0 +1,136 @@
+"""
+numpy mesh readers: vertex deduplication, and binary STL and PLY files read to the same
+meshes as vtkSTLReader and vtkPLYReader, with other files handed to those readers.
+
+    python -m unittest discover tests
+"""
+
+import os
+import shutil
+import tempfile
+import unittest
+
+import numpy as np
+import vtk
+from vtk.util.numpy_support import vtk_to_numpy
+
+from PI.visualization.vtkMultiIO import fastmesh
+
+
+def MakeMesh():
+    source = vtk.vtkSphereSource()
+    source.SetThetaResolution(12)
+    source.SetPhiResolution(9)
+    source.Update()
+    return source.GetOutput()
+
+
+def GetPoints(polydata):
+    return vtk_to_numpy(polydata.GetPoints().GetData())
+
+
+def GetTriangles(polydata):
+    """The triangles of `polydata` as rows of point coordinates, in a canonical order"""
+    points = GetPoints(polydata)
+    cells = vtk_to_numpy(polydata.GetPolys().GetConnectivityArray()).reshape(-1, 3)
+    triangles = points[cells].reshape(len(cells), -1)
+    return triangles[np.lexsort(triangles.T[::-1])]
+
+
+class MergeRowsTest(unittest.TestCase):
+
+    def test_matches_unique(self):
+        rng = np.random.RandomState(3)
+        distinct = rng.uniform(-1, 1, (50, 3)).astype(np.float32)
+        vertices = distinct[rng.randint(0, 50, 400)]
+
+        first, inverse = fastmesh._MergeRows(vertices)
+
+        # every row maps to an identical distinct row
+        np.testing.assert_array_equal(vertices[first][inverse], vertices)
+        # the first occurrences np.unique finds, numbered in order of appearance
+        keys = vertices.view(np.dtype((np.void, 12))).ravel()
+        _, expected_first = np.unique(keys, return_index=True)
+        np.testing.assert_array_equal(first, np.sort(expected_first))
+        self.assertEqual(inverse[0], 0)
+        self.assertTrue((np.diff(np.maximum.accumulate(inverse)) <= 1).all())
+
+    def test_empty(self):
+        first, inverse = fastmesh._MergeRows(np.empty((0, 3), np.float32))
+        self.assertEqual((len(first), len(inverse)), (0, 0))
+
+
+class ReaderTest(unittest.TestCase):
+
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+        self.mesh = MakeMesh()
+
+    def tearDown(self):
+        shutil.rmtree(self.directory, ignore_errors=True)
+
+    def Write(self, writer, name, binary=True):
+        filename = os.path.join(self.directory, name)
+        writer.SetFileName(filename)
+        writer.SetInputData(self.mesh)
+        if binary:
+            writer.SetFileTypeToBinary()
+        else:
+            writer.SetFileTypeToASCII()
+        writer.Write()
+        return filename
+
+    def Read(self, classname, filename):
+        reader = classname()
+        reader.SetFileName(filename)
+        reader.Update()
+        return reader, reader.GetOutput()
+
+    def test_stl(self):
+        filename = self.Write(vtk.vtkSTLWriter(), 'mesh.stl')
+        reader, output = self.Read(fastmesh.vtkNumpySTLReader, filename)
+        _, expected = self.Read(vtk.vtkSTLReader, filename)
+
+        self.assertTrue(reader.IsFastPath())
+        self.assertEqual(output.GetNumberOfPoints(), expected.GetNumberOfPoints())
+        self.assertEqual(output.GetNumberOfPolys(), expected.GetNumberOfPolys())
+        np.testing.assert_array_equal(GetTriangles(output), GetTriangles(expected))
+
+    def test_ascii_stl(self):
+        filename = self.Write(vtk.vtkSTLWriter(), 'ascii.stl', binary=False)
+        reader, output = self.Read(fastmesh.vtkNumpySTLReader, filename)
+        self.assertFalse(reader.IsFastPath())
+        self.assertEqual(output.GetNumberOfPolys(), self.mesh.GetNumberOfPolys())
+
+    def test_ply(self):
+        colors = vtk.vtkUnsignedCharArray()
+        colors.SetName('Colors')
+        colors.SetNumberOfComponents(3)
+        for i in range(self.mesh.GetNumberOfPoints()):
+            colors.InsertNextTuple3(i % 256, 2 * i % 256, 3 * i % 256)
+        self.mesh.GetPointData().AddArray(colors)
+
+        writer = vtk.vtkPLYWriter()
+        writer.SetArrayName('Colors')
+        filename = self.Write(writer, 'mesh.ply')
+        reader, output = self.Read(fastmesh.vtkNumpyPLYReader, filename)
+        _, expected = self.Read(vtk.vtkPLYReader, filename)
+
+        self.assertTrue(reader.IsFastPath())
+        np.testing.assert_array_equal(GetPoints(output), GetPoints(expected))
+        np.testing.assert_array_equal(
+            vtk_to_numpy(output.GetPolys().GetConnectivityArray()),
+            vtk_to_numpy(expected.GetPolys().GetConnectivityArray()))
+        np.testing.assert_array_equal(
+            vtk_to_numpy(output.GetPointData().GetScalars()),
+            vtk_to_numpy(expected.GetPointData().GetScalars()))
+
+    def test_ascii_ply(self):
+        filename = self.Write(vtk.vtkPLYWriter(), 'ascii.ply', binary=False)
+        reader, output = self.Read(fastmesh.vtkNumpyPLYReader, filename)
+        self.assertFalse(reader.IsFastPath())
+        self.assertEqual(output.GetNumberOfPoints(), self.mesh.GetNumberOfPoints())
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,133 @@
+"""
+I/O metrics: the IOMetrics records vtkMultiImageWriter and vtkMultiImageReader hand to
+their metrics observers and publish as ImageIOMetricsEvents.
+
+    python -m unittest discover tests
+"""
+
+import os
+import shutil
+import tempfile
+import unittest
+
+import numpy as np
+import vtk
+from vtk.util.numpy_support import numpy_to_vtk
+from zope import event
+
+from PI.visualization.vtkMultiIO import instrumentation
+from PI.visualization.vtkMultiIO.events import ImageIOMetricsEvent
+from PI.visualization.vtkMultiIO.vtkMultiImageReader import vtkMultiImageReader
+from PI.visualization.vtkMultiIO.vtkMultiImageWriter import vtkMultiImageWriter
+
+
+def MakeImage():
+    image = vtk.vtkImageData()
+    image.SetDimensions(16, 12, 4)
+    image.GetPointData().SetScalars(numpy_to_vtk(np.arange(768, dtype=np.int16), deep=1))
+    return image
+
+
+class IOMetricsTest(unittest.TestCase):
+
+    def test_throughput(self):
+        metrics = instrumentation.IOMetrics('read', 'image.vff')
+        self.assertEqual(metrics.GetThroughput(), 0.0)
+
+        metrics.detection_time, metrics.header_time, metrics.io_time = 0.25, 0.25, 0.5
+        metrics.bytes = 4 << 20
+        self.assertEqual(metrics.GetWallTime(), 1.0)
+        self.assertEqual(metrics.GetThroughput(), 8.0)
+        self.assertEqual(metrics.AsDict()['throughput'], 8.0)
+
+    def test_stopwatch(self):
+        metrics = instrumentation.IOMetrics('write')
+        with instrumentation.Stopwatch(metrics, 'io_time'):
+            pass
+        first = metrics.io_time
+        with instrumentation.Stopwatch(metrics, 'io_time'):
+            pass
+        self.assertGreaterEqual(metrics.io_time, first)
+        # no record - nothing to time
+        with instrumentation.Stopwatch(None, 'io_time'):
+            pass
+
+    def test_observers(self):
+        observers = instrumentation.IOMetricsObservers()
+        received = []
+        first = observers.AddObserver(received.append)
+        second = observers.AddObserver(received.append)
+        self.assertNotEqual(first, second)
+
+        metrics = instrumentation.IOMetrics('read')
+        observers.Notify(metrics)
+        self.assertEqual(received, [metrics, metrics])
+
+        observers.RemoveObserver(first)
+        observers.Notify(metrics)
+        self.assertEqual(len(received), 3)
+        self.assertIs(observers.GetLastMetrics(), metrics)
+
+
+class ReadWriteMetricsTest(unittest.TestCase):
+
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+        self.filename = os.path.join(self.directory, 'image.mha')
+        self.events = []
+        event.subscribers.append(self.OnEvent)
+
+    def tearDown(self):
+        event.subscribers.remove(self.OnEvent)
+        shutil.rmtree(self.directory, ignore_errors=True)
+
+    def OnEvent(self, e):
+        if isinstance(e, ImageIOMetricsEvent):
+            self.events.append(e.GetMetrics())
+
+    def test_write(self):
+        received = []
+        writer = vtkMultiImageWriter()
+        writer.AddIOMetricsObserver(received.append)
+        writer.SetFileName(self.filename)
+        writer.SetInputData(MakeImage())
+        writer.Write()
+
+        self.assertEqual(len(received), 1)
+        metrics = received[0]
+        self.assertEqual(metrics.operation, 'write')
+        self.assertEqual(metrics.filename, self.filename)
+        self.assertEqual(metrics.classname, 'MyMetaImageWriter')
+        self.assertEqual(metrics.bytes, os.path.getsize(self.filename))
+        self.assertIs(writer.GetLastIOMetrics(), metrics)
+        self.assertEqual(self.events, [metrics])
+
+    def test_read(self):
+        writer = vtk.vtkMetaImageWriter()
+        writer.SetFileName(self.filename)
+        writer.SetInputData(MakeImage())
+        writer.Write()
+
+        received = []
+        reader = vtkMultiImageReader()
+        reader.AddIOMetricsObserver(received.append)
+        reader.SetFileName(self.filename)
+        reader.Update()
+
+        self.assertEqual(len(received), 1)
+        metrics = received[0]
+        self.assertEqual(metrics.operation, 'read')
+        self.assertEqual(metrics.bytes, 768 * 2)
+        self.assertIsNotNone(metrics.classname)
+        self.assertEqual(self.events, [metrics])
+
+    def test_observer_ids(self):
+        # AddObserver used to hand out 0 for every observer
+        writer = vtkMultiImageWriter()
+        first = writer.AddObserver('ProgressEvent', lambda *args: None)
+        second = writer.AddObserver('ProgressEvent', lambda *args: None)
+        self.assertNotEqual(first, second)
+
+
+if __name__ == '__main__':
+    unittest.main()
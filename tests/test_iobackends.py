@@ -0,0 +1,111 @@
+"""
+I/O backends: the file, memory-mapped, in-memory and batched backends return the same
+bytes, and vtkImageReader3 reads through whichever backend it is given.
+
+    python -m unittest discover tests
+"""
+
+import os
+import shutil
+import tempfile
+import unittest
+
+import numpy as np
+from vtk.util.numpy_support import vtk_to_numpy
+
+from PI.visualization.vtkMultiIO import iobackends
+from PI.visualization.vtkMultiIO.vtkImageReader3 import vtkImageReader3
+
+DATA = bytes(range(256)) * 16
+RANGES = [(0, 10), (100, 256), (4000, 96), (17, 0)]
+
+
+class BackendTest(unittest.TestCase):
+
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+        self.filename = os.path.join(self.directory, 'data.raw')
+        with open(self.filename, 'wb') as f:
+            f.write(DATA)
+
+    def tearDown(self):
+        shutil.rmtree(self.directory, ignore_errors=True)
+
+    def CheckBackend(self, backend):
+        self.assertTrue(backend.Exists(self.filename))
+        self.assertFalse(backend.Exists(self.filename + '.missing'))
+        self.assertEqual(backend.GetSize(self.filename), len(DATA))
+        with backend.Open(self.filename) as f:
+            self.assertEqual(f.read(), DATA)
+
+        self.assertEqual([bytes(d) for d in backend.ReadRanges(self.filename, RANGES)],
+                         [DATA[offset:offset + length] for offset, length in RANGES])
+        with self.assertRaises(IOError):
+            backend.ReadRanges(self.filename, [(len(DATA) - 4, 8)])
+
+        with self.assertRaises(ValueError):
+            backend.Open(self.filename, 'r+b')
+
+    def test_file(self):
+        self.CheckBackend(iobackends.FileBackend())
+
+    def test_mmap(self):
+        self.CheckBackend(iobackends.MMapBackend())
+
+    def test_memory(self):
+        self.CheckBackend(iobackends.MemoryBackend({self.filename: DATA}))
+
+    def test_batched(self):
+        backend = iobackends.BatchedBackend(max_workers=2)
+        try:
+            self.CheckBackend(backend)
+            futures = backend.SubmitRanges(self.filename, RANGES[:2])
+            self.assertEqual([f.result() for f in futures], [DATA[0:10], DATA[100:356]])
+        finally:
+            backend.Close()
+
+    def test_memory_write(self):
+        backend = iobackends.MemoryBackend()
+        with backend.Open('image.raw', 'wb') as f:
+            f.write(b'abc')
+            # stored when the file is closed
+            self.assertFalse(backend.Exists('image.raw'))
+        self.assertEqual(backend.GetData('image.raw'), b'abc')
+        self.assertEqual(backend.GetFileNames(), ['image.raw'])
+        backend.Remove('image.raw')
+        self.assertRaises(IOError, backend.GetData, 'image.raw')
+
+    def test_default_backend(self):
+        memory = iobackends.MemoryBackend()
+        iobackends.SetDefaultBackend(memory)
+        try:
+            self.assertIs(iobackends.GetDefaultBackend(), memory)
+        finally:
+            iobackends.SetDefaultBackend(None)
+        self.assertIsInstance(iobackends.GetDefaultBackend(), iobackends.FileBackend)
+
+
+class ReaderBackendTest(unittest.TestCase):
+
+    def test_memory_read(self):
+        # nothing on disk - the reader only sees the backend
+        values = np.arange(4 * 3 * 2, dtype='>i2')
+        backend = iobackends.MemoryBackend({'volume.raw': values.tobytes()})
+
+        reader = vtkImageReader3()
+        reader.SetIOBackend(backend)
+        reader.SetFileName('volume.raw')
+        reader.SetFileDimensionality(3)
+        reader.SetDataExtent(0, 3, 0, 2, 0, 1)
+        reader.SetDataScalarTypeToShort()
+        reader.SetDataByteOrder(0)
+        reader.SetFileLowerLeft(0)
+        reader.Update()
+
+        output = reader.GetOutputDataObject(0)
+        np.testing.assert_array_equal(vtk_to_numpy(output.GetPointData().GetScalars()),
+                                      values)
+
+
+if __name__ == '__main__':
+    unittest.main()
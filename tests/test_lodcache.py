@@ -0,0 +1,108 @@
+"""
+Mesh LOD cache: cache keys follow the source file's size and modification time,
+decimated levels are stored and found again, and vtkMultiPolyDataReader returns the
+coarse level in LOD mode.
+
+    python -m unittest discover tests
+"""
+
+import os
+import shutil
+import tempfile
+import unittest
+
+import vtk
+
+from PI.visualization.vtkMultiIO import lodcache
+from PI.visualization.vtkMultiIO.vtkMultiPolyDataReader import vtkMultiPolyDataReader
+
+TARGET = 100
+
+
+def MakeMesh():
+    source = vtk.vtkSphereSource()
+    source.SetThetaResolution(32)
+    source.SetPhiResolution(32)
+    source.Update()
+    return source.GetOutput()
+
+
+class MeshLODCacheTest(unittest.TestCase):
+
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+        self.cache = lodcache.MeshLODCache(os.path.join(self.directory, 'cache'))
+        self.filename = os.path.join(self.directory, 'mesh.vtp')
+        self.mesh = MakeMesh()
+        self.WriteMesh()
+
+    def tearDown(self):
+        shutil.rmtree(self.directory, ignore_errors=True)
+
+    def WriteMesh(self):
+        writer = vtk.vtkXMLPolyDataWriter()
+        writer.SetFileName(self.filename)
+        writer.SetInputData(self.mesh)
+        writer.Write()
+
+    def CreateReader(self):
+        reader = vtk.vtkXMLPolyDataReader()
+        reader.SetFileName(self.filename)
+        return reader
+
+    def test_key(self):
+        key = self.cache.GetCacheFileName(self.filename, TARGET)
+        self.assertEqual(self.cache.GetCacheFileName(self.filename, TARGET), key)
+        self.assertNotEqual(self.cache.GetCacheFileName(self.filename, TARGET * 2), key)
+
+        # a new modification time or size is a new version of the file
+        st = os.stat(self.filename)
+        os.utime(self.filename, ns=(st.st_atime_ns, st.st_mtime_ns + 10 ** 9))
+        self.assertNotEqual(self.cache.GetCacheFileName(self.filename, TARGET), key)
+        modified = self.cache.GetCacheFileName(self.filename, TARGET)
+        with open(self.filename, 'ab') as f:
+            f.write(b' ')
+        os.utime(self.filename, ns=(st.st_atime_ns, st.st_mtime_ns + 10 ** 9))
+        self.assertNotEqual(self.cache.GetCacheFileName(self.filename, TARGET), modified)
+
+    def test_put_get(self):
+        self.assertIsNone(self.cache.Get(self.filename, TARGET))
+        self.cache.Put(self.filename, TARGET, self.mesh)
+        cached = self.cache.Get(self.filename, TARGET)
+        self.assertEqual(cached.GetNumberOfPoints(), self.mesh.GetNumberOfPoints())
+        # nothing left behind under a temporary name
+        self.assertEqual(os.listdir(self.cache.GetDirectory()),
+                         [os.path.basename(self.cache.GetCacheFileName(self.filename, TARGET))])
+
+        self.cache.Clear()
+        self.assertIsNone(self.cache.Get(self.filename, TARGET))
+
+    def test_level(self):
+        level = self.cache.GetLevel(self.filename, TARGET, self.CreateReader())
+        self.assertLess(level.GetNumberOfPolys(), self.mesh.GetNumberOfPolys())
+        self.assertLessEqual(level.GetNumberOfPolys(), TARGET * 1.1)
+        self.assertIsNotNone(self.cache.Get(self.filename, TARGET))
+
+        # rewriting the file invalidates the cached level
+        os.utime(self.filename, ns=(0, 0))
+        self.assertIsNone(self.cache.Get(self.filename, TARGET))
+
+    def test_small_mesh(self):
+        # meshes already small enough aren't decimated or cached
+        target = self.mesh.GetNumberOfPolys()
+        level = self.cache.GetLevel(self.filename, target, self.CreateReader())
+        self.assertEqual(level.GetNumberOfPolys(), target)
+        self.assertIsNone(self.cache.Get(self.filename, target))
+
+    def test_reader(self):
+        reader = vtkMultiPolyDataReader()
+        reader.SetLODCacheDirectory(self.cache.GetDirectory())
+        reader.SetLODTargetSize(TARGET)
+        reader.SetFileName(self.filename)
+        self.assertLess(reader.GetOutput().GetNumberOfPolys(), self.mesh.GetNumberOfPolys())
+        self.assertEqual(reader.GetFullResolutionOutput().GetNumberOfPolys(),
+                         self.mesh.GetNumberOfPolys())
+
+
+if __name__ == '__main__':
+    unittest.main()
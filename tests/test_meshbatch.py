@@ -0,0 +1,99 @@
+"""
+Batch mesh loading: meshes read by a pool of threads or processes, returned in order
+or appended with mesh id arrays, with progress events.
+
+    python -m unittest discover tests
+"""
+
+import os
+import shutil
+import tempfile
+import unittest
+
+import numpy as np
+import vtk
+from vtk.util.numpy_support import vtk_to_numpy
+from zope import event
+
+from PI.visualization.vtkMultiIO import meshbatch
+from PI.visualization.vtkMultiIO.events import MeshLoadProgressEvent
+
+
+def MakeMesh(resolution):
+    source = vtk.vtkSphereSource()
+    source.SetThetaResolution(resolution)
+    source.SetPhiResolution(resolution)
+    source.Update()
+    return source.GetOutput()
+
+
+class LoadMeshesTest(unittest.TestCase):
+
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+        self.meshes = [MakeMesh(r) for r in (4, 6, 8)]
+        self.filenames = []
+        for index, mesh in enumerate(self.meshes):
+            filename = os.path.join(self.directory, 'mesh{0}.vtp'.format(index))
+            writer = vtk.vtkXMLPolyDataWriter()
+            writer.SetFileName(filename)
+            writer.SetInputData(mesh)
+            writer.Write()
+            self.filenames.append(filename)
+
+        self.events = []
+        event.subscribers.append(self.OnEvent)
+
+    def tearDown(self):
+        event.subscribers.remove(self.OnEvent)
+        shutil.rmtree(self.directory, ignore_errors=True)
+
+    def OnEvent(self, e):
+        if isinstance(e, MeshLoadProgressEvent):
+            self.events.append(e)
+
+    def CheckMeshes(self, meshes):
+        self.assertEqual([m.GetNumberOfPoints() for m in meshes],
+                         [m.GetNumberOfPoints() for m in self.meshes])
+
+    def test_threads(self):
+        progress = []
+        meshes = meshbatch.LoadMeshes(self.filenames, max_workers=2,
+                                      progress=lambda f, name: progress.append(f))
+        self.CheckMeshes(meshes)
+        self.assertEqual(sorted(progress), [1 / 3.0, 2 / 3.0, 1.0])
+        self.assertEqual(sorted(e.GetFileName() for e in self.events), self.filenames)
+
+    def test_processes(self):
+        self.CheckMeshes(meshbatch.LoadMeshes(self.filenames, max_workers=2,
+                                              use_processes=True))
+
+    def test_missing_file(self):
+        filenames = [self.filenames[0], os.path.join(self.directory, 'missing.vtp')]
+        meshes = meshbatch.LoadMeshes(filenames)
+        self.assertIsNotNone(meshes[0])
+        self.assertIsNone(meshes[1])
+        errors = [e for e in self.events if e.GetError() is not None]
+        self.assertEqual([e.GetFileName() for e in errors], filenames[1:])
+
+    def test_merge(self):
+        merged = meshbatch.LoadMeshes(self.filenames, merge=True)
+        self.assertEqual(merged.GetNumberOfPoints(),
+                         sum(m.GetNumberOfPoints() for m in self.meshes))
+
+        ids = vtk_to_numpy(merged.GetPointData().GetArray(meshbatch.MESH_ID_ARRAY))
+        np.testing.assert_array_equal(
+            np.bincount(ids), [m.GetNumberOfPoints() for m in self.meshes])
+        ids = vtk_to_numpy(merged.GetCellData().GetArray(meshbatch.MESH_ID_ARRAY))
+        np.testing.assert_array_equal(
+            np.bincount(ids), [m.GetNumberOfCells() for m in self.meshes])
+
+    def test_append_skips_missing(self):
+        merged = meshbatch.AppendMeshes([None, self.meshes[1]])
+        ids = vtk_to_numpy(merged.GetPointData().GetArray(meshbatch.MESH_ID_ARRAY))
+        self.assertTrue((ids == 1).all())
+        self.assertEqual(meshbatch.AppendMeshes([None]).GetNumberOfPoints(), 0)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,239 @@
+"""
+MetaImage files: header-only parsing, and streamed and plain writes by
+vtkMultiImageWriter, read back with vtkMetaImageReader, with DICOM keywords in the
+header.
+
+    python -m unittest discover tests
+"""
+
+import os
+import shutil
+import tempfile
+import unittest
+
+import numpy as np
+import pydicom
+import vtk
+from vtk.util.numpy_support import numpy_to_vtk, vtk_to_numpy
+
+from PI.visualization.vtkMultiIO import iobackends
+from PI.visualization.vtkMultiIO import metaimage
+from PI.visualization.vtkMultiIO.vtkMultiImageReader import MyMetaImageReader
+from PI.visualization.vtkMultiIO.vtkMultiImageWriter import vtkMultiImageWriter
+
+
+def MakeImage(shape=(5, 12, 16), dtype=np.int16):
+    """A vtkImageData of `shape` (z, y, x) in which neighbouring voxels differ"""
+
+    values = (np.arange(int(np.prod(shape))) * 7 % 4001 - 1000).astype(dtype)
+    image = vtk.vtkImageData()
+    image.SetDimensions(shape[2], shape[1], shape[0])
+    image.SetSpacing(0.5, 0.25, 2.0)
+    image.SetOrigin(1.0, 2.0, 3.0)
+    image.GetPointData().SetScalars(numpy_to_vtk(values, deep=1))
+    return image
+
+
+def GetValues(image):
+    return vtk_to_numpy(image.GetPointData().GetScalars())
+
+
+def MakeDICOMHeader():
+    ds = pydicom.dataset.Dataset()
+    ds.Modality = 'CT'
+    ds.PatientName = 'Doe^Jane'
+    ds.StudyDate = '20240131'
+    ds.ImageComments = 'first line\nsecond line'
+    return ds
+
+
+def MakeHeader(*entries):
+    """A MetaImage header ending in an ElementDataFile entry"""
+    header = ['ObjectType = Image', 'NDims = 3', 'DimSize = 4 3 2',
+              'ElementSpacing = 0.5 0.5 2', 'Offset = 1 2 3', 'ElementType = MET_SHORT']
+    header += list(entries) + ['ElementDataFile = LOCAL']
+    return ('\n'.join(header) + '\n').encode('latin-1')
+
+
+class MetaImageHeaderTest(unittest.TestCase):
+
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+        metaimage.ClearHeaderCache()
+
+    def tearDown(self):
+        shutil.rmtree(self.directory, ignore_errors=True)
+
+    def Write(self, data, name='image.mha'):
+        filename = os.path.join(self.directory, name)
+        with open(filename, 'wb') as f:
+            f.write(data)
+        return filename
+
+    def test_header(self):
+        header = MakeHeader('dicom_Modality = CT', 'dicom_ImageComments = a\\nb')
+        filename = self.Write(header + np.zeros(24, np.int16).tobytes())
+        result = metaimage.ReadMetaImageHeader(filename)
+
+        self.assertEqual(result['header_size'], len(header))
+        self.assertEqual(result['dimensions'], (4, 3, 2))
+        self.assertEqual(result['extent'], (0, 3, 0, 2, 0, 1))
+        self.assertEqual(result['spacing'], (0.5, 0.5, 2.0))
+        self.assertEqual(result['origin'], (1.0, 2.0, 3.0))
+        self.assertEqual(result['scalar_type'], vtk.VTK_SHORT)
+        self.assertEqual(result['element_data_file'], 'LOCAL')
+        self.assertFalse(result['compressed'])
+        self.assertEqual(dict(result['dicom']), {'dicom_Modality': 'CT',
+                                                 'dicom_ImageComments': 'a\nb'})
+        self.assertTrue(metaimage.IsMetaImageFile(filename))
+
+    def test_block_boundaries(self):
+        # the ElementDataFile entry straddles the end of the first block, and the
+        # pixel data (which must not be searched) holds the keyword
+        pixels = b'\nElementDataFile = bogus\n' * 4
+        for split in range(len('ElementDataFile = LOCAL\n')):
+            padding = metaimage._BLOCK_SIZE - len(MakeHeader('Comment = ')) + split + 1
+            header = MakeHeader('Comment = ' + 'x' * padding)
+            metaimage.ClearHeaderCache()
+            result = metaimage.ReadMetaImageHeader(self.Write(header + pixels))
+            self.assertEqual(result['header_size'], len(header))
+            self.assertEqual(result['element_data_file'], 'LOCAL')
+
+    def test_not_metaimage(self):
+        filename = self.Write(b'\0' * (metaimage._BLOCK_SIZE * 4), 'image.raw')
+        with self.assertRaises(IOError):
+            metaimage.ReadMetaImageHeader(filename)
+        self.assertFalse(metaimage.IsMetaImageFile(filename))
+
+        filename = self.Write(MakeHeader()[:-len('ElementDataFile = LOCAL\n')], 'short.mha')
+        with self.assertRaises(IOError):
+            metaimage.ReadMetaImageHeader(filename)
+
+    def test_bad_values(self):
+        filename = self.Write(MakeHeader('ElementNumberOfChannels = many'))
+        with self.assertRaises(ValueError):
+            metaimage.ReadMetaImageHeader(filename)
+        self.assertFalse(metaimage.IsMetaImageFile(filename))
+
+        # the reader falls back to vtkMetaImageReader's own values
+        reader = MyMetaImageReader()
+        reader.SetFileName(filename)
+        self.assertIsNone(reader._GetHeader())
+
+
+class MetaImageRoundTripTest(unittest.TestCase):
+
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+
+    def tearDown(self):
+        shutil.rmtree(self.directory, ignore_errors=True)
+
+    def Read(self, memory, filename):
+        """vtkMetaImageReader reads real files - copy the backend's files out first"""
+
+        for name in memory.GetFileNames():
+            with open(os.path.join(self.directory, name), 'wb') as f:
+                f.write(memory.GetData(name))
+        path = os.path.join(self.directory, filename)
+        reader = vtk.vtkMetaImageReader()
+        reader.SetFileName(path)
+        reader.Update()
+        return reader.GetOutput(), metaimage.ReadMetaImageHeader(path)
+
+    def CheckRoundTrip(self, filename, compression):
+        image = MakeImage()
+        image.SetDirectionMatrix(0, 1, 0, -1, 0, 0, 0, 0, 1)
+
+        memory = iobackends.MemoryBackend()
+        writer = vtkMultiImageWriter()
+        writer.SetIOBackend(memory)
+        writer.SetFileName(filename)
+        writer.SetCompression(compression)
+        writer.SetDICOMHeader(MakeDICOMHeader())
+        writer.SetInputData(image)
+        writer.SetStreamingSlabSize(2)
+        writer.Write()
+
+        output, header = self.Read(memory, filename)
+        np.testing.assert_array_equal(GetValues(output), GetValues(image))
+        self.assertEqual(output.GetSpacing(), image.GetSpacing())
+        self.assertEqual(output.GetOrigin(), image.GetOrigin())
+        direction = output.GetDirectionMatrix()
+        self.assertEqual([direction.GetElement(i, j) for i in range(3) for j in range(3)],
+                         [0, 1, 0, -1, 0, 0, 0, 0, 1])
+
+        self.assertEqual(header['compressed'], bool(compression))
+        self.assertEqual(header['dicom']['dicom_Modality'], 'CT')
+        self.assertEqual(header['dicom']['dicom_ImageComments'], 'first line\nsecond line')
+
+    def test_mha(self):
+        self.CheckRoundTrip('image.mha', 0)
+
+    def test_compressed_mha(self):
+        self.CheckRoundTrip('image.mha', 1)
+
+    def test_mhd(self):
+        self.CheckRoundTrip('image.mhd', 0)
+
+    def test_compressed_mhd(self):
+        self.CheckRoundTrip('image.mhd', 1)
+
+
+class MetaImageWriteTest(unittest.TestCase):
+
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+        self.filename = os.path.join(self.directory, 'image.mha')
+
+    def tearDown(self):
+        shutil.rmtree(self.directory, ignore_errors=True)
+
+    def Read(self):
+        reader = vtk.vtkMetaImageReader()
+        reader.SetFileName(self.filename)
+        reader.Update()
+        return reader.GetOutput(), metaimage.ReadMetaImageHeader(self.filename)
+
+    def Write(self, ds=None, backend=None):
+        image = MakeImage()
+        writer = vtkMultiImageWriter()
+        if backend is not None:
+            writer.SetIOBackend(backend)
+        writer.SetFileName(self.filename)
+        if ds is not None:
+            writer.SetDICOMHeader(ds)
+        writer.SetInputData(image)
+        writer.Write()
+        return image
+
+    def test_keywords(self):
+        # the keywords are in the header as it is written - nothing is rewritten
+        image = self.Write(MakeDICOMHeader())
+        self.assertEqual(os.listdir(self.directory), ['image.mha'])
+
+        output, header = self.Read()
+        np.testing.assert_array_equal(GetValues(output), GetValues(image))
+        self.assertEqual(output.GetSpacing(), image.GetSpacing())
+        self.assertEqual(header['dicom']['dicom_PatientsName'], 'Doe^Jane')
+        self.assertEqual(header['dicom']['dicom_ImageComments'], 'first line\nsecond line')
+        # compressed, as vtkMetaImageWriter compresses by default
+        self.assertTrue(header['compressed'])
+
+    def test_no_keywords(self):
+        image = self.Write()
+        output, header = self.Read()
+        np.testing.assert_array_equal(GetValues(output), GetValues(image))
+        self.assertEqual(header['dicom'], {})
+        self.assertTrue(header['compressed'])
+
+    def test_keywords_backend(self):
+        # written through the I/O backend, like streamed writes
+        memory = iobackends.MemoryBackend()
+        self.Write(MakeDICOMHeader(), memory)
+        self.assertEqual(memory.GetFileNames(), [self.filename])
+        self.assertFalse(os.path.exists(self.filename))
+
+
+if __name__ == '__main__':
+    unittest.main()
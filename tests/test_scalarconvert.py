@@ -0,0 +1,173 @@
+"""
+Scalar type conversion: the target type picked for each writer capability, the CAST,
+CLAMP and RESCALE policies, and streamed writes that convert one slab at a time.
+
+    python -m unittest discover tests
+"""
+
+import os
+import shutil
+import tempfile
+import unittest
+
+import numpy as np
+import vtk
+from vtk.util.numpy_support import numpy_to_vtk, vtk_to_numpy
+
+from PI.visualization.vtkMultiIO import iobackends
+from PI.visualization.vtkMultiIO import scalarconvert
+from PI.visualization.vtkMultiIO import vtkImageWriterBase
+from PI.visualization.vtkMultiIO.vtkMultiImageWriter import vtkMultiImageWriter
+
+DEPTHS = vtkImageWriterBase.DEPTH_8 | vtkImageWriterBase.DEPTH_16 | vtkImageWriterBase.DEPTH_32
+PNG = vtkImageWriterBase.DEPTH_8 | vtkImageWriterBase.DEPTH_16 | vtkImageWriterBase.UNSIGNED_ONLY
+JPEG = vtkImageWriterBase.DEPTH_8 | vtkImageWriterBase.UNSIGNED_ONLY
+
+
+def MakeImage(values, shape=(4, 3, 5)):
+    image = vtk.vtkImageData()
+    image.SetDimensions(shape[2], shape[1], shape[0])
+    image.SetSpacing(0.5, 0.25, 2.0)
+    image.GetPointData().SetScalars(numpy_to_vtk(values.ravel(), deep=1))
+    return image
+
+
+class TargetScalarTypeTest(unittest.TestCase):
+
+    def test_supported(self):
+        self.assertIsNone(scalarconvert.GetTargetScalarType(vtk.VTK_SHORT, DEPTHS))
+        self.assertIsNone(scalarconvert.GetTargetScalarType(vtk.VTK_UNSIGNED_SHORT, PNG))
+        # writers that declare no depths take anything
+        self.assertIsNone(scalarconvert.GetTargetScalarType(vtk.VTK_DOUBLE, 0))
+
+    def test_narrower(self):
+        self.assertEqual(scalarconvert.GetTargetScalarType(vtk.VTK_UNSIGNED_SHORT, JPEG),
+                         vtk.VTK_UNSIGNED_CHAR)
+        self.assertEqual(scalarconvert.GetTargetScalarType(vtk.VTK_DOUBLE, DEPTHS),
+                         vtk.VTK_FLOAT)
+        self.assertEqual(scalarconvert.GetTargetScalarType(vtk.VTK_LONG_LONG, DEPTHS),
+                         vtk.VTK_INT)
+        self.assertEqual(scalarconvert.GetTargetScalarType(vtk.VTK_FLOAT, PNG),
+                         vtk.VTK_UNSIGNED_SHORT)
+
+    def test_unsigned_only(self):
+        self.assertEqual(scalarconvert.GetTargetScalarType(vtk.VTK_SHORT, PNG),
+                         vtk.VTK_UNSIGNED_SHORT)
+        self.assertEqual(scalarconvert.GetTargetScalarType(vtk.VTK_SIGNED_CHAR, PNG),
+                         vtk.VTK_UNSIGNED_CHAR)
+
+    def test_wider(self):
+        # with no narrower depth the narrowest wider one is used
+        self.assertEqual(scalarconvert.GetTargetScalarType(vtk.VTK_UNSIGNED_CHAR,
+                                                           vtkImageWriterBase.DEPTH_16),
+                         vtk.VTK_UNSIGNED_SHORT)
+
+
+class ConvertArrayTest(unittest.TestCase):
+
+    def test_cast(self):
+        values = np.array([-1, 0, 255, 256], np.int16)
+        np.testing.assert_array_equal(
+            scalarconvert.ConvertArray(values, np.uint8, scalarconvert.CAST), [255, 0, 255, 0])
+
+    def test_clamp(self):
+        values = np.array([-1000, -1, 0, 200, 300], np.int16)
+        np.testing.assert_array_equal(
+            scalarconvert.ConvertArray(values, np.uint8, scalarconvert.CLAMP),
+            [0, 0, 0, 200, 255])
+
+    def test_clamp_float(self):
+        values = np.array([-3.7, 0.4, 1.5, 2.5, 99.6, 300.0, np.nan, np.inf, -np.inf])
+        np.testing.assert_array_equal(
+            scalarconvert.ConvertArray(values, np.uint8, scalarconvert.CLAMP),
+            [0, 0, 2, 2, 100, 255, 0, 255, 0])
+        np.testing.assert_array_equal(
+            scalarconvert.ConvertArray(values, np.int16, scalarconvert.CLAMP),
+            [-4, 0, 2, 2, 100, 300, 0, 32767, -32768])
+
+    def test_clamp_float_target(self):
+        values = np.array([-1e300, 1.0, 1e300])
+        converted = scalarconvert.ConvertArray(values, np.float32, scalarconvert.CLAMP)
+        self.assertEqual(converted.dtype, np.float32)
+        np.testing.assert_array_equal(converted, [np.finfo(np.float32).min, 1.0,
+                                                  np.finfo(np.float32).max])
+
+    def test_rescale(self):
+        values = np.array([0, 100, 200, 300, 500], np.int16)
+        np.testing.assert_array_equal(
+            scalarconvert.ConvertArray(values, np.uint8, scalarconvert.RESCALE, (300, 255)),
+            [0, 0, 28, 128, 255])
+
+    def test_rescale_nan(self):
+        values = np.array([0.0, np.nan, 1.0])
+        np.testing.assert_array_equal(
+            scalarconvert.ConvertArray(values, np.uint8, scalarconvert.RESCALE, (0.5, 1.0)),
+            [0, 0, 255])
+
+    def test_range_window(self):
+        self.assertEqual(scalarconvert.GetRangeWindow(np.array([2.0, np.nan, 6.0])), (4.0, 4.0))
+        self.assertEqual(scalarconvert.GetRangeWindow(np.array([3, 3]))[0], 3.0)
+
+    def test_unknown_policy(self):
+        self.assertRaises(ValueError, scalarconvert.ConvertArray,
+                          np.zeros(3, np.int16), np.uint8, 'bogus')
+
+
+class ImageScalarConvertTest(unittest.TestCase):
+
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+
+    def tearDown(self):
+        shutil.rmtree(self.directory, ignore_errors=True)
+
+    def test_sub_extent(self):
+        values = np.arange(60, dtype=np.float64).reshape(4, 3, 5) - 10.4
+        image = MakeImage(values)
+
+        converter = scalarconvert.vtkImageScalarConvert(vtk.VTK_UNSIGNED_CHAR,
+                                                        scalarconvert.CLAMP)
+        converter.SetInputDataObject(0, image)
+        converter.UpdateExtent((0, 4, 0, 2, 1, 2))
+        output = converter.GetOutput()
+
+        self.assertEqual(output.GetExtent(), (0, 4, 0, 2, 1, 2))
+        self.assertEqual(output.GetSpacing(), (0.5, 0.25, 2.0))
+        scalars = output.GetPointData().GetScalars()
+        self.assertEqual(scalars.GetDataType(), vtk.VTK_UNSIGNED_CHAR)
+        np.testing.assert_array_equal(
+            vtk_to_numpy(scalars),
+            np.clip(np.rint(values[1:3]), 0, 255).astype(np.uint8).ravel())
+
+    def test_rescale_needs_window(self):
+        self.assertRaises(ValueError, scalarconvert.vtkImageScalarConvert,
+                          vtk.VTK_UNSIGNED_CHAR, scalarconvert.RESCALE)
+
+    def test_streamed_write(self):
+        # double volumes are written as float, one converted slab at a time
+        values = (np.arange(60, dtype=np.float64).reshape(4, 3, 5) - 30) * 1e40
+        memory = iobackends.MemoryBackend()
+        writer = vtkMultiImageWriter()
+        writer.SetIOBackend(memory)
+        writer.SetFileName('image.mha')
+        writer.SetScalarConversionPolicy(scalarconvert.CLAMP)
+        writer.SetInputData(MakeImage(values))
+        writer.SetStreamingSlabSize(1)
+        self.assertIsInstance(writer._converter, scalarconvert.vtkImageScalarConvert)
+        writer.Write()
+
+        path = os.path.join(self.directory, 'image.mha')
+        with open(path, 'wb') as f:
+            f.write(memory.GetData('image.mha'))
+        reader = vtk.vtkMetaImageReader()
+        reader.SetFileName(path)
+        reader.Update()
+        scalars = reader.GetOutput().GetPointData().GetScalars()
+        self.assertEqual(scalars.GetDataType(), vtk.VTK_FLOAT)
+        info = np.finfo(np.float32)
+        np.testing.assert_array_equal(vtk_to_numpy(scalars),
+                                      np.clip(values, info.min, info.max).ravel())
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,142 @@
+"""
+Streaming (slab by slab) writes through an in-memory I/O backend: images written by
+vtkMultiImageWriter are read back and compared voxel for voxel.
+
+    python -m unittest discover tests
+"""
+
+import os
+import shutil
+import tempfile
+import unittest
+
+import numpy as np
+import pydicom
+import vtk
+from vtk.util.numpy_support import numpy_to_vtk, vtk_to_numpy
+
+from PI.visualization.vtkMultiIO import iobackends
+from PI.visualization.vtkMultiIO import vffheader
+from PI.visualization.vtkMultiIO.vtkImageReader3 import vtkImageReader3
+from PI.visualization.vtkMultiIO.vtkMultiImageWriter import vtkMultiImageWriter
+
+
+def MakeImage(shape=(5, 12, 16), dtype=np.int16):
+    """A vtkImageData of `shape` (z, y, x) in which neighbouring voxels differ"""
+
+    values = (np.arange(int(np.prod(shape))) * 7 % 4001 - 1000).astype(dtype)
+    image = vtk.vtkImageData()
+    image.SetDimensions(shape[2], shape[1], shape[0])
+    image.SetSpacing(0.5, 0.25, 2.0)
+    image.SetOrigin(1.0, 2.0, 3.0)
+    image.GetPointData().SetScalars(numpy_to_vtk(values, deep=1))
+    return image
+
+
+def GetValues(image):
+    return vtk_to_numpy(image.GetPointData().GetScalars())
+
+
+def MakeDICOMHeader():
+    ds = pydicom.dataset.Dataset()
+    ds.Modality = 'CT'
+    ds.PatientName = 'Doe^Jane'
+    ds.StudyDate = '20240131'
+    ds.ImageComments = 'first line\nsecond line'
+    return ds
+
+
+def Write(image, filename, backend, slab_size=2, ds=None):
+    """Write `image` to `filename` in `backend`, streaming `slab_size` slices at a time"""
+
+    writer = vtkMultiImageWriter()
+    writer.SetIOBackend(backend)
+    writer.SetFileName(filename)
+    if ds is not None:
+        writer.SetDICOMHeader(ds)
+    writer.SetInputData(image)
+    writer.SetStreamingSlabSize(slab_size)
+    writer.Write()
+    return writer
+
+
+def ReadVFF(filename, backend):
+    """Read a 16 bit VFF file with vtkImageReader3"""
+
+    raw, _size = vffheader.ReadRawHeader(filename, backend)
+    keywords = vffheader.ParseKeywords(raw.decode('latin-1'))
+    nx, ny, nz = ([int(v) for v in keywords['size'].split()] + [1])[:3]
+
+    reader = vtkImageReader3()
+    reader.SetIOBackend(backend)
+    reader.SetFileName(filename)
+    reader.SetDataExtent(0, nx - 1, 0, ny - 1, 0, nz - 1)
+    reader.SetDataScalarTypeToShort()
+    # VFF shorts are big-endian
+    reader.SetDataByteOrder(0)
+    reader.Update()
+    return reader.GetOutputDataObject(0), keywords
+
+
+class VFFRoundTripTest(unittest.TestCase):
+
+    def test_streamed(self):
+        image = MakeImage()
+        memory = iobackends.MemoryBackend()
+        Write(image, 'image.vff', memory, ds=MakeDICOMHeader())
+
+        output, keywords = ReadVFF('image.vff', memory)
+        self.assertEqual(output.GetDimensions(), image.GetDimensions())
+        np.testing.assert_array_equal(GetValues(output), GetValues(image))
+        self.assertEqual(keywords['dicom_Modality'], 'CT')
+        self.assertEqual(keywords['dicom_PatientsName'], 'Doe^Jane')
+
+    def test_slab_sizes_agree(self):
+        image = MakeImage()
+        memory = iobackends.MemoryBackend()
+        Write(image, 'one.vff', memory, slab_size=1)
+        Write(image, 'all.vff', memory, slab_size=100)
+        self.assertEqual(memory.GetData('one.vff'), memory.GetData('all.vff'))
+
+
+class ScalarTypeTest(unittest.TestCase):
+
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+
+    def tearDown(self):
+        shutil.rmtree(self.directory, ignore_errors=True)
+
+    def CheckLong(self, filename, reader):
+        values = np.arange(60, dtype=np.int64) * 10 ** 9
+        image = vtk.vtkImageData()
+        image.SetDimensions(5, 4, 3)
+        image.GetPointData().SetScalars(numpy_to_vtk(values, deep=1, array_type=vtk.VTK_LONG))
+
+        memory = iobackends.MemoryBackend()
+        writer = vtkMultiImageWriter()
+        writer.SetIOBackend(memory)
+        writer.SetFileName(filename)
+        writer.SetScalarConversionPolicy('none')
+        writer.SetInputData(image)
+        writer.SetStreamingSlabSize(1)
+        writer.Write()
+
+        path = os.path.join(self.directory, filename)
+        with open(path, 'wb') as f:
+            f.write(memory.GetData(filename))
+        reader.SetFileName(path)
+        reader.Update()
+        scalars = reader.GetOutput().GetPointData().GetScalars()
+        self.assertEqual(scalars.GetDataType(), vtk.VTK_LONG)
+        np.testing.assert_array_equal(vtk_to_numpy(scalars), values)
+
+    def test_long_metaimage(self):
+        self.CheckLong('image.mha', vtk.vtkMetaImageReader())
+
+    def test_long_legacy_vtk(self):
+        self.CheckLong('image.vtk', vtk.vtkStructuredPointsReader())
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,106 @@
+"""
+TIFF stacks: multi-page files written by vtkMultiImageWriter and read back by
+vtkTIFFStackReader voxel for voxel, whole or a sub-extent at a time, with a StartEvent
+matched by one EndEvent for every write.
+
+    python -m unittest discover tests
+"""
+
+import unittest
+
+import numpy as np
+import vtk
+from vtk.util.numpy_support import numpy_to_vtk, vtk_to_numpy
+
+from PI.visualization.vtkMultiIO import iobackends
+from PI.visualization.vtkMultiIO import tiffio
+from PI.visualization.vtkMultiIO.vtkMultiImageWriter import vtkMultiImageWriter
+
+
+def MakeImage(shape=(5, 12, 16), dtype=np.int16):
+    """A vtkImageData of `shape` (z, y, x) in which neighbouring voxels differ"""
+
+    values = (np.arange(int(np.prod(shape))) * 7 % 4001 - 1000).astype(dtype)
+    image = vtk.vtkImageData()
+    image.SetDimensions(shape[2], shape[1], shape[0])
+    image.SetSpacing(0.5, 0.25, 2.0)
+    image.SetOrigin(1.0, 2.0, 3.0)
+    image.GetPointData().SetScalars(numpy_to_vtk(values, deep=1))
+    return image
+
+
+def GetValues(image):
+    return vtk_to_numpy(image.GetPointData().GetScalars())
+
+
+class TIFFRoundTripTest(unittest.TestCase):
+
+    def CheckRoundTrip(self, compression, dtype):
+        image = MakeImage(dtype=dtype)
+        memory = iobackends.MemoryBackend()
+
+        writer = vtkMultiImageWriter()
+        writer.SetIOBackend(memory)
+        writer.SetFileName('image.tif')
+        writer.SetCompression(compression)
+        writer.SetScalarConversionPolicy('none')
+        writer.SetInputData(image)
+        writer.Write()
+
+        reader = tiffio.vtkTIFFStackReader()
+        reader.SetIOBackend(memory)
+        reader.SetFileName('image.tif')
+        reader.Update()
+        output = reader.GetOutput()
+
+        self.assertEqual(reader.GetTIFFFile().GetNumberOfPages(), image.GetDimensions()[2])
+        self.assertEqual(output.GetDimensions(), image.GetDimensions())
+        np.testing.assert_array_equal(GetValues(output), GetValues(image))
+
+    def test_uncompressed(self):
+        self.CheckRoundTrip(tiffio.NONE, np.int16)
+
+    def test_deflate(self):
+        self.CheckRoundTrip(tiffio.DEFLATE, np.uint16)
+
+    def test_deflate_float(self):
+        self.CheckRoundTrip(tiffio.DEFLATE, np.float32)
+
+    def test_events(self):
+        # every StartEvent is matched by one EndEvent, even when the write fails
+        events = []
+        writer = vtkMultiImageWriter()
+        writer.SetIOBackend(iobackends.MemoryBackend())
+        writer.AddObserver('StartEvent', lambda *args: events.append('start'))
+        writer.AddObserver('EndEvent', lambda *args: events.append('end'))
+        writer.SetFileName('image.tif')
+        writer.SetScalarConversionPolicy('none')
+
+        writer.SetInputData(MakeImage())
+        writer.Write()
+        self.assertEqual(events, ['start', 'end'])
+
+        del events[:]
+        writer.SetInputData(MakeImage(dtype=np.float64))
+        with self.assertRaises(ValueError):
+            writer.Write()
+        self.assertEqual(events, ['start', 'end'])
+
+    def test_sub_extent(self):
+        image = MakeImage(shape=(6, 12, 16), dtype=np.uint16)
+        memory = iobackends.MemoryBackend()
+        tiffio.WriteTIFF('image.tif', image, tiffio.DEFLATE, backend=memory)
+
+        reader = tiffio.vtkTIFFStackReader()
+        reader.SetIOBackend(memory)
+        reader.SetFileName('image.tif')
+        reader.UpdateExtent((0, 15, 0, 11, 2, 4))
+        output = reader.GetOutput()
+
+        expected = GetValues(image).reshape(6, 12, 16)[2:5]
+        self.assertEqual(output.GetExtent(), (0, 15, 0, 11, 2, 4))
+        np.testing.assert_array_equal(GetValues(output).reshape(3, 12, 16), expected)
+
+
+if __name__ == '__main__':
+    unittest.main()
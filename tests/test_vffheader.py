@@ -0,0 +1,103 @@
+"""
+Header-only VFF access: ReadVFFHeader() and ScanVFFDirectory() parse the keywords up
+to the form feed without reading the pixel data.
+
+    python -m unittest discover tests
+"""
+
+import os
+import shutil
+import tempfile
+import unittest
+
+import vtk
+
+from PI.visualization.vtkMultiIO import vffheader
+
+
+def MakeVFF(keywords, data=b'\0' * 64):
+    """The bytes of a VFF file with the given 'key=value;' lines"""
+    header = 'ncaa\n' + ''.join('{0}={1};\n'.format(k, v) for k, v in keywords) + '\f\n'
+    return header.encode('latin-1') + data
+
+
+KEYWORDS = [('rank', 3), ('type', 'raster'), ('format', 'slice'), ('bits', 16),
+            ('bands', 1), ('size', '4 2 4'), ('spacing', '0.5 0.5 2'),
+            ('origin', '-2 0 1'), ('dicom_0008_0060', 'CT'),
+            ('hidden_note', 'not for display'), ('md5_digest', '0123abcd')]
+
+
+class ReadVFFHeaderTest(unittest.TestCase):
+
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+
+    def tearDown(self):
+        shutil.rmtree(self.directory, ignore_errors=True)
+
+    def Write(self, name, data):
+        filename = os.path.join(self.directory, name)
+        with open(filename, 'wb') as f:
+            f.write(data)
+        return filename
+
+    def test_header(self):
+        data = MakeVFF(KEYWORDS)
+        filename = self.Write('image.vff', data)
+        header = vffheader.ReadVFFHeader(filename)
+
+        self.assertEqual(header['filename'], filename)
+        self.assertEqual(header['header_size'], data.index(b'\f') + 2)
+        self.assertEqual(header['rank'], 3)
+        self.assertEqual(header['bits'], 16)
+        self.assertEqual(header['scalar_type'], vtk.VTK_SHORT)
+        self.assertEqual(header['dimensions'], (4, 2, 4))
+        self.assertEqual(header['rawsize'], 64)
+        self.assertEqual(header['spacing'], (0.5, 0.5, 2.0))
+        # the header stores the origin in voxels
+        self.assertEqual(header['origin'], (-1.0, 0.0, 2.0))
+        self.assertEqual(header['dicom'], {'dicom_0008_0060': 'CT'})
+        self.assertEqual(header['digests'], {'md5_digest': '0123abcd'})
+        self.assertNotIn('hidden_note', header['keywords'])
+
+    def test_long_header(self):
+        # the form feed lies beyond the first block read
+        keywords = KEYWORDS + [('comment', 'x' * (vffheader._BLOCK_SIZE * 2))]
+        data = MakeVFF(keywords)
+        header = vffheader.ReadVFFHeader(self.Write('long.vff', data))
+        self.assertEqual(header['header_size'], data.index(b'\f') + 2)
+        self.assertEqual(header['dimensions'], (4, 2, 4))
+
+    def test_defaults(self):
+        header = vffheader.ReadVFFHeader(self.Write('2d.vff', MakeVFF([('size', '3 2')])))
+        self.assertEqual(header['dimensions'], (3, 2, 1))
+        self.assertEqual(header['rank'], 2)
+        self.assertEqual(header['bits'], 8)
+        self.assertEqual(header['spacing'], (1.0, 1.0, 1.0))
+        self.assertEqual(header['rawsize'], 6)
+
+    def test_not_vff(self):
+        with self.assertRaises(IOError):
+            vffheader.ReadVFFHeader(self.Write('image.raw', b'\0' * 64))
+        with self.assertRaises(IOError):
+            vffheader.ReadVFFHeader(self.Write('truncated.vff', b'ncaa\nrank=3;\n'))
+
+    def test_scan_directory(self):
+        self.Write('b.vff', MakeVFF(KEYWORDS))
+        self.Write('a.VFF', MakeVFF([('size', '3 2')]))
+        self.Write('bad.vff', b'not a vff file')
+        self.Write('notes.txt', b'ignored')
+        os.mkdir(os.path.join(self.directory, 'series'))
+        self.Write(os.path.join('series', 'c.vff'), MakeVFF(KEYWORDS))
+
+        names = [os.path.basename(h['filename'])
+                 for h in vffheader.ScanVFFDirectory(self.directory, max_workers=2)]
+        self.assertEqual(names, ['a.VFF', 'b.vff'])
+
+        names = [os.path.basename(h['filename'])
+                 for h in vffheader.ScanVFFDirectory(self.directory, recursive=True)]
+        self.assertEqual(sorted(names), ['a.VFF', 'b.vff', 'c.vff'])
+
+
+if __name__ == '__main__':
+    unittest.main()
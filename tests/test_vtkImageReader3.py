@@ -0,0 +1,135 @@
+"""
+vtkImageReader3: x/y/z sub-extents read at computed offsets, one volume file or one
+file per slice, serial or parallel, with rows flipped in place (FileLowerLeft).  The
+compiled reader runs the same tests when the vtkMultiIO module is built.
+
+    python -m unittest discover tests
+"""
+
+import os
+import shutil
+import tempfile
+import unittest
+
+import numpy as np
+import vtk
+from vtk.util.numpy_support import vtk_to_numpy
+
+from PI.visualization.vtkMultiIO import _vtkMultiIO
+from PI.visualization.vtkMultiIO.vtkImageReader3 import vtkImageReader3
+
+SHAPE = (6, 5, 7)
+HEADER = b'raw header'
+
+
+def MakeValues():
+    return (np.arange(int(np.prod(SHAPE))) * 3 - 50).astype(np.int16).reshape(SHAPE)
+
+
+class ImageReader3Test(unittest.TestCase):
+
+    def CreateReader(self):
+        return vtkImageReader3()
+
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+        self.values = MakeValues()
+
+    def tearDown(self):
+        shutil.rmtree(self.directory, ignore_errors=True)
+
+    def WriteVolume(self):
+        filename = os.path.join(self.directory, 'volume.raw')
+        with open(filename, 'wb') as f:
+            f.write(HEADER)
+            f.write(self.values.astype('>i2').tobytes())
+        return filename
+
+    def WriteSlices(self):
+        filenames = vtk.vtkStringArray()
+        for z in range(SHAPE[0]):
+            filename = os.path.join(self.directory, 'slice{0}.raw'.format(z))
+            with open(filename, 'wb') as f:
+                f.write(HEADER)
+                f.write(self.values[z].astype('>i2').tobytes())
+            filenames.InsertNextValue(filename)
+        return filenames
+
+    def Read(self, reader, extent=None):
+        reader.SetDataExtent(0, SHAPE[2] - 1, 0, SHAPE[1] - 1, 0, SHAPE[0] - 1)
+        reader.SetDataScalarTypeToShort()
+        # big-endian shorts
+        reader.SetDataByteOrder(0)
+        if extent is None:
+            reader.Update()
+        else:
+            reader.UpdateExtent(extent)
+        output = reader.GetOutputDataObject(0)
+        x0, x1, y0, y1, z0, z1 = output.GetExtent()
+        values = vtk_to_numpy(output.GetPointData().GetScalars())
+        return output.GetExtent(), values.reshape(z1 - z0 + 1, y1 - y0 + 1, x1 - x0 + 1)
+
+    def CreateVolumeReader(self, parallel=False):
+        reader = self.CreateReader()
+        reader.SetFileName(self.WriteVolume())
+        reader.SetFileDimensionality(3)
+        reader.SetFileLowerLeft(0)
+        reader.SetParallelRead(parallel)
+        return reader
+
+    def test_whole_volume(self):
+        # the header size is whatever precedes the pixel data
+        _extent, values = self.Read(self.CreateVolumeReader())
+        np.testing.assert_array_equal(values, self.values)
+
+    def test_sub_extents(self):
+        for extent in ((0, 6, 0, 4, 2, 3), (2, 5, 0, 4, 0, 5), (1, 3, 1, 2, 1, 4)):
+            for parallel in (False, True):
+                output_extent, values = self.Read(self.CreateVolumeReader(parallel), extent)
+                self.assertEqual(output_extent, extent)
+                np.testing.assert_array_equal(
+                    values, self.values[extent[4]:extent[5] + 1, extent[2]:extent[3] + 1,
+                                        extent[0]:extent[1] + 1])
+
+    def test_slice_files(self):
+        reader = self.CreateReader()
+        reader.SetFileNames(self.WriteSlices())
+        reader.SetFileDimensionality(2)
+        reader.SetFileLowerLeft(0)
+        reader.SetHeaderSize(len(HEADER))
+        extent, values = self.Read(reader, (1, 5, 0, 4, 2, 4))
+        self.assertEqual(extent, (1, 5, 0, 4, 2, 4))
+        np.testing.assert_array_equal(values, self.values[2:5, :, 1:6])
+
+    def test_flipped_rows(self):
+        # with FileLowerLeft on, the file's first row is the output's last
+        for parallel in (False, True):
+            reader = self.CreateVolumeReader(parallel)
+            reader.SetFileLowerLeft(1)
+            for extent in ((0, 6, 1, 3, 0, 5), (2, 4, 0, 4, 1, 2)):
+                output_extent, values = self.Read(reader, extent)
+                self.assertEqual(output_extent, extent)
+                np.testing.assert_array_equal(
+                    values, self.values[:, ::-1][extent[4]:extent[5] + 1,
+                                                 extent[2]:extent[3] + 1,
+                                                 extent[0]:extent[1] + 1])
+
+
+class PythonImageReader3Test(ImageReader3Test):
+    pass
+
+
+@unittest.skipUnless(hasattr(getattr(_vtkMultiIO, 'vtkImageReader3', None), 'SetParallelRead'),
+                     "needs the compiled vtkMultiIO module")
+class CompiledImageReader3Test(ImageReader3Test):
+
+    def CreateReader(self):
+        return _vtkMultiIO.vtkImageReader3()
+
+
+# the shared tests run through the subclasses
+del ImageReader3Test
+
+
+if __name__ == '__main__':
+    unittest.main()
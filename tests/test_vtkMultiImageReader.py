@@ -0,0 +1,116 @@
+"""
+vtkMultiImageReader in-memory input: images loaded from the bytes of a file, with
+magic-number detection on the buffer, and images written with WriteToBuffer().
+
+    python -m unittest discover tests
+"""
+
+import os
+import shutil
+import tempfile
+import unittest
+
+import numpy as np
+import vtk
+from vtk.util.numpy_support import numpy_to_vtk, vtk_to_numpy
+
+from PI.visualization.vtkMultiIO.vtkMultiImageReader import MyBMPImageReader
+from PI.visualization.vtkMultiIO.vtkMultiImageReader import vtkMultiImageReader
+from PI.visualization.vtkMultiIO.vtkMultiImageWriter import vtkMultiImageWriter
+
+
+def MakeImage():
+    image = vtk.vtkImageData()
+    image.SetDimensions(16, 12, 4)
+    image.SetSpacing(0.5, 0.5, 2.0)
+    image.GetPointData().SetScalars(numpy_to_vtk(np.arange(768, dtype=np.int16), deep=1))
+    return image
+
+
+def GetValues(image):
+    return vtk_to_numpy(image.GetPointData().GetScalars())
+
+
+class MagicTest(unittest.TestCase):
+
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+
+    def tearDown(self):
+        shutil.rmtree(self.directory, ignore_errors=True)
+
+    def test_magic(self):
+        # magic strings are text and compared with the bytes read from the file
+        filename = os.path.join(self.directory, 'image.bmp')
+        writer = vtk.vtkBMPWriter()
+        writer.SetFileName(filename)
+        source = vtk.vtkImageCanvasSource2D()
+        source.SetExtent(0, 7, 0, 7, 0, 0)
+        source.SetScalarTypeToUnsignedChar()
+        writer.SetInputConnection(source.GetOutputPort())
+        writer.Write()
+
+        other = os.path.join(self.directory, 'other.bmp')
+        with open(other, 'wb') as f:
+            f.write(b'\0' * 64)
+
+        reader = MyBMPImageReader()
+        self.assertEqual(reader.CanReadFile(filename), 3)
+        self.assertEqual(reader.CanReadFile(other), 0)
+        with open(filename, 'rb') as f:
+            self.assertEqual(reader.CanReadBuffer(f.read()), 3)
+        self.assertEqual(reader.CanReadBuffer(b'\0' * 64), 0)
+
+
+class InputBufferTest(unittest.TestCase):
+
+    def setUp(self):
+        self.image = MakeImage()
+
+    def WriteToBuffer(self, filename):
+        writer = vtkMultiImageWriter()
+        writer.SetFileName(filename)
+        writer.SetInputData(self.image)
+        return writer.WriteToBuffer()
+
+    def test_temp_file(self):
+        # vtkMetaImageReader reads files only - the buffer goes through a temporary file
+        data = self.WriteToBuffer('image.mha')
+        self.assertTrue(data.startswith(b'ObjectType'))
+
+        reader = vtkMultiImageReader()
+        self.assertTrue(reader.SetInputBuffer(data))
+        reader.Update()
+        output = reader.GetOutput().GetRealImage()
+        np.testing.assert_array_equal(GetValues(output), GetValues(self.image))
+        self.assertEqual(output.GetSpacing(), (0.5, 0.5, 2.0))
+
+        # the temporary file is private to the reader
+        temp_filename = reader._temp_filename
+        self.assertTrue(os.path.exists(temp_filename))
+        self.assertIsNone(reader.GetFileName())
+        self.assertIsNone(reader.GetRecipe().filename)
+        self.assertIsNone(reader.GetLastIOMetrics().filename)
+
+        reader.tearDown()
+        self.assertFalse(os.path.exists(temp_filename))
+
+    def test_name_hint(self):
+        data = self.WriteToBuffer('image.mha')
+        reader = vtkMultiImageReader()
+        self.assertTrue(reader.SetInputBuffer(memoryview(data), name='upload.mha'))
+        reader.Update()
+        self.assertIsNone(reader.GetFileName())
+        self.assertEqual(reader.GetLastIOMetrics().filename, 'upload.mha')
+        reader.tearDown()
+
+    def test_multiple_files(self):
+        # a .mhd header and its raw data can't be returned as one buffer
+        writer = vtkMultiImageWriter()
+        writer.SetFileName('image.mhd')
+        writer.SetInputData(self.image)
+        self.assertRaises(IOError, writer.WriteToBuffer)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,170 @@
+"""
+vtkMultiImageWriter writer selection: the longest registered extension wins, a writer
+is reused while consecutive files need the same class, observers follow the current
+writer, and a reused writer starts every file with a clean header.  Slice series
+export with WriteSeries().
+
+    python -m unittest discover tests
+"""
+
+import os
+import shutil
+import tempfile
+import unittest
+
+import numpy as np
+import pydicom
+import vtk
+from vtk.util.numpy_support import numpy_to_vtk, vtk_to_numpy
+
+from PI.visualization.vtkMultiIO import iobackends
+from PI.visualization.vtkMultiIO import metaimage
+from PI.visualization.vtkMultiIO import vffheader
+from PI.visualization.vtkMultiIO.vtkMultiImageWriter import MyMetaImageWriter
+from PI.visualization.vtkMultiIO.vtkMultiImageWriter import MyPNGWriter
+from PI.visualization.vtkMultiIO.vtkMultiImageWriter import MyTIFFWriter
+from PI.visualization.vtkMultiIO.vtkMultiImageWriter import vtkMultiImageWriter
+
+
+def MakeImage(shape=(3, 6, 8)):
+    values = (np.arange(int(np.prod(shape))) * 7 % 251).astype(np.uint8)
+    image = vtk.vtkImageData()
+    image.SetDimensions(shape[2], shape[1], shape[0])
+    image.GetPointData().SetScalars(numpy_to_vtk(values, deep=1))
+    return image
+
+
+class WriterSelectionTest(unittest.TestCase):
+
+    def test_longest_extension(self):
+        writer = vtkMultiImageWriter()
+        writer.registerFileType({'.tar.mha': 'Archived meta'}, MyTIFFWriter, ())
+        self.assertIs(writer._FindWriterClass('volume.TAR.MHA'), MyTIFFWriter)
+        self.assertIs(writer._FindWriterClass('volume.mha'), MyMetaImageWriter)
+        self.assertIsNone(writer._FindWriterClass('volume.xyz'))
+        self.assertRaises(AttributeError, writer.SetFileName, 'volume.xyz')
+
+    def test_first_registered(self):
+        # a later registration for the same extension doesn't displace the first
+        writer = vtkMultiImageWriter()
+        writer.registerFileType({'.png': 'Another PNG'}, MyTIFFWriter, ())
+        self.assertIs(writer._FindWriterClass('slice.png'), MyPNGWriter)
+
+    def test_reuse(self):
+        writer = vtkMultiImageWriter()
+        writer.SetFileName('first.mha')
+        first = writer._writer
+        writer.SetFileName('second.mhd')
+        self.assertIs(writer._writer, first)
+        writer.SetFileName('third.png')
+        self.assertIsInstance(writer._writer, MyPNGWriter)
+        self.assertEqual(writer._writer.GetFileName(), 'third.png')
+
+    def test_observers(self):
+        # observers are attached once to each writer, new or reused
+        memory = iobackends.MemoryBackend()
+        writer = vtkMultiImageWriter()
+        writer.SetIOBackend(memory)
+        writer.SetStreamingSlabSize(1)
+        starts = []
+        handle = writer.AddObserver('StartEvent', lambda caller, event: starts.append(1))
+
+        for filename in ('a.mha', 'b.mha', 'c.vtk', 'd.mha'):
+            writer.SetFileName(filename)
+            writer.SetInputData(MakeImage())
+            writer.Write()
+        self.assertEqual(len(starts), 4)
+
+        writer.RemoveObserver(handle)
+        writer.SetFileName('e.mha')
+        writer.SetInputData(MakeImage())
+        writer.Write()
+        self.assertEqual(len(starts), 4)
+
+    def test_reused_writer(self):
+        # the second file's header holds its own DICOM values, none of the first's
+        memory = iobackends.MemoryBackend()
+        writer = vtkMultiImageWriter()
+        writer.SetIOBackend(memory)
+        writer.SetStreamingSlabSize(2)
+
+        ds = pydicom.dataset.Dataset()
+        ds.Modality = 'CT'
+        ds.PatientName = 'Doe^Jane'
+        ds.StudyDate = '20240131'
+        writer.SetFileName('first.vff')
+        writer.SetDICOMHeader(ds)
+        writer.SetInputData(MakeImage())
+        writer.Write()
+
+        ds = pydicom.dataset.Dataset()
+        ds.Modality = 'MR'
+        writer.SetFileName('second.vff')
+        writer.SetDICOMHeader(ds)
+        writer.SetInputData(MakeImage())
+        writer.Write()
+
+        raw, _size = vffheader.ReadRawHeader('second.vff', memory)
+        keywords = vffheader.ParseKeywords(raw.decode('latin-1'))
+        self.assertEqual(keywords['dicom_Modality'], 'MR')
+        self.assertNotIn('dicom_PatientsName', keywords)
+        self.assertNotIn('dicom_StudyDate', keywords)
+
+
+class WriteSeriesTest(unittest.TestCase):
+
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+        self.image = MakeImage((5, 6, 8))
+        self.writer = vtkMultiImageWriter()
+        self.writer.SetInputData(self.image)
+        self.events = []
+        for name in ('StartEvent', 'EndEvent'):
+            self.writer.AddObserver(name, lambda caller, event: self.events.append(event))
+
+    def tearDown(self):
+        shutil.rmtree(self.directory, ignore_errors=True)
+
+    def test_png(self):
+        pattern = os.path.join(self.directory, 'slice_%02d.png')
+        filenames = self.writer.WriteSeries(pattern, z_range=(1, 3), max_workers=2)
+        self.assertEqual(filenames, [pattern % z for z in (1, 2, 3)])
+        self.assertEqual(self.events, ['StartEvent', 'EndEvent'])
+
+        values = vtk_to_numpy(self.image.GetPointData().GetScalars()).reshape(5, 6, 8)
+        for z, filename in zip((1, 2, 3), filenames):
+            reader = vtk.vtkPNGReader()
+            reader.SetFileName(filename)
+            reader.Update()
+            np.testing.assert_array_equal(
+                vtk_to_numpy(reader.GetOutput().GetPointData().GetScalars()).reshape(6, 8),
+                values[z])
+
+    def test_dicom_keywords(self):
+        ds = pydicom.dataset.Dataset()
+        ds.Modality = 'CT'
+        self.writer.SetDICOMHeader(ds)
+        filenames = self.writer.WriteSeries(os.path.join(self.directory, 'slice_%d.mha'))
+        self.assertEqual(len(filenames), 5)
+        for filename in filenames:
+            self.assertEqual(metaimage.ReadMetaImageHeader(filename)['dicom']['dicom_Modality'],
+                             'CT')
+
+    def test_bad_pattern(self):
+        for pattern in ('slice.png', 'slice_%d_%d.png', 'slice_%%d.png'):
+            self.assertRaises(ValueError, self.writer.WriteSeries,
+                              os.path.join(self.directory, pattern))
+        self.assertRaises(ValueError, self.writer.WriteSeries,
+                          os.path.join(self.directory, 'slice_%d.png'), z_range=(3, 9))
+        self.assertEqual(self.events, [])
+        self.assertEqual(os.listdir(self.directory), [])
+
+    def test_failure(self):
+        # EndEvent follows StartEvent even when a slice can't be written
+        pattern = os.path.join(self.directory, 'missing', 'slice_%d.png')
+        self.assertRaises(IOError, self.writer.WriteSeries, pattern)
+        self.assertEqual(self.events, ['StartEvent', 'EndEvent'])
+
+
+if __name__ == '__main__':
+    unittest.main()
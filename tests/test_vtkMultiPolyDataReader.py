@@ -0,0 +1,120 @@
+"""
+vtkMultiPolyDataReader format detection: file signatures matched from one header read,
+readers for the file's extension checked first, and only the chosen reader built.
+
+    python -m unittest discover tests
+"""
+
+import os
+import shutil
+import struct
+import tempfile
+import unittest
+
+import vtk
+
+from PI.visualization.vtkMultiIO import fastmesh
+from PI.visualization.vtkMultiIO import vtkMultiPolyDataReader as polydatareader
+from PI.visualization.vtkMultiIO.vtkMultiPolyDataReader import vtkMultiPolyDataReader
+
+
+def MakeMesh():
+    source = vtk.vtkSphereSource()
+    source.SetThetaResolution(8)
+    source.SetPhiResolution(6)
+    source.Update()
+    return source.GetOutput()
+
+
+class CountingReader(vtk.vtkPolyDataReader):
+
+    """Counts its instances, to show which readers detection constructs"""
+
+    instances = 0
+
+    def __init__(self):
+        CountingReader.instances += 1
+
+
+class SignatureTest(unittest.TestCase):
+
+    def test_magic(self):
+        signature = [('# vtk', 0), (b'Data', 6)]
+        self.assertTrue(polydatareader.MatchSignature(signature, b'# vtk DataFile', 14))
+        self.assertFalse(polydatareader.MatchSignature(signature, b'# vtk File', 10))
+        # an empty magic string never matches, nor does an unreadable file
+        self.assertFalse(polydatareader.MatchSignature([('', 0)], b'ply', 3))
+        self.assertFalse(polydatareader.MatchSignature([('ply', 0)], b'', 0))
+
+    def test_callable(self):
+        self.assertTrue(polydatareader.MatchSignature(lambda h, s: s == 3, b'ply', 3))
+        self.assertFalse(polydatareader.MatchSignature(lambda h, s: s == 4, b'ply', 3))
+
+    def test_stl(self):
+        binary = b'\0' * 80 + struct.pack('<I', 2) + b'\0' * 100
+        self.assertTrue(polydatareader._IsSTLFile(binary, len(binary)))
+        self.assertFalse(polydatareader._IsSTLFile(binary, len(binary) + 1))
+        self.assertTrue(polydatareader._IsSTLFile(b'  solid mesh\n', 13))
+
+
+class DetectionTest(unittest.TestCase):
+
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+        self.mesh = MakeMesh()
+
+    def tearDown(self):
+        shutil.rmtree(self.directory, ignore_errors=True)
+
+    def Write(self, writer, name, binary=True):
+        filename = os.path.join(self.directory, name)
+        writer.SetFileName(filename)
+        writer.SetInputData(self.mesh)
+        if hasattr(writer, 'SetFileTypeToBinary'):
+            if binary:
+                writer.SetFileTypeToBinary()
+            else:
+                writer.SetFileTypeToASCII()
+        writer.Write()
+        return filename
+
+    def CheckReader(self, filename, classname):
+        reader = vtkMultiPolyDataReader()
+        reader.SetFileName(filename)
+        self.assertIsInstance(reader._reader, classname)
+        reader.Update()
+        self.assertEqual(reader.GetOutput().GetNumberOfPoints(), self.mesh.GetNumberOfPoints())
+
+    def test_signatures(self):
+        self.CheckReader(self.Write(vtk.vtkPolyDataWriter(), 'mesh.vtk'), vtk.vtkDataSetReader)
+        self.CheckReader(self.Write(vtk.vtkXMLPolyDataWriter(), 'mesh.vtp'),
+                         vtk.vtkXMLPolyDataReader)
+        self.CheckReader(self.Write(vtk.vtkSTLWriter(), 'mesh.stl'),
+                         fastmesh.vtkNumpySTLReader)
+        self.CheckReader(self.Write(vtk.vtkSTLWriter(), 'ascii.stl', False), vtk.vtkSTLReader)
+
+    def test_wrong_extension(self):
+        # the signature wins over the extension
+        self.CheckReader(self.Write(vtk.vtkPolyDataWriter(), 'mesh.vtp'), vtk.vtkDataSetReader)
+
+    def test_only_chosen_reader_built(self):
+        filename = self.Write(vtk.vtkXMLPolyDataWriter(), 'mesh.vtp')
+        reader = vtkMultiPolyDataReader()
+        reader.registerFileType({'.vtp': 'Counting'}, CountingReader, [('never', 0)])
+        CountingReader.instances = 0
+        reader.SetFileName(filename)
+        self.assertIsInstance(reader._reader, vtk.vtkXMLPolyDataReader)
+        self.assertEqual(CountingReader.instances, 0)
+
+    def test_unsigned_format(self):
+        # formats without a signature are trusted on their extension
+        filename = os.path.join(self.directory, 'mesh.obj')
+        with open(filename, 'w') as f:
+            f.write('v 0 0 0\nv 1 0 0\nv 0 1 0\nf 1 2 3\n')
+        reader = vtkMultiPolyDataReader()
+        reader.SetFileName(filename)
+        self.assertIsInstance(reader._reader, vtk.vtkOBJReader)
+
+
+if __name__ == '__main__':
+    unittest.main()
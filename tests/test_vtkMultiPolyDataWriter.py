@@ -0,0 +1,78 @@
+"""
+vtkMultiPolyDataWriter writer options: binary and compressed defaults per format,
+overrides with SetWriterOptions(), and options registered with a writer class.
+
+    python -m unittest discover tests
+"""
+
+import os
+import shutil
+import tempfile
+import unittest
+
+import vtk
+
+from PI.visualization.vtkMultiIO.vtkMultiPolyDataWriter import vtkMultiPolyDataWriter
+
+
+def MakeMesh():
+    source = vtk.vtkSphereSource()
+    source.SetThetaResolution(16)
+    source.SetPhiResolution(12)
+    source.Update()
+    return source.GetOutput()
+
+
+class WriterOptionsTest(unittest.TestCase):
+
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+        self.mesh = MakeMesh()
+
+    def tearDown(self):
+        shutil.rmtree(self.directory, ignore_errors=True)
+
+    def Write(self, writer, name):
+        filename = os.path.join(self.directory, name)
+        writer.SetFileName(filename)
+        writer.SetInputData(self.mesh)
+        writer.Write()
+        with open(filename, 'rb') as f:
+            return f.read()
+
+    def test_binary_defaults(self):
+        writer = vtkMultiPolyDataWriter()
+        self.assertIn(b'\nBINARY\n', self.Write(writer, 'mesh.vtk'))
+        self.assertFalse(self.Write(writer, 'mesh.stl').startswith(b'solid'))
+
+        data = self.Write(writer, 'mesh.vtp')
+        self.assertIn(b'format="appended"', data)
+        self.assertIn(b'header_type="UInt64"', data)
+        self.assertNotIn(b'encoding="base64"', data)
+
+    def test_overrides(self):
+        writer = vtkMultiPolyDataWriter()
+        writer.SetWriterOptions('.STL', FileType=vtk.VTK_ASCII)
+        self.assertEqual(writer.GetWriterOptions('.stl'), {'FileType': vtk.VTK_ASCII})
+        self.assertTrue(self.Write(writer, 'mesh.stl').startswith(b'solid'))
+        # other formats keep their defaults
+        self.assertIn(b'\nBINARY\n', self.Write(writer, 'mesh.vtk'))
+
+        writer.ClearWriterOptions('.stl')
+        self.assertEqual(writer.GetWriterOptions('.stl'), {'FileType': vtk.VTK_BINARY})
+        self.assertRaises(AttributeError, writer.SetWriterOptions, '.xyz', FileType=1)
+
+    def test_registered_options(self):
+        class ASCIIWriter(vtk.vtkPolyDataWriter):
+            __options__ = {'FileType': vtk.VTK_ASCII, 'Bogus': 1}
+
+        writer = vtkMultiPolyDataWriter()
+        writer.registerFileType({'.avtk': 'ASCII VTK'}, ASCIIWriter)
+        # options the writer doesn't have are logged and skipped
+        with self.assertLogs('PI.visualization.vtkMultiIO.vtkMultiPolyDataWriter', 'WARNING'):
+            data = self.Write(writer, 'mesh.avtk')
+        self.assertIn(b'\nASCII\n', data)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,80 @@
+"""
+vtkVFFWriter parallel writes: files written by the thread pool match those written
+serially, with and without chunked checksums.  Needs the compiled vtkMultiIO module.
+
+    python -m unittest discover tests
+"""
+
+import os
+import shutil
+import tempfile
+import unittest
+
+import numpy as np
+import vtk
+from vtk.util.numpy_support import numpy_to_vtk
+
+from PI.visualization.vtkMultiIO import _vtkMultiIO
+from PI.visualization.vtkMultiIO import checksums
+
+COMPILED = hasattr(getattr(_vtkMultiIO, 'vtkVFFWriter', None), 'SetParallelWrite')
+
+
+def MakeImage(shape=(11, 6, 8)):
+    values = (np.arange(int(np.prod(shape))) * 5 - 200).astype(np.int16)
+    image = vtk.vtkImageData()
+    image.SetDimensions(shape[2], shape[1], shape[0])
+    image.GetPointData().SetScalars(numpy_to_vtk(values, deep=1))
+    return image
+
+
+@unittest.skipUnless(COMPILED, "needs the compiled vtkMultiIO module")
+class ParallelWriteTest(unittest.TestCase):
+
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+        self.image = MakeImage()
+
+    def tearDown(self):
+        shutil.rmtree(self.directory, ignore_errors=True)
+
+    def Write(self, name, parallel, slab_size=16, checksum=False, chunk_size=2):
+        filename = os.path.join(self.directory, name)
+        writer = _vtkMultiIO.vtkVFFWriter()
+        writer.SetFileName(filename)
+        writer.SetInputData(self.image)
+        writer.SetParallelWrite(parallel)
+        writer.SetSlabSize(slab_size)
+        if checksum:
+            writer.SetChecksumModeToTrailer()
+            writer.SetChecksumChunkSize(chunk_size)
+
+        progress = []
+        writer.AddObserver('ProgressEvent',
+                           lambda caller, event: progress.append(caller.GetProgress()))
+        writer.Write()
+        self.assertEqual(writer.GetErrorCode(), 0)
+
+        with open(filename, 'rb') as f:
+            return f.read(), progress
+
+    def test_matches_serial(self):
+        serial, _progress = self.Write('serial.vff', False)
+        for slab_size in (1, 3, 16):
+            data, progress = self.Write('parallel.vff', True, slab_size)
+            self.assertEqual(data, serial)
+            # progress is reported as the slabs complete
+            self.assertGreaterEqual(len(progress), (11 + slab_size - 1) // slab_size)
+
+    def test_checksums(self):
+        # slabs are the checksum chunks, whatever the slab size
+        serial, _progress = self.Write('serial.vff', False, checksum=True)
+        data, _progress = self.Write('parallel.vff', True, slab_size=5, checksum=True)
+        self.assertEqual(data, serial)
+        record = checksums.ReadChecksums(os.path.join(self.directory, 'parallel.vff'))
+        self.assertEqual(record['chunk_slices'], 2)
+        self.assertTrue(checksums.VerifyChecksums(os.path.join(self.directory, 'parallel.vff')))
+
+
+if __name__ == '__main__':
+    unittest.main()